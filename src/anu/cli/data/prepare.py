@@ -1,15 +1,36 @@
 """cli data prepar modules."""
 
 import os
+from typing import Optional
 
 import click
 
-from anu.data.data_operations import extract_proteins_id_from_dataframe
+from anu.data.data_operations import (
+    canonicalize_protein_pairs,
+    extract_proteins_id_from_dataframe,
+    find_conflicting_pairs,
+)
 from anu.data.dataframe_operation import (
     convert_csv_to_dataframe,
+    describe_dataframe_source,
+    read_dataframes_from_file,
     save_dataframe_to_file,
 )
-from anu.data.pipelines.prepare_input import build_input_from_json
+from anu.data.features.contacts import save_contact_features
+from anu.data.features.minhash import cluster_proteins
+from anu.data.features.normalization import (
+    channel_names,
+    compute_channel_stats,
+    save_channel_stats,
+)
+from anu.data.index.atom_table import build_atom_table
+from anu.data.index.structure_index import build_structure_index
+from anu.data.pipelines.prepare_input import (
+    build_input_from_json,
+    id_col_name,
+    input_col_name,
+)
+from anu.data.pipelines.update_input import update_input_from_json
 
 
 @click.command()
@@ -23,7 +44,9 @@ def dataframes() -> None:
         1. First prepare raw vaex dataframe for pickle dataset
         2. Filter column of raw vaex dataframe and keep on the
         column containing protein id
-        3. Do above two process for negatome dataset.
+        3. Canonicalize the pairs and remove duplicates.
+        4. Do above three process for negatome dataset.
+        5. Report pairs present in both datasets.
     """
     PICKLE_PROTEIN_A_COLUMN = "InteractorA"
     PICKLE_PROTEIN_B_COLUMN = "InteractorB"
@@ -43,6 +66,11 @@ def dataframes() -> None:
             pickle_df, PICKLE_PROTEIN_A_COLUMN, PICKLE_PROTEIN_B_COLUMN
         )
 
+        click.secho("Removing duplicate pairs from pickle dataframes", fg="blue")
+        pickle_df = canonicalize_protein_pairs(
+            pickle_df, PICKLE_PROTEIN_A_COLUMN, PICKLE_PROTEIN_B_COLUMN
+        )
+
         # Negatome operations.
         click.secho("Preparing negatome dataframes", fg="cyan")
         negatome_df = convert_csv_to_dataframe(NEGATOME_PATH)
@@ -51,6 +79,11 @@ def dataframes() -> None:
         negatome_df = extract_proteins_id_from_dataframe(
             negatome_df, NEGATOME_PROTEIN_A_COLUMN, NEGATOME_PROTEIN_B_COLUMN
         )
+
+        click.secho("Removing duplicate pairs from negatome dataframes", fg="blue")
+        negatome_df = canonicalize_protein_pairs(
+            negatome_df, NEGATOME_PROTEIN_A_COLUMN, NEGATOME_PROTEIN_B_COLUMN
+        )
     except OSError:
         click.secho("Dataset(s) not found.", fg="red")
         click.secho("Probably you haven't run: anu data fetch-databases", fg="yellow")
@@ -70,6 +103,21 @@ def dataframes() -> None:
         click.secho("Unable to save dataframes", fg="red")
         exit()
 
+    conflict_df = find_conflicting_pairs(
+        pickle_df,
+        (PICKLE_PROTEIN_A_COLUMN, PICKLE_PROTEIN_B_COLUMN),
+        negatome_df,
+        (NEGATOME_PROTEIN_A_COLUMN, NEGATOME_PROTEIN_B_COLUMN),
+    )
+    if len(conflict_df) > 0:
+        CONFLICT_SAVE_PATH = os.path.join("conflicts", "pickle-negatome")
+        click.secho(
+            f"{len(conflict_df)} pairs are both interacting and non-interacting.",
+            fg="yellow",
+        )
+        click.secho(f"Saving them to data/processed/{CONFLICT_SAVE_PATH}.arrow")
+        save_dataframe_to_file(conflict_df, CONFLICT_SAVE_PATH)
+
     click.secho("Completed successfully.", fg="green")
 
 
@@ -86,31 +134,283 @@ def dataframes() -> None:
     is_flag=True,
     help="Prepare non-interacting input dataframe for training",
 )
-def inputs(interacting: bool, non_interacting: bool) -> None:
-    """Prepare input dataframe for training."""
+@click.option(
+    "--compression",
+    "-c",
+    type=click.Choice(["none", "zstd", "lz4"]),
+    default="none",
+    help="Compression codec of the saved input dataframe",
+)
+@click.option(
+    "--max-len",
+    type=int,
+    default=4000,
+    help="Pad or truncate proteins to this length, 0 keeps whole proteins",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only featurize new or changed pairs of an existing input dataframe",
+)
+def inputs(
+    interacting: bool,
+    non_interacting: bool,
+    compression: str,
+    max_len: int,
+    incremental: bool,
+) -> None:
+    """Prepare input dataframe for training.
+
+    Whole proteins (--max-len 0) must be trained with: anu train cnn --window
+
+    With --incremental, pairs already featurized from unchanged structures
+    are kept, removed pairs and stale structures are tombstoned.
+    """
     NEGATOME_PATH = os.path.join(
         "negatome", "non-interacting-protein", "pair_selected.json"
     )
     PICKLE_PATH = os.path.join("pickle", "interacting-protein", "pair_selected.json")
+    codec = None if compression == "none" else compression
+    length = None if max_len == 0 else max_len
+
+    def build(path: str, db_name: str, filename: str, interaction: bool) -> None:
+        if not incremental:
+            build_input_from_json(path, db_name, filename, interaction, codec, length)
+            return
+
+        try:
+            featurized, tombstoned = update_input_from_json(
+                path, db_name, filename, interaction, codec, length
+            )
+        except ValueError as err:
+            click.secho(str(err), fg="red")
+            exit()
+        click.secho(f"Featurized {featurized} pairs, tombstoned {tombstoned} rows.")
 
     if interacting:
         click.secho("Building interacting protein input dataframe", fg="blue")
-        build_input_from_json(PICKLE_PATH, "pickle", "pickle_input_df", True)
+        build(PICKLE_PATH, "pickle", "pickle_input_df", True)
         click.secho("Process completed successfully", fg="green")
 
     elif non_interacting:
         click.secho("Building non-interacting protein input dataframe", fg="blue")
-        build_input_from_json(NEGATOME_PATH, "negatome", "negatome_input_df", False)
+        build(NEGATOME_PATH, "negatome", "negatome_input_df", False)
         click.secho("Process completed successfully", fg="green")
 
     else:
         click.secho("First, building interacting protein input dataframe", fg="blue")
-        build_input_from_json(PICKLE_PATH, "pickle", "pickle_input_df", True)
+        build(PICKLE_PATH, "pickle", "pickle_input_df", True)
         click.secho("Now, building non-interacting protein input dataframe", fg="blue")
-        build_input_from_json(NEGATOME_PATH, "negatome", "negatome_input_df", False)
+        build(NEGATOME_PATH, "negatome", "negatome_input_df", False)
         click.secho("Process completed successfully", fg="green")
 
 
+@click.command()
+@click.option("--kmer", "-k", type=int, default=3, help="Length of k-mers")
+@click.option(
+    "--threshold",
+    "-t",
+    type=float,
+    default=0.5,
+    help="Minimum estimated Jaccard similarity of clustered proteins",
+)
+def clusters(kmer: int, threshold: float) -> None:
+    """Cluster proteins of the input dataframes by sequence similarity.
+
+    Clusters are used to keep similar proteins in one split while training.
+    """
+    PICKLE_PATH = os.path.join("input", "pickle", "pickle_input_df")
+    NEGATOME_PATH = os.path.join("input", "negatome", "negatome_input_df")
+    SEQ_COLUMNS = ["proteinA_seq", "proteinB_seq"]
+
+    try:
+        df = read_dataframes_from_file(
+            [PICKLE_PATH, NEGATOME_PATH], columns=id_col_name + SEQ_COLUMNS
+        )
+    except OSError:
+        click.secho("Unable to load input", fg="red")
+        click.secho("You probably forgot to run: anu data prepare inputs", fg="yellow")
+        exit()
+
+    click.secho("Clustering proteins", fg="blue")
+    clusters_df = cluster_proteins(
+        df, id_col_name, SEQ_COLUMNS, k=kmer, threshold=threshold
+    )
+    num_clusters = len(clusters_df["cluster"].unique())
+    click.secho(f"{len(clusters_df)} proteins in {num_clusters} clusters.")
+
+    status = save_dataframe_to_file(clusters_df, os.path.join("clusters", "proteins"))
+    if status is False:
+        click.secho("Unable to save clusters", fg="red")
+        exit()
+
+    click.secho("Completed successfully.", fg="green")
+
+
+@click.command()
+@click.option(
+    "--fasta",
+    "-f",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Also write every indexed sequence to this fasta file",
+)
+@click.option(
+    "--atoms",
+    "-a",
+    is_flag=True,
+    help="Also store coordinates of every atom",
+)
+def structures(fasta: Optional[str], atoms: bool) -> None:
+    """Index sequences and residues of every downloaded pdb file.
+
+    The index gives the sequence, residue centroids and chains of a protein
+    without parsing its pdb file again.
+    """
+    try:
+        click.secho("Indexing pdb files", fg="blue")
+        index = build_structure_index()
+    except FileNotFoundError:
+        click.secho("No pdb file found.", fg="red")
+        click.secho("You probably forgot to run: anu data fetch pdb", fg="yellow")
+        exit()
+
+    click.secho(f"Indexed {len(index)} proteins, {len(index.sequence)} residues.")
+
+    if fasta is not None:
+        with open(fasta, "w") as fp:
+            index.write_fasta(fp)
+        click.secho(f"Sequences written to {fasta}")
+
+    if atoms:
+        click.secho("Storing atom coordinates", fg="blue")
+        atom_table = build_atom_table()
+        click.secho(f"Stored atoms of {len(atom_table)} proteins.")
+
+    click.secho("Completed successfully.", fg="green")
+
+
+@click.command()
+@click.option(
+    "--radius",
+    "-r",
+    type=float,
+    default=8.0,
+    help="Residues closer than radius (in angstrom) are in contact",
+)
+def contacts(radius: float) -> None:
+    """Compute residue contacts of the input dataframes.
+
+    Contacts are saved as sparse CSR columns with the ids of their pair, in
+    partitions of a dataset next to every input dataframe.
+    """
+    INPUTS = [
+        (os.path.join("input", "pickle", "pickle_input_df"), "pickle_contacts_df"),
+        (
+            os.path.join("input", "negatome", "negatome_input_df"),
+            "negatome_contacts_df",
+        ),
+    ]
+    CONTACT_COLUMNS = (
+        [f"protein{protein}_{axis}" for protein in ["A", "B"] for axis in "xyz"]
+        + ["proteinA_seq", "proteinB_seq"]
+        + id_col_name
+    )
+
+    for path, name in INPUTS:
+        try:
+            df = read_dataframes_from_file([path], columns=CONTACT_COLUMNS)
+        except OSError:
+            click.secho(f"Unable to load {path}", fg="red")
+            click.secho("You probably forgot to run: anu data prepare inputs")
+            exit()
+
+        click.secho(f"Computing contacts of {path}", fg="blue")
+        status = save_contact_features(
+            df, os.path.join(os.path.dirname(path), name), radius
+        )
+        if status is False:
+            click.secho("Unable to save contacts", fg="red")
+            exit()
+
+    click.secho("Completed successfully.", fg="green")
+
+
+@click.command()
+def stats() -> None:
+    """Compute statistics of every channel of the input dataframes.
+
+    Statistics are saved next to every input dataframe and are used to
+    normalize the channels while training.
+    """
+    PATHS = [
+        os.path.join("input", "pickle", "pickle_input_df"),
+        os.path.join("input", "negatome", "negatome_input_df"),
+    ]
+    STATS_COLUMNS = [
+        f"protein{protein}_{name}" for name in channel_names for protein in ["A", "B"]
+    ]
+
+    for path in PATHS:
+        try:
+            df = read_dataframes_from_file([path], columns=STATS_COLUMNS)
+        except OSError:
+            click.secho(f"Unable to load {path}", fg="red")
+            click.secho("You probably forgot to run: anu data prepare inputs")
+            exit()
+
+        click.secho(f"Computing statistics of {path}", fg="blue")
+        channel_stats = compute_channel_stats(df)
+        save_channel_stats(channel_stats, path)
+
+        for name, item in channel_stats.items():
+            click.secho(
+                f"{name}: mean {item.mean:.3f}, std {item.std:.3f}, "
+                f"min {item.minimum:g}, max {item.maximum:g}"
+            )
+
+    click.secho("Completed successfully.", fg="green")
+
+
+@click.command()
+@click.option("--shard-rows", type=int, default=512, help="Rows in one tensor shard")
+def shards(shard_rows: int) -> None:
+    """Export the input dataframes to memory mapped tensor shards.
+
+    Shards hold the decoded model inputs and are read with: anu train cnn
+    --shards. Rows deleted from the input dataframes are not exported.
+    """
+    from anu.models.cnn.shards import export_tensor_shards, get_shards_path
+
+    PATHS = [
+        os.path.join("input", "pickle", "pickle_input_df"),
+        os.path.join("input", "negatome", "negatome_input_df"),
+    ]
+
+    for path in PATHS:
+        try:
+            df = read_dataframes_from_file([path], columns=input_col_name)
+        except OSError:
+            click.secho(f"Unable to load {path}", fg="red")
+            click.secho("You probably forgot to run: anu data prepare inputs")
+            exit()
+
+        click.secho(f"Exporting tensor shards of {path}", fg="blue")
+        try:
+            rows = export_tensor_shards(
+                df,
+                get_shards_path(path),
+                shard_rows,
+                source=describe_dataframe_source(path),
+            )
+        except ValueError:
+            click.secho("Proteins must be padded, run: anu data prepare inputs")
+            exit()
+        click.secho(f"Exported {rows} rows.")
+
+    click.secho("Completed successfully.", fg="green")
+
+
 @click.group()
 def prepare() -> None:
     """Currently only prepare dataframes or input."""
@@ -119,3 +419,8 @@ def prepare() -> None:
 
 prepare.add_command(dataframes)
 prepare.add_command(inputs)
+prepare.add_command(clusters)
+prepare.add_command(structures)
+prepare.add_command(contacts)
+prepare.add_command(stats)
+prepare.add_command(shards)
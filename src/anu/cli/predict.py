@@ -2,13 +2,22 @@
 
 import json
 import os
-from typing import Any, List, Tuple, Union
+from typing import Any, List, Optional, Tuple, Union
 
 import click
 
 from anu.data.data_operations import fetch_pdb_from_pdb_id, fetch_pdb_using_uniprot_id
-from anu.data.pipelines.prepare_input import build_df_from_dic, build_matrix
-from anu.models.cnn.pipeline import predict_cnn
+from anu.data.index.protein_index import find_protein_rows
+from anu.data.pipelines.prepare_input import (
+    build_df_from_dic,
+    build_matrix,
+    PROTEIN_SEQ_MAX_LEN,
+)
+from anu.models.cnn.pipeline import (
+    get_model_window,
+    load_pretrained_model,
+    predict_cnn,
+)
 
 
 @click.group()
@@ -110,13 +119,49 @@ def protein(paths: Any, pdb: Union[bool, None], uniprot: Union[bool, None]) -> N
             exit()
 
     click.secho("PDB file loaded successfully", fg="green")
+    model = load_pretrained_model()
+
+    # Models taking windows crop whole proteins, the others padded ones.
+    max_len: Optional[int] = PROTEIN_SEQ_MAX_LEN
+    if get_model_window(model) < PROTEIN_SEQ_MAX_LEN:
+        max_len = None
+
     click.secho("Preparing input", fg="cyan")
-    protein_a = build_matrix(protein_a, "Protein A")
-    protein_b = build_matrix(protein_b, "Protein B")
+    protein_a = build_matrix(protein_a, "Protein A", max_len=max_len)
+    protein_b = build_matrix(protein_b, "Protein B", max_len=max_len)
 
     df = build_df_from_dic(protein_a, protein_b)
 
-    predict_cnn(df)
+    predict_cnn(df, model)
+
+
+@click.command()
+@click.argument("protein_id")
+def partners(protein_id: str) -> None:
+    """List known interacting and non-interacting partners of a protein.
+
+    Args:
+        protein_id: uniprot id of the protein.
+    """
+    databases = [
+        ("Interacting", os.path.join("pickle", "interacting-protein")),
+        ("Non-interacting", os.path.join("negatome", "non-interacting-protein")),
+    ]
+
+    for label, path in databases:
+        try:
+            rows = find_protein_rows(
+                os.path.join("final_protein_dataframes", path), protein_id
+            )
+        except OSError:
+            click.secho(f"No index found for {path}", fg="yellow")
+            click.secho("You probably forgot to run: anu data fetch pdb", fg="yellow")
+            continue
+
+        click.secho(f"{label} partners: {len(rows)}", fg="cyan")
+        for first, second in zip(*[rows[col].tolist() for col in rows.column_names]):
+            click.secho(second if first == protein_id else first)
 
 
 predict.add_command(protein)
+predict.add_command(partners)
@@ -1,27 +1,410 @@
 """Cli train module."""
 
 import os
+from typing import Optional, Tuple
 
 import click
 
+# Path with respect to data/processed and without file extension
+PICKLE_PATH = os.path.join("input", "pickle", "pickle_input_df")
+NEGATOME_PATH = os.path.join("input", "negatome", "negatome_input_df")
+KNOWN_PAIRS_PATH = os.path.join("pickle", "interacting-protein")
+CLUSTERS_PATH = os.path.join("clusters", "proteins")
+
 
 @click.command()
-def cnn() -> None:
-    """Train using cnn model."""
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Data loading processes, 0 loads on the training process "
+    "[default: tuning profile, else 0]",
+)
+@click.option(
+    "--batch-size",
+    "-b",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Samples in one batch [default: tuning profile, else 2]",
+)
+@click.option(
+    "--negative-ratio",
+    type=float,
+    default=None,
+    help="Draw this many random non-interacting pairs per training row",
+)
+@click.option(
+    "--split",
+    type=click.Choice(["random", "cluster", "hash", "protein-hash"]),
+    default="random",
+    help="Split rows at random, by protein cluster or by a stable hash",
+)
+@click.option(
+    "--max-per-cluster",
+    type=int,
+    default=None,
+    help="With --split cluster, keep this many rows per pair of clusters",
+)
+@click.option(
+    "--strict-clusters/--loose-clusters",
+    default=True,
+    help="With --split cluster, share no cluster between splits and drop rows "
+    "linking two splits, or only keep clusters of the training split apart "
+    "[default: strict]",
+)
+@click.option(
+    "--normalize",
+    is_flag=True,
+    help="Normalize channels, needs: anu data prepare stats",
+)
+@click.option(
+    "--window",
+    type=int,
+    default=None,
+    help="Train on random windows of this many residues of every protein",
+)
+@click.option(
+    "--crop-stride",
+    type=int,
+    default=None,
+    help="Residues between two evaluation windows, half the window by default",
+)
+@click.option(
+    "--shards",
+    is_flag=True,
+    help="Read samples from tensor shards, needs: anu data prepare shards",
+)
+@click.option(
+    "--channels",
+    type=str,
+    default=None,
+    help="Comma separated input channels, seq first [default: every channel]",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Stream record batches in sequence, rows are split with a hash",
+)
+@click.option(
+    "--accelerate",
+    is_flag=True,
+    help="Train with bf16 autocast, channels last and a compiled model",
+)
+@click.option(
+    "--accumulate",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Batches per parameter update, multiplies the effective batch size",
+)
+@click.option(
+    "--checkpoint-activations",
+    is_flag=True,
+    help="Recompute convolution activations in the backward pass to save memory",
+)
+@click.option(
+    "--checkpoint-every",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Also save a training checkpoint every this many batches",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume from the latest training checkpoint",
+)
+@click.option(
+    "--overwrite-checkpoints",
+    is_flag=True,
+    help="Remove training checkpoints of a previous run and start over",
+)
+@click.option(
+    "--eval-batch-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Samples in one evaluation batch [default: 4 * batch size]",
+)
+@click.option(
+    "--patience",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Stop once the validation loss hasn't improved for this many epochs",
+)
+@click.option(
+    "--eval-process",
+    is_flag=True,
+    help="Evaluate checkpoints in a separate process while training goes on",
+)
+def cnn(
+    workers: Optional[int],
+    batch_size: Optional[int],
+    negative_ratio: Optional[float],
+    split: str,
+    max_per_cluster: Optional[int],
+    strict_clusters: bool,
+    normalize: bool,
+    window: Optional[int],
+    crop_stride: Optional[int],
+    shards: bool,
+    channels: Optional[str],
+    stream: bool,
+    accelerate: bool,
+    accumulate: int,
+    checkpoint_activations: bool,
+    checkpoint_every: Optional[int],
+    resume: bool,
+    overwrite_checkpoints: bool,
+    eval_batch_size: Optional[int],
+    patience: Optional[int],
+    eval_process: bool,
+) -> None:
+    """Train using cnn model.
+
+    Torch threads, and workers and batch size if not given, come from the
+    profile written by anu train tune on this machine, with the same
+    --window, --accelerate, --checkpoint-activations and --accumulate.
+
+    Args:
+        workers: data loading processes.
+        batch_size: samples in one batch.
+        negative_ratio: random non-interacting pairs per training row.
+        split: random, cluster, hash or protein-hash split of the rows.
+        max_per_cluster: rows kept for every pair of clusters.
+        strict_clusters: keep every cluster in one split.
+        normalize: normalize every channel.
+        window: residues of every protein in one sample.
+        crop_stride: residues between evaluation windows.
+        shards: read samples from memory mapped tensor shards.
+        channels: comma separated channels of the model input.
+        stream: stream the input files instead of reading rows at random.
+        accelerate: enable the acceleration options of the trainer config.
+        accumulate: batches whose gradients are summed in one update.
+        checkpoint_activations: checkpoint activations of the convolutions.
+        checkpoint_every: batches between two mid epoch checkpoints.
+        resume: resume from the latest training checkpoint.
+        overwrite_checkpoints: remove checkpoints of a previous run.
+        eval_batch_size: samples in one evaluation batch.
+        patience: epochs without improvement before stopping.
+        eval_process: evaluate in a separate process.
+    """
+    from anu.data.pipelines.prepare_input import PROTEIN_SEQ_MAX_LEN
     from anu.models.cnn.pipeline import train_cnn
+    from anu.models.cnn.tuning import load_tuning_profile, trial_settings
 
-    # Path with respect to data/processed and without file extension
-    PICKLE_PATH = os.path.join("input", "pickle", "pickle_input_df")
-    NEGATOME_PATH = os.path.join("input", "negatome", "negatome_input_df")
+    threads = None
+    settings = trial_settings(
+        window or PROTEIN_SEQ_MAX_LEN, accelerate, checkpoint_activations, accumulate
+    )
+    profile = load_tuning_profile(settings=settings)
+    if profile is None and load_tuning_profile() is not None:
+        click.secho(
+            "Tuning profile is for other training options, run: anu train tune "
+            "with the same --window, --accelerate, --checkpoint-activations and "
+            "--accumulate",
+            fg="yellow",
+        )
+    if profile is not None:
+        click.secho("Using tuning profile, see: anu train tune", fg="blue")
+        workers = profile["workers"] if workers is None else workers
+        batch_size = profile["batch_size"] if batch_size is None else batch_size
+        threads = profile["threads"]
 
     try:
         click.secho("Starting cnn training", fg="blue")
-        train_cnn([PICKLE_PATH, NEGATOME_PATH], num_workers=0)
+        train_cnn(
+            [PICKLE_PATH, NEGATOME_PATH],
+            batch_size=2 if batch_size is None else batch_size,
+            num_workers=0 if workers is None else workers,
+            negative_ratio=negative_ratio,
+            known_pair_paths=[KNOWN_PAIRS_PATH],
+            clusters_path=CLUSTERS_PATH if split == "cluster" else None,
+            max_per_cluster=max_per_cluster,
+            strict_clusters=strict_clusters,
+            hash_split_by={"hash": "pair", "protein-hash": "protein"}.get(split),
+            normalize=normalize,
+            window=window,
+            crop_stride=crop_stride,
+            shards=shards,
+            channels=None if channels is None else channels.split(","),
+            streaming=stream,
+            accelerate=accelerate,
+            threads=threads,
+            accumulation_steps=accumulate,
+            checkpoint_activations=checkpoint_activations,
+            checkpoint_steps=checkpoint_every,
+            resume=resume,
+            overwrite_checkpoints=overwrite_checkpoints,
+            eval_batch_size=eval_batch_size,
+            patience=patience,
+            eval_process=eval_process,
+        )
     except OSError:
         click.secho("Unable to load input", fg="red")
         click.secho("You probably forgot to run: anu data prepare-input", fg="yellow")
         click.secho("Both interacting and non-interacting input must be prepared.")
+        if split == "cluster":
+            click.secho("Cluster split needs: anu data prepare clusters")
+        if normalize:
+            click.secho("Normalization needs: anu data prepare stats")
+        if shards:
+            click.secho("Tensor shards need: anu data prepare shards")
         exit()
+    except ValueError as err:
+        click.secho(str(err), fg="red")
+        exit()
+
+
+@click.command()
+@click.option("--batch-size", "-b", type=int, default=16, help="Samples per batch")
+@click.option("--steps", "-s", type=int, default=20, help="Training steps per run")
+@click.option("--window", type=int, default=4000, help="Residues of every protein")
+def benchmark(batch_size: int, steps: int, window: int) -> None:
+    """Compare float32 training with the --accelerate mode.
+
+    Both runs train ConvNet from the same weights over the same synthetic
+    batches, so their losses are compared step by step.
+
+    Args:
+        batch_size: samples in one batch.
+        steps: training steps of every run.
+        window: residues of every protein.
+    """
+    from anu.models.cnn.benchmark import compare_acceleration
+
+    click.secho("Running benchmark", fg="blue")
+    results = compare_acceleration(batch_size, steps, window)
+
+    for name, result in results.items():
+        click.secho(
+            f"{name}: {result['samples_per_second']:.1f} samples/s, "
+            f"final loss {result['losses'][-1]:.4f}"
+        )
+
+    baseline, accelerated = results["baseline"], results["accelerated"]
+    speedup = accelerated["samples_per_second"] / baseline["samples_per_second"]
+    difference = max(
+        abs(a - b) for a, b in zip(accelerated["losses"], baseline["losses"])
+    )
+    click.secho(f"Speedup {speedup:.2f}x, largest loss difference {difference:.4f}")
+
+
+@click.command()
+@click.option(
+    "--batch-size",
+    "-b",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 2, 4, 8, 16, 32],
+    help="Batch size to try, repeat for more",
+)
+@click.option(
+    "--threads",
+    "-t",
+    type=click.IntRange(min=1),
+    multiple=True,
+    help="Torch threads to try, repeat for more [default: powers of two]",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=0),
+    multiple=True,
+    default=[0, 1, 2, 4],
+    help="Data loading processes to try, repeat for more",
+)
+@click.option(
+    "--memory",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Peak memory of a trial in GiB [default: half of the memory]",
+)
+@click.option("--steps", "-s", type=int, default=5, help="Training steps per trial")
+@click.option("--window", type=int, default=4000, help="Residues of every protein")
+@click.option(
+    "--accelerate",
+    is_flag=True,
+    help="Train with bf16 autocast, channels last and a compiled model",
+)
+@click.option(
+    "--checkpoint-activations",
+    is_flag=True,
+    help="Recompute convolution activations in the backward pass to save memory",
+)
+@click.option(
+    "--accumulate",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Batches per parameter update",
+)
+def tune(
+    batch_size: Tuple[int, ...],
+    threads: Tuple[int, ...],
+    workers: Tuple[int, ...],
+    memory: Optional[float],
+    steps: int,
+    window: int,
+    accelerate: bool,
+    checkpoint_activations: bool,
+    accumulate: int,
+) -> None:
+    """Find the fastest batch size, threads and workers of anu train cnn.
+
+    Short timed trials train ConvNet on synthetic batches, then read the
+    prepared input with more and more workers. The best configuration is
+    saved as the tuning profile of this machine, used by anu train cnn with
+    the same training options.
+
+    Args:
+        batch_size: batch sizes to try.
+        threads: torch thread counts to try.
+        workers: data loading processes to try.
+        memory: peak memory of a trial in GiB.
+        steps: training steps of every trial.
+        window: residues of every protein.
+        accelerate: enable the acceleration options of the trainer config.
+        checkpoint_activations: checkpoint activations of the convolutions.
+        accumulate: batches whose gradients are summed in one update.
+    """
+    from anu.models.cnn.tuning import (
+        default_memory_budget,
+        default_thread_counts,
+        get_profile_path,
+        save_tuning_profile,
+        trial_settings,
+        tune_training,
+    )
+
+    budget = default_memory_budget() if memory is None else int(memory * 2**30)
+
+    click.secho("Running trials", fg="blue")
+    try:
+        profile = tune_training(
+            list(batch_size),
+            list(threads) or default_thread_counts(),
+            list(workers),
+            budget,
+            trial_settings(window, accelerate, checkpoint_activations, accumulate),
+            steps,
+            paths=[PICKLE_PATH, NEGATOME_PATH],
+        )
+    except ValueError as err:
+        click.secho(str(err), fg="red")
+        exit()
+
+    for trial in profile["trials"]:
+        click.secho(
+            f"batch size {trial['batch_size']}, {trial['threads']} threads, "
+            f"{trial['workers']} workers: "
+            f"{trial['samples_per_second']:.1f} samples/s, "
+            f"{trial['peak_rss'] / 2**20:.0f} MiB"
+        )
+
+    save_tuning_profile(profile)
+    click.secho(
+        f"Best: batch size {profile['batch_size']}, {profile['threads']} threads, "
+        f"{profile['workers']} workers, saved to {get_profile_path()}",
+        fg="green",
+    )
 
 
 @click.group()
@@ -31,3 +414,5 @@ def train() -> None:
 
 
 train.add_command(cnn)
+train.add_command(benchmark)
+train.add_command(tune)
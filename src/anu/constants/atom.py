@@ -0,0 +1,50 @@
+"""Atom names of standard amino acids."""
+
+from typing import Dict, List
+
+# Heavy atom names of the standard amino acids. Code of an atom name is its
+# position plus one, 0 is used for any other atom (hydrogens, atoms of hetero
+# residues and waters).
+atom_names: List[str] = [
+    "N",
+    "CA",
+    "C",
+    "CB",
+    "O",
+    "CG",
+    "CG1",
+    "CG2",
+    "OG",
+    "OG1",
+    "SG",
+    "CD",
+    "CD1",
+    "CD2",
+    "ND1",
+    "ND2",
+    "OD1",
+    "OD2",
+    "SD",
+    "CE",
+    "CE1",
+    "CE2",
+    "CE3",
+    "NE",
+    "NE1",
+    "NE2",
+    "OE1",
+    "OE2",
+    "CH2",
+    "NH1",
+    "NH2",
+    "OH",
+    "CZ",
+    "CZ2",
+    "CZ3",
+    "NZ",
+    "OXT",
+]
+
+atom_name_to_code: Dict[str, int] = {
+    name: code for code, name in enumerate(atom_names, start=1)
+}
@@ -1,5 +1,6 @@
 """Data utilities module."""
 
 from . import features  # noqa
+from . import index  # noqa
 from . import parser  # noqa
 from . import pipelines  # noqa
@@ -2,8 +2,11 @@
 
 import os
 from time import time
+from typing import Tuple
 
 import click
+import pyarrow as pa
+import pyarrow.compute as pc
 import requests
 import vaex
 
@@ -37,6 +40,86 @@ def extract_proteins_id_from_dataframe(
     return protein_df
 
 
+def canonicalize_protein_pairs(
+    df: vaex.dataframe.DataFrame, first_col_name: str, second_col_name: str
+) -> vaex.dataframe.DataFrame:
+    """Canonicalize and de-duplicate protein id pairs.
+
+    Databases list the same interaction as (A, B) and (B, A) and sometimes
+    repeat rows verbatim. Ids are stripped, each pair is ordered so that the
+    smaller id comes first, and duplicates are removed using a hash based
+    group by. Everything runs as arrow compute kernels, so there is no python
+    level loop over the rows.
+
+    Args:
+        df: vaex dataframe returned by extract_proteins_id_from_dataframe.
+        first_col_name: name of the first col where we get the protein id.
+        second_col_name: name of the second col where we get the protein id.
+
+    Returns:
+        Return a new dataframe with unique canonical pairs.
+    """
+    table = df.to_arrow_table(column_names=[first_col_name, second_col_name])
+
+    first = pc.utf8_trim_whitespace(table[first_col_name].cast(pa.string()))
+    second = pc.utf8_trim_whitespace(table[second_col_name].cast(pa.string()))
+
+    swap = pc.greater(first, second)
+    canonical = pa.table(
+        {
+            first_col_name: pc.if_else(swap, second, first),
+            second_col_name: pc.if_else(swap, first, second),
+        }
+    )
+
+    # Missing or empty ids can never be fetched, so drop them here.
+    canonical = canonical.drop_null()
+    canonical = canonical.filter(
+        pc.and_(
+            pc.not_equal(canonical[first_col_name], ""),
+            pc.not_equal(canonical[second_col_name], ""),
+        )
+    )
+
+    unique = canonical.group_by([first_col_name, second_col_name]).aggregate([])
+
+    return vaex.from_arrow_table(unique)
+
+
+def find_conflicting_pairs(
+    positive_df: vaex.dataframe.DataFrame,
+    positive_cols: Tuple[str, str],
+    negative_df: vaex.dataframe.DataFrame,
+    negative_cols: Tuple[str, str],
+) -> vaex.dataframe.DataFrame:
+    """Find pairs that are listed as interacting and non-interacting.
+
+    Both dataframes must already be canonicalized with
+    canonicalize_protein_pairs.
+
+    Args:
+        positive_df: canonical dataframe of interacting proteins.
+        positive_cols: protein id columns of positive_df.
+        negative_df: canonical dataframe of non-interacting proteins.
+        negative_cols: protein id columns of negative_df.
+
+    Returns:
+        Return a dataframe with protein_a and protein_b columns.
+    """
+    keys = ["protein_a", "protein_b"]
+
+    positive = positive_df.to_arrow_table(
+        column_names=list(positive_cols)
+    ).rename_columns(keys)
+    negative = negative_df.to_arrow_table(
+        column_names=list(negative_cols)
+    ).rename_columns(keys)
+
+    conflicts = positive.join(negative, keys=keys, join_type="inner")
+
+    return vaex.from_arrow_table(conflicts.select(keys))
+
+
 def fetch_pdb_using_uniprot_id(id: str) -> (str, int):
     """Fetch pdb file using uniprot id.
 
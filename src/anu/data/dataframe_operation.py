@@ -1,10 +1,29 @@
 """modules to realted to data frame operations."""
 
+import contextlib
 import os
-from typing import Union, Optional
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import vaex
 
+# File extension of every supported storage format.
+STORAGE_FORMATS = {"arrow": ".arrow", "feather": ".feather", "parquet": ".parquet"}
+DEFAULT_COMPRESSION = "zstd"
+
 
 def get_base_data_path() -> str:
     """Compute the base data path.
@@ -39,12 +58,148 @@ def convert_csv_to_dataframe(
     raise OSError
 
 
-def save_dataframe_to_file(df: vaex.dataframe.DataFrame, filename: str) -> bool:
-    """Only save dataframe relative to data/processed in arrow format.
+def fsync_directory(path: str) -> None:
+    """Flush directory entries of the given directory to disk.
+
+    Args:
+        path: path of the directory.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Not every platform allows opening a directory.
+        return
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomically(path: str, write: Callable[[str], None]) -> None:
+    """Write a file without ever exposing a half written file at path.
+
+    write is called with a temporary path in the same directory. The
+    temporary file is flushed to disk and then renamed over path. If anything
+    fails, including KeyboardInterrupt, the temporary file is removed and the
+    previous file at path (if any) is left untouched.
+
+    Args:
+        path: final path of the file.
+        write: function writing the file to the given path.
+    """
+    dir, name = os.path.split(path)
+    tmp_path = os.path.join(dir, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    try:
+        write(tmp_path)
+
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        os.replace(tmp_path, path)
+        fsync_directory(dir)
+
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def export_dataframe_atomically(
+    df: vaex.dataframe.DataFrame,
+    path: str,
+    file_format: str = "arrow",
+    compression: Optional[str] = None,
+) -> None:
+    """Export dataframe to path using write_file_atomically.
+
+    Compressed arrow files are written as feather v2, which is the arrow file
+    format with compressed buffers.
+
+    Args:
+        df: vaex dataframe.
+        path: final path of the file.
+        file_format: one of arrow, feather or parquet.
+        compression: codec like zstd or lz4. None writes arrow uncompressed and
+            uses zstd for feather and parquet.
+
+    Raises:
+        ValueError: if the file format is not supported.
+    """
+    if file_format not in STORAGE_FORMATS:
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+    if file_format == "arrow" and compression is None:
+        write_file_atomically(path, df.export_arrow)
+        return
+
+    compression = compression or DEFAULT_COMPRESSION
+
+    def write(tmp_path: str) -> None:
+        if file_format == "parquet":
+            df.export_parquet(tmp_path, compression=compression)
+        else:
+            df.export_feather(tmp_path, compression=compression)
+
+    write_file_atomically(path, write)
+
+
+def read_arrow_table(path: str) -> pa.Table:
+    """Read an arrow file written either in file or in stream format.
+
+    Args:
+        path: path of the arrow file.
+
+    Returns:
+        Return the arrow table. Buffers are memory mapped.
+    """
+    source = pa.memory_map(path)
+    try:
+        return pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source).read_all()
+
+
+def write_arrow_table_atomically(
+    table: pa.Table, path: str, compression: Optional[str] = None
+) -> None:
+    """Write arrow table to path in arrow file format using write_file_atomically.
+
+    Args:
+        table: arrow table.
+        path: final path of the arrow file.
+        compression: codec like zstd or lz4, None to write uncompressed buffers.
+    """
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    def write(tmp_path: str) -> None:
+        with pa.ipc.new_file(tmp_path, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+    write_file_atomically(path, write)
+
+
+def save_dataframe_to_file(
+    df: vaex.dataframe.DataFrame,
+    filename: str,
+    file_format: str = "arrow",
+    compression: Optional[str] = None,
+) -> bool:
+    """Only save dataframe relative to data/processed.
+
+    The file is replaced atomically, so readers either see the old dataframe
+    or the new one but never a partially written file.
 
     Args:
         df: vaex dataframe.
         filename: name of the file.
+        file_format: one of arrow, feather or parquet.
+        compression: codec like zstd or lz4, see export_dataframe_atomically.
 
     Returns:
         True if successfully save the file.
@@ -58,10 +213,14 @@ def save_dataframe_to_file(df: vaex.dataframe.DataFrame, filename: str) -> bool:
         dir = os.path.dirname(path)
         pathlib.Path(dir).mkdir(parents=True, exist_ok=True)
 
-        if os.path.exists(f"{path}.arrow"):
-            os.remove(f"{path}.arrow")
+        export_dataframe_atomically(
+            df, f"{path}{STORAGE_FORMATS[file_format]}", file_format, compression
+        )
 
-        df.export(f"{path}.arrow")
+        # A copy left in another format would be read instead of this one.
+        for other_format, extension in STORAGE_FORMATS.items():
+            if other_format != file_format and os.path.exists(f"{path}{extension}"):
+                os.remove(f"{path}{extension}")
         return True
 
     except OSError as err:
@@ -69,31 +228,1129 @@ def save_dataframe_to_file(df: vaex.dataframe.DataFrame, filename: str) -> bool:
         return False
 
 
+def save_dataframes_to_file(
+    dataframes: Dict[str, vaex.dataframe.DataFrame], max_workers: int = 4
+) -> bool:
+    """Save several dataframes relative to data/processed in parallel.
+
+    Each dataframe is saved with save_dataframe_to_file, so every file is
+    replaced atomically and files which finished exporting are kept even if
+    another export fails or the job is interrupted.
+
+    Args:
+        dataframes: mapping of filename to vaex dataframe.
+        max_workers: number of exports running at the same time.
+
+    Returns:
+        True if all the dataframes are saved successfully.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        status = executor.map(
+            lambda item: save_dataframe_to_file(item[1], item[0]),
+            dataframes.items(),
+        )
+        return all(list(status))
+
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_LOCK_FILENAME = ".manifest.lock"
+
+
+class PartitionEntry(TypedDict):
+    """Dictionary shape for one partition of a dataset manifest."""
+
+    name: str
+    rows: int
+    bytes: int
+    checksum: Optional[str]
+    meta: Dict[str, Any]
+
+
+class DatasetManifest(TypedDict):
+    """Dictionary shape for dataset manifest."""
+
+    version: int
+    rows: int
+    schema: Dict[str, str]
+    partitions: List[PartitionEntry]
+
+
+def get_dataset_path(path: str) -> str:
+    """Compute the directory of a partitioned dataset.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+
+    Returns:
+        Return the absolute path of the dataset directory.
+    """
+    return os.path.realpath(os.path.join(get_base_data_path(), "processed", path))
+
+
+def compute_file_checksum(path: str, block_size: int = 1 << 20) -> str:
+    """Compute the checksum of a file.
+
+    Args:
+        path: path of the file.
+        block_size: number of bytes read at once.
+
+    Returns:
+        Return the checksum prefixed with the name of the algorithm.
+    """
+    import hashlib
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(block_size), b""):
+            digest.update(block)
+
+    return f"blake2b:{digest.hexdigest()}"
+
+
+def read_file_schema(file_path: str) -> Tuple[int, pa.Schema]:
+    """Read the number of rows and the schema of a file from its footer.
+
+    Only the metadata of arrow, feather and parquet files is read, so
+    compressed files are not decompressed. Arrow files written as a stream
+    have no footer and are read entirely.
+
+    Args:
+        file_path: absolute path of an arrow, feather or parquet file.
+
+    Returns:
+        Return the number of rows and the arrow schema of the file.
+    """
+    if file_path.endswith(STORAGE_FORMATS["parquet"]):
+        metadata = pq.ParquetFile(file_path).metadata
+        return metadata.num_rows, metadata.schema.to_arrow_schema()
+
+    source = pa.memory_map(file_path)
+    try:
+        reader = pa.ipc.open_file(source)
+        return reader.count_rows(), reader.schema
+    except pa.ArrowInvalid:
+        source.seek(0)
+        table = pa.ipc.open_stream(source).read_all()
+        return len(table), table.schema
+
+
+def describe_partition(
+    file_path: str, meta: Optional[Dict[str, Any]] = None, checksum: bool = True
+) -> Tuple[PartitionEntry, Dict[str, str]]:
+    """Compute the manifest entry of a partition file.
+
+    Args:
+        file_path: absolute path of the partition.
+        meta: extra information used to prune partitions.
+        checksum: False to skip reading the whole file, the partition is then
+            verified by size only.
+
+    Returns:
+        Return the partition entry and the schema of the partition.
+    """
+    rows, arrow_schema = read_file_schema(file_path)
+    df = vaex.from_arrow_table(arrow_schema.empty_table())
+    schema = {name: str(dtype) for name, dtype in df.dtypes.items()}
+    entry: PartitionEntry = {
+        "name": os.path.basename(file_path),
+        "rows": rows,
+        "bytes": os.path.getsize(file_path),
+        "checksum": compute_file_checksum(file_path) if checksum else None,
+        "meta": meta or {},
+    }
+
+    return entry, schema
+
+
+@contextlib.contextmanager
+def lock_dataset_manifest(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on the manifest of a dataset.
+
+    Writers reading, updating and writing back the manifest hold the lock,
+    so concurrent writers of the same dataset don't lose each other updates.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+
+    Yields:
+        Nothing, the lock is released when the context exits.
+    """
+    import fcntl
+    import pathlib
+
+    dataset_path = get_dataset_path(path)
+    pathlib.Path(dataset_path).mkdir(parents=True, exist_ok=True)
+
+    with open(os.path.join(dataset_path, MANIFEST_LOCK_FILENAME), "w") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def read_dataset_manifest(path: str) -> Optional[DatasetManifest]:
+    """Read the manifest of a partitioned dataset.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+
+    Returns:
+        Return the manifest or None if the dataset has no manifest.
+    """
+    import json
+
+    try:
+        with open(os.path.join(get_dataset_path(path), MANIFEST_FILENAME)) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+
+
+def write_dataset_manifest(path: str, manifest: DatasetManifest) -> None:
+    """Atomically write the manifest of a partitioned dataset.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+        manifest: manifest to write.
+    """
+    import json
+    import pathlib
+
+    dataset_path = get_dataset_path(path)
+    pathlib.Path(dataset_path).mkdir(parents=True, exist_ok=True)
+
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "w") as fp:
+            json.dump(manifest, fp, indent=2)
+
+    write_file_atomically(os.path.join(dataset_path, MANIFEST_FILENAME), write)
+
+
+def add_partitions_to_manifest(
+    path: str,
+    names: List[str],
+    meta: Optional[List[Dict[str, Any]]] = None,
+    checksum: bool = True,
+) -> DatasetManifest:
+    """Add partition files of a dataset to its manifest.
+
+    Partitions already present in the manifest with the same name are
+    replaced. The manifest is created if it doesn't exist yet.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+        names: file names of the partitions inside the dataset directory.
+        meta: extra information of each partition used for pruning.
+        checksum: False to not checksum the partitions, see describe_partition.
+
+    Returns:
+        Return the updated manifest.
+
+    Raises:
+        ValueError: if the schema of a partition differs from the dataset.
+    """
+    dataset_path = get_dataset_path(path)
+    described = [
+        describe_partition(
+            os.path.join(dataset_path, name),
+            None if meta is None else meta[i],
+            checksum,
+        )
+        for i, name in enumerate(names)
+    ]
+
+    with lock_dataset_manifest(path):
+        manifest = read_dataset_manifest(path) or {
+            "version": 1,
+            "rows": 0,
+            "schema": {},
+            "partitions": [],
+        }
+
+        partitions = {entry["name"]: entry for entry in manifest["partitions"]}
+
+        for entry, schema in described:
+            if not manifest["schema"]:
+                manifest["schema"] = schema
+            elif manifest["schema"] != schema:
+                raise ValueError(
+                    f"Partition {entry['name']} doesn't match the dataset schema"
+                )
+
+            partitions[entry["name"]] = entry
+
+        manifest["partitions"] = list(partitions.values())
+        manifest["rows"] = sum(entry["rows"] for entry in manifest["partitions"])
+        write_dataset_manifest(path, manifest)
+
+    return manifest
+
+
+def remove_partitions_from_manifest(path: str, names: List[str]) -> DatasetManifest:
+    """Remove partitions from the manifest of a dataset.
+
+    The partition files are left on disk.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+        names: file names of the partitions to remove.
+
+    Returns:
+        Return the updated manifest.
+
+    Raises:
+        OSError: if the dataset has no manifest.
+    """
+    with lock_dataset_manifest(path):
+        manifest = read_dataset_manifest(path)
+        if manifest is None:
+            raise OSError(f"Dataset {path} has no manifest")
+
+        manifest["partitions"] = [
+            entry for entry in manifest["partitions"] if entry["name"] not in names
+        ]
+        manifest["rows"] = sum(entry["rows"] for entry in manifest["partitions"])
+        write_dataset_manifest(path, manifest)
+
+    return manifest
+
+
+def add_tombstones_to_manifest(
+    path: str, deleted: Dict[str, List[int]]
+) -> DatasetManifest:
+    """Mark rows of partitions as deleted without rewriting the partitions.
+
+    Deleted rows are listed in the deleted meta of their partition and are
+    skipped by read_dataset.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+        deleted: row ids of every partition, relative to the partition.
+
+    Returns:
+        Return the updated manifest.
+
+    Raises:
+        OSError: if the dataset has no manifest.
+    """
+    with lock_dataset_manifest(path):
+        manifest = read_dataset_manifest(path)
+        if manifest is None:
+            raise OSError(f"Dataset {path} has no manifest")
+
+        for entry in manifest["partitions"]:
+            if entry["name"] in deleted:
+                rows = set(entry["meta"].get("deleted", []))
+                rows.update(int(row) for row in deleted[entry["name"]])
+                entry["meta"]["deleted"] = sorted(rows)
+
+        write_dataset_manifest(path, manifest)
+
+    return manifest
+
+
+def build_dataset_manifest(path: str) -> DatasetManifest:
+    """Build the manifest of a directory containing arrow partitions.
+
+    Useful to migrate directories of chunks written before manifests existed.
+    Numeric file names are ordered numerically.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+
+    Returns:
+        Return the manifest.
+    """
+    dataset_path = get_dataset_path(path)
+
+    def sort_key(name: str) -> Tuple[int, Union[int, str]]:
+        stem = os.path.splitext(name)[0]
+        return (0, int(stem)) if stem.isdigit() else (1, stem)
+
+    names = sorted(
+        [
+            entry.name
+            for entry in os.scandir(dataset_path)
+            if os.path.splitext(entry.name)[1] in STORAGE_FORMATS.values()
+            and not entry.name.startswith(".")
+        ],
+        key=sort_key,
+    )
+
+    manifest = read_dataset_manifest(path)
+    if manifest is not None:
+        known = {entry["name"] for entry in manifest["partitions"]}
+        names = [name for name in names if name not in known]
+
+    return add_partitions_to_manifest(path, names)
+
+
+def save_dataframe_partition(
+    df: vaex.dataframe.DataFrame,
+    path: str,
+    name: str,
+    meta: Optional[Dict[str, Any]] = None,
+    file_format: str = "arrow",
+    compression: Optional[str] = None,
+    checksum: bool = True,
+) -> bool:
+    """Save dataframe as a partition of a dataset and register it.
+
+    Args:
+        df: vaex dataframe.
+        path: path of the dataset relative to data/processed.
+        name: name of the partition without extension.
+        meta: extra information of the partition used for pruning.
+        file_format: one of arrow, feather or parquet.
+        compression: codec like zstd or lz4, see export_dataframe_atomically.
+        checksum: False to not checksum the partition, see describe_partition.
+
+    Returns:
+        True if successfully save the partition.
+    """
+    if not save_dataframe_to_file(
+        df, os.path.join(path, name), file_format, compression
+    ):
+        return False
+
+    filename = f"{name}{STORAGE_FORMATS[file_format]}"
+    add_partitions_to_manifest(path, [filename], [meta or {}], checksum)
+    return True
+
+
+def verify_dataset(path: str) -> List[str]:
+    """Verify partitions of a dataset against its manifest.
+
+    Partitions added without checksum are only verified by size.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+
+    Returns:
+        Return the names of partitions which are missing or corrupted.
+
+    Raises:
+        OSError: if the dataset has no manifest.
+    """
+    manifest = read_dataset_manifest(path)
+    if manifest is None:
+        raise OSError(f"Dataset {path} has no manifest")
+
+    dataset_path = get_dataset_path(path)
+    invalid = []
+
+    for entry in manifest["partitions"]:
+        file_path = os.path.join(dataset_path, entry["name"])
+        if (
+            not os.path.exists(file_path)
+            or os.path.getsize(file_path) != entry["bytes"]
+            or (
+                entry["checksum"] is not None
+                and compute_file_checksum(file_path) != entry["checksum"]
+            )
+        ):
+            invalid.append(entry["name"])
+
+    return invalid
+
+
+def open_arrow_file(
+    source: pa.NativeFile, columns: Optional[List[str]] = None
+) -> pa.ipc.RecordBatchFileReader:
+    """Open an arrow or feather file decoding only some columns.
+
+    Args:
+        source: opened file, usually memory mapped.
+        columns: columns decoded from every record batch, None for every
+            column.
+
+    Returns:
+        Return the reader of the record batches.
+
+    Raises:
+        ArrowInvalid: if the file is written as a stream.
+    """
+    fields = None
+    if columns is not None:
+        schema = pa.ipc.open_file(source).schema
+        fields = [schema.get_field_index(name) for name in columns]
+
+    return pa.ipc.open_file(
+        source, options=pa.ipc.IpcReadOptions(included_fields=fields)
+    )
+
+
+class RecordBatchFileDataset(vaex.dataset.Dataset):
+    """Arrow or feather file decoded one record batch at a time.
+
+    vaex decodes every record batch of an arrow file when opening it, which
+    decompresses the whole file if it was written with zstd or lz4. Here
+    only the record batches holding the rows read are decoded, and only
+    their requested columns. The last decoded record batch is kept, so rows
+    read one at a time don't decode their record batch again.
+    """
+
+    snake_name = "anu-record-batch-file"
+
+    def __init__(
+        self: "RecordBatchFileDataset",
+        file_path: str,
+        columns: Optional[List[str]] = None,
+    ) -> None:
+        """Initialize the dataset.
+
+        Args:
+            file_path: absolute path of an arrow or feather file.
+            columns: columns to read, None to read every column.
+
+        Raises:
+            ArrowInvalid: if the file is written as a stream, such files have
+                no index of their record batches.
+        """
+        super().__init__()
+        self.file_path = file_path
+        self.columns = columns
+        self._reader: Optional[pa.ipc.RecordBatchFileReader] = None
+        self._cached: Tuple[int, Optional[pa.RecordBatch]] = (-1, None)
+
+        schema = self.reader.schema
+        self.names = schema.names if columns is None else columns
+        self._schema = {name: schema.field(name).type for name in self.names}
+        self.offsets = np.cumsum([0, *count_record_batches(file_path)])
+        self._row_count = int(self.offsets[-1])
+        self._ids: Dict[str, str] = {}
+        self._create_columns()
+
+    @property
+    def reader(self: "RecordBatchFileDataset") -> pa.ipc.RecordBatchFileReader:
+        """Reader of the memory mapped file decoding the requested columns.
+
+        Returns:
+            Return the reader, the file is opened again after unpickling.
+        """
+        if self._reader is None:
+            self._reader = open_arrow_file(pa.memory_map(self.file_path), self.columns)
+
+        return self._reader
+
+    def read_batch(self: "RecordBatchFileDataset", index: int) -> pa.RecordBatch:
+        """Decode one record batch.
+
+        Args:
+            index: record batch to decode.
+
+        Returns:
+            Return the record batch with the requested columns.
+        """
+        if self._cached[0] != index:
+            self._cached = (index, self.reader.get_batch(index))
+
+        return self._cached[1]
+
+    @property
+    def _fingerprint(self: "RecordBatchFileDataset") -> str:
+        fingerprint = vaex.cache.fingerprint(
+            vaex.file.fingerprint(self.file_path), self.columns
+        )
+        return f"dataset-{self.snake_name}-{fingerprint}"
+
+    def _create_columns(self: "RecordBatchFileDataset") -> None:
+        self._columns = {
+            name: vaex.dataset.ColumnProxy(self, name, dtype)
+            for name, dtype in self._schema.items()
+        }
+
+    def __getstate__(self: "RecordBatchFileDataset") -> Dict[str, Any]:
+        state = super().__getstate__()
+        state["_reader"] = None
+        state["_cached"] = (-1, None)
+        return state
+
+    def chunk_iterator(
+        self: "RecordBatchFileDataset",
+        columns: List[str],
+        chunk_size: Optional[int] = None,
+        reverse: bool = False,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        """Iterate over chunks of rows, decoding only their record batches.
+
+        Args:
+            columns: columns to read.
+            chunk_size: maximum number of rows of every chunk.
+            reverse: iterate from the last chunk.
+            start: first row.
+            end: last row (excluded), None for the last row of the file.
+
+        Yields:
+            Start and end row of every chunk, relative to start, with the
+            values of its columns.
+        """
+        end = self._row_count if end is None else end
+        chunk_size = chunk_size or 1024**2
+        first = int(np.searchsorted(self.offsets, start, side="right")) - 1
+        last = int(np.searchsorted(self.offsets, end, side="left"))
+        indices = range(max(first, 0), last)
+
+        for index in reversed(indices) if reverse else indices:
+            offset = int(self.offsets[index])
+            batch_start = max(start, offset)
+            batch_end = min(end, int(self.offsets[index + 1]))
+            batch = self.read_batch(index)
+
+            for i1 in range(batch_start, batch_end, chunk_size):
+                i2 = min(i1 + chunk_size, batch_end)
+                chunk = batch.slice(i1 - offset, i2 - i1)
+                yield i1 - start, i2 - start, {
+                    name: chunk.column(name) for name in columns
+                }
+
+    def is_masked(self: "RecordBatchFileDataset", column: str) -> bool:
+        """Arrow arrays hold their missing values themselves.
+
+        Args:
+            column: name of the column.
+
+        Returns:
+            Return False.
+        """
+        return False
+
+    def shape(self: "RecordBatchFileDataset", column: str) -> Tuple[int, ...]:
+        """Shape of one value of a column, values of arrow arrays are scalars.
+
+        Args:
+            column: name of the column.
+
+        Returns:
+            Return an empty shape.
+        """
+        return ()
+
+    def slice(
+        self: "RecordBatchFileDataset", start: int, end: int
+    ) -> vaex.dataset.Dataset:
+        """Select rows of the file without decoding them.
+
+        Args:
+            start: first row.
+            end: last row (excluded).
+
+        Returns:
+            Return the sliced dataset.
+        """
+        if start == 0 and end == self._row_count:
+            return self
+
+        return vaex.dataset.DatasetSliced(self, start, end)
+
+    def hashed(self: "RecordBatchFileDataset") -> "RecordBatchFileDataset":
+        """Files are identified by their fingerprint instead of their values.
+
+        Returns:
+            Return the dataset itself.
+        """
+        return self
+
+    def leafs(self: "RecordBatchFileDataset") -> List[vaex.dataset.Dataset]:
+        """Datasets this dataset is made of.
+
+        Returns:
+            Return the dataset itself.
+        """
+        return [self]
+
+    def close(self: "RecordBatchFileDataset") -> None:
+        """Release the memory map and the decoded record batch."""
+        self._reader = None
+        self._cached = (-1, None)
+
+
+def open_dataframe_file(
+    file_path: str, columns: Optional[List[str]] = None
+) -> vaex.dataframe.DataFrame:
+    """Open an arrow, feather or parquet file reading only the given columns.
+
+    Arrow and feather files are memory mapped and read with
+    RecordBatchFileDataset, so record batches are only decompressed when
+    their rows are read. Parquet files are opened lazily by vaex, so only
+    the row groups of the requested columns are read.
+
+    Args:
+        file_path: absolute path of the file.
+        columns: columns to read, None to read every column.
+
+    Returns:
+        vaex dataframe.
+    """
+    if not file_path.endswith(STORAGE_FORMATS["parquet"]):
+        try:
+            return vaex.from_dataset(RecordBatchFileDataset(file_path, columns))
+        except pa.ArrowInvalid:
+            # Arrow files written as a stream can't be read batch wise.
+            pass
+
+    df = vaex.open(file_path)
+    return df if columns is None else df[columns]
+
+
+class PartitionedDataset(vaex.dataset.DatasetConcatenated):
+    """Concatenated datasets which read only the rows asked for.
+
+    vaex reads every dataset holding rows of a range from its first row and
+    drops the rows before the range. Here every dataset is sliced to the
+    range first, so a RecordBatchFileDataset or a LazyPartitionDataset only
+    decodes the record batches holding the rows read.
+    """
+
+    snake_name = "anu-partitioned"
+
+    def _chunk_iterator_non_strict(
+        self: "PartitionedDataset",
+        columns: List[str],
+        chunk_size: Optional[int] = None,
+        reverse: bool = False,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        from vaex.schema import resolver_flexible
+
+        end = self.row_count if end is None else end
+        offset = 0
+        for dataset in self.datasets:
+            first, last = max(start - offset, 0), min(end - offset, dataset.row_count)
+            offset += dataset.row_count
+            if first >= last:
+                continue
+
+            present = [name for name in columns if name in dataset]
+            chunks = dataset.slice(first, last).chunk_iterator(
+                present, chunk_size=chunk_size, reverse=reverse
+            )
+            for i1, i2, chunk in chunks:
+                yield {
+                    name: resolver_flexible.align(
+                        i2 - i1, chunk.get(name), self._schema[name], self._shapes[name]
+                    )
+                    for name in columns
+                }
+
+
+def get_column_dataset(df: vaex.dataframe.DataFrame) -> vaex.dataset.Dataset:
+    """Return the dataset of the columns of a dataframe opened from files.
+
+    Args:
+        df: dataframe opened from files, maybe projected on some columns.
+
+    Returns:
+        Return the dataset without the columns not in the dataframe.
+    """
+    names = df.get_column_names()
+    if set(names) == set(df.dataset):
+        return df.dataset
+
+    return df.dataset.project(*names)
+
+
+def concat_datasets(datasets: List[vaex.dataset.Dataset]) -> vaex.dataframe.DataFrame:
+    """Concatenate datasets in a dataframe with PartitionedDataset.
+
+    Args:
+        datasets: datasets to concatenate.
+
+    Returns:
+        vaex dataframe.
+    """
+    if len(datasets) == 1:
+        return vaex.from_dataset(datasets[0])
+
+    return vaex.from_dataset(PartitionedDataset(datasets, resolver="flexible"))
+
+
+def open_dataframe_files(
+    file_path_list: List[str], columns: Optional[List[str]] = None
+) -> vaex.dataframe.DataFrame:
+    """Open and concatenate files with open_dataframe_file.
+
+    Args:
+        file_path_list: list of absolute path of the files.
+        columns: columns to read, None to read every column.
+
+    Returns:
+        vaex dataframe.
+    """
+    datasets = []
+    for path in file_path_list:
+        datasets.append(get_column_dataset(open_dataframe_file(path, columns)))
+
+    return concat_datasets(datasets)
+
+
+def find_dataframe_file(path: str) -> str:
+    """Find the file of a dataframe stored in any supported format.
+
+    save_dataframe_to_file removes copies in other formats, if some are
+    still there the most recently written one is returned.
+
+    Args:
+        path: absolute path of the file without extension.
+
+    Returns:
+        Return the path of the file with extension.
+
+    Raises:
+        OSError: if no file is found.
+    """
+    found = [
+        f"{path}{extension}"
+        for extension in STORAGE_FORMATS.values()
+        if os.path.exists(f"{path}{extension}")
+    ]
+    if len(found) == 0:
+        raise OSError(f"No dataframe found at {path}")
+
+    return max(found, key=os.path.getmtime)
+
+
+class LazyPartitionDataset(vaex.dataset.Dataset):
+    """Partition of a dataset which is opened on first access to its rows.
+
+    The number of rows comes from the manifest and the schema from another
+    partition of the dataset, so a dataframe of many partitions is built
+    without opening them.
+    """
+
+    snake_name = "anu-lazy-partition"
+
+    def __init__(
+        self: "LazyPartitionDataset",
+        file_path: str,
+        entry: PartitionEntry,
+        template: vaex.dataset.Dataset,
+        columns: Optional[List[str]] = None,
+    ) -> None:
+        """Initialize the partition.
+
+        Args:
+            file_path: absolute path of the partition.
+            entry: manifest entry of the partition.
+            template: dataset with the schema of the partition.
+            columns: columns to read, None to read every column.
+        """
+        super().__init__()
+        self.file_path = file_path
+        self.checksum = entry["checksum"]
+        self.columns = columns
+        self._schema = template.schema()
+        self._shapes = template.shapes()
+        self._original: Optional[vaex.dataset.Dataset] = None
+        self._row_count = entry["rows"]
+        self._ids: Dict[str, str] = {}
+        self._create_columns()
+
+    @property
+    def original(self: "LazyPartitionDataset") -> vaex.dataset.Dataset:
+        """Dataset of the opened partition file.
+
+        Returns:
+            Return the dataset, the file is opened on first access.
+
+        Raises:
+            ValueError: if the file doesn't match its manifest entry.
+        """
+        if self._original is None:
+            dataset = open_dataframe_file(self.file_path, self.columns).dataset
+            if dataset.row_count != self._row_count:
+                raise ValueError(f"Partition {self.file_path} doesn't match manifest")
+            self._original = dataset
+
+        return self._original
+
+    @property
+    def _fingerprint(self: "LazyPartitionDataset") -> str:
+        fingerprint = vaex.cache.fingerprint(
+            self.file_path, self.checksum, self.columns
+        )
+        return f"dataset-{self.snake_name}-{fingerprint}"
+
+    def _create_columns(self: "LazyPartitionDataset") -> None:
+        self._columns = {
+            name: vaex.dataset.ColumnProxy(self, name, dtype)
+            for name, dtype in self._schema.items()
+        }
+
+    def __getstate__(self: "LazyPartitionDataset") -> Dict[str, Any]:
+        state = super().__getstate__()
+        state["_original"] = None
+        return state
+
+    def chunk_iterator(
+        self: "LazyPartitionDataset",
+        columns: List[str],
+        chunk_size: Optional[int] = None,
+        reverse: bool = False,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        """Iterate over chunks of rows of the partition.
+
+        Args:
+            columns: columns to read.
+            chunk_size: number of rows of every chunk.
+            reverse: iterate from the last chunk.
+            start: first row.
+            end: last row (excluded), None for the last row of the partition.
+
+        Yields:
+            Start and end row of every chunk with the values of its columns.
+        """
+        dataset = self.original
+        end = self._row_count if end is None else end
+        if start != 0 or end != self._row_count:
+            dataset = dataset.slice(start, end)
+
+        yield from dataset.chunk_iterator(
+            columns, chunk_size=chunk_size, reverse=reverse
+        )
+
+    def is_masked(self: "LazyPartitionDataset", column: str) -> bool:
+        """Check if a column has missing values.
+
+        Args:
+            column: name of the column.
 
-def read_dataframe_from_file(path: str) -> Optional[vaex.dataframe.DataFrame]:
+        Returns:
+            Return True if the column is masked.
+        """
+        return self.original.is_masked(column)
+
+    def shape(self: "LazyPartitionDataset", column: str) -> Tuple[int, ...]:
+        """Shape of one value of a column.
+
+        Args:
+            column: name of the column.
+
+        Returns:
+            Return the shape.
+        """
+        return self._shapes[column]
+
+    def slice(
+        self: "LazyPartitionDataset", start: int, end: int
+    ) -> vaex.dataset.Dataset:
+        """Select rows of the partition without opening it.
+
+        Args:
+            start: first row.
+            end: last row (excluded).
+
+        Returns:
+            Return the sliced dataset.
+        """
+        if start == 0 and end == self._row_count:
+            return self
+
+        return vaex.dataset.DatasetSliced(self, start, end)
+
+    def hashed(self: "LazyPartitionDataset") -> "LazyPartitionDataset":
+        """Partitions are identified by their checksum instead of their values.
+
+        Returns:
+            Return the partition itself.
+        """
+        return self
+
+    def leafs(self: "LazyPartitionDataset") -> List[vaex.dataset.Dataset]:
+        """Datasets this dataset is made of.
+
+        Returns:
+            Return the partition itself.
+        """
+        return [self]
+
+    def close(self: "LazyPartitionDataset") -> None:
+        """Close the partition file if it was opened."""
+        if self._original is not None:
+            self._original.close()
+            self._original = None
+
+
+def read_dataset(
+    path: str,
+    partition_filter: Optional[Callable[[PartitionEntry], bool]] = None,
+    columns: Optional[List[str]] = None,
+) -> vaex.dataframe.DataFrame:
+    """Read a partitioned dataset present in data/processed using its manifest.
+
+    Only the manifest and the first selected partition are read, the other
+    partitions are opened when their rows are first accessed, so opening a
+    dataset doesn't depend on the number of partitions it has. Partitions
+    can be pruned using the manifest entries without touching the files.
+    Rows marked as deleted in the manifest are skipped.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+        partition_filter: return False for partitions which should be skipped.
+        columns: columns to read, None to read every column.
+
+    Returns:
+        vaex dataframe.
+
+    Raises:
+        OSError: if the dataset has no manifest or no partition is selected.
+    """
+    manifest = read_dataset_manifest(path)
+    if manifest is None:
+        raise OSError(f"Dataset {path} has no manifest")
+
+    dataset_path = get_dataset_path(path)
+    entries = [
+        entry
+        for entry in manifest["partitions"]
+        if entry["rows"] > len(entry["meta"].get("deleted", []))
+        and (partition_filter is None or partition_filter(entry))
+    ]
+
+    if len(entries) == 0:
+        raise OSError(f"No partition selected from dataset {path}")
+
+    df = open_dataframe_file(os.path.join(dataset_path, entries[0]["name"]), columns)
+    template = get_column_dataset(df)
+
+    datasets = []
+    for i, entry in enumerate(entries):
+        dataset = (
+            template
+            if i == 0
+            else LazyPartitionDataset(
+                os.path.join(dataset_path, entry["name"]), entry, template, columns
+            )
+        )
+
+        # Skip rows deleted with add_tombstones_to_manifest.
+        deleted = entry["meta"].get("deleted", [])
+        if len(deleted) > 0:
+            dataset = dataset.take(np.setdiff1d(np.arange(entry["rows"]), deleted))
+        datasets.append(dataset)
+
+    return concat_datasets(datasets)
+
+
+def list_dataset_files(path: str) -> List[Tuple[str, List[int]]]:
+    """List files of a partitioned dataset or of a single file dataframe.
+
+    Args:
+        path: path of the dataset relative to data/processed.
+
+    Returns:
+        Return absolute path of every file and its rows marked as deleted.
+
+    Raises:
+        OSError: if there is neither a manifest nor a file at path.
+    """
+    manifest = read_dataset_manifest(path)
+    dataset_path = get_dataset_path(path)
+    if manifest is None:
+        return [(find_dataframe_file(dataset_path), [])]
+
+    return [
+        (os.path.join(dataset_path, entry["name"]), entry["meta"].get("deleted", []))
+        for entry in manifest["partitions"]
+    ]
+
+
+def count_record_batches(file_path: str) -> List[int]:
+    """Count rows of every record batch of a file without reading the data.
+
+    Row groups of parquet files are their record batches. Arrow files written
+    as a stream have no index of their batches, so they count as one.
+
+    Args:
+        file_path: absolute path of an arrow, feather or parquet file.
+
+    Returns:
+        Return rows of every record batch.
+    """
+    if file_path.endswith(STORAGE_FORMATS["parquet"]):
+        metadata = pq.ParquetFile(file_path).metadata
+        return [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+
+    source = pa.memory_map(file_path)
+    try:
+        # Record batches without columns only hold their number of rows.
+        reader = open_arrow_file(source, [])
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return [len(pa.ipc.open_stream(source).read_all())]
+
+    return [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+
+
+def read_record_batch(
+    file_path: str, index: int, columns: Optional[List[str]] = None
+) -> pa.Table:
+    """Read one record batch of a file, see count_record_batches.
+
+    Arrow and feather files are memory mapped, so only the buffers of the
+    requested columns are read and decompressed.
+
+    Args:
+        file_path: absolute path of an arrow, feather or parquet file.
+        index: record batch to read.
+        columns: columns to read, None to read every column.
+
+    Returns:
+        Return the record batch as arrow table.
+    """
+    if file_path.endswith(STORAGE_FORMATS["parquet"]):
+        return pq.ParquetFile(file_path).read_row_group(index, columns=columns)
+
+    source = pa.memory_map(file_path)
+    try:
+        batch = open_arrow_file(source, columns).get_batch(index)
+        table = pa.Table.from_batches([batch])
+    except pa.ArrowInvalid:
+        source.seek(0)
+        table = pa.ipc.open_stream(source).read_all()
+
+    return table if columns is None else table.select(columns)
+
+
+def read_dataframe_from_file(
+    path: str, columns: Optional[List[str]] = None
+) -> Optional[vaex.dataframe.DataFrame]:
     """Only read dataframe present in data/processed.
 
     Args:
-        path: path relative to data/processed.
+        path: path relative to data/processed, without extension.
+        columns: columns to read, None to read every column.
 
     Returns:
         vaex dataframe.
     """
     path_to_processed_data = os.path.join(get_base_data_path(), "processed", path)
-    file_path = f"{path_to_processed_data}.arrow"
-
-    if not os.path.exists(file_path):
-        raise OSError
 
-    else:
-        return vaex.open(file_path)
+    return open_dataframe_file(find_dataframe_file(path_to_processed_data), columns)
 
 
-def read_dataframes_from_file(path_list: str) -> Optional[vaex.dataframe.DataFrame]:
+def read_dataframes_from_file(
+    path_list: List[str], columns: Optional[List[str]] = None
+) -> Optional[vaex.dataframe.DataFrame]:
     """Only read dataframe present in data/processed.
 
+    A path can either point to a partitioned dataset directory having a
+    manifest or to an arrow, feather or parquet file (without extension). A
+    dataset takes precedence over a file with the same name. Datasets are
+    read with read_dataset, so their partitions are opened lazily and rows
+    marked as deleted are skipped.
+
     Args:
         path_list: list of path relative to data/processed.
+        columns: columns to read, None to read every column.
 
     Returns:
         vaex dataframe.
@@ -102,14 +1359,112 @@ def read_dataframes_from_file(path_list: str) -> Optional[vaex.dataframe.DataFra
     base_path = os.path.join(get_base_data_path(), "processed")
 
     file_path_list: List[str] = []
+    dataframes: List[vaex.dataframe.DataFrame] = []
 
     for path in path_list:
-        file_path = os.path.join(base_path, f"{path}.arrow")
-        if not os.path.exists(file_path):
-            raise OSError
-        file_path_list.append(file_path)
+        manifest = read_dataset_manifest(path)
+        if manifest is None:
+            file_path_list.append(find_dataframe_file(os.path.join(base_path, path)))
+            continue
+
+        # Files read so far are opened first to keep the order of rows.
+        if len(file_path_list) > 0:
+            dataframes.append(open_dataframe_files(file_path_list, columns))
+            file_path_list = []
+        dataframes.append(read_dataset(path, columns=columns))
+
+    if len(file_path_list) > 0:
+        dataframes.append(open_dataframe_files(file_path_list, columns))
+
+    return concat_datasets([df.dataset for df in dataframes])
+
 
-    return vaex.open_many(file_path_list)
+def describe_dataframe_source(path: str) -> List[Dict[str, Any]]:
+    """Describe the files a dataframe is read from by read_dataframes_from_file.
+
+    Partitions of a dataset are described by their manifest entry and their
+    deleted rows. A single file is described by its size and modification
+    time, it isn't checksummed to not read it whole.
+
+    Args:
+        path: path relative to data/processed.
+
+    Returns:
+        Return one json serializable description per file, equal for two
+        calls as long as the rows of the dataframe are unchanged.
+    """
+    manifest = read_dataset_manifest(path)
+    if manifest is None:
+        file_path = find_dataframe_file(
+            os.path.join(get_base_data_path(), "processed", path)
+        )
+        stat = os.stat(file_path)
+        return [
+            {
+                "name": os.path.basename(file_path),
+                "bytes": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+        ]
+
+    return [
+        {
+            "name": entry["name"],
+            "rows": entry["rows"],
+            "bytes": entry["bytes"],
+            "checksum": entry["checksum"],
+            "deleted": sorted(entry["meta"].get("deleted", [])),
+        }
+        for entry in manifest["partitions"]
+    ]
+
+
+def block_shuffle_indices(
+    length: int,
+    block_size: int = 64,
+    window_size: int = 1024,
+    random_state: Optional[int] = 32,
+) -> np.ndarray:
+    """Compute an I/O friendly permutation of row indices.
+
+    Rows are grouped in contiguous blocks of block_size rows and the order of
+    the blocks is shuffled. Rows are then shuffled inside consecutive windows
+    of window_size rows. Reading rows in this order touches at most
+    window_size / block_size contiguous regions at a time, so reads of memory
+    mapped files stay mostly sequential.
+
+    Args:
+        length: number of rows.
+        block_size: number of contiguous rows moved together.
+        window_size: number of rows shuffled together.
+        random_state: seed for reproducibility.
+
+    Returns:
+        Return the permuted row indices.
+
+    Raises:
+        ValueError: if block_size or window_size is not positive.
+    """
+    if block_size <= 0 or window_size <= 0:
+        raise ValueError("block_size and window_size must be positive")
+
+    rng = np.random.default_rng(random_state)
+
+    num_blocks = -(-length // block_size)
+    block_order = rng.permutation(num_blocks)
+
+    # Start of every row's block after permuting blocks, plus offset in block.
+    block_starts = block_order * block_size
+    block_lengths = np.minimum(block_size, length - block_starts)
+    offsets = np.arange(length) - np.repeat(
+        np.cumsum(block_lengths) - block_lengths, block_lengths
+    )
+    indices = np.repeat(block_starts, block_lengths) + offsets
+
+    # Sorting on window number plus a random fraction shuffles every window.
+    window_keys = np.arange(length) // window_size + rng.random(length)
+
+    return indices[np.argsort(window_keys, kind="stable")]
 
 
 def shuffle_dataframe(
@@ -117,13 +1472,61 @@ def shuffle_dataframe(
     frac: float = 1.0,
     replace: bool = False,
     random_state: int = 32,
+    block_size: Optional[int] = None,
+    window_size: int = 1024,
 ) -> vaex.dataframe.DataFrame:
     """Shuffle the given dataframe.
 
+    If block_size is given, rows are shuffled with block_shuffle_indices
+    instead of a full random permutation.
+
     Args:
         df: vaex dataframe which has to be shuffled.
         frac: fractional number of takes to take
         replace: If true, a row may be drawn multiple times
         random_state: seed or RandomState for reproducibility
+        block_size: number of contiguous rows moved together.
+        window_size: number of rows shuffled together in block mode.
+
+    Returns:
+        Return the shuffled dataframe.
+
+    Raises:
+        ValueError: if replace is used together with block_size.
     """
-    return df.sample(frac=frac, replace=replace, random_state=random_state)
+    if block_size is None:
+        return df.sample(frac=frac, replace=replace, random_state=random_state)
+
+    if replace:
+        raise ValueError("Block shuffle can't draw a row multiple times")
+
+    indices = block_shuffle_indices(len(df), block_size, window_size, random_state)
+    return df.take(indices[: int(round(frac * len(df)))])
+
+
+def split_dataframe(
+    df: vaex.dataframe.DataFrame,
+    frac: List[float],
+    random_state: int = 32,
+    block_size: int = 64,
+    window_size: int = 1024,
+) -> List[vaex.dataframe.DataFrame]:
+    """Split the given dataframe in random parts using block shuffle.
+
+    Works like split_random of vaex but rows are ordered with
+    block_shuffle_indices, so every part is read mostly sequentially.
+
+    Args:
+        df: vaex dataframe which has to be split.
+        frac: fraction of rows in every part.
+        random_state: seed for reproducibility.
+        block_size: number of contiguous rows moved together.
+        window_size: number of rows shuffled together.
+
+    Returns:
+        Return list of dataframes.
+    """
+    indices = block_shuffle_indices(len(df), block_size, window_size, random_state)
+    bounds = np.round(np.cumsum([0.0, *frac]) / sum(frac) * len(df)).astype(int)
+
+    return [df.take(indices[start:end]) for start, end in zip(bounds, bounds[1:])]
@@ -0,0 +1,384 @@
+"""Residue contact features computed with a cell list."""
+
+import itertools
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import vaex
+
+from anu.data.dataframe_operation import (
+    read_dataset,
+    read_dataset_manifest,
+    remove_partitions_from_manifest,
+    save_dataframe_partition,
+)
+
+# Offsets of a cell and its 26 neighbours.
+NEIGHBOUR_CELLS = np.array(list(itertools.product([-1, 0, 1], repeat=3)))
+
+
+def cell_list_pairs(
+    coords: np.ndarray, radius: float, groups: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find every pair of points closer than radius.
+
+    Points are binned in cubic cells of side radius, so only points of the
+    same or of neighbouring cells are compared. Points of different groups
+    (e.g. proteins of one batch) are never paired. Cost is linear in the
+    number of points and of close pairs instead of quadratic.
+
+    Args:
+        coords: points of shape (points, 3).
+        radius: distance cutoff.
+        groups: group of every point, all points are in one group if None.
+
+    Returns:
+        Return indices i < j of the pairs.
+    """
+    n = len(coords)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    groups = np.zeros(n, dtype=np.int64) if groups is None else groups
+    cells = np.floor(coords / radius).astype(np.int64)
+    # One empty cell of margin, so neighbour cells never wrap around.
+    cells = cells - cells.min(axis=0) + 1
+    dims = cells.max(axis=0) + 2
+
+    def pack(cell: np.ndarray) -> np.ndarray:
+        key = (groups * dims[0] + cell[:, 0]) * dims[1] + cell[:, 1]
+        return key * dims[2] + cell[:, 2]
+
+    keys = pack(cells)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    first: List[np.ndarray] = []
+    second: List[np.ndarray] = []
+    for offset in NEIGHBOUR_CELLS:
+        neighbour_keys = pack(cells + offset)
+        low = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+        high = np.searchsorted(sorted_keys, neighbour_keys, side="right")
+
+        counts = high - low
+        i = np.repeat(np.arange(n), counts)
+        starts = np.repeat(low - np.cumsum(counts) + counts, counts)
+        j = order[starts + np.arange(len(i))]
+
+        keep = i < j
+        i, j = i[keep], j[keep]
+        close = ((coords[i] - coords[j]) ** 2).sum(axis=1) <= radius**2
+        first.append(i[close])
+        second.append(j[close])
+
+    return np.concatenate(first), np.concatenate(second)
+
+
+def pairs_to_csr(
+    first: np.ndarray, second: np.ndarray, size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Build symmetric CSR adjacency from pairs.
+
+    Args:
+        first: first point of every pair.
+        second: second point of every pair.
+        size: number of points.
+
+    Returns:
+        Return offsets of shape (size + 1,) and neighbour indices. Neighbours
+        of point i are indices[offsets[i] : offsets[i + 1]], sorted.
+    """
+    rows = np.concatenate([first, second])
+    cols = np.concatenate([second, first])
+    order = np.lexsort((cols, rows))
+
+    counts = np.bincount(rows, minlength=size)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+
+    return offsets, cols[order]
+
+
+def residue_contacts(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, seq: np.ndarray, radius: float = 8.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute contact map of one protein of the input dataframe.
+
+    Args:
+        x: x position of every residue.
+        y: y position of every residue.
+        z: z position of every residue.
+        seq: amino acid codes, positions with 0 are padding.
+        radius: distance cutoff in angstrom.
+
+    Returns:
+        Return CSR offsets and neighbour indices over all positions.
+    """
+    valid = np.flatnonzero(np.asarray(seq) > 0)
+    coords = np.stack([x, y, z], axis=1)[valid].astype(np.float32)
+
+    i, j = cell_list_pairs(coords, radius)
+    return pairs_to_csr(valid[i], valid[j], len(seq))
+
+
+def neighbour_counts(offsets: np.ndarray) -> np.ndarray:
+    """Return number of neighbours of every residue from CSR offsets."""
+    return np.diff(offsets)
+
+
+def densify_contacts(
+    offsets: np.ndarray, indices: np.ndarray, size: Optional[int] = None
+) -> np.ndarray:
+    """Expand CSR contacts to a dense contact map.
+
+    Args:
+        offsets: CSR offsets.
+        indices: CSR neighbour indices.
+        size: side of the map, number of positions if None.
+
+    Returns:
+        Return uint8 matrix with 1 for residues in contact.
+    """
+    size = len(offsets) - 1 if size is None else size
+    dense = np.zeros((size, size), dtype=np.uint8)
+
+    rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keep = (rows < size) & (indices < size)
+    dense[rows[keep], indices[keep]] = 1
+
+    return dense
+
+
+CONTACT_TYPES = {
+    "contact_offsets": pa.list_(pa.int32()),
+    "contact_index": pa.list_(pa.int32()),
+    "neighbour_count": pa.list_(pa.int16()),
+}
+
+
+def contact_batches(
+    df: vaex.dataframe.DataFrame,
+    radius: float = 8.0,
+    batch_rows: int = 256,
+    id_columns: Optional[List[str]] = None,
+) -> Iterator[pa.Table]:
+    """Compute sparse contact features of both proteins, batch by batch.
+
+    Only one batch of rows is held in memory at a time.
+
+    Args:
+        df: input dataframe.
+        radius: distance cutoff in angstrom.
+        batch_rows: rows read at once.
+        id_columns: columns of df holding ids of protein A and protein B,
+            copied to every batch so contacts are found by pair.
+
+    Yields:
+        Arrow table of batch_rows rows of df. For protein A and protein B it
+        has CSR contact offsets and indices and neighbour counts columns.
+    """
+    for start in range(0, len(df), batch_rows):
+        columns = {}
+        if id_columns is not None:
+            ids = df[start : start + batch_rows].to_arrow_table(column_names=id_columns)
+            columns = dict(zip(id_columns, ids.columns))
+
+        for protein in ["A", "B"]:
+            names = [f"protein{protein}_{axis}" for axis in ["x", "y", "z", "seq"]]
+            table = df[start : start + batch_rows].to_arrow_table(column_names=names)
+
+            # Rows have different lengths when proteins are not padded.
+            values = []
+            for column in table:
+                array = column.combine_chunks()
+                row_offsets = array.offsets.to_numpy()
+                values.append(
+                    np.split(
+                        array.flatten().to_numpy(), row_offsets[1:-1] - row_offsets[0]
+                    )
+                )
+
+            offsets, indices, counts = [], [], []
+            for x, y, z, seq in zip(*values):
+                row_offsets, row_indices = residue_contacts(x, y, z, seq, radius)
+                offsets.append(row_offsets)
+                indices.append(row_indices.astype(np.int32))
+                counts.append(neighbour_counts(row_offsets).astype(np.int16))
+
+            for name, arrays in zip(CONTACT_TYPES, [offsets, indices, counts]):
+                columns[f"protein{protein}_{name}"] = pa.array(
+                    arrays, type=CONTACT_TYPES[name]
+                )
+
+        yield pa.table(columns)
+
+
+def contact_features(
+    df: vaex.dataframe.DataFrame, radius: float = 8.0, batch_rows: int = 256
+) -> vaex.dataframe.DataFrame:
+    """Compute sparse contact features of both proteins of every row.
+
+    Contacts of every row are held in memory, use save_contact_features for
+    whole input dataframes.
+
+    Args:
+        df: input dataframe.
+        radius: distance cutoff in angstrom.
+        batch_rows: rows read at once.
+
+    Returns:
+        Return dataframe aligned with df, see contact_batches.
+    """
+    tables = list(contact_batches(df, radius, batch_rows))
+    if len(tables) == 0:
+        return vaex.from_arrays(
+            **{
+                f"protein{protein}_{name}": pa.array([], type=type_)
+                for protein in ["A", "B"]
+                for name, type_ in CONTACT_TYPES.items()
+            }
+        )
+
+    return vaex.from_arrow_table(pa.concat_tables(tables).combine_chunks())
+
+
+def save_contact_features(
+    df: vaex.dataframe.DataFrame,
+    path: str,
+    radius: float = 8.0,
+    batch_rows: int = 256,
+    id_columns: Optional[List[str]] = None,
+) -> bool:
+    """Compute contact features and save every batch as a dataset partition.
+
+    Partitions of a previous run are removed from the manifest first. Rows
+    keep the ids of their pair, see ContactMaps.
+
+    Args:
+        df: input dataframe with protein id columns.
+        path: path of the contacts dataset relative to data/processed.
+        radius: distance cutoff in angstrom.
+        batch_rows: rows of every partition.
+        id_columns: columns of df holding ids of protein A and protein B.
+
+    Returns:
+        True if every partition is saved.
+    """
+    id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+
+    manifest = read_dataset_manifest(path)
+    if manifest is not None:
+        remove_partitions_from_manifest(
+            path, [entry["name"] for entry in manifest["partitions"]]
+        )
+
+    batches = contact_batches(df, radius, batch_rows, id_columns)
+    for i, table in enumerate(batches):
+        if not save_dataframe_partition(
+            vaex.from_arrow_table(table), path, f"part-{i:05d}", {"index": i}
+        ):
+            return False
+
+    return True
+
+
+class ContactMaps:
+    """Contact maps of the pairs of a contacts dataset, densified on demand.
+
+    Only the pair ids are read when opening, sorted for binary search. CSR
+    contacts of a pair are read when its maps are requested.
+    """
+
+    def __init__(
+        self: "ContactMaps", path: str, id_columns: Optional[List[str]] = None
+    ) -> None:
+        """Initialize contact maps.
+
+        Args:
+            path: path of the contacts dataset relative to data/processed,
+                see save_contact_features.
+            id_columns: columns holding ids of protein A and protein B.
+        """
+        self.path = path
+        self.id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+        self._df: Optional[vaex.dataframe.DataFrame] = None
+        self._keys: Optional[np.ndarray] = None
+        self._rows: Optional[np.ndarray] = None
+
+    def open(self: "ContactMaps") -> vaex.dataframe.DataFrame:
+        """Open the contacts dataset and index its pairs, once."""
+        if self._df is None:
+            self._df = read_dataset(self.path)
+            ids = self._df.to_arrow_table(column_names=self.id_columns)
+            keys = pc.binary_join_element_wise(ids.column(0), ids.column(1), "\t")
+            keys = np.asarray(keys.to_pylist(), dtype=str)
+            self._rows = np.argsort(keys, kind="stable")
+            self._keys = keys[self._rows]
+        return self._df
+
+    def __getstate__(self: "ContactMaps") -> Dict[str, Any]:
+        """Pickle the path only, workers open the dataset again."""
+        state = dict(self.__dict__)
+        state.update(_df=None, _keys=None, _rows=None)
+        return state
+
+    def find(self: "ContactMaps", protein_a: str, protein_b: str) -> Optional[int]:
+        """Return row of the pair in the contacts dataset, None if missing."""
+        self.open()
+        key = f"{protein_a}\t{protein_b}"
+        i = int(np.searchsorted(self._keys, key))
+        if i < len(self._keys) and self._keys[i] == key:
+            return int(self._rows[i])
+        return None
+
+    def __call__(
+        self: "ContactMaps", protein_a: str, protein_b: str, size: int
+    ) -> np.ndarray:
+        """Densify contact maps of both proteins of a pair.
+
+        Args:
+            protein_a: id of protein A.
+            protein_b: id of protein B.
+            size: side of every map, residues past size are dropped.
+
+        Returns:
+            Return uint8 maps of shape (2, size, size).
+
+        Raises:
+            KeyError: if the pair has no contacts.
+        """
+        row = self.find(protein_a, protein_b)
+        if row is None:
+            raise KeyError(f"No contacts of {protein_a}, {protein_b}")
+
+        return np.stack(
+            [row_contact_map(self.open(), row, protein, size) for protein in "AB"]
+        )
+
+
+def row_contact_map(
+    df: vaex.dataframe.DataFrame, row: int, protein: str, size: Optional[int] = None
+) -> np.ndarray:
+    """Densify contact map of one protein of a contact features dataframe.
+
+    Args:
+        df: dataframe returned by contact_features.
+        row: row of df.
+        protein: A or B.
+        size: side of the map, number of positions if None.
+
+    Returns:
+        Return uint8 contact map.
+    """
+    table = df[row : row + 1].to_arrow_table(
+        column_names=[
+            f"protein{protein}_contact_offsets",
+            f"protein{protein}_contact_index",
+        ]
+    )
+    offsets, indices = [
+        column.combine_chunks().flatten().to_numpy() for column in table
+    ]
+
+    return densify_contacts(offsets, indices, size)
@@ -0,0 +1,277 @@
+"""MinHash signatures and LSH clustering of protein sequences."""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import vaex
+
+from anu.constants.amino_acid import AminoAcidToInt
+
+# Mersenne prime used by the universal hash functions.
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def encode_kmers(seqs: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode every k-mer of integer coded sequences as one integer.
+
+    Args:
+        seqs: sequences of shape (proteins, residues). 0 marks padding and
+            non amino acid residues.
+        k: length of k-mers.
+
+    Returns:
+        Return k-mer codes of shape (proteins, residues - k + 1) and a mask
+        which is False for k-mers touching padding.
+    """
+    base = len(AminoAcidToInt) + 1
+    width = seqs.shape[1] - k + 1
+
+    kmers = np.zeros((seqs.shape[0], width), dtype=np.uint64)
+    valid = np.ones((seqs.shape[0], width), dtype=bool)
+
+    for i in range(k):
+        window = seqs[:, i : i + width]
+        kmers = kmers * np.uint64(base) + window.astype(np.uint64)
+        valid &= window > 0
+
+    return kmers, valid
+
+
+def pad_sequences(seqs: Sequence[np.ndarray]) -> np.ndarray:
+    """Pad sequences of different lengths with 0 to the longest one.
+
+    Args:
+        seqs: integer coded sequences.
+
+    Returns:
+        Return uint8 array of shape (proteins, residues).
+    """
+    lengths = [len(seq) for seq in seqs]
+    padded = np.zeros((len(seqs), max(lengths, default=0)), dtype=np.uint8)
+    for row, seq in enumerate(seqs):
+        padded[row, : len(seq)] = seq
+
+    return padded
+
+
+def minhash_signatures(
+    seqs: Sequence[np.ndarray],
+    k: int = 3,
+    num_perm: int = 64,
+    random_state: int = 1,
+    batch_size: int = 16,
+) -> np.ndarray:
+    """Compute MinHash signatures of the k-mer sets of sequences.
+
+    Args:
+        seqs: integer coded sequences, of shape (proteins, residues) or of
+            different lengths.
+        k: length of k-mers.
+        num_perm: number of hash functions.
+        random_state: seed of the hash functions.
+        batch_size: sequences hashed at once, bounds memory.
+
+    Returns:
+        Return signatures of shape (proteins, num_perm). Sequences without
+        any k-mer get MAX_HASH everywhere.
+    """
+    rng = np.random.default_rng(random_state)
+    a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(seqs), num_perm), dtype=np.uint64)
+
+    for start in range(0, len(seqs), batch_size):
+        batch = pad_sequences(seqs[start : start + batch_size])
+
+        # Padding at the end carries no k-mer, don't hash it.
+        used = np.flatnonzero(batch.any(axis=0))
+        batch = batch[:, : max(used[-1] + 1 if len(used) > 0 else 0, k)]
+
+        kmers, valid = encode_kmers(batch, k)
+
+        # (batch, kmers, num_perm) hashes, padding is pushed to MAX_HASH.
+        hashes = (kmers[:, :, None] * a + b) % MERSENNE_PRIME & MAX_HASH
+        hashes[~valid] = MAX_HASH
+        signatures[start : start + batch_size] = hashes.min(axis=1)
+
+    return signatures
+
+
+def connected_components(num_nodes: int, edges: np.ndarray) -> np.ndarray:
+    """Label connected components of an undirected graph.
+
+    Args:
+        num_nodes: number of nodes.
+        edges: array of shape (edges, 2).
+
+    Returns:
+        Return for every node the smallest node of its component.
+    """
+    parent = np.arange(num_nodes)
+    if len(edges) == 0:
+        return parent
+
+    u, v = edges[:, 0], edges[:, 1]
+
+    while True:
+        pu, pv = parent[u], parent[v]
+        if np.array_equal(pu, pv):
+            return parent
+
+        low = np.minimum(pu, pv)
+        np.minimum.at(parent, pu, low)
+        np.minimum.at(parent, pv, low)
+
+        # Pointer jumping until every node points to its root.
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def lsh_clusters(
+    signatures: np.ndarray, bands: int = 16, threshold: float = 0.5
+) -> np.ndarray:
+    """Cluster signatures with LSH banding.
+
+    Signatures sharing a bucket in any band are candidates. Candidates are
+    linked if their estimated Jaccard similarity is at least threshold, and
+    clusters are the connected components of the links.
+
+    Args:
+        signatures: MinHash signatures of shape (proteins, num_perm).
+        bands: number of bands, must divide num_perm.
+        threshold: minimum estimated Jaccard similarity of linked proteins.
+
+    Returns:
+        Return cluster label of every protein.
+
+    Raises:
+        ValueError: if bands doesn't divide num_perm.
+    """
+    num_proteins, num_perm = signatures.shape
+    if num_perm % bands != 0:
+        raise ValueError("bands must divide the number of hash functions")
+
+    rows = num_perm // bands
+    # Proteins without k-mers would all share buckets, keep them alone.
+    has_kmers = np.flatnonzero((signatures != MAX_HASH).any(axis=1))
+    multiplier = np.uint64(0x9E3779B97F4A7C15)
+
+    edges: List[np.ndarray] = [np.empty((0, 2), dtype=np.int64)]
+
+    for band in range(bands):
+        band_values = signatures[has_kmers, band * rows : (band + 1) * rows]
+        keys = np.zeros(len(has_kmers), dtype=np.uint64)
+        for column in band_values.T:
+            keys = keys * multiplier + column
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        same = sorted_keys[1:] == sorted_keys[:-1]
+
+        # Link every protein to the previous protein in its bucket.
+        edges.append(
+            np.stack([has_kmers[order[1:][same]], has_kmers[order[:-1][same]]], 1)
+        )
+
+    candidates = np.unique(np.concatenate(edges), axis=0)
+    if len(candidates) > 0:
+        similarity = (
+            signatures[candidates[:, 0]] == signatures[candidates[:, 1]]
+        ).mean(axis=1)
+        candidates = candidates[similarity >= threshold]
+
+    return connected_components(num_proteins, candidates)
+
+
+def unique_protein_sequences(
+    df: vaex.dataframe.DataFrame,
+    id_columns: List[str],
+    seq_columns: List[str],
+    batch_rows: int = 4096,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Collect the sequence of every distinct protein of an input dataframe.
+
+    Args:
+        df: input dataframe.
+        id_columns: columns holding ids of protein A and protein B.
+        seq_columns: columns holding sequences of protein A and protein B.
+        batch_rows: rows read at once.
+
+    Returns:
+        Return sorted protein ids and their uint8 sequences, which have
+        different lengths when proteins are not padded.
+    """
+    ids: List[np.ndarray] = []
+    seqs: List[np.ndarray] = []
+    seen = np.empty(0, dtype=str)
+
+    for start in range(0, len(df), batch_rows):
+        table = df[start : start + batch_rows].to_arrow_table(
+            column_names=id_columns + seq_columns
+        )
+
+        for id_column, seq_column in zip(id_columns, seq_columns):
+            batch_ids = np.asarray(
+                table[id_column].to_numpy(zero_copy_only=False), dtype=str
+            )
+            batch_ids, first = np.unique(batch_ids, return_index=True)
+            new = ~np.isin(batch_ids, seen)
+            if not new.any():
+                continue
+
+            seq = table[seq_column].combine_chunks().take(pa.array(first[new]))
+            offsets = seq.offsets.to_numpy()
+            ids.append(batch_ids[new])
+            seqs.extend(
+                np.split(
+                    np.asarray(seq.flatten().to_numpy(), dtype=np.uint8),
+                    offsets[1:-1] - offsets[0],
+                )
+            )
+            seen = np.union1d(seen, batch_ids[new])
+
+    if len(ids) == 0:
+        return np.empty(0, dtype=str), []
+
+    ids_array = np.concatenate(ids)
+    order = np.argsort(ids_array)
+
+    return ids_array[order], [seqs[i] for i in order]
+
+
+def cluster_proteins(
+    df: vaex.dataframe.DataFrame,
+    id_columns: List[str],
+    seq_columns: List[str],
+    k: int = 3,
+    num_perm: int = 64,
+    bands: int = 16,
+    threshold: float = 0.5,
+    random_state: Optional[int] = 1,
+) -> vaex.dataframe.DataFrame:
+    """Cluster proteins of an input dataframe by sequence similarity.
+
+    Args:
+        df: input dataframe.
+        id_columns: columns holding ids of protein A and protein B.
+        seq_columns: columns holding sequences of protein A and protein B.
+        k: length of k-mers.
+        num_perm: number of hash functions.
+        bands: number of LSH bands.
+        threshold: minimum estimated Jaccard similarity of linked proteins.
+        random_state: seed of the hash functions.
+
+    Returns:
+        Return dataframe with protein_id and cluster columns, sorted by id.
+    """
+    ids, seqs = unique_protein_sequences(df, id_columns, seq_columns)
+    signatures = minhash_signatures(seqs, k, num_perm, random_state)
+    labels = lsh_clusters(signatures, bands, threshold)
+
+    return vaex.from_arrays(protein_id=pa.array(ids), cluster=labels)
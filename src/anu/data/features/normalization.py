@@ -0,0 +1,378 @@
+"""Streaming per channel statistics of the input dataframes."""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Type
+
+import numpy as np
+import vaex
+
+from anu.data.dataframe_operation import get_dataset_path, write_file_atomically
+
+# Channels of the input dataframe, in the order used by the model.
+channel_names = [
+    "seq",
+    "x",
+    "y",
+    "z",
+    "hydropathy",
+    "hydropathy_index",
+    "acidity_basicity",
+    "mass",
+    "isoelectric_point",
+    "charge",
+]
+
+# Channels holding codes or few distinct values, counted value by value.
+CATEGORICAL_CHANNELS = ["seq", "charge"]
+BINS_PER_OCTAVE = 8
+
+STATS_FILENAME = "stats.json"
+
+
+def log_bin_edges(values: np.ndarray, bins_per_octave: int) -> np.ndarray:
+    """Map values to the edge closest to zero of their log spaced bin.
+
+    Bins of the magnitude are [2 ** (i / k) - 1, 2 ** ((i + 1) / k) - 1) for
+    k bins per octave, the same for every dataset, so histograms of two
+    datasets are merged bin by bin. Bins are about 9% wide for k = 8.
+
+    Args:
+        values: values of a channel.
+        bins_per_octave: bins between two powers of two.
+
+    Returns:
+        Return the bin edge of every value, with the sign of the value.
+    """
+    magnitude = np.floor(np.log2(1 + np.abs(values)) * bins_per_octave)
+    return np.sign(values) * (np.exp2(magnitude / bins_per_octave) - 1)
+
+
+class ChannelStats:
+    """Count, mean, variance, min, max and histogram of one channel.
+
+    Statistics of two parts of a dataset can be merged, so they are
+    computed batch by batch in one pass and datasets can be combined later.
+    The histogram counts every distinct value of categorical channels, and
+    values of continuous channels in log spaced bins, see log_bin_edges.
+    """
+
+    def __init__(
+        self: "ChannelStats",
+        count: int = 0,
+        mean: float = 0.0,
+        m2: float = 0.0,
+        minimum: float = np.inf,
+        maximum: float = -np.inf,
+        values: Optional[np.ndarray] = None,
+        counts: Optional[np.ndarray] = None,
+        bins_per_octave: Optional[int] = None,
+    ) -> None:
+        """Initialize channel statistics.
+
+        Args:
+            count: number of values.
+            mean: mean of the values.
+            m2: sum of squared differences from the mean.
+            minimum: smallest value.
+            maximum: largest value.
+            values: sorted distinct values, or bin edges.
+            counts: count of every distinct value or bin.
+            bins_per_octave: bins of the histogram, see log_bin_edges. None
+                if the histogram counts distinct values.
+        """
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+        self.values = np.empty(0) if values is None else values
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+        self.bins_per_octave = bins_per_octave
+
+    @property
+    def variance(self: "ChannelStats") -> float:
+        """Return population variance of the values."""
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self: "ChannelStats") -> float:
+        """Return population standard deviation of the values."""
+        return float(np.sqrt(self.variance))
+
+    @classmethod
+    def from_values(
+        cls: "Type[ChannelStats]",
+        values: np.ndarray,
+        bins_per_octave: Optional[int] = None,
+    ) -> "ChannelStats":
+        """Compute statistics of an array of values.
+
+        Args:
+            values: values of a channel.
+            bins_per_octave: bins of the histogram, see log_bin_edges. None
+                to count every distinct value.
+
+        Returns:
+            Return the statistics.
+        """
+        if len(values) == 0:
+            return cls(bins_per_octave=bins_per_octave)
+
+        values = values.astype(np.float64)
+        binned = (
+            values
+            if bins_per_octave is None
+            else log_bin_edges(values, bins_per_octave)
+        )
+        distinct, counts = np.unique(binned, return_counts=True)
+        mean = float(values.mean())
+
+        return cls(
+            len(values),
+            mean,
+            float(((values - mean) ** 2).sum()),
+            float(values.min()),
+            float(values.max()),
+            distinct,
+            counts,
+            bins_per_octave,
+        )
+
+    def rebin(self: "ChannelStats", bins_per_octave: int) -> "ChannelStats":
+        """Return statistics whose histogram counts distinct values in bins.
+
+        Args:
+            bins_per_octave: bins of the histogram, see log_bin_edges.
+
+        Returns:
+            Return the statistics with a binned histogram.
+
+        Raises:
+            ValueError: if the histogram is already binned differently.
+        """
+        if self.bins_per_octave == bins_per_octave:
+            return self
+        if self.bins_per_octave is not None:
+            raise ValueError("Histograms have different bins")
+
+        values, inverse = np.unique(
+            log_bin_edges(self.values, bins_per_octave), return_inverse=True
+        )
+        counts = np.bincount(
+            inverse.reshape(-1), weights=self.counts, minlength=len(values)
+        ).astype(np.int64)
+
+        return ChannelStats(
+            self.count,
+            self.mean,
+            self.m2,
+            self.minimum,
+            self.maximum,
+            values,
+            counts,
+            bins_per_octave,
+        )
+
+    def merge(self: "ChannelStats", other: "ChannelStats") -> "ChannelStats":
+        """Combine statistics of two disjoint sets of values.
+
+        Histograms counting distinct values are binned like the histogram
+        of the other values if it is binned, e.g. when loading statistics
+        saved before continuous channels were binned.
+
+        Args:
+            other: statistics of the other values.
+
+        Returns:
+            Return statistics of all the values.
+        """
+        bins_per_octave = self.bins_per_octave or other.bins_per_octave
+        first, second = self, other
+        if bins_per_octave is not None:
+            first, second = self.rebin(bins_per_octave), other.rebin(bins_per_octave)
+
+        count = first.count + second.count
+        if count == 0:
+            return ChannelStats(bins_per_octave=bins_per_octave)
+
+        # Parallel variance update of Chan et al.
+        delta = second.mean - first.mean
+        mean = first.mean + delta * second.count / count
+        m2 = first.m2 + second.m2 + delta**2 * first.count * second.count / count
+
+        values, inverse = np.unique(
+            np.concatenate([first.values, second.values]), return_inverse=True
+        )
+        counts = np.bincount(
+            inverse.reshape(-1),
+            weights=np.concatenate([first.counts, second.counts]),
+            minlength=len(values),
+        ).astype(np.int64)
+
+        return ChannelStats(
+            count,
+            mean,
+            m2,
+            min(first.minimum, second.minimum),
+            max(first.maximum, second.maximum),
+            values,
+            counts,
+            bins_per_octave,
+        )
+
+    def to_dict(self: "ChannelStats") -> Dict[str, Any]:
+        """Return json serializable statistics."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "variance": self.variance,
+            "min": self.minimum,
+            "max": self.maximum,
+            "histogram": {
+                "values": self.values.tolist(),
+                "counts": self.counts.tolist(),
+                "bins_per_octave": self.bins_per_octave,
+            },
+        }
+
+    @classmethod
+    def from_dict(cls: "Type[ChannelStats]", data: Dict[str, Any]) -> "ChannelStats":
+        """Load statistics returned by to_dict."""
+        return cls(
+            data["count"],
+            data["mean"],
+            data["m2"],
+            data["min"],
+            data["max"],
+            np.asarray(data["histogram"]["values"], dtype=np.float64),
+            np.asarray(data["histogram"]["counts"], dtype=np.int64),
+            data["histogram"].get("bins_per_octave"),
+        )
+
+
+def compute_channel_stats(
+    df: vaex.dataframe.DataFrame, batch_rows: int = 64
+) -> Dict[str, ChannelStats]:
+    """Compute statistics of every channel in one pass over an input dataframe.
+
+    Channels of protein A and protein B are pooled. Padded positions, where
+    the sequence is 0, are left out.
+
+    Args:
+        df: input dataframe.
+        batch_rows: rows read at once.
+
+    Returns:
+        Return statistics of every channel.
+    """
+    bins = {
+        name: None if name in CATEGORICAL_CHANNELS else BINS_PER_OCTAVE
+        for name in channel_names
+    }
+    stats = {name: ChannelStats(bins_per_octave=bins[name]) for name in channel_names}
+
+    for start in range(0, len(df), batch_rows):
+        for protein in ["A", "B"]:
+            columns = [f"protein{protein}_{name}" for name in channel_names]
+            table = df[start : start + batch_rows].to_arrow_table(column_names=columns)
+            # Channels of a protein have the same length, so the flat values
+            # of every channel line up even when proteins are not padded.
+            values = [column.combine_chunks().flatten().to_numpy() for column in table]
+
+            mask = values[0] > 0
+            for name, channel in zip(channel_names, values):
+                stats[name] = stats[name].merge(
+                    ChannelStats.from_values(channel[mask], bins[name])
+                )
+
+    return stats
+
+
+def get_stats_path(path: str) -> str:
+    """Return path of the statistics of a dataframe saved next to it.
+
+    Args:
+        path: path of the dataframe relative to data/processed.
+
+    Returns:
+        Return absolute path of the statistics file.
+    """
+    dataset_path = get_dataset_path(path)
+    if os.path.isdir(dataset_path):
+        return os.path.join(dataset_path, STATS_FILENAME)
+    return f"{dataset_path}.{STATS_FILENAME}"
+
+
+def save_channel_stats(stats: Dict[str, ChannelStats], path: str) -> None:
+    """Save statistics next to a dataframe using write_file_atomically.
+
+    Args:
+        stats: statistics of every channel.
+        path: path of the dataframe relative to data/processed.
+    """
+
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "w") as fp:
+            json.dump({name: item.to_dict() for name, item in stats.items()}, fp)
+
+    write_file_atomically(get_stats_path(path), write)
+
+
+def load_channel_stats(paths: List[str]) -> Dict[str, ChannelStats]:
+    """Load and merge statistics of dataframes.
+
+    Args:
+        paths: paths of dataframes relative to data/processed.
+
+    Returns:
+        Return statistics of every channel over all the dataframes.
+
+    Raises:
+        OSError: if statistics of a dataframe are missing.
+    """
+    stats = {name: ChannelStats() for name in channel_names}
+
+    for path in paths:
+        stats_path = get_stats_path(path)
+        if not os.path.exists(stats_path):
+            raise OSError(f"No statistics at {stats_path}")
+
+        with open(stats_path) as fp:
+            data = json.load(fp)
+
+        for name in channel_names:
+            stats[name] = stats[name].merge(ChannelStats.from_dict(data[name]))
+
+    return stats
+
+
+def normalization_parameters(
+    stats: Dict[str, ChannelStats],
+    skip: Optional[List[str]] = None,
+    channels: Optional[List[str]] = None,
+) -> np.ndarray:
+    """Compute shift and scale of every channel.
+
+    Args:
+        stats: statistics of every channel.
+        skip: channels left as they are, seq by default as it holds codes.
+        channels: channels of the model input, every channel if None.
+
+    Returns:
+        Return float32 array of shape (2, channels) with the mean and the
+        inverse standard deviation of every channel.
+    """
+    skip = ["seq"] if skip is None else skip
+    channels = channel_names if channels is None else channels
+    parameters = np.zeros((2, len(channels)), dtype=np.float32)
+
+    for i, name in enumerate(channels):
+        std = stats[name].std
+        if name in skip or std == 0:
+            parameters[:, i] = [0.0, 1.0]
+        else:
+            parameters[:, i] = [stats[name].mean, 1.0 / std]
+
+    return parameters
@@ -0,0 +1,5 @@
+"""Indexes over processed data."""
+
+from .atom_table import AtomTable  # noqa
+from .protein_index import ProteinIndex  # noqa
+from .structure_index import StructureIndex  # noqa
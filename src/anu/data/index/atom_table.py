@@ -0,0 +1,246 @@
+"""Atom level coordinates of the structure cache in arrow file format."""
+
+import os
+from typing import Iterable, Iterator, List, Optional, Type, TypedDict
+
+import numpy as np
+import pyarrow as pa
+from tqdm import tqdm
+
+from anu.constants.atom import atom_name_to_code
+from anu.data.dataframe_operation import get_base_data_path, write_file_atomically
+from anu.data.index.structure_index import get_pdb_path
+from anu.data.parser.pdb_parser import parse_pdb_atoms, THREE_TO_ONE
+
+ATOM_TABLE_SCHEMA = pa.schema(
+    [
+        ("protein_id", pa.string()),
+        ("coords", pa.list_(pa.float32())),
+        ("atom_type", pa.list_(pa.uint8())),
+        ("residue_offsets", pa.list_(pa.int32())),
+    ]
+)
+
+
+class ProteinAtoms(TypedDict):
+    """Atoms of one protein, as views of the memory mapped table."""
+
+    coords: np.ndarray
+    atom_type: np.ndarray
+    residue_offsets: np.ndarray
+
+
+def encode_atom_names(names: np.ndarray) -> np.ndarray:
+    """Encode atom names with the codes of anu.constants.atom.
+
+    Args:
+        names: atom names.
+
+    Returns:
+        Return uint8 codes, 0 for unknown atoms.
+    """
+    return np.fromiter(
+        (atom_name_to_code.get(name, 0) for name in names),
+        dtype=np.uint8,
+        count=len(names),
+    )
+
+
+def build_atom_batches(
+    pdb_paths: Iterable[str], batch_size: int = 256, progress: bool = False
+) -> Iterator[pa.RecordBatch]:
+    """Read pdb files and yield their atoms as record batches.
+
+    Every row holds one protein: flat xyz coordinates, atom type codes and
+    the offsets of the atoms of every residue. Residues are the same as in
+    the structure index and in build_matrix, hetero residues and waters
+    included, but their atoms have type 0.
+
+    Args:
+        pdb_paths: pdb files, the file name without extension is the id.
+        batch_size: proteins in one record batch.
+        progress: show a progress bar.
+
+    Yields:
+        Record batches of ATOM_TABLE_SCHEMA, sorted by protein id.
+    """
+    paths = sorted(
+        pdb_paths, key=lambda path: os.path.splitext(os.path.basename(path))[0]
+    )
+
+    for start in tqdm(
+        range(0, len(paths), batch_size),
+        desc="Storing atoms",
+        leave=False,
+        disable=not progress,
+    ):
+        ids: List[str] = []
+        coords: List[np.ndarray] = []
+        atom_types: List[np.ndarray] = []
+        offsets: List[np.ndarray] = []
+
+        for path in paths[start : start + batch_size]:
+            atoms = parse_pdb_atoms(path, amino_acids_only=False)
+            ids.append(os.path.splitext(os.path.basename(path))[0])
+            coords.append(atoms["coords"].reshape(-1))
+            amino_acid = np.repeat(
+                np.isin(atoms["residue_names"], list(THREE_TO_ONE)),
+                np.diff(atoms["residue_offsets"]),
+            )
+            atom_types.append(encode_atom_names(atoms["atom_names"]) * amino_acid)
+            offsets.append(atoms["residue_offsets"].astype(np.int32))
+
+        yield pa.RecordBatch.from_arrays(
+            [
+                pa.array(ids, type=pa.string()),
+                pa.array(coords, type=pa.list_(pa.float32())),
+                pa.array(atom_types, type=pa.list_(pa.uint8())),
+                pa.array(offsets, type=pa.list_(pa.int32())),
+            ],
+            schema=ATOM_TABLE_SCHEMA,
+        )
+
+
+def write_atom_table(
+    path: str, pdb_paths: Iterable[str], batch_size: int = 256, progress: bool = False
+) -> None:
+    """Write atom table of pdb files using write_file_atomically.
+
+    Batches are written as soon as they are read, so only batch_size
+    proteins are held in memory. Buffers are left uncompressed so that the
+    table can be memory mapped without copies.
+
+    Args:
+        path: final path of the arrow file.
+        pdb_paths: pdb files, the file name without extension is the id.
+        batch_size: proteins in one record batch.
+        progress: show a progress bar.
+    """
+
+    def write(tmp_path: str) -> None:
+        with pa.ipc.new_file(tmp_path, ATOM_TABLE_SCHEMA) as writer:
+            for batch in build_atom_batches(pdb_paths, batch_size, progress):
+                writer.write_batch(batch)
+
+    write_file_atomically(path, write)
+
+
+class AtomTable:
+    """Memory mapped atom table.
+
+    Opening the table reads only the arrow footer, coordinates of a protein
+    are numpy views of the mapped file.
+    """
+
+    def __init__(self: "AtomTable", table: pa.Table) -> None:
+        """Initialize atom table.
+
+        Args:
+            table: arrow table of ATOM_TABLE_SCHEMA sorted by protein id.
+        """
+        self.table = table
+        self.ids = np.asarray(
+            table.column("protein_id").to_numpy(zero_copy_only=False), dtype=str
+        )
+
+        chunk_lengths = [len(chunk) for chunk in table.column("protein_id").chunks]
+        self.chunk_starts = np.concatenate([[0], np.cumsum(chunk_lengths)])
+
+    def __len__(self: "AtomTable") -> int:
+        """Return number of proteins."""
+        return len(self.ids)
+
+    def __contains__(self: "AtomTable", protein_id: str) -> bool:
+        """Return True if protein is present in the table."""
+        return self.position(protein_id) is not None
+
+    @classmethod
+    def open(cls: "Type[AtomTable]", path: str) -> "AtomTable":
+        """Open atom table without reading it.
+
+        Args:
+            path: absolute path of the arrow file.
+
+        Returns:
+            Return the atom table.
+
+        Raises:
+            OSError: if there is no atom table at path.
+        """
+        if not os.path.exists(path):
+            raise OSError(f"No atom table at {path}")
+
+        return cls(pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+
+    def position(self: "AtomTable", protein_id: str) -> Optional[int]:
+        """Find position of protein id in the sorted ids.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return the position or None if id is not present.
+        """
+        protein_id = str.strip(protein_id)
+        i = int(np.searchsorted(self.ids, protein_id))
+        if i < len(self.ids) and self.ids[i] == protein_id:
+            return i
+        return None
+
+    def get(self: "AtomTable", protein_id: str) -> ProteinAtoms:
+        """Return atoms of protein without copying them.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return coords of shape (atoms, 3), atom type codes and offsets
+            of the atoms of every residue.
+
+        Raises:
+            KeyError: if protein is not present.
+        """
+        i = self.position(protein_id)
+        if i is None:
+            raise KeyError(protein_id)
+
+        chunk = int(np.searchsorted(self.chunk_starts, i, side="right")) - 1
+        row = i - int(self.chunk_starts[chunk])
+
+        def values(name: str) -> np.ndarray:
+            return self.table.column(name).chunk(chunk)[row].values.to_numpy()
+
+        return {
+            "coords": values("coords").reshape(-1, 3),
+            "atom_type": values("atom_type"),
+            "residue_offsets": values("residue_offsets"),
+        }
+
+    def iter_batches(self: "AtomTable") -> Iterator[pa.RecordBatch]:
+        """Iterate over record batches for vectorized passes."""
+        return iter(self.table.to_batches())
+
+
+def get_atom_table_path() -> str:
+    """Return the absolute path of the atom table."""
+    return os.path.join(get_base_data_path(), "processed", "index", "atoms.arrow")
+
+
+def build_atom_table() -> AtomTable:
+    """Write atom table of every cached pdb file and open it.
+
+    Returns:
+        Return the atom table.
+    """
+    pdb_path = get_pdb_path()
+    paths = [
+        os.path.join(pdb_path, name)
+        for name in os.listdir(pdb_path)
+        if name.endswith(".pdb")
+    ]
+
+    path = get_atom_table_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atom_table(path, paths, progress=True)
+
+    return AtomTable.open(path)
@@ -0,0 +1,372 @@
+"""Secondary index from protein id to rows of pair dataframes."""
+
+import json
+import os
+import pathlib
+from typing import Optional, Type
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import vaex
+
+from anu.data.dataframe_operation import (
+    get_base_data_path,
+    read_dataframe_from_file,
+    write_file_atomically,
+)
+
+
+def save_array_atomically(path: str, array: np.ndarray) -> None:
+    """Save numpy array in npy format using write_file_atomically.
+
+    Args:
+        path: final path of the npy file.
+        array: numpy array.
+    """
+
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "wb") as fp:
+            np.save(fp, array)
+
+    write_file_atomically(path, write)
+
+
+class ProteinIndex:
+    """Index from protein id to the rows containing the protein.
+
+    Protein ids are kept in a sorted array and rows in CSR layout: rows of
+    ids[i] are rows[offsets[i] : offsets[i + 1]]. Looking up an id is a
+    binary search, and the returned row ids can be given to vaex take.
+
+    Row ids are those of the indexed pair dataframe only. Input dataframes
+    built from it drop deleted rows and are split in partitions, so their
+    rows are in another order; they are indexed by the rows of their
+    ledger instead, see update_input.update_ledger_index.
+    """
+
+    def __init__(
+        self: "ProteinIndex",
+        ids: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        num_rows: int,
+        checksum: Optional[str] = None,
+    ) -> None:
+        """Initialize protein index.
+
+        Args:
+            ids: sorted unique protein ids.
+            offsets: start of the rows of every id, with a trailing end offset.
+            rows: row ids grouped by protein id.
+            num_rows: number of rows of the indexed dataframe.
+            checksum: checksum of the indexed protein ids, see
+                compute_pairs_checksum.
+        """
+        self.ids = ids
+        self.offsets = offsets
+        self.rows = rows
+        self.num_rows = num_rows
+        self.checksum = checksum
+
+    def __len__(self: "ProteinIndex") -> int:
+        """Return number of distinct proteins."""
+        return len(self.ids)
+
+    def __contains__(self: "ProteinIndex", protein_id: str) -> bool:
+        """Return True if protein is present in the index."""
+        return self.position(protein_id) is not None
+
+    @classmethod
+    def build(
+        cls: "Type[ProteinIndex]",
+        first_ids: pa.Array,
+        second_ids: pa.Array,
+        row_offset: int = 0,
+    ) -> "ProteinIndex":
+        """Build index from the two protein id columns of a pair dataframe.
+
+        Args:
+            first_ids: ids of the first protein of every row.
+            second_ids: ids of the second protein of every row.
+            row_offset: row id of the first row.
+
+        Returns:
+            Return the protein index.
+        """
+        num_rows = len(first_ids)
+        row_ids = np.arange(row_offset, row_offset + num_rows, dtype=np.int64)
+
+        # A protein paired with itself must be listed once for that row.
+        not_self = pc.invert(pc.equal(first_ids, second_ids)).fill_null(True)
+        not_self = not_self.to_numpy(zero_copy_only=False)
+        ids = pa.concat_arrays(
+            [
+                pa.array(first_ids, type=pa.string()),
+                pa.array(second_ids, type=pa.string()).filter(pa.array(not_self)),
+            ]
+        )
+        rows = np.concatenate([row_ids, row_ids[not_self]])
+
+        encoded = ids.dictionary_encode()
+        order = pc.array_sort_indices(encoded.dictionary).to_numpy()
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        codes = rank[encoded.indices.to_numpy()]
+        sort = np.lexsort((rows, codes))
+        counts = np.bincount(codes, minlength=len(order))
+
+        return cls(
+            np.asarray(encoded.dictionary.take(order).to_pylist(), dtype=str),
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            rows[sort],
+            row_offset + num_rows,
+        )
+
+    def merge(self: "ProteinIndex", other: "ProteinIndex") -> "ProteinIndex":
+        """Merge an index built over rows appended after the indexed rows.
+
+        Args:
+            other: index of the appended rows.
+
+        Returns:
+            Return the merged index.
+        """
+        ids = np.union1d(self.ids, other.ids)
+
+        def expand(index: "ProteinIndex") -> np.ndarray:
+            counts = np.diff(index.offsets)
+            return np.repeat(np.searchsorted(ids, index.ids), counts)
+
+        codes = np.concatenate([expand(self), expand(other)])
+        rows = np.concatenate([self.rows, other.rows])
+        sort = np.lexsort((rows, codes))
+        counts = np.bincount(codes, minlength=len(ids))
+
+        return ProteinIndex(
+            ids,
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            rows[sort],
+            max(self.num_rows, other.num_rows),
+        )
+
+    def position(self: "ProteinIndex", protein_id: str) -> Optional[int]:
+        """Find position of protein id in the sorted ids.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return the position or None if id is not indexed.
+        """
+        protein_id = str.strip(protein_id)
+        i = int(np.searchsorted(self.ids, protein_id))
+        if i < len(self.ids) and self.ids[i] == protein_id:
+            return i
+        return None
+
+    def lookup(self: "ProteinIndex", protein_id: str) -> np.ndarray:
+        """Return ids of the rows containing protein.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return sorted row ids, empty if protein is not indexed.
+        """
+        i = self.position(protein_id)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return np.asarray(self.rows[self.offsets[i] : self.offsets[i + 1]])
+
+    def save(self: "ProteinIndex", path: str) -> None:
+        """Save index to a directory.
+
+        Arrays are written to a new version directory and meta.json is
+        switched to it atomically, so readers never see a mix of versions.
+
+        Args:
+            path: absolute path of the index directory.
+        """
+        import shutil
+
+        meta_path = os.path.join(path, "meta.json")
+        previous = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as fp:
+                previous = json.load(fp)["version"]
+
+        version = 0 if previous is None else previous + 1
+        version_path = os.path.join(path, str(version))
+        pathlib.Path(version_path).mkdir(parents=True, exist_ok=True)
+
+        for name in ["ids", "offsets", "rows"]:
+            save_array_atomically(
+                os.path.join(version_path, f"{name}.npy"), getattr(self, name)
+            )
+
+        def write_meta(tmp_path: str) -> None:
+            with open(tmp_path, "w") as fp:
+                json.dump(
+                    {
+                        "version": version,
+                        "num_rows": self.num_rows,
+                        "checksum": self.checksum,
+                    },
+                    fp,
+                )
+
+        write_file_atomically(meta_path, write_meta)
+
+        if previous is not None:
+            shutil.rmtree(os.path.join(path, str(previous)), ignore_errors=True)
+
+    @classmethod
+    def load(cls: "Type[ProteinIndex]", path: str) -> "ProteinIndex":
+        """Load index from a directory. Arrays are memory mapped.
+
+        Args:
+            path: absolute path of the index directory.
+
+        Returns:
+            Return the protein index.
+
+        Raises:
+            OSError: if there is no index at path.
+        """
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise OSError(f"No protein index at {path}")
+
+        with open(meta_path) as fp:
+            meta = json.load(fp)
+
+        version_path = os.path.join(path, str(meta["version"]))
+
+        return cls(
+            np.load(os.path.join(version_path, "ids.npy")),
+            np.load(os.path.join(version_path, "offsets.npy"), mmap_mode="r"),
+            np.load(os.path.join(version_path, "rows.npy"), mmap_mode="r"),
+            meta["num_rows"],
+            meta.get("checksum"),
+        )
+
+
+def get_protein_index_path(path: str) -> str:
+    """Compute the directory of the index of a pair dataframe.
+
+    Args:
+        path: path of the pair dataframe relative to data/processed.
+
+    Returns:
+        Return the absolute path of the index directory.
+    """
+    return os.path.join(get_base_data_path(), "processed", "index", "protein", path)
+
+
+def get_pair_columns(df: vaex.dataframe.DataFrame) -> pa.Table:
+    """Return the two protein id columns of a pair dataframe.
+
+    Args:
+        df: vaex dataframe whose first two columns are protein ids.
+
+    Returns:
+        Return arrow table of protein ids.
+    """
+    return df.to_arrow_table(column_names=df.get_column_names()[:2])
+
+
+def compute_pairs_checksum(table: pa.Table) -> str:
+    """Compute the checksum of protein id columns.
+
+    Lengths and bytes of the ids are hashed rather than the arrow buffers,
+    so a slice of a table has the same checksum as a copy of it.
+
+    Args:
+        table: arrow table of protein ids, see get_pair_columns.
+
+    Returns:
+        Return the checksum prefixed with the name of the algorithm.
+    """
+    import hashlib
+
+    digest = hashlib.blake2b(digest_size=16)
+    for column in table.columns:
+        array = column.combine_chunks().cast(pa.large_string()).fill_null("")
+        offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)
+        offsets = offsets[array.offset : array.offset + len(array) + 1]
+        digest.update(np.diff(offsets).tobytes())
+        if len(array) > 0:
+            digest.update(memoryview(array.buffers()[2])[offsets[0] : offsets[-1]])
+
+    return f"blake2b:{digest.hexdigest()}"
+
+
+def update_index(index_path: str, table: pa.Table) -> ProteinIndex:
+    """Build or update the protein index of a table of protein id pairs.
+
+    Only rows appended since the index was last saved are indexed. The index
+    is rebuilt if the table has fewer rows than the index, or if the
+    checksum of its indexed rows changed, i.e. it was rewritten.
+
+    Args:
+        index_path: absolute path of the index directory.
+        table: arrow table whose two columns are protein ids.
+
+    Returns:
+        Return the updated index.
+    """
+    try:
+        index: Optional[ProteinIndex] = ProteinIndex.load(index_path)
+    except OSError:
+        index = None
+
+    if index is not None and (
+        index.num_rows > len(table)
+        or index.checksum != compute_pairs_checksum(table.slice(0, index.num_rows))
+    ):
+        index = None
+
+    start = 0 if index is None else index.num_rows
+    if index is not None and start == len(table):
+        return index
+
+    appended = table.slice(start)
+    delta = ProteinIndex.build(
+        appended.column(0).combine_chunks(),
+        appended.column(1).combine_chunks(),
+        start,
+    )
+    index = delta if index is None else index.merge(delta)
+    index.checksum = compute_pairs_checksum(table)
+    index.save(index_path)
+
+    return index
+
+
+def update_protein_index(path: str) -> ProteinIndex:
+    """Build or update the protein index of a pair dataframe, see update_index.
+
+    Args:
+        path: path of the pair dataframe relative to data/processed.
+
+    Returns:
+        Return the updated index.
+    """
+    df = read_dataframe_from_file(path)
+    return update_index(get_protein_index_path(path), get_pair_columns(df))
+
+
+def find_protein_rows(path: str, protein_id: str) -> vaex.dataframe.DataFrame:
+    """Return the rows of a pair dataframe containing the protein.
+
+    Args:
+        path: path of the pair dataframe relative to data/processed.
+        protein_id: protein id.
+
+    Returns:
+        vaex dataframe with the rows containing the protein.
+    """
+    index = ProteinIndex.load(get_protein_index_path(path))
+    return read_dataframe_from_file(path).take(index.lookup(protein_id))
@@ -0,0 +1,348 @@
+"""Random access index of sequences and residues of the structure cache."""
+
+import json
+import os
+import pathlib
+import shutil
+from typing import Iterable, List, Optional, TextIO, Tuple, Type
+
+import numpy as np
+from tqdm import tqdm
+
+from anu.data.dataframe_operation import get_base_data_path, write_file_atomically
+from anu.data.index.protein_index import save_array_atomically
+from anu.data.parser.pdb_parser import parse_pdb_atoms, residue_centroids, THREE_TO_ONE
+
+
+class StructureIndex:
+    """Sequences, residue centroids and chains of every cached pdb file.
+
+    Residues are the columns of build_matrix, see parse_pdb_atoms. Hetero
+    residues and waters are kept and their one letter code is X.
+
+    Like a fasta index, residues of all proteins are stored back to back in
+    flat arrays and offsets give the slice of every protein: residues of
+    ids[i] are residue_offsets[i] to residue_offsets[i + 1]. Chains are
+    stored the same way, chain j spans chain_offsets[j] to
+    chain_offsets[j + 1] residues and chains of ids[i] are
+    protein_chains[i] to protein_chains[i + 1].
+
+    Flat arrays are memory mapped, so loading the index reads only the ids
+    and a lookup touches only the pages of one protein.
+    """
+
+    arrays = [
+        "ids",
+        "residue_offsets",
+        "sequence",
+        "centroids",
+        "file_offsets",
+        "chain_offsets",
+        "chain_names",
+        "protein_chains",
+    ]
+
+    def __init__(
+        self: "StructureIndex",
+        ids: np.ndarray,
+        residue_offsets: np.ndarray,
+        sequence: np.ndarray,
+        centroids: np.ndarray,
+        file_offsets: np.ndarray,
+        chain_offsets: np.ndarray,
+        chain_names: np.ndarray,
+        protein_chains: np.ndarray,
+    ) -> None:
+        """Initialize structure index.
+
+        Args:
+            ids: sorted unique protein ids.
+            residue_offsets: start of the residues of every protein, with a
+                trailing end offset.
+            sequence: one letter code of every residue as uint8.
+            centroids: float32 mean atom position of every residue.
+            file_offsets: byte offset of every residue in its pdb file.
+            chain_offsets: start residue of every chain, with a trailing end.
+            chain_names: chain id of every chain as uint8.
+            protein_chains: start chain of every protein, with a trailing end.
+        """
+        self.ids = ids
+        self.residue_offsets = residue_offsets
+        self.sequence = sequence
+        self.centroids = centroids
+        self.file_offsets = file_offsets
+        self.chain_offsets = chain_offsets
+        self.chain_names = chain_names
+        self.protein_chains = protein_chains
+
+    def __len__(self: "StructureIndex") -> int:
+        """Return number of indexed proteins."""
+        return len(self.ids)
+
+    def __contains__(self: "StructureIndex", protein_id: str) -> bool:
+        """Return True if protein is present in the index."""
+        return self.position(protein_id) is not None
+
+    @classmethod
+    def build(
+        cls: "Type[StructureIndex]",
+        pdb_paths: Iterable[str],
+        progress: bool = False,
+    ) -> "StructureIndex":
+        """Build index by reading pdb files once.
+
+        Args:
+            pdb_paths: pdb files, the file name without extension is the id.
+            progress: show a progress bar.
+
+        Returns:
+            Return the structure index.
+        """
+        paths = sorted(
+            pdb_paths, key=lambda path: os.path.splitext(os.path.basename(path))[0]
+        )
+
+        sequences: List[np.ndarray] = []
+        centroids: List[np.ndarray] = []
+        file_offsets: List[np.ndarray] = []
+        chain_starts: List[np.ndarray] = []
+        chain_names: List[np.ndarray] = []
+        residue_counts: List[int] = []
+        chain_counts: List[int] = []
+
+        residues = 0
+        for path in tqdm(paths, desc="Indexing", leave=False, disable=not progress):
+            atoms = parse_pdb_atoms(path, amino_acids_only=False)
+            names = atoms["residue_names"]
+            chains = atoms["chain_ids"]
+
+            codes = "".join(THREE_TO_ONE.get(name, "X") for name in names).encode()
+            sequences.append(np.frombuffer(codes, dtype=np.uint8))
+            centroids.append(residue_centroids(atoms))
+            file_offsets.append(atoms["file_offsets"])
+
+            starts = np.flatnonzero(np.r_[True, chains[1:] != chains[:-1]])
+            starts = starts[starts < len(chains)]
+            chain_starts.append(starts + residues)
+            chain_names.append(
+                np.frombuffer("".join(chains[starts]).encode(), dtype=np.uint8)
+            )
+
+            residues = residues + len(names)
+            residue_counts.append(len(names))
+            chain_counts.append(len(starts))
+
+        def concatenate(arrays: List[np.ndarray], dtype: type) -> np.ndarray:
+            return np.concatenate([np.empty(0, dtype=dtype), *arrays]).astype(dtype)
+
+        return cls(
+            np.asarray(
+                [os.path.splitext(os.path.basename(path))[0] for path in paths],
+                dtype=str,
+            ),
+            np.concatenate([[0], np.cumsum(residue_counts)]).astype(np.int64),
+            concatenate(sequences, np.uint8),
+            np.concatenate([np.empty((0, 3), np.float32), *centroids]),
+            concatenate(file_offsets, np.int64),
+            np.append(concatenate(chain_starts, np.int64), residues),
+            concatenate(chain_names, np.uint8),
+            np.concatenate([[0], np.cumsum(chain_counts)]).astype(np.int64),
+        )
+
+    def position(self: "StructureIndex", protein_id: str) -> Optional[int]:
+        """Find position of protein id in the sorted ids.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return the position or None if id is not indexed.
+        """
+        protein_id = str.strip(protein_id)
+        i = int(np.searchsorted(self.ids, protein_id))
+        if i < len(self.ids) and self.ids[i] == protein_id:
+            return i
+        return None
+
+    def residue_range(self: "StructureIndex", protein_id: str) -> Tuple[int, int]:
+        """Return start and end residue of protein in the flat arrays.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return the range of residues.
+
+        Raises:
+            KeyError: if protein is not indexed.
+        """
+        i = self.position(protein_id)
+        if i is None:
+            raise KeyError(protein_id)
+        return int(self.residue_offsets[i]), int(self.residue_offsets[i + 1])
+
+    def lengths(self: "StructureIndex") -> np.ndarray:
+        """Return number of residues of every protein."""
+        return np.diff(self.residue_offsets)
+
+    def get_sequence(self: "StructureIndex", protein_id: str) -> str:
+        """Return one letter sequence of protein."""
+        start, end = self.residue_range(protein_id)
+        return bytes(self.sequence[start:end]).decode()
+
+    def get_centroids(self: "StructureIndex", protein_id: str) -> np.ndarray:
+        """Return residue centroids of protein, shape (residues, 3)."""
+        start, end = self.residue_range(protein_id)
+        return np.asarray(self.centroids[start:end])
+
+    def get_file_offsets(self: "StructureIndex", protein_id: str) -> np.ndarray:
+        """Return byte offset of every residue of protein in its pdb file."""
+        start, end = self.residue_range(protein_id)
+        return np.asarray(self.file_offsets[start:end])
+
+    def get_chains(
+        self: "StructureIndex", protein_id: str
+    ) -> List[Tuple[str, int, int]]:
+        """Return chains of protein.
+
+        Args:
+            protein_id: protein id.
+
+        Returns:
+            Return chain id, first residue and end residue of every chain,
+            relative to the protein.
+        """
+        start, _ = self.residue_range(protein_id)
+        i = self.position(protein_id)
+        first, last = self.protein_chains[i], self.protein_chains[i + 1]
+
+        return [
+            (
+                chr(self.chain_names[j]),
+                int(self.chain_offsets[j]) - start,
+                int(self.chain_offsets[j + 1]) - start,
+            )
+            for j in range(first, last)
+        ]
+
+    def write_fasta(
+        self: "StructureIndex",
+        fp: TextIO,
+        protein_ids: Optional[Iterable[str]] = None,
+        line_width: int = 60,
+    ) -> int:
+        """Write sequences in fasta format.
+
+        Args:
+            fp: text file to write to.
+            protein_ids: proteins to write, every protein if None.
+            line_width: residues per line.
+
+        Returns:
+            Return number of written sequences.
+        """
+        written = 0
+        for protein_id in self.ids if protein_ids is None else protein_ids:
+            sequence = self.get_sequence(protein_id)
+            lines = [
+                sequence[i : i + line_width]
+                for i in range(0, len(sequence), line_width)
+            ]
+            fp.write("\n".join([f">{protein_id}", *lines]) + "\n")
+            written = written + 1
+
+        return written
+
+    def save(self: "StructureIndex", path: str) -> None:
+        """Save index to a directory.
+
+        Arrays are written to a new version directory and meta.json is
+        switched to it atomically, so readers never see a mix of versions.
+
+        Args:
+            path: absolute path of the index directory.
+        """
+        meta_path = os.path.join(path, "meta.json")
+        previous = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as fp:
+                previous = json.load(fp)["version"]
+
+        version = 0 if previous is None else previous + 1
+        version_path = os.path.join(path, str(version))
+        pathlib.Path(version_path).mkdir(parents=True, exist_ok=True)
+
+        for name in self.arrays:
+            save_array_atomically(
+                os.path.join(version_path, f"{name}.npy"), getattr(self, name)
+            )
+
+        def write_meta(tmp_path: str) -> None:
+            with open(tmp_path, "w") as fp:
+                json.dump({"version": version, "proteins": len(self)}, fp)
+
+        write_file_atomically(meta_path, write_meta)
+
+        if previous is not None:
+            shutil.rmtree(os.path.join(path, str(previous)), ignore_errors=True)
+
+    @classmethod
+    def load(cls: "Type[StructureIndex]", path: str) -> "StructureIndex":
+        """Load index from a directory. Flat arrays are memory mapped.
+
+        Args:
+            path: absolute path of the index directory.
+
+        Returns:
+            Return the structure index.
+
+        Raises:
+            OSError: if there is no index at path.
+        """
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise OSError(f"No structure index at {path}")
+
+        with open(meta_path) as fp:
+            meta = json.load(fp)
+
+        version_path = os.path.join(path, str(meta["version"]))
+
+        return cls(
+            *[
+                np.load(
+                    os.path.join(version_path, f"{name}.npy"),
+                    mmap_mode=None if name == "ids" else "r",
+                )
+                for name in cls.arrays
+            ]
+        )
+
+
+def get_structure_index_path() -> str:
+    """Return the absolute path of the structure index directory."""
+    return os.path.join(get_base_data_path(), "processed", "index", "structure")
+
+
+def get_pdb_path() -> str:
+    """Return the absolute path of the structure cache."""
+    return os.path.join(get_base_data_path(), "raw", "pdb")
+
+
+def build_structure_index() -> StructureIndex:
+    """Build structure index over every cached pdb file and save it.
+
+    Returns:
+        Return the structure index.
+    """
+    pdb_path = get_pdb_path()
+    paths = [
+        os.path.join(pdb_path, name)
+        for name in os.listdir(pdb_path)
+        if name.endswith(".pdb")
+    ]
+
+    index = StructureIndex.build(paths, progress=True)
+    index.save(get_structure_index_path())
+
+    return index
@@ -0,0 +1,219 @@
+"""Sampling of random non-interacting protein pairs."""
+
+from typing import List, Optional, Tuple, Type
+
+import numpy as np
+import pyarrow as pa
+import vaex
+
+
+def encode_protein_ids(ids: np.ndarray, values: pa.Array) -> np.ndarray:
+    """Map protein ids to their position in the sorted ids.
+
+    Args:
+        ids: sorted unique protein ids.
+        values: protein ids to encode.
+
+    Returns:
+        Return the codes, -1 for ids which are not present in ids.
+    """
+    values = np.asarray(values.to_numpy(zero_copy_only=False), dtype=str)
+    values = np.char.strip(values)
+
+    codes = np.searchsorted(ids, values)
+    codes[codes == len(ids)] = 0
+    found = ids[codes] == values if len(ids) > 0 else np.zeros(len(values), bool)
+
+    return np.where(found, codes, -1).astype(np.int64)
+
+
+def pair_keys(first_codes: np.ndarray, second_codes: np.ndarray) -> np.ndarray:
+    """Compute order independent 64 bit keys of protein pairs.
+
+    Args:
+        first_codes: codes of the first proteins.
+        second_codes: codes of the second proteins.
+
+    Returns:
+        Return the pair keys.
+    """
+    low = np.minimum(first_codes, second_codes).astype(np.uint64)
+    high = np.maximum(first_codes, second_codes).astype(np.uint64)
+
+    return (low << np.uint64(32)) | high
+
+
+class KnownPairs:
+    """Sorted 64 bit keys of known protein pairs.
+
+    Keys are built over a fixed dictionary of protein ids, so membership
+    tests are exact and cost one binary search per pair.
+    """
+
+    def __init__(self: "KnownPairs", ids: np.ndarray, keys: np.ndarray) -> None:
+        """Initialize known pairs.
+
+        Args:
+            ids: sorted unique protein ids.
+            keys: sorted unique pair keys.
+        """
+        self.ids = ids
+        self.keys = keys
+
+    def __len__(self: "KnownPairs") -> int:
+        """Return number of known pairs."""
+        return len(self.keys)
+
+    @classmethod
+    def build(
+        cls: "Type[KnownPairs]",
+        ids: np.ndarray,
+        dataframes: List[vaex.dataframe.DataFrame],
+    ) -> "KnownPairs":
+        """Build known pairs from pair dataframes.
+
+        Pairs with a protein missing from ids can never be sampled, so they
+        are left out.
+
+        Args:
+            ids: sorted unique protein ids of the sampling pool.
+            dataframes: dataframes whose first two columns are protein ids.
+
+        Returns:
+            Return the known pairs.
+        """
+        keys = [np.empty(0, dtype=np.uint64)]
+
+        for df in dataframes:
+            table = df.to_arrow_table(column_names=df.get_column_names()[:2])
+            first = encode_protein_ids(ids, table.column(0).combine_chunks())
+            second = encode_protein_ids(ids, table.column(1).combine_chunks())
+
+            known = (first >= 0) & (second >= 0)
+            keys.append(pair_keys(first[known], second[known]))
+
+        return cls(ids, np.unique(np.concatenate(keys)))
+
+    def contains(
+        self: "KnownPairs", first_codes: np.ndarray, second_codes: np.ndarray
+    ) -> np.ndarray:
+        """Test if pairs are known.
+
+        Args:
+            first_codes: codes of the first proteins.
+            second_codes: codes of the second proteins.
+
+        Returns:
+            Return boolean array, True for known pairs.
+        """
+        keys = pair_keys(first_codes, second_codes)
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+
+        position = np.searchsorted(self.keys, keys)
+        position[position == len(self.keys)] = 0
+
+        return self.keys[position] == keys
+
+
+class NegativePairSampler:
+    """Draw random protein pairs which are not known to interact.
+
+    The pool is made of slots: slot 2 * row + side refers to protein A
+    (side 0) or protein B (side 1) of a row of the input dataframe.
+    """
+
+    def __init__(
+        self: "NegativePairSampler",
+        slot_codes: np.ndarray,
+        known_pairs: KnownPairs,
+        random_state: Optional[int] = None,
+    ) -> None:
+        """Initialize negative pair sampler.
+
+        Args:
+            slot_codes: protein code of every slot.
+            known_pairs: pairs which must never be drawn.
+            random_state: seed for reproducibility.
+        """
+        self.slot_codes = slot_codes
+        self.known_pairs = known_pairs
+        self.rng = np.random.default_rng(random_state)
+
+    @classmethod
+    def from_dataframe(
+        cls: "Type[NegativePairSampler]",
+        df: vaex.dataframe.DataFrame,
+        id_columns: List[str],
+        known_dataframes: List[vaex.dataframe.DataFrame],
+        random_state: Optional[int] = None,
+    ) -> "NegativePairSampler":
+        """Build sampler over the proteins of an input dataframe.
+
+        Args:
+            df: input dataframe.
+            id_columns: columns of df holding ids of protein A and protein B.
+            known_dataframes: dataframes of known interacting pairs.
+            random_state: seed for reproducibility.
+
+        Returns:
+            Return the sampler.
+        """
+        table = df.to_arrow_table(column_names=id_columns)
+        first = table.column(0).combine_chunks()
+        second = table.column(1).combine_chunks()
+
+        slots = pa.concat_arrays([first, second]).to_numpy(zero_copy_only=False)
+        ids = np.unique(np.char.strip(np.asarray(slots, dtype=str)))
+
+        # Interleave, so slot 2 * row + side is side of row.
+        slot_codes = np.empty(2 * len(first), dtype=np.int64)
+        slot_codes[0::2] = encode_protein_ids(ids, first)
+        slot_codes[1::2] = encode_protein_ids(ids, second)
+
+        known_pairs = KnownPairs.build(ids, [df[id_columns], *known_dataframes])
+
+        return cls(slot_codes, known_pairs, random_state)
+
+    def sample(self: "NegativePairSampler", n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Draw n pairs of slots.
+
+        Pairs of a protein with itself and known pairs are rejected and
+        drawn again. Drawing is vectorized, so millions of pairs are drawn
+        per second.
+
+        Args:
+            n: number of pairs.
+
+        Returns:
+            Return slots of the first and of the second protein.
+
+        Raises:
+            ValueError: if the pool has no unknown pair of distinct proteins.
+        """
+        if len(self.known_pairs.ids) < 2:
+            raise ValueError("Pool must have at least two distinct proteins")
+
+        first: List[np.ndarray] = []
+        second: List[np.ndarray] = []
+        remaining = n
+        rounds_without_pair = 0
+
+        while remaining > 0:
+            size = remaining + remaining // 10 + 16
+            a = self.rng.integers(0, len(self.slot_codes), size)
+            b = self.rng.integers(0, len(self.slot_codes), size)
+
+            code_a = self.slot_codes[a]
+            code_b = self.slot_codes[b]
+            valid = (code_a != code_b) & ~self.known_pairs.contains(code_a, code_b)
+
+            first.append(a[valid][:remaining])
+            second.append(b[valid][:remaining])
+            remaining = remaining - len(first[-1])
+
+            rounds_without_pair = 0 if len(first[-1]) > 0 else rounds_without_pair + 1
+            if rounds_without_pair == 100:
+                raise ValueError("Pool has no unknown pair of distinct proteins")
+
+        return np.concatenate(first), np.concatenate(second)
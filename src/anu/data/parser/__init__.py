@@ -1,3 +1,4 @@
 """Parser module."""
 
 from .mif25parser import Mif25Parser  # noqa
+from .pdb_parser import parse_pdb_atoms  # noqa
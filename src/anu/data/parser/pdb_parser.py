@@ -0,0 +1,152 @@
+"""Fast reader of atom records of pdb files."""
+
+from typing import Dict, List, TypedDict
+
+from Bio.Data.IUPACData import protein_letters_3to1
+import numpy as np
+
+# Three letter code of standard amino acids to one letter code.
+THREE_TO_ONE: Dict[str, str] = {
+    three.upper(): one for three, one in protein_letters_3to1.items()
+}
+
+
+class PdbAtoms(TypedDict):
+    """Atoms of the first model of a pdb file, grouped by residue."""
+
+    coords: np.ndarray
+    atom_names: np.ndarray
+    elements: np.ndarray
+    residue_offsets: np.ndarray
+    residue_names: np.ndarray
+    chain_ids: np.ndarray
+    file_offsets: np.ndarray
+
+
+def parse_pdb_atoms(path: str, amino_acids_only: bool = True) -> PdbAtoms:
+    """Read atom records of the first model of a pdb file.
+
+    Only the fixed columns of ATOM and HETATM records are read, which is
+    much faster than building a Bio.PDB structure. Residues are in the order
+    of the residues of Bio.PDB chains: chains in order of first appearance,
+    then residues of a chain in file order. With amino_acids_only=False,
+    residue i is therefore column i of build_matrix, which has zero columns
+    for hetero residues and waters.
+
+    Args:
+        path: path of the pdb file.
+        amino_acids_only: keep only residues of standard amino acids.
+
+    Returns:
+        Return atoms of the first model. Atoms of residue i are
+        residue_offsets[i] to residue_offsets[i + 1] and file_offsets[i] is
+        the byte offset of the first record of residue i in the file.
+    """
+    coords: List[List[float]] = []
+    atom_names: List[str] = []
+    elements: List[str] = []
+    residue_offsets: List[int] = []
+    residue_names: List[str] = []
+    chain_ids: List[str] = []
+    file_offsets: List[int] = []
+
+    previous = None
+    offset = 0
+
+    with open(path, "rb") as fp:
+        for line in fp:
+            start = offset
+            offset = offset + len(line)
+
+            if line.startswith(b"ENDMDL"):
+                break
+            if not line.startswith((b"ATOM  ", b"HETATM")):
+                continue
+
+            residue_name = line[17:20].decode().strip()
+            if amino_acids_only and residue_name not in THREE_TO_ONE:
+                continue
+
+            # Chain, residue number and insertion code identify a residue,
+            # hetero residues are also identified by their name like in Bio.
+            key = line[21:27] + (line[17:20] if line.startswith(b"HETATM") else b"")
+            if key != previous:
+                previous = key
+                residue_offsets.append(len(atom_names))
+                residue_names.append(residue_name)
+                chain_ids.append(line[21:22].decode())
+                file_offsets.append(start)
+
+            coords.append([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+            atom_names.append(line[12:16].decode().strip())
+            elements.append(line[76:78].decode().strip())
+
+    residue_offsets.append(len(atom_names))
+
+    return group_by_chain(
+        {
+            "coords": np.asarray(coords, dtype=np.float32).reshape(-1, 3),
+            "atom_names": np.asarray(atom_names, dtype=str),
+            "elements": np.asarray(elements, dtype=str),
+            "residue_offsets": np.asarray(residue_offsets, dtype=np.int64),
+            "residue_names": np.asarray(residue_names, dtype=str),
+            "chain_ids": np.asarray(chain_ids, dtype=str),
+            "file_offsets": np.asarray(file_offsets, dtype=np.int64),
+        }
+    )
+
+
+def group_by_chain(atoms: PdbAtoms) -> PdbAtoms:
+    """Move residues next to the previous residues of their chain.
+
+    Hetero residues and waters are often listed after every chain, Bio.PDB
+    appends them to the residues of their chain.
+
+    Args:
+        atoms: atoms with residues in file order.
+
+    Returns:
+        Return atoms with residues grouped by chain, in order of first
+        appearance of the chains.
+    """
+    chains, first = np.unique(atoms["chain_ids"], return_index=True)
+    rank = np.empty(len(chains), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(chains))
+    order = np.argsort(rank[np.searchsorted(chains, atoms["chain_ids"])], kind="stable")
+    if np.all(order == np.arange(len(order))):
+        return atoms
+
+    offsets = atoms["residue_offsets"]
+    counts = np.diff(offsets)[order]
+    atom_order = np.concatenate(
+        [np.empty(0, dtype=np.int64)]
+        + [np.arange(offsets[i], offsets[i + 1]) for i in order]
+    )
+
+    return {
+        "coords": atoms["coords"][atom_order],
+        "atom_names": atoms["atom_names"][atom_order],
+        "elements": atoms["elements"][atom_order],
+        "residue_offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        "residue_names": atoms["residue_names"][order],
+        "chain_ids": atoms["chain_ids"][order],
+        "file_offsets": atoms["file_offsets"][order],
+    }
+
+
+def residue_centroids(atoms: PdbAtoms) -> np.ndarray:
+    """Compute mean position of the atoms of every residue.
+
+    Args:
+        atoms: parsed atoms.
+
+    Returns:
+        Return float32 array of shape (residues, 3).
+    """
+    offsets = atoms["residue_offsets"]
+    counts = np.diff(offsets)
+    if len(counts) == 0:
+        return np.empty((0, 3), dtype=np.float32)
+
+    sums = np.add.reduceat(atoms["coords"].astype(np.float64), offsets[:-1], axis=0)
+    return (sums / counts[:, None]).astype(np.float32)
@@ -0,0 +1,185 @@
+"""Streaming compaction of dataframe chunks into a partitioned dataset."""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+from tqdm import tqdm
+
+from anu.data.dataframe_operation import (
+    add_partitions_to_manifest,
+    get_dataset_path,
+    read_arrow_table,
+    read_dataset_manifest,
+    write_arrow_table_atomically,
+)
+
+
+def compute_group_size(
+    chunk_path: str,
+    save_path: str,
+    memory_budget: int,
+    workers: int,
+    num_chunks: int,
+) -> int:
+    """Compute number of chunks merged in one output row group.
+
+    A resumed compaction must keep the group size it started with, so it is
+    read back from the manifest when one exists. Otherwise groups are sized
+    from the largest chunk still present.
+
+    Args:
+        chunk_path: absolute path of the directory containing chunks.
+        save_path: path of the output dataset relative to data/processed.
+        memory_budget: bytes of memory available for all the workers.
+        workers: number of row groups built at the same time.
+        num_chunks: number of chunks to merge.
+
+    Returns:
+        Return the number of chunks in one row group.
+
+    Raises:
+        OSError: if none of the chunks exists.
+    """
+    manifest = read_dataset_manifest(save_path)
+    for entry in [] if manifest is None else manifest["partitions"]:
+        if "group_size" in entry["meta"]:
+            return entry["meta"]["group_size"]
+
+    sizes = [
+        os.path.getsize(os.path.join(chunk_path, f"{i}.arrow"))
+        for i in range(num_chunks)
+        if os.path.exists(os.path.join(chunk_path, f"{i}.arrow"))
+    ]
+    if len(sizes) == 0:
+        raise OSError(f"No chunks found in {chunk_path}")
+
+    return max(1, memory_budget // (workers * max(1, max(sizes))))
+
+
+def read_chunk(chunk_path: str, i: int, schema: Optional[pa.Schema]) -> pa.Table:
+    """Read a chunk, checking it has the columns of the other chunks.
+
+    Args:
+        chunk_path: absolute path of the directory containing chunks.
+        i: number of the chunk.
+        schema: schema of the other chunks, not checked if None.
+
+    Returns:
+        Return the chunk.
+
+    Raises:
+        ValueError: if the chunk has other columns than the other chunks,
+            e.g. chunks written before id columns were added.
+    """
+    table = read_arrow_table(os.path.join(chunk_path, f"{i}.arrow"))
+    if schema is not None and not table.schema.equals(schema):
+        raise ValueError(
+            f"Chunk {i}.arrow has columns {table.schema.names} but other chunks "
+            f"have {schema.names}. Remove {chunk_path} and prepare the input again."
+        )
+    return table
+
+
+def compact_chunks(
+    chunk_base_path: str,
+    save_path: str,
+    num_chunks: int,
+    memory_budget: int = 1 << 30,
+    workers: int = 1,
+    compression: Optional[str] = None,
+) -> int:
+    """Merge numbered chunks into large row groups of a partitioned dataset.
+
+    Chunks 0.arrow to {num_chunks - 1}.arrow are merged group by group, so
+    only memory_budget bytes are held in memory at once. Every row group is
+    written atomically and registered in the dataset manifest as soon as it
+    is complete. The compaction can therefore be interrupted at any time and
+    resumed later. Only the last (partial) group is rebuilt when new chunks
+    are appended.
+
+    Args:
+        chunk_base_path: path of the chunk directory relative to data/processed.
+        save_path: path of the output dataset relative to data/processed.
+        num_chunks: number of chunks to merge.
+        memory_budget: bytes of memory available for all the workers.
+        workers: number of row groups built at the same time.
+        compression: codec like zstd or lz4 used for the row groups.
+
+    Returns:
+        Return the number of rows written during this call.
+
+    Raises:
+        ValueError: if chunks don't all have the same columns.
+    """
+    chunk_path = get_dataset_path(chunk_base_path)
+    dataset_path = get_dataset_path(save_path)
+    os.makedirs(dataset_path, exist_ok=True)
+
+    group_size = compute_group_size(
+        chunk_path, save_path, memory_budget, workers, num_chunks
+    )
+
+    manifest = read_dataset_manifest(save_path)
+    done: Dict[str, Dict[str, Any]] = (
+        {}
+        if manifest is None
+        else {entry["name"]: entry["meta"] for entry in manifest["partitions"]}
+    )
+
+    groups: List[Tuple[str, int, int]] = []
+    for start in range(0, num_chunks, group_size):
+        end = min(start + group_size, num_chunks)
+        name = f"part-{start // group_size:05d}.arrow"
+        if name in done and done[name]["last_chunk"] == end - 1:
+            continue
+        groups.append((name, start, end))
+
+    # Every row group must have the columns of the first chunk.
+    schema = None
+    if len(groups) > 0:
+        first = min(
+            i
+            for i in range(num_chunks)
+            if os.path.exists(os.path.join(chunk_path, f"{i}.arrow"))
+        )
+        schema = read_arrow_table(os.path.join(chunk_path, f"{first}.arrow")).schema
+
+    def compact_group(group: Tuple[str, int, int]) -> Tuple[str, Dict[str, Any], int]:
+        name, start, end = group
+        table = pa.concat_tables(
+            [read_chunk(chunk_path, i, schema) for i in range(start, end)]
+        ).combine_chunks()
+        write_arrow_table_atomically(
+            table, os.path.join(dataset_path, name), compression
+        )
+
+        meta = {"first_chunk": start, "last_chunk": end - 1, "group_size": group_size}
+        return name, meta, table.num_rows
+
+    rows = 0
+    progress = tqdm(desc="Compacting", unit=" rows", unit_scale=True, leave=False)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(compact_group, group) for group in groups]
+
+        try:
+            # Checkpoint in order, so the manifest always lists a prefix of
+            # row groups followed by groups which are yet to be built.
+            for future in futures:
+                name, meta, num_rows = future.result()
+                add_partitions_to_manifest(save_path, [name], [meta])
+
+                rows = rows + num_rows
+                progress.update(num_rows)
+
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            progress.close()
+            print("Compaction interrupted. Run the same command again to resume.")
+            return rows
+
+    progress.close()
+    return rows
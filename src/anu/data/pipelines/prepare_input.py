@@ -2,7 +2,7 @@
 
 import os
 from statistics import mean
-from typing import List, Tuple, TypedDict, Union
+from typing import List, Optional, Tuple, TypedDict, Union
 
 from Bio.PDB import PDBParser, Polypeptide
 import pyarrow
@@ -10,11 +10,11 @@ import tqdm
 import vaex
 
 from anu.constants.amino_acid import amino_acid
-from anu.data.dataframe_operation import (
-    read_dataframes_from_file,
-    save_dataframe_to_file,
-)
+from anu.data.dataframe_operation import save_dataframe_to_file
+from anu.data.pipelines.compact_chunks import compact_chunks
 
+# Length of every protein in the input dataframe.
+PROTEIN_SEQ_MAX_LEN = 4000
 
 # Dictionary keys
 col_name = [
@@ -30,6 +30,27 @@ col_name = [
     "charge",
 ]
 
+# Columns of the input dataframe in the order used by the model.
+input_col_name = [
+    f"protein{protein}_{name}"
+    for name in [
+        "seq",
+        "x",
+        "y",
+        "z",
+        "hydropathy",
+        "hydropathy_index",
+        "acidity_basicity",
+        "mass",
+        "isoelectric_point",
+        "charge",
+    ]
+    for protein in ["A", "B"]
+] + ["interaction"]
+
+# Columns of the input dataframe holding protein ids.
+id_col_name = ["proteinA_id", "proteinB_id"]
+
 
 class BuildMatrixDict(TypedDict):
     """Dictionary shape for build matrix class."""
@@ -47,7 +68,10 @@ class BuildMatrixDict(TypedDict):
 
 
 def build_matrix(
-    path: str, filename: str, truncate_log: Union[tqdm.tqdm, None] = None
+    path: str,
+    filename: str,
+    truncate_log: Union[tqdm.tqdm, None] = None,
+    max_len: Optional[int] = PROTEIN_SEQ_MAX_LEN,
 ) -> BuildMatrixDict:
     """Build the input matrix for one protein.
 
@@ -55,62 +79,67 @@ def build_matrix(
         path: path of the pdb file.
         filename: name of the file (without extension).
         truncate_log: tqdm logger
+        max_len: proteins are padded with 0 or truncated to max_len residues.
+            If None, whole proteins are kept without padding, so that long
+            proteins can be cropped in windows while training.
 
     Returns:
         Build matrix dictionary
     """
-    PROTEIN_SEQ_MAX_LEN = 4000
-    protein_matrix = [[0 for x in range(PROTEIN_SEQ_MAX_LEN)] for y in range(10)]
+    protein_matrix: List[List[float]] = [[] for y in range(10)]
     protein_structure = PDBParser().get_structure(filename, path)
     protein_model = list(protein_structure.get_models())
     protein_chains = list(protein_model[0].get_chains())
 
-    col = 0
+    for chain in protein_chains:
+        protein_residues = list(chain.get_residues())
 
-    try:
-        for chain in protein_chains:
-            protein_residues = list(chain.get_residues())
-
-            for residue in protein_residues:
-                if Polypeptide.is_aa(residue.get_resname(), standard=True):
-                    atoms = list(residue.get_atoms())
-                    x = []
-                    y = []
-                    z = []
-
-                    for atom in atoms:
-                        vec = atom.get_vector()
-                        x.append(vec.__getitem__(0))
-                        y.append(vec.__getitem__(1))
-                        z.append(vec.__getitem__(2))
+        for residue in protein_residues:
+            # 0 is saved at this position if it is not an amino acid.
+            values = [0] * 10
+
+            if Polypeptide.is_aa(residue.get_resname(), standard=True):
+                atoms = list(residue.get_atoms())
+                x = []
+                y = []
+                z = []
+
+                for atom in atoms:
+                    vec = atom.get_vector()
+                    x.append(vec.__getitem__(0))
+                    y.append(vec.__getitem__(1))
+                    z.append(vec.__getitem__(2))
 
+                # one letter code
+                code = Polypeptide.three_to_one(residue.get_resname())
+
+                aa = amino_acid[code]
+                values = [
+                    aa["code"],
                     # calculate position of residue
-                    x = round(mean(x))
-                    y = round(mean(y))
-                    z = round(mean(z))
-
-                    # one letter code
-                    code = Polypeptide.three_to_one(residue.get_resname())
-
-                    aa = amino_acid[code]
-                    protein_matrix[0][col] = aa["code"]
-                    protein_matrix[1][col] = x
-                    protein_matrix[2][col] = y
-                    protein_matrix[3][col] = z
-                    protein_matrix[4][col] = aa["hydropathy"]
-                    protein_matrix[5][col] = aa["hydropathy_index"]
-                    protein_matrix[6][col] = aa["acidity_basicity"]
-                    protein_matrix[7][col] = aa["mass"]
-                    protein_matrix[8][col] = aa["isoelectric_point"]
-                    protein_matrix[9][col] = aa["charge"]
-
-                # Even if the current residue is not amino acid we increase the col.
-                # 0 is save at this position if it is not an amino acid.
-                col = col + 1
-
-    except IndexError:
-        if truncate_log is not None:
-            truncate_log.set_description_str(f"Protein {filename} is truncated.")
+                    round(mean(x)),
+                    round(mean(y)),
+                    round(mean(z)),
+                    aa["hydropathy"],
+                    aa["hydropathy_index"],
+                    aa["acidity_basicity"],
+                    aa["mass"],
+                    aa["isoelectric_point"],
+                    aa["charge"],
+                ]
+
+            for i in range(10):
+                protein_matrix[i].append(values[i])
+
+    length = len(protein_matrix[0])
+    if max_len is not None:
+        if length > max_len and truncate_log is not None:
+            truncate_log.set_description_str(
+                f"Protein {filename} is truncated from {length} to {max_len}."
+            )
+        protein_matrix = [
+            row[:max_len] + [0] * max(max_len - length, 0) for row in protein_matrix
+        ]
 
     # Prepare dict so it can be load to vaex dataframe
     dic: BuildMatrixDict = {
@@ -127,9 +156,7 @@ def build_matrix(
     }
 
     for i in range(10):
-        dic[col_name[i]] = pyarrow.array(
-            [[protein_matrix[i][x] for x in range(PROTEIN_SEQ_MAX_LEN)]]
-        )
+        dic[col_name[i]] = pyarrow.array([protein_matrix[i]])
 
     return dic
 
@@ -138,6 +165,7 @@ def build_df_from_dic(
     protein_a: BuildMatrixDict,
     protein_b: BuildMatrixDict,
     interaction_type: Union[bool, None] = None,
+    protein_ids: Optional[Tuple[str, str]] = None,
 ) -> vaex.dataframe.DataFrame:
     """Build dataframe using protein dict.
 
@@ -145,6 +173,8 @@ def build_df_from_dic(
         protein_a: Protein A in the form of BuildMatrixDict.
         protein_b: Protein B in the form of BuildMatrixDict.
         interaction_type: boolean, true if protein interacts.
+        protein_ids: ids of protein A and protein B, saved after the
+            interaction column if given.
 
     Returns:
         vaex dataframe.
@@ -157,6 +187,13 @@ def build_df_from_dic(
     else:
         interaction_array = [[]]
 
+    ids = {}
+    if protein_ids is not None:
+        ids = {
+            id_col_name[0]: pyarrow.array([protein_ids[0]]),
+            id_col_name[1]: pyarrow.array([protein_ids[1]]),
+        }
+
     return vaex.from_arrays(
         proteinA_seq=protein_a[col_name[0]],
         proteinB_seq=protein_b[col_name[0]],
@@ -179,37 +216,53 @@ def build_df_from_dic(
         proteinA_charge=protein_a[col_name[9]],
         proteinB_charge=protein_b[col_name[9]],
         interaction=interaction_array,
+        **ids,
     )
 
 
 def save_build_df(
-    list_of_logs: List[tqdm.tqdm], df_base_path: str, save_path: str, index_path: str
+    list_of_logs: List[tqdm.tqdm],
+    df_base_path: str,
+    save_path: str,
+    index_path: str,
+    memory_budget: int = 1 << 30,
+    workers: int = 1,
+    compression: Optional[str] = None,
 ) -> None:
     """Saving progress of build input from json.
 
+    Chunks are compacted into a partitioned dataset at save_path. Compaction
+    is checkpointed, so it can be interrupted and resumed.
+
     Args:
         list_of_logs: list of tqdm logs.
         df_base_path: path of last saved df.
         save_path: path to save new df.
         index_path: path of the file containing index information
+        memory_budget: bytes of memory available for compaction.
+        workers: number of row groups built at the same time.
+        compression: codec like zstd or lz4 used for the saved dataframe.
     """
+    from time import time
+
     for logger in list_of_logs:
         logger.clear()
         logger.close()
 
-    length = 0
-    with open(index_path) as fp:
-        length = int(fp.read())
-
-    if length != 0:
-        expected_time = (length // 300) + 1
-        print("Please don't press ctrl+c...")
-        print("Trying to build and save dataframe...")
-        print(f"On average machine, this will take around {expected_time}min")
-        df = read_dataframes_from_file(
-            [os.path.join(df_base_path, str(x)) for x in range(length + 1)]
-        )
-        save_dataframe_to_file(df, save_path)
+    try:
+        with open(index_path) as fp:
+            length = int(fp.read()) + 1
+    except (IOError, ValueError):
+        return
+
+    print("Building and saving dataframe...")
+    print("You can press ctrl+c, the next run continues from the last row group.")
+    start = time()
+    rows = compact_chunks(
+        df_base_path, save_path, length, memory_budget, workers, compression
+    )
+    elapsed = max(time() - start, 1e-6)
+    print(f"Saved {rows} rows in {elapsed:.1f}s ({rows / elapsed:.1f} rows/s)")
 
 
 def build_input_from_json_intermediate_step(
@@ -219,6 +272,7 @@ def build_input_from_json_intermediate_step(
     current_log: tqdm.tqdm,
     truncate_log: tqdm.tqdm,
     interaction_type: bool,
+    max_len: Optional[int] = PROTEIN_SEQ_MAX_LEN,
 ) -> vaex.dataframe:
     """Intermediate step for build input from json.
 
@@ -229,19 +283,26 @@ def build_input_from_json_intermediate_step(
         current_log: tqdm logger for current status.
         truncate_log: tqdm logger for truncate status.
         interaction_type: interaction status of both protein
+        max_len: residues kept for every protein, None keeps whole proteins.
 
     Returns:
         vaex dataframe.
     """
     current_log.set_description_str(f"Processing  [{protein_a}, {protein_b}]")
     a = build_matrix(
-        os.path.join(pdb_file_path, f"{protein_a}.pdb"), protein_a, truncate_log
+        os.path.join(pdb_file_path, f"{protein_a}.pdb"),
+        protein_a,
+        truncate_log,
+        max_len,
     )
     b = build_matrix(
-        os.path.join(pdb_file_path, f"{protein_b}.pdb"), protein_b, truncate_log
+        os.path.join(pdb_file_path, f"{protein_b}.pdb"),
+        protein_b,
+        truncate_log,
+        max_len,
     )
 
-    return build_df_from_dic(a, b, interaction_type)
+    return build_df_from_dic(a, b, interaction_type, (protein_a, protein_b))
 
 
 def get_proteins_list_from_json(file_path: str) -> Tuple[List[str], List[str]]:
@@ -269,7 +330,12 @@ def get_proteins_list_from_json(file_path: str) -> Tuple[List[str], List[str]]:
 
 
 def build_input_from_json(
-    path: str, db_name: str, filename: str, interaction_type: bool
+    path: str,
+    db_name: str,
+    filename: str,
+    interaction_type: bool,
+    compression: Optional[str] = None,
+    max_len: Optional[int] = PROTEIN_SEQ_MAX_LEN,
 ) -> None:
     """Build input from json file.
 
@@ -278,6 +344,8 @@ def build_input_from_json(
         db_name: name of the database.
         filename: name of the output file containing df.
         interaction_type: boolean, true if protein interacts.
+        compression: codec like zstd or lz4 used for the saved dataframe.
+        max_len: residues kept for every protein, None keeps whole proteins.
     """
     import os
     import warnings
@@ -329,6 +397,7 @@ def build_input_from_json(
                     current_log,
                     truncate_log,
                     interaction_type,
+                    max_len,
                 )
 
                 save_dataframe_to_file(df, os.path.join(df_chunk_base_path, str(i)))
@@ -342,10 +411,18 @@ def build_input_from_json(
 
         print("Completed...")
         save_build_df(
-            loggers, df_chunk_base_path, save_df_path, row_already_processed_path
+            loggers,
+            df_chunk_base_path,
+            save_df_path,
+            row_already_processed_path,
+            compression=compression,
         )
 
     except KeyboardInterrupt:
         save_build_df(
-            loggers, df_chunk_base_path, save_df_path, row_already_processed_path
+            loggers,
+            df_chunk_base_path,
+            save_df_path,
+            row_already_processed_path,
+            compression=compression,
         )
@@ -16,6 +16,7 @@ from anu.data.dataframe_operation import (
     read_dataframe_from_file,
     save_dataframe_to_file,
 )
+from anu.data.index.protein_index import update_protein_index
 
 
 def process_raw_csv_data(path: str, db_name: str, sep: str = "\t") -> None:
@@ -250,6 +251,9 @@ def fetch_pdb_from_df(path: str, db_name: str) -> None:
             file_path = join("final_protein_dataframes", db_name, filename)
             save_dataframe_to_file(final_df, file_path)
 
+            print("Updating protein index")
+            update_protein_index(file_path)
+
         except KeyboardInterrupt:
             current_id_log.clear()
             missing_log.clear()
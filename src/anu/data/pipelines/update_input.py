@@ -0,0 +1,565 @@
+"""Incremental maintenance of input dataframes."""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import tqdm
+import vaex
+
+from anu.data.dataframe_operation import (
+    add_tombstones_to_manifest,
+    compute_file_checksum,
+    get_base_data_path,
+    get_dataset_path,
+    open_dataframe_file,
+    read_arrow_table,
+    read_dataset,
+    read_dataset_manifest,
+    remove_partitions_from_manifest,
+    save_dataframe_partition,
+    write_arrow_table_atomically,
+    write_file_atomically,
+)
+from anu.data.index.protein_index import (
+    get_protein_index_path,
+    ProteinIndex,
+    update_index,
+)
+from anu.data.pipelines.prepare_input import (
+    build_input_from_json_intermediate_step,
+    get_proteins_list_from_json,
+    id_col_name,
+    PROTEIN_SEQ_MAX_LEN,
+)
+
+LEDGER_FILENAME = "ledger.arrow"
+# Ledger rows of the partitions appended since the ledger was last written.
+LEDGER_DELTA_DIRNAME = "ledger-deltas"
+STRUCTURES_FILENAME = "structures.json"
+DELTA_PREFIX = "delta-"
+
+LEDGER_SCHEMA = pa.schema(
+    [
+        ("key", pa.string()),
+        ("hash_a", pa.string()),
+        ("hash_b", pa.string()),
+        ("partition", pa.string()),
+        ("row", pa.int64()),
+        ("live", pa.bool_()),
+    ]
+)
+
+
+def canonical_pair_key(protein_a: str, protein_b: str) -> str:
+    """Return key of a pair which doesn't depend on the order of proteins."""
+    protein_a, protein_b = sorted([protein_a.strip(), protein_b.strip()])
+    return f"{protein_a}\t{protein_b}"
+
+
+def hash_structures(
+    protein_ids: List[str], pdb_file_path: str, cache: Dict[str, Dict]
+) -> Dict[str, Optional[str]]:
+    """Compute checksum of the pdb file of every protein.
+
+    A file is hashed again only if its size or modification time changed
+    since the checksum in cache was computed.
+
+    Args:
+        protein_ids: protein ids.
+        pdb_file_path: directory of pdb files.
+        cache: size, mtime_ns and checksum of every protein, updated in place.
+
+    Returns:
+        Return checksum of every protein, None if its pdb file is missing.
+    """
+    hashes: Dict[str, Optional[str]] = {}
+
+    for protein_id in protein_ids:
+        try:
+            stat = os.stat(os.path.join(pdb_file_path, f"{protein_id}.pdb"))
+        except FileNotFoundError:
+            cache.pop(protein_id, None)
+            hashes[protein_id] = None
+            continue
+
+        cached = cache.get(protein_id)
+        if (
+            cached is None
+            or cached["size"] != stat.st_size
+            or cached["mtime_ns"] != stat.st_mtime_ns
+        ):
+            cached = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "checksum": compute_file_checksum(
+                    os.path.join(pdb_file_path, f"{protein_id}.pdb")
+                ),
+            }
+            cache[protein_id] = cached
+
+        hashes[protein_id] = cached["checksum"]
+
+    return hashes
+
+
+def get_ledger_path(save_path: str) -> str:
+    """Return absolute path of the ledger of an input dataset."""
+    return os.path.join(get_dataset_path(save_path), LEDGER_FILENAME)
+
+
+def get_ledger_delta_path(save_path: str, partition: str) -> str:
+    """Return absolute path of the ledger rows of a partition.
+
+    Args:
+        save_path: path of the dataset relative to data/processed.
+        partition: file name of the partition in the manifest.
+
+    Returns:
+        Return absolute path of the ledger delta.
+    """
+    return os.path.join(get_dataset_path(save_path), LEDGER_DELTA_DIRNAME, partition)
+
+
+def tombstone_mask(ledger: pa.Table, deleted: Dict[str, List[int]]) -> np.ndarray:
+    """Return which ledger rows are deleted.
+
+    Args:
+        ledger: ledger of the dataset.
+        deleted: deleted rows grouped by partition.
+
+    Returns:
+        Return boolean array of the ledger rows.
+    """
+    rows = ledger["row"].to_numpy()
+    if len(rows) == 0:
+        return np.zeros(0, dtype=bool)
+
+    # Partition and row are combined into one integer key of every row.
+    partitions = ledger["partition"].combine_chunks().dictionary_encode()
+    codes = {name: i for i, name in enumerate(partitions.dictionary.to_pylist())}
+    stride = 1 + max(
+        [rows.max()] + [max(items, default=0) for items in deleted.values()]
+    )
+    keys = partitions.indices.to_numpy().astype(np.int64) * stride + rows
+    removed = [
+        codes[name] * stride + np.asarray(items, dtype=np.int64)
+        for name, items in deleted.items()
+        if name in codes
+    ]
+
+    return np.isin(keys, np.concatenate([np.empty(0, dtype=np.int64), *removed]))
+
+
+def read_ledger(save_path: str) -> pa.Table:
+    """Read the ledger of an input dataset.
+
+    The ledger lists the canonical pair and the structure checksums of every
+    row of the dataset. Ledger rows of partitions appended by an update are
+    saved as ledger deltas until the update completes, see
+    update_input_from_json. Rows of partitions missing from the manifest
+    are dropped and rows tombstoned in the manifest are marked dead, so the
+    ledger agrees with the manifest after an interrupted update.
+
+    Args:
+        save_path: path of the dataset relative to data/processed.
+
+    Returns:
+        Return the ledger, empty if the dataset has no ledger.
+    """
+    path = get_ledger_path(save_path)
+    if not os.path.exists(path):
+        return LEDGER_SCHEMA.empty_table()
+
+    ledger = read_arrow_table(path)
+    delta_path = os.path.dirname(get_ledger_delta_path(save_path, ""))
+    if os.path.isdir(delta_path):
+        # Deltas already in the ledger were left by an interrupted cleanup.
+        known = set(pc.unique(ledger["partition"]).to_pylist())
+        deltas = [
+            read_arrow_table(os.path.join(delta_path, name))
+            for name in sorted(os.listdir(delta_path))
+            if name not in known and not name.startswith(".")
+        ]
+        ledger = pa.concat_tables([ledger, *deltas])
+
+    manifest = read_dataset_manifest(save_path)
+    entries = [] if manifest is None else manifest["partitions"]
+    ledger = ledger.filter(
+        pc.is_in(ledger["partition"], pa.array([entry["name"] for entry in entries]))
+    )
+
+    # Tombstones written to the manifest before the ledger was saved.
+    deleted = {entry["name"]: entry["meta"].get("deleted", []) for entry in entries}
+    live = pc.and_(ledger["live"], pa.array(~tombstone_mask(ledger, deleted)))
+
+    return ledger.set_column(ledger.schema.get_field_index("live"), "live", live)
+
+
+def write_ledger(save_path: str, ledger: pa.Table) -> None:
+    """Write the ledger of an input dataset and remove the ledger deltas.
+
+    Args:
+        save_path: path of the dataset relative to data/processed.
+        ledger: ledger of the dataset, with the rows of the deltas.
+    """
+    write_arrow_table_atomically(ledger, get_ledger_path(save_path))
+
+    delta_path = os.path.dirname(get_ledger_delta_path(save_path, ""))
+    if os.path.isdir(delta_path):
+        shutil.rmtree(delta_path)
+
+
+def bootstrap_ledger(
+    save_path: str, pdb_file_path: str, cache: Dict[str, Dict]
+) -> pa.Table:
+    """Build the ledger of a dataset built before incremental updates.
+
+    Structures are assumed unchanged since the rows were featurized.
+
+    Args:
+        save_path: path of the dataset relative to data/processed.
+        pdb_file_path: directory of pdb files.
+        cache: structure checksum cache, updated in place.
+
+    Returns:
+        Return the ledger, empty if the dataset doesn't exist.
+
+    Raises:
+        ValueError: if a partition has no protein id columns, i.e. the
+            dataset was built before they were saved and must be rebuilt.
+    """
+    manifest = read_dataset_manifest(save_path)
+    if manifest is None:
+        return LEDGER_SCHEMA.empty_table()
+
+    tables = [LEDGER_SCHEMA.empty_table()]
+    dataset_path = get_dataset_path(save_path)
+
+    for entry in manifest["partitions"]:
+        df = open_dataframe_file(os.path.join(dataset_path, entry["name"]))
+        if not set(id_col_name).issubset(df.get_column_names()):
+            raise ValueError(
+                f"{save_path} has no protein ids and can't be updated, rebuild "
+                "it with: anu data prepare inputs"
+            )
+        ids = df.to_arrow_table(column_names=id_col_name)
+        first = [str(item) for item in ids.column(0).to_pylist()]
+        second = [str(item) for item in ids.column(1).to_pylist()]
+        hashes = hash_structures(sorted(set(first + second)), pdb_file_path, cache)
+
+        deleted = set(entry["meta"].get("deleted", []))
+        tables.append(
+            pa.table(
+                {
+                    "key": [canonical_pair_key(a, b) for a, b in zip(first, second)],
+                    "hash_a": [hashes[a] for a in first],
+                    "hash_b": [hashes[b] for b in second],
+                    "partition": [entry["name"]] * len(first),
+                    "row": np.arange(len(first), dtype=np.int64),
+                    "live": [row not in deleted for row in range(len(first))],
+                },
+                schema=LEDGER_SCHEMA,
+            )
+        )
+
+    return pa.concat_tables(tables)
+
+
+def get_ledger_pairs(ledger: pa.Table) -> pa.Table:
+    """Split the canonical pair of every ledger row into two protein ids.
+
+    Args:
+        ledger: ledger of the dataset.
+
+    Returns:
+        Return arrow table of the two protein ids of every row.
+    """
+    parts = pc.split_pattern(ledger["key"], "\t")
+    return pa.table(
+        {"first": pc.list_element(parts, 0), "second": pc.list_element(parts, 1)}
+    )
+
+
+def update_ledger_index(save_path: str, ledger: pa.Table) -> ProteinIndex:
+    """Build or update the protein index of the ledger of a dataset.
+
+    Rows of the ledger are stable ids of the dataset rows: every ledger row
+    names a partition and a row of it, and rows are only appended while the
+    partitions are left in place.
+
+    Args:
+        save_path: path of the dataset relative to data/processed.
+        ledger: ledger of the dataset.
+
+    Returns:
+        Return the index from protein id to ledger rows.
+    """
+    return update_index(get_protein_index_path(save_path), get_ledger_pairs(ledger))
+
+
+def find_input_rows(save_path: str, protein_id: str) -> vaex.dataframe.DataFrame:
+    """Return the rows of an input dataset containing the protein.
+
+    Args:
+        save_path: path of the dataset relative to data/processed.
+        protein_id: protein id.
+
+    Returns:
+        vaex dataframe with the live rows containing the protein.
+
+    Raises:
+        OSError: if the dataset has no ledger, i.e. was never updated
+            incrementally.
+    """
+    if not os.path.exists(get_ledger_path(save_path)):
+        raise OSError(f"No ledger for {save_path}")
+
+    ledger = read_ledger(save_path)
+    found = update_ledger_index(save_path, ledger).lookup(protein_id)
+    found = found[ledger["live"].to_numpy(zero_copy_only=False)[found]]
+
+    # Rows of read_dataset are the live rows of the partitions in order.
+    manifest = read_dataset_manifest(save_path)
+    entries = [] if manifest is None else manifest["partitions"]
+    positions = {entry["name"]: i for i, entry in enumerate(entries)}
+    deleted = [np.asarray(entry["meta"].get("deleted", [])) for entry in entries]
+    starts = np.cumsum(
+        [0] + [entry["rows"] - len(rows) for entry, rows in zip(entries, deleted)]
+    )
+
+    partitions = ledger["partition"].take(pa.array(found)).to_pylist()
+    rows = ledger["row"].take(pa.array(found)).to_numpy()
+    take = [
+        starts[positions[name]] + row - np.searchsorted(deleted[positions[name]], row)
+        for name, row in zip(partitions, rows)
+    ]
+
+    return read_dataset(save_path).take(np.asarray(take, dtype=np.int64))
+
+
+def plan_update(
+    ledger: pa.Table,
+    pairs: List[Tuple[str, str]],
+    hashes: Dict[str, Optional[str]],
+    index: Optional[ProteinIndex] = None,
+    changed: Optional[List[str]] = None,
+) -> Tuple[List[Tuple[str, str]], Dict[str, List[int]]]:
+    """Compare wanted pairs with the ledger.
+
+    Without index, the structure checksums of every live row are compared.
+    With the index of the ledger, only the rows of the changed proteins are
+    looked up and compared.
+
+    Args:
+        ledger: ledger of the dataset.
+        pairs: wanted pairs, in the order of the source.
+        hashes: current structure checksum of every protein.
+        index: index of the ledger, see update_ledger_index.
+        changed: proteins whose structure checksum changed since the last
+            update, used with index.
+
+    Returns:
+        Return pairs to featurize and rows to tombstone, grouped by
+        partition. Rows are tombstoned if their pair is gone, if one of
+        their structures is gone or if one of their structures changed.
+    """
+    wanted: Dict[str, Tuple[str, str]] = {}
+    for protein_a, protein_b in pairs:
+        if hashes[protein_a] is not None and hashes[protein_b] is not None:
+            wanted.setdefault(
+                canonical_pair_key(protein_a, protein_b), (protein_a, protein_b)
+            )
+
+    live = ledger["live"].to_numpy(zero_copy_only=False)
+    keys = pa.array(list(wanted), type=pa.string())
+    found = pc.is_in(ledger["key"], keys).to_numpy(zero_copy_only=False)
+    stale = live & ~found
+
+    if index is None:
+        compared = np.flatnonzero(live & found)
+    else:
+        rows = [index.lookup(protein_id) for protein_id in changed or []]
+        compared = np.unique(np.concatenate([np.empty(0, dtype=np.int64), *rows]))
+        compared = compared[(live & found)[compared]]
+
+    for row, key, hash_a, hash_b in zip(
+        compared,
+        ledger["key"].take(pa.array(compared)).to_pylist(),
+        ledger["hash_a"].take(pa.array(compared)).to_pylist(),
+        ledger["hash_b"].take(pa.array(compared)).to_pylist(),
+    ):
+        protein_a, protein_b = wanted[key]
+        if sorted([hash_a, hash_b]) != sorted([hashes[protein_a], hashes[protein_b]]):
+            stale[row] = True
+
+    kept = pc.is_in(keys, ledger["key"].filter(pa.array(live & ~stale)))
+    featurize = [wanted[key] for key in keys.filter(pc.invert(kept)).to_pylist()]
+
+    deleted: Dict[str, List[int]] = {}
+    rows = np.flatnonzero(stale)
+    for partition, row in zip(
+        ledger["partition"].take(pa.array(rows)).to_pylist(),
+        ledger["row"].take(pa.array(rows)).to_pylist(),
+    ):
+        deleted.setdefault(partition, []).append(row)
+
+    return featurize, deleted
+
+
+def update_input_from_json(
+    path: str,
+    db_name: str,
+    filename: str,
+    interaction_type: bool,
+    compression: Optional[str] = None,
+    max_len: Optional[int] = PROTEIN_SEQ_MAX_LEN,
+    partition_rows: int = 256,
+) -> Tuple[int, int]:
+    """Update input dataframe with only the pairs which changed.
+
+    Pairs are keyed by canonical pair and by the checksums of their
+    structures. New pairs and pairs whose structures changed are featurized
+    and appended as new partitions of the dataset manifest. Rows of removed
+    pairs and of missing or changed structures are tombstoned. Rows of
+    changed structures are found with the protein index of the ledger, see
+    update_ledger_index.
+
+    The update is checkpointed after every partition and can be resumed:
+    ledger rows of every new partition are saved as a small ledger delta,
+    and merged into the ledger once the update completes.
+
+    Args:
+        path: path of json file.
+        db_name: name of the database.
+        filename: name of the output dataset.
+        interaction_type: boolean, true if protein interacts.
+        compression: codec like zstd or lz4 used for the new partitions.
+        max_len: residues kept for every protein, None keeps whole proteins.
+        partition_rows: rows in one new partition.
+
+    Returns:
+        Return number of featurized pairs and of tombstoned rows.
+    """
+    import warnings
+
+    warnings.simplefilter("ignore")
+    file_path = os.path.join(get_base_data_path(), "processed", "protein_id", path)
+    pdb_file_path = os.path.join(get_base_data_path(), "raw", "pdb")
+    save_path = os.path.join("input", db_name, filename)
+    dataset_path = get_dataset_path(save_path)
+    os.makedirs(dataset_path, exist_ok=True)
+
+    structures_path = os.path.join(dataset_path, STRUCTURES_FILENAME)
+    cache: Dict[str, Dict] = {}
+    if os.path.exists(structures_path):
+        with open(structures_path) as fp:
+            cache = json.load(fp)
+
+    if os.path.exists(get_ledger_path(save_path)):
+        ledger = read_ledger(save_path)
+    else:
+        ledger = bootstrap_ledger(save_path, pdb_file_path, cache)
+        write_ledger(save_path, ledger)
+
+    # Partitions written by an interrupted update but missing from the ledger.
+    manifest = read_dataset_manifest(save_path)
+    known = set(ledger["partition"].to_pylist())
+    orphans = [
+        entry["name"]
+        for entry in ([] if manifest is None else manifest["partitions"])
+        if entry["name"].startswith(DELTA_PREFIX) and entry["name"] not in known
+    ]
+    if len(orphans) > 0:
+        remove_partitions_from_manifest(save_path, orphans)
+
+    protein_list_a, protein_list_b = get_proteins_list_from_json(file_path)
+    pairs = list(zip(protein_list_a, protein_list_b))
+    previous = {protein_id: cached["checksum"] for protein_id, cached in cache.items()}
+    hashes = hash_structures(
+        sorted(set(protein_list_a) | set(protein_list_b)), pdb_file_path, cache
+    )
+    changed = [
+        protein_id
+        for protein_id, checksum in hashes.items()
+        if checksum != previous.get(protein_id)
+    ]
+
+    index = update_ledger_index(save_path, ledger)
+    featurize, deleted = plan_update(ledger, pairs, hashes, index, changed)
+
+    if len(deleted) > 0:
+        add_tombstones_to_manifest(save_path, deleted)
+        ledger = ledger.set_column(
+            ledger.schema.get_field_index("live"),
+            "live",
+            pc.and_(ledger["live"], pa.array(~tombstone_mask(ledger, deleted))),
+        )
+
+    # Rows of changed structures are tombstoned, their checksums can be saved.
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "w") as fp:
+            json.dump(cache, fp)
+
+    write_file_atomically(structures_path, write)
+
+    manifest = read_dataset_manifest(save_path)
+    number = sum(
+        entry["name"].startswith(DELTA_PREFIX)
+        for entry in ([] if manifest is None else manifest["partitions"])
+    )
+
+    current_log = tqdm.tqdm(total=0, position=1, bar_format="{desc}", leave=False)
+    truncate_log = tqdm.tqdm(total=0, position=2, bar_format="{desc}", leave=False)
+    progress_log = tqdm.tqdm(total=len(featurize), position=0, leave=False)
+
+    for start in range(0, len(featurize), partition_rows):
+        batch = featurize[start : start + partition_rows]
+        df = vaex.concat(
+            [
+                build_input_from_json_intermediate_step(
+                    protein_a,
+                    protein_b,
+                    pdb_file_path,
+                    current_log,
+                    truncate_log,
+                    interaction_type,
+                    max_len,
+                )
+                for protein_a, protein_b in batch
+            ]
+        )
+
+        name = f"{DELTA_PREFIX}{number:05d}"
+        number = number + 1
+        save_dataframe_partition(
+            df, save_path, name, {"kind": "delta"}, compression=compression
+        )
+
+        delta = pa.table(
+            {
+                "key": [canonical_pair_key(a, b) for a, b in batch],
+                "hash_a": [hashes[a] for a, _ in batch],
+                "hash_b": [hashes[b] for _, b in batch],
+                "partition": [f"{name}.arrow"] * len(batch),
+                "row": np.arange(len(batch), dtype=np.int64),
+                "live": [True] * len(batch),
+            },
+            schema=LEDGER_SCHEMA,
+        )
+        delta_path = get_ledger_delta_path(save_path, f"{name}.arrow")
+        os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+        write_arrow_table_atomically(delta, delta_path)
+        ledger = pa.concat_tables([ledger, delta])
+        progress_log.update(len(batch))
+
+    for logger in [current_log, truncate_log, progress_log]:
+        logger.close()
+
+    write_ledger(save_path, ledger)
+
+    return len(featurize), sum(len(rows) for rows in deleted.values())
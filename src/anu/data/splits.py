@@ -0,0 +1,479 @@
+"""Train, test and validation splits of pair dataframes."""
+
+from typing import List, Optional, Tuple, Union
+
+from logzero import logger
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import vaex
+
+from anu.data.negative_sampling import encode_protein_ids, pair_keys
+
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def assign_cluster_splits(
+    labels: np.ndarray, frac: List[float], random_state: Optional[int] = None
+) -> np.ndarray:
+    """Assign whole clusters of proteins to splits.
+
+    Clusters are visited in random order and assigned to the first split
+    until it holds frac[0] of the proteins, then to the second one and so on.
+
+    Args:
+        labels: cluster label of every protein.
+        frac: fraction of proteins in every split.
+        random_state: seed for reproducibility.
+
+    Returns:
+        Return split of every protein.
+    """
+    clusters, inverse, counts = np.unique(
+        labels, return_inverse=True, return_counts=True
+    )
+    rng = np.random.default_rng(random_state)
+    order = rng.permutation(len(clusters))
+
+    # Split of a cluster is decided by the proteins placed before its middle.
+    middle = np.cumsum(counts[order]) - counts[order] / 2
+    bounds = np.cumsum(frac) / np.sum(frac) * len(labels)
+    cluster_split = np.empty(len(clusters), dtype=np.int64)
+    cluster_split[order] = np.minimum(
+        np.searchsorted(bounds, middle, side="right"), len(frac) - 1
+    )
+
+    return cluster_split[inverse]
+
+
+def get_pair_clusters(
+    df: vaex.dataframe.DataFrame,
+    clusters_df: vaex.dataframe.DataFrame,
+    id_columns: List[str],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Look up the cluster of both proteins of every row.
+
+    Args:
+        df: input dataframe.
+        clusters_df: dataframe with protein_id and cluster columns, sorted by
+            protein_id.
+        id_columns: columns of df holding ids of protein A and protein B.
+
+    Returns:
+        Return cluster of protein A and cluster of protein B.
+
+    Raises:
+        ValueError: if a protein of df has no cluster.
+    """
+    ids = np.asarray(clusters_df["protein_id"].tolist(), dtype=str)
+    labels = clusters_df["cluster"].to_numpy()
+    table = df.to_arrow_table(column_names=id_columns)
+
+    codes = [encode_protein_ids(ids, column.combine_chunks()) for column in table]
+    if any((code < 0).any() for code in codes):
+        raise ValueError("Some proteins have no cluster, cluster them again")
+
+    return labels[codes[0]], labels[codes[1]]
+
+
+def traverse_graph(
+    first: np.ndarray, second: np.ndarray, size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Order nodes of a graph breadth first, from random starting nodes.
+
+    Every component is visited from one starting node before the next
+    component, so linked nodes are close to each other in the order.
+
+    Args:
+        first: first node of every edge.
+        second: second node of every edge.
+        size: number of nodes.
+        rng: random generator choosing the starting nodes.
+
+    Returns:
+        Return position of every node in the order.
+    """
+    from collections import deque
+
+    nodes = np.concatenate([first, second])
+    neighbours = np.concatenate([second, first])[np.argsort(nodes, kind="stable")]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(nodes, minlength=size))])
+
+    visited = np.zeros(size, dtype=bool)
+    order: List[int] = []
+    for start in rng.permutation(size):
+        if visited[start]:
+            continue
+        visited[start] = True
+        queue = deque([int(start)])
+        while len(queue) > 0:
+            node = queue.popleft()
+            order.append(node)
+            linked = np.unique(neighbours[indptr[node] : indptr[node + 1]])
+            linked = linked[~visited[linked]]
+            visited[linked] = True
+            queue.extend(linked.tolist())
+
+    position = np.empty(size, dtype=np.int64)
+    position[order] = np.arange(size)
+    return position
+
+
+def strict_cluster_splits(
+    first: np.ndarray,
+    second: np.ndarray,
+    frac: List[float],
+    random_state: Optional[int] = None,
+    iterations: int = 10,
+) -> np.ndarray:
+    """Assign rows to splits so that no cluster is shared between splits.
+
+    Clusters are ordered breadth first over the graph of clusters linked by
+    rows, see traverse_graph, and every split takes a segment of the order,
+    the last split first, until it holds its fraction of the kept rows.
+    Only rows linking clusters of two segments are dropped, i.e. rows of the
+    components cut at the ends of the segments.
+
+    Args:
+        first: cluster of protein A of every row.
+        second: cluster of protein B of every row.
+        frac: fraction of kept rows in every split.
+        random_state: seed for reproducibility.
+        iterations: refinements of the number of kept rows the fractions
+            are taken of.
+
+    Returns:
+        Return split of every row, -1 for dropped rows.
+    """
+    nodes, codes = np.unique(np.concatenate([first, second]), return_inverse=True)
+    position = traverse_graph(
+        codes[: len(first)],
+        codes[len(first) :],
+        len(nodes),
+        np.random.default_rng(random_state),
+    )
+    low = np.minimum(position[codes[: len(first)]], position[codes[len(first) :]])
+    high = np.maximum(position[codes[: len(first)]], position[codes[len(first) :]])
+    shares = np.asarray(frac, dtype=np.float64) / np.sum(frac)
+
+    kept = len(first)
+    for _ in range(iterations):
+        ends: List[int] = []
+        for share in shares[:0:-1]:
+            # Rows whose clusters are both in the segment from the last end.
+            start = ends[-1] if len(ends) > 0 else 0
+            held = np.cumsum(np.bincount(high[low >= start], minlength=len(nodes)))
+            ends.append(min(int(np.searchsorted(held, share * kept)) + 1, len(nodes)))
+
+        segment = np.searchsorted(ends, low, side="right")
+        split = np.where(
+            segment == np.searchsorted(ends, high, side="right"),
+            len(frac) - 1 - segment,
+            -1,
+        )
+        if (split >= 0).sum() == kept:
+            break
+        kept = int((split >= 0).sum())
+
+    return split
+
+
+def cluster_split_dataframe(
+    df: vaex.dataframe.DataFrame,
+    clusters_df: vaex.dataframe.DataFrame,
+    frac: List[float],
+    random_state: Optional[int] = None,
+    id_columns: Optional[List[str]] = None,
+    strict: bool = True,
+) -> List[vaex.dataframe.DataFrame]:
+    """Split a pair dataframe so that similar proteins stay in one split.
+
+    If strict, no cluster is shared between splits, see
+    strict_cluster_splits; only rows linking clusters cut between two
+    splits are dropped, and logged. Otherwise proteins are split
+    cluster by cluster and a row whose proteins fall in different splits
+    goes to the later split, so no row is dropped and every row of a later
+    split has a protein of a cluster missing from the training split.
+
+    Args:
+        df: input dataframe.
+        clusters_df: dataframe with protein_id and cluster columns.
+        frac: fraction of rows in every split, of proteins if not strict.
+        random_state: seed for reproducibility.
+        id_columns: columns of df holding ids of protein A and protein B.
+        strict: keep every cluster in one split.
+
+    Returns:
+        Return one dataframe per split.
+    """
+    id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+    first, second = get_pair_clusters(df, clusters_df, id_columns)
+
+    if strict:
+        split = strict_cluster_splits(first, second, frac, random_state)
+        dropped = int((split < 0).sum())
+        if dropped > 0:
+            logger.warning(
+                f"Dropped {dropped} of {len(split)} rows linking clusters "
+                "of two splits"
+            )
+        return [df.take(np.flatnonzero(split == s)) for s in range(len(frac))]
+
+    clusters = clusters_df["cluster"].to_numpy()
+    protein_split = assign_cluster_splits(clusters, frac, random_state)
+
+    # Cluster labels are protein positions, every protein of a cluster has
+    # the same split.
+    cluster_split = np.zeros(len(clusters), dtype=np.int64)
+    cluster_split[clusters] = protein_split
+    split = np.maximum(cluster_split[first], cluster_split[second])
+
+    return [df.take(np.flatnonzero(split == s)) for s in range(len(frac))]
+
+
+def downsample_clusters(
+    df: vaex.dataframe.DataFrame,
+    clusters_df: vaex.dataframe.DataFrame,
+    max_per_cluster: int,
+    random_state: Optional[int] = None,
+    id_columns: Optional[List[str]] = None,
+) -> vaex.dataframe.DataFrame:
+    """Keep at most max_per_cluster random rows of every pair of clusters.
+
+    Args:
+        df: input dataframe.
+        clusters_df: dataframe with protein_id and cluster columns.
+        max_per_cluster: rows kept for every pair of clusters.
+        random_state: seed for reproducibility.
+        id_columns: columns of df holding ids of protein A and protein B.
+
+    Returns:
+        Return the downsampled dataframe, rows keep their order.
+    """
+    id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+    first, second = get_pair_clusters(df, clusters_df, id_columns)
+    keys = pair_keys(first, second)
+
+    rng = np.random.default_rng(random_state)
+    order = rng.permutation(len(keys))
+    order = order[np.argsort(keys[order], kind="stable")]
+
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    rank = np.arange(len(keys)) - group_start
+
+    return df.take(np.sort(order[rank < max_per_cluster]))
+
+
+def stable_hash(values: Union[np.ndarray, pa.Array]) -> np.ndarray:
+    """Compute 64 bit FNV-1a hashes of strings.
+
+    Unlike the builtin hash, the hashes are the same on every run, process
+    and machine.
+
+    Args:
+        values: strings, surrounding whitespace is ignored.
+
+    Returns:
+        Return the hashes.
+    """
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if not isinstance(values, pa.Array):
+        values = pa.array(np.asarray(values, dtype=str))
+
+    strings = pc.utf8_trim_whitespace(values.cast(pa.large_string()))
+    offsets = np.frombuffer(strings.buffers()[1], dtype=np.int64)
+    offsets = offsets[strings.offset : strings.offset + len(strings) + 1]
+    buffer = strings.buffers()[2]
+    data = np.frombuffer(buffer, dtype=np.uint8) if buffer is not None else None
+
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+
+    hashes = np.full(len(strings), FNV_OFFSET, dtype=np.uint64)
+    for i in range(int(lengths.max()) if len(lengths) > 0 else 0):
+        # Only strings longer than i have an i-th byte.
+        rows = np.flatnonzero(lengths > i)
+        byte = data[starts[rows] + i].astype(np.uint64)
+        hashes[rows] = (hashes[rows] ^ byte) * FNV_PRIME
+
+    return hashes
+
+
+def hash_to_fraction(hashes: np.ndarray, salt: int = 0) -> np.ndarray:
+    """Map hashes to uniformly spread numbers in [0, 1).
+
+    Args:
+        hashes: 64 bit hashes.
+        salt: changes the mapping, so one hash gives independent splits.
+
+    Returns:
+        Return the fractions.
+    """
+    # splitmix64 finalizer spreads similar hashes over the whole range.
+    x = hashes + np.uint64(salt * 0x9E3779B97F4A7C15 % (1 << 64))
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+@vaex.register_function()
+def pair_hash_fraction(
+    first: Union[np.ndarray, pa.Array], second: Union[np.ndarray, pa.Array], salt: int
+) -> np.ndarray:
+    """Map protein pairs to [0, 1) independently of the order of the pair.
+
+    Registered as vaex function, so it is evaluated lazily chunk by chunk.
+
+    Args:
+        first: ids of the first protein of every row.
+        second: ids of the second protein of every row.
+        salt: changes the mapping.
+
+    Returns:
+        Return fraction of every pair.
+    """
+    first_hash = stable_hash(first)
+    second_hash = stable_hash(second)
+
+    low = np.minimum(first_hash, second_hash)
+    high = np.maximum(first_hash, second_hash)
+
+    return hash_to_fraction(low * FNV_PRIME ^ high, salt)
+
+
+@vaex.register_function()
+def protein_hash_fraction(values: Union[np.ndarray, pa.Array], salt: int) -> np.ndarray:
+    """Map protein ids to [0, 1).
+
+    Registered as vaex function, so it is evaluated lazily chunk by chunk.
+
+    Args:
+        values: protein ids.
+        salt: changes the mapping.
+
+    Returns:
+        Return fraction of every protein.
+    """
+    return hash_to_fraction(stable_hash(values), salt)
+
+
+def split_bounds(frac: List[float]) -> np.ndarray:
+    """Return bounds in [0, 1] of the hash fractions of every split."""
+    bounds = np.concatenate([[0.0], np.cumsum(frac) / np.sum(frac)])
+    bounds[-1] = 1.0
+    return bounds
+
+
+class HashSplitFilter:
+    """Select rows of one hash split from arrow tables.
+
+    Same assignment as hash_split_dataframe, for rows streamed as record
+    batches instead of read from a vaex dataframe.
+    """
+
+    def __init__(
+        self: "HashSplitFilter",
+        frac: List[float],
+        split: int,
+        by: str = "pair",
+        salt: int = 0,
+        id_columns: Optional[List[str]] = None,
+    ) -> None:
+        """Initialize filter.
+
+        Args:
+            frac: fraction of rows (or proteins) in every split.
+            split: index of the selected split in frac.
+            by: pair or protein.
+            salt: changes the assignment of rows to splits.
+            id_columns: columns holding ids of protein A and protein B.
+
+        Raises:
+            ValueError: if by is neither pair nor protein.
+        """
+        if by not in ["pair", "protein"]:
+            raise ValueError(f"Unable to split by {by}")
+
+        self.low, self.high = split_bounds(frac)[split : split + 2]
+        self.by = by
+        self.salt = salt
+        self.id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+
+    def __call__(self: "HashSplitFilter", table: pa.Table) -> np.ndarray:
+        """Return True for rows of table in the selected split."""
+        first = table.column(self.id_columns[0]).combine_chunks()
+        second = table.column(self.id_columns[1]).combine_chunks()
+
+        if self.by == "pair":
+            fractions = [pair_hash_fraction(first, second, self.salt)]
+        else:
+            fractions = [
+                protein_hash_fraction(first, self.salt),
+                protein_hash_fraction(second, self.salt),
+            ]
+
+        selection = np.ones(len(table), dtype=bool)
+        for fraction in fractions:
+            selection &= (fraction >= self.low) & (fraction < self.high)
+        return selection
+
+
+def hash_split_dataframe(
+    df: vaex.dataframe.DataFrame,
+    frac: List[float],
+    by: str = "pair",
+    salt: int = 0,
+    id_columns: Optional[List[str]] = None,
+) -> List[vaex.dataframe.DataFrame]:
+    """Split a pair dataframe with a stable hash of every row.
+
+    A row goes to the split its hash falls in, so the split of a row never
+    changes when rows are appended and is the same in every run and worker.
+    No index is built, the splits are lazy filters of df.
+
+    With by set to protein, proteins are hashed instead of pairs and a row
+    is kept only if both its proteins fall in the same split, so no protein
+    is shared between splits.
+
+    Args:
+        df: input dataframe.
+        frac: fraction of rows (or proteins) in every split.
+        by: pair or protein.
+        salt: changes the assignment of rows to splits.
+        id_columns: columns of df holding ids of protein A and protein B.
+
+    Returns:
+        Return one dataframe per split.
+
+    Raises:
+        ValueError: if by is neither pair nor protein.
+    """
+    id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+    first, second = df[id_columns[0]], df[id_columns[1]]
+
+    if by == "pair":
+        fractions = [df.func.pair_hash_fraction(first, second, salt)]
+    elif by == "protein":
+        fractions = [
+            df.func.protein_hash_fraction(first, salt),
+            df.func.protein_hash_fraction(second, salt),
+        ]
+    else:
+        raise ValueError(f"Unable to split by {by}")
+
+    bounds = split_bounds(frac)
+
+    splits = []
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        selection = (fractions[0] >= low) & (fractions[0] < high)
+        for fraction in fractions[1:]:
+            selection = selection & (fraction >= low) & (fraction < high)
+        splits.append(df[selection])
+
+    return splits
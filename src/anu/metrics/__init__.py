@@ -1 +1,3 @@
 """Metrics module."""
+
+from . import classification  # noqa
@@ -0,0 +1,66 @@
+"""Binary classification metrics."""
+
+from typing import Dict
+
+import numpy as np
+
+
+def roc_auc(labels: np.ndarray, scores: np.ndarray) -> float:
+    """Area under the roc curve, from the ranks of the scores.
+
+    Tied scores get their average rank, like the Mann-Whitney U statistic.
+
+    Args:
+        labels: 1 for positive samples, 0 for negative ones.
+        scores: higher for samples more likely positive.
+
+    Returns:
+        Return the area, nan if only one class is present.
+    """
+    labels = np.asarray(labels, dtype=bool)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    if positives == 0 or negatives == 0:
+        return float("nan")
+
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2)[inverse]
+
+    return float(
+        (ranks[labels].sum() - positives * (positives + 1) / 2)
+        / (positives * negatives)
+    )
+
+
+def classification_metrics(
+    labels: np.ndarray, scores: np.ndarray, threshold: float = 0.5
+) -> Dict[str, float]:
+    """Accuracy, precision, recall, f1 and roc auc of binary predictions.
+
+    Args:
+        labels: 1 for positive samples, 0 for negative ones.
+        scores: probability of every sample to be positive.
+        threshold: samples with a higher score are predicted positive.
+
+    Returns:
+        Return every metric by name, precision and recall are 0 when they
+        are undefined.
+    """
+    labels = np.asarray(labels, dtype=bool)
+    predictions = np.asarray(scores) > threshold
+
+    true_positives = int((predictions & labels).sum())
+    predicted = int(predictions.sum())
+    actual = int(labels.sum())
+
+    precision = true_positives / predicted if predicted > 0 else 0.0
+    recall = true_positives / actual if actual > 0 else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if true_positives > 0 else 0.0
+
+    return {
+        "accuracy": float((predictions == labels).mean()) if len(labels) else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "roc_auc": roc_auc(labels, scores),
+    }
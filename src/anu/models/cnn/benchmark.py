@@ -0,0 +1,133 @@
+"""Fixed training benchmark of the cnn model."""
+
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+import numpy as np
+import torch
+from torch.nn import CrossEntropyLoss
+from torch.optim import Adam
+
+from anu.models.cnn.config import (
+    CNNTrainerConfig,
+    get_accelerated_cnn_trainer_config,
+    get_default_cnn_trainer_config,
+)
+from anu.models.cnn.model import ConvNet
+from anu.models.cnn.trainer import GradientAccumulator, prepare_model
+
+
+class BenchmarkResult(TypedDict):
+    """Throughput and losses of a benchmark run."""
+
+    samples_per_second: float
+    losses: List[float]
+
+
+def synthetic_batches(
+    batches: int, batch_size: int, window: int = 4000, seed: int = 0
+) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Build reproducible batches shaped like the input dataframe.
+
+    Args:
+        batches: number of batches.
+        batch_size: samples in one batch.
+        window: residues of every protein.
+        seed: seed of the values.
+
+    Returns:
+        Return one hot labels and inputs of every batch.
+    """
+    rng = np.random.default_rng(seed)
+    result = []
+    for _ in range(batches):
+        classes = rng.integers(0, 2, batch_size)
+        labels = np.eye(2, dtype=np.int64)[classes]
+        inputs = rng.standard_normal((batch_size, 1, 10, 2 * window))
+        # Shift inputs with the class, so the loss can decrease.
+        inputs[:, :, :, : window // 2] += classes[:, None, None, None]
+        result.append((torch.from_numpy(labels), torch.from_numpy(inputs)))
+
+    return result
+
+
+def benchmark_training(
+    config: CNNTrainerConfig,
+    batches: List[Tuple[torch.Tensor, torch.Tensor]],
+    window: int = 4000,
+    warmup: int = 2,
+    seed: int = 0,
+) -> BenchmarkResult:
+    """Time training steps of ConvNet over fixed batches.
+
+    Every run starts from the same weights, so losses of two configs can be
+    compared step by step.
+
+    Args:
+        config: trainer config.
+        batches: labels and inputs, see synthetic_batches.
+        window: residues of every protein.
+        warmup: steps run before timing, they include compilation.
+        seed: seed of the initial weights.
+
+    Returns:
+        Return samples per second of the timed steps and loss of every step.
+    """
+    torch.manual_seed(seed)
+    _, model = prepare_model(
+        ConvNet(window=window, checkpoint=config["checkpoint_activations"]), config
+    )
+    optimizer = Adam(model.parameters(), lr=0.0001)
+    accumulator = GradientAccumulator(model, optimizer, CrossEntropyLoss(), config)
+
+    losses = []
+    samples = 0
+    start = perf_counter()
+    for step, (labels, inputs) in enumerate(batches):
+        if step == warmup:
+            samples = 0
+            start = perf_counter()
+        losses.append(accumulator.step(labels, inputs))
+        samples = samples + len(labels)
+    accumulator.update()
+
+    return {
+        "samples_per_second": samples / max(perf_counter() - start, 1e-9),
+        "losses": losses,
+    }
+
+
+def compare_acceleration(
+    batch_size: int = 16,
+    steps: int = 20,
+    window: int = 4000,
+    config: Optional[CNNTrainerConfig] = None,
+    seed: int = 0,
+) -> Dict[str, BenchmarkResult]:
+    """Benchmark the float32 baseline against an accelerated config.
+
+    Args:
+        batch_size: samples in one batch.
+        steps: training steps of every run.
+        window: residues of every protein.
+        config: accelerated config, get_accelerated_cnn_trainer_config if None.
+        seed: seed of the batches and of the initial weights.
+
+    Returns:
+        Return result of the baseline and of the accelerated run.
+    """
+    batches = synthetic_batches(steps, batch_size, window, seed)
+    warmup = min(2, steps - 1)
+
+    return {
+        "baseline": benchmark_training(
+            get_default_cnn_trainer_config(), batches, window, warmup, seed
+        ),
+        "accelerated": benchmark_training(
+            config or get_accelerated_cnn_trainer_config(),
+            batches,
+            window,
+            warmup,
+            seed,
+        ),
+    }
@@ -0,0 +1,174 @@
+"""Resumable training checkpoints, written in the background."""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import copy
+import glob
+import os
+import pathlib
+import random
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+import torch
+
+from anu.data.dataframe_operation import write_file_atomically
+
+CHECKPOINT_PREFIX = "checkpoint-"
+
+
+def get_rng_state() -> Dict[str, Any]:
+    """Return state of the python, numpy and torch random generators.
+
+    The numpy state is stored with lists only, so checkpoints are loaded
+    with torch.load(weights_only=True).
+    """
+    state = np.random.get_state(legacy=False)
+    state["state"]["key"] = state["state"]["key"].tolist()
+
+    return {
+        "python": random.getstate(),
+        "numpy": state,
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state: Dict[str, Any]) -> None:
+    """Restore random generators from get_rng_state.
+
+    Args:
+        state: state of the random generators.
+    """
+    numpy_state = copy.deepcopy(state["numpy"])
+    numpy_state["state"]["key"] = np.array(numpy_state["state"]["key"], np.uint32)
+
+    random.setstate((state["python"][0], tuple(state["python"][1]), state["python"][2]))
+    np.random.set_state(numpy_state)
+    torch.set_rng_state(state["torch"])
+    if torch.cuda.is_available() and len(state["cuda"]) > 0:
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def snapshot(value: Any) -> Any:
+    """Copy a state, tensors are copied to cpu.
+
+    Training goes on while the copy is written, so parameters updated in
+    place must not be shared with it.
+
+    Args:
+        value: state dict, or nested dicts, lists and tuples of tensors.
+
+    Returns:
+        Return the copy.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(snapshot(item) for item in value)
+    return copy.deepcopy(value)
+
+
+def get_checkpoint_name(step: int) -> str:
+    """Return file name of the checkpoint after step training steps."""
+    return f"{CHECKPOINT_PREFIX}{step:010d}.pt"
+
+
+def list_checkpoints(path: str) -> List[str]:
+    """Return absolute paths of the checkpoints in path, oldest first."""
+    return sorted(glob.glob(os.path.join(path, f"{CHECKPOINT_PREFIX}*.pt")))
+
+
+def load_latest_checkpoint(
+    path: str, map_location: str = "cpu"
+) -> Optional[Dict[str, Any]]:
+    """Load the latest checkpoint of a directory.
+
+    Args:
+        path: absolute path of the checkpoints directory.
+        map_location: device of the loaded tensors.
+
+    Returns:
+        Return the checkpoint, None if there is none.
+    """
+    checkpoints = list_checkpoints(path)
+    if len(checkpoints) == 0:
+        return None
+    return torch.load(checkpoints[-1], map_location=map_location, weights_only=True)
+
+
+class CheckpointWriter:
+    """Write checkpoints from a background thread.
+
+    save copies the state on the calling thread, which is fast, and a single
+    background thread writes the copy with write_file_atomically and removes
+    old checkpoints, except the ones in retained. At most one checkpoint is
+    pending, save waits for the previous one, so memory holds at most one
+    extra copy of the state.
+    """
+
+    def __init__(self: "CheckpointWriter", path: str, keep: int = 3) -> None:
+        """Initialize writer.
+
+        Args:
+            path: absolute path of the checkpoints directory.
+            keep: number of latest checkpoints kept.
+        """
+        self.path = path
+        self.keep = keep
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Optional[Future] = None
+        # Checkpoints still read elsewhere, never removed.
+        self.retained: Set[str] = set()
+
+    def save(self: "CheckpointWriter", state: Dict[str, Any], step: int) -> None:
+        """Write a copy of state in the background.
+
+        Args:
+            state: training state, see CNNTrainer.training_state.
+            step: training steps done, orders the checkpoints.
+
+        Raises:
+            Exception: any error raised while writing the previous checkpoint.
+        """
+        self.wait()
+        self.pending = self.executor.submit(self.write, snapshot(state), step)
+
+    def write(self: "CheckpointWriter", state: Dict[str, Any], step: int) -> None:
+        """Write state and remove checkpoints beyond keep."""
+        pathlib.Path(self.path).mkdir(parents=True, exist_ok=True)
+        write_file_atomically(
+            os.path.join(self.path, get_checkpoint_name(step)),
+            lambda tmp_path: torch.save(state, tmp_path),
+        )
+
+        retained = set(self.retained)
+        for old in list_checkpoints(self.path)[: -self.keep]:
+            if old not in retained:
+                os.remove(old)
+
+    def clear(self: "CheckpointWriter") -> int:
+        """Remove every checkpoint of the directory, e.g. of a previous run.
+
+        Returns:
+            Return number of removed checkpoints.
+        """
+        self.wait()
+        checkpoints = list_checkpoints(self.path)
+        for path in checkpoints:
+            os.remove(path)
+        return len(checkpoints)
+
+    def wait(self: "CheckpointWriter") -> None:
+        """Wait for the pending checkpoint, raising its error if any."""
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self: "CheckpointWriter") -> None:
+        """Wait for the pending checkpoint and stop the thread."""
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown()
@@ -1,16 +1,49 @@
 """CNN model configs."""
 
 import os
-from typing import TypedDict
+from typing import Optional, TypedDict
 
 
 class CNNTrainerConfig(TypedDict):
-    """CNN model trainer config."""
+    """CNN model trainer config.
+
+    autocast runs forward passes in bfloat16 on cpu (float16 on cuda),
+    channels_last stores activations of the convolutions in NHWC layout and
+    compile is None, "compile" for torch.compile or "script" for
+    TorchScript. All three are off by default.
+
+    accumulation_steps sums gradients of this many batches before every
+    optimizer step, so the effective batch size is accumulation_steps times
+    the batch size of the data loader. checkpoint_activations recomputes
+    activations of the convolution blocks in the backward pass instead of
+    keeping them. Peak memory depends on the batch size and on
+    checkpointing only.
+
+    Training checkpoints are saved after every epoch and, if
+    checkpoint_steps is set, every checkpoint_steps batches. The latest
+    keep_checkpoints are kept.
+
+    The model is evaluated every eval_epochs epochs (never if None), in a
+    separate process on the latest checkpoint if eval_process is set.
+    Training stops once the validation loss hasn't decreased by more than
+    early_stopping_delta for early_stopping_patience evaluations, if set.
+    """
 
     device: str
     epochs: int
     logdir: str
     model_savedir: str
+    autocast: bool
+    channels_last: bool
+    compile: Optional[str]
+    accumulation_steps: int
+    checkpoint_activations: bool
+    checkpoint_steps: Optional[int]
+    keep_checkpoints: int
+    eval_epochs: Optional[int]
+    eval_process: bool
+    early_stopping_patience: Optional[int]
+    early_stopping_delta: float
 
 
 def get_default_cnn_trainer_config() -> CNNTrainerConfig:
@@ -21,18 +54,30 @@ def get_default_cnn_trainer_config() -> CNNTrainerConfig:
     logdir_path = os.path.join(root, "logs")
     model_savedir_path = os.path.join(root, "pre_trained_models")
 
-    if os.environ.get("TRAIN_DEVICE") == "GPU":
-        config: CNNTrainerConfig = {
-            "device": "cuda:0",
-            "epochs": 10,
-            "logdir": logdir_path,
-            "model_savedir": model_savedir_path,
-        }
-    else:
-        config: CNNTrainerConfig = {
-            "device": "cpu",
-            "epochs": 10,
-            "logdir": logdir_path,
-            "model_savedir": model_savedir_path,
-        }
+    config: CNNTrainerConfig = {
+        "device": "cuda:0" if os.environ.get("TRAIN_DEVICE") == "GPU" else "cpu",
+        "epochs": 10,
+        "logdir": logdir_path,
+        "model_savedir": model_savedir_path,
+        "autocast": False,
+        "channels_last": False,
+        "compile": None,
+        "accumulation_steps": 1,
+        "checkpoint_activations": False,
+        "checkpoint_steps": None,
+        "keep_checkpoints": 3,
+        "eval_epochs": 1,
+        "eval_process": False,
+        "early_stopping_patience": None,
+        "early_stopping_delta": 0.0,
+    }
+    return config
+
+
+def get_accelerated_cnn_trainer_config() -> CNNTrainerConfig:
+    """Return default config with autocast, channels_last and compilation."""
+    config = get_default_cnn_trainer_config()
+    config["autocast"] = True
+    config["channels_last"] = True
+    config["compile"] = "compile"
     return config
@@ -1,82 +1,925 @@
 """Dataloader for the model."""
 
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
 import numpy as np
+import pyarrow as pa
 import torch
-from torch.utils.data import Dataset
+import torch.distributed as dist
+from torch.utils.data import ConcatDataset, Dataset, get_worker_info, IterableDataset
+from torch.utils.data.dataloader import default_collate
 import vaex
 
+from anu.data.dataframe_operation import (
+    count_record_batches,
+    list_dataset_files,
+    read_dataframes_from_file,
+    read_record_batch,
+)
+from anu.data.features.contacts import ContactMaps
+from anu.data.features.normalization import channel_names
+from anu.data.negative_sampling import NegativePairSampler
+
+
+class DataFrameSource:
+    """Rows of input dataframes opened lazily in every process.
+
+    vaex dataframes hold file handles and thread pools which don't survive
+    being sent to data loader workers. Only the paths and the row ids are
+    pickled, and the files are opened again in the process which reads them.
+    """
+
+    def __init__(
+        self: "DataFrameSource",
+        paths: List[str],
+        columns: Optional[List[str]] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> None:
+        """Initialize source.
+
+        Args:
+            paths: dataframes path with respect to /data/processed.
+            columns: columns to read, None to read every column.
+            rows: rows of the concatenated dataframes, every row if None.
+        """
+        self.paths = paths
+        self.columns = columns
+        self.rows = rows
+        self._df: Optional[vaex.dataframe.DataFrame] = None
+        self._pid: Optional[int] = None
+
+    def open(self: "DataFrameSource") -> vaex.dataframe.DataFrame:
+        """Return the rows, opening the files once per process."""
+        if self._df is None or self._pid != os.getpid():
+            df = read_dataframes_from_file(self.paths, columns=self.columns)
+            self._df = df if self.rows is None else df.take(self.rows)
+            self._pid = os.getpid()
+        return self._df
+
+    def __len__(self: "DataFrameSource") -> int:
+        """Return number of rows."""
+        return len(self.open()) if self.rows is None else len(self.rows)
+
+    def __getstate__(self: "DataFrameSource") -> Dict[str, Any]:
+        """Pickle paths and rows without the opened dataframe."""
+        state = dict(self.__dict__)
+        state["_df"] = None
+        return state
+
 
-class InteractionClassificationDataset(Dataset):
-    """Interaction classification dataset."""
+class DataFrameDataset(Dataset):
+    """Dataset reading an input dataframe, opened lazily from a source.
+
+    If given a DataFrameSource instead of a dataframe, every data loader
+    worker opens the files itself, see WorkerInit.
+    """
 
     def __init__(
-        self: "InteractionClassificationDataset", df: vaex.dataframe.DataFrame
+        self: "DataFrameDataset",
+        df: Union[vaex.dataframe.DataFrame, DataFrameSource],
     ) -> None:
-        """Initialize dataset."""
-        try:
-            self.df = df
-        except BaseException:
-            raise "Error Initializing dataset"
+        """Initialize dataset.
+
+        Args:
+            df: input dataframe or source of the input dataframe.
+        """
+        self.source = df
+
+    @property
+    def df(self: "DataFrameDataset") -> vaex.dataframe.DataFrame:
+        """Return the input dataframe."""
+        if isinstance(self.source, DataFrameSource):
+            return self.source.open()
+        return self.source
+
+
+class WorkerInit:
+    """Prepare a data loader worker, used as worker_init_fn.
+
+    Limits the threads of the worker, so workers don't compete with each
+    other and with the training process for cores, opens the dataframes of
+    the worker's copy of the dataset and reseeds its random generators.
+    Every worker gets a copy of the generators of the training process, so
+    without reseeding all workers would draw the same random crops.
+    """
+
+    def __init__(self: "WorkerInit", threads: Optional[int] = 1) -> None:
+        """Initialize worker init.
+
+        Args:
+            threads: torch threads of every worker, unchanged if None.
+        """
+        self.threads = threads
+
+    def __call__(self: "WorkerInit", worker_id: int) -> None:
+        """Prepare worker worker_id."""
+        if self.threads is not None:
+            torch.set_num_threads(self.threads)
+
+        info = get_worker_info()
+        datasets = [info.dataset]
+        while len(datasets) > 0:
+            dataset = datasets.pop()
+            if isinstance(dataset, ConcatDataset):
+                datasets.extend(dataset.datasets)
+                continue
+
+            # The seed of a worker differs between workers and comes from the
+            # torch generator of the training process when the epoch starts.
+            # Persistent workers are seeded once, see draws_every_epoch. The
+            # datasets of a ConcatDataset get different streams.
+            if isinstance(getattr(dataset, "rng", None), np.random.Generator):
+                dataset.rng = np.random.default_rng([info.seed, len(datasets)])
+            if isinstance(dataset, DataFrameDataset) and isinstance(
+                dataset.source, DataFrameSource
+            ):
+                dataset.source.open()
+
+
+def draws_every_epoch(dataset: Dataset) -> bool:
+    """Return True if samples of a dataset are drawn again every epoch.
+
+    Datasets defining resample are resampled by the training process, and
+    random crops are drawn with generators seeded by WorkerInit. Workers of
+    such datasets must start again every epoch: persistent workers keep
+    their copy of the dataset and their generators, which neither follow
+    resample nor the random state restored when training resumes.
+
+    Args:
+        dataset: dataset of a data loader, ConcatDataset and datasets
+            wrapping another one (dataset attribute) are searched.
+
+    Returns:
+        Return whether workers must not be persistent.
+    """
+    datasets = [dataset]
+    while len(datasets) > 0:
+        item = datasets.pop()
+        if isinstance(item, ConcatDataset):
+            datasets.extend(item.datasets)
+        elif hasattr(item, "resample") or getattr(item, "random_crops", False):
+            return True
+        elif isinstance(getattr(item, "dataset", None), Dataset):
+            datasets.append(item.dataset)
+
+    return False
+
+
+class CollatedBatch(tuple):
+    """Labels and inputs of a batch already stacked by a dataset.
+
+    Returned by __getitems__ of datasets reading a whole batch at once, so
+    collate_samples passes it through instead of stacking samples again.
+    """
+
+
+def collate_samples(
+    samples: Union[CollatedBatch, List[Tuple[torch.Tensor, torch.Tensor]]],
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Collate samples of a data loader, batches read at once are kept as is."""
+    if isinstance(samples, CollatedBatch):
+        return tuple(samples)
+    return default_collate(samples)
+
+
+def check_channels(channels: Optional[Sequence[str]] = None) -> List[str]:
+    """Check a subset of the channels of the input dataframe.
+
+    Args:
+        channels: names of the channels in the order used by the model, every
+            channel if None.
+
+    Returns:
+        Return the channels.
+
+    Raises:
+        ValueError: if a channel is unknown or seq isn't the first channel,
+            seq tells residues from padding.
+    """
+    channels = list(channel_names if channels is None else channels)
+    unknown = set(channels) - set(channel_names)
+    if unknown:
+        raise ValueError(f"Unknown channels {', '.join(sorted(unknown))}")
+    if len(channels) == 0 or channels[0] != "seq":
+        raise ValueError("The first channel must be seq")
+
+    return channels
+
+
+def input_columns(channels: Optional[Sequence[str]] = None) -> List[str]:
+    """Return columns read for channels, channel by channel for protein A and B.
+
+    Args:
+        channels: see check_channels.
+
+    Returns:
+        Return the channel columns followed by interaction.
+    """
+    return [
+        f"protein{protein}_{name}"
+        for name in check_channels(channels)
+        for protein in ["A", "B"]
+    ] + ["interaction"]
+
+
+# Columns read by read_input_batch with every channel.
+batch_columns = input_columns()
+
+
+def decode_input_table(
+    table: pa.Table, channels: Optional[Sequence[str]] = None
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Build labels and model inputs from rows of an input dataframe.
+
+    Values are copied once, from the arrow buffers straight into the batch
+    array.
+
+    Args:
+        table: arrow table with the columns of input_columns.
+        channels: see check_channels.
+
+    Returns:
+        Return labels of shape (rows, 2) and inputs of shape
+        (rows, 1, channels, 2 * residues).
+
+    Raises:
+        ValueError: if proteins are not padded to one length, such rows must
+            be read with WindowedInteractionDataset.
+    """
+    rows = len(table)
+    columns = input_columns(channels)
+    inputs = None
+    for i, name in enumerate(columns[:-1]):
+        values = table.column(name).combine_chunks()
+        lengths = np.diff(values.offsets.to_numpy())
+        if len(lengths) > 0 and np.any(lengths != lengths[0]):
+            raise ValueError("Proteins of the batch have different lengths")
+
+        residues = int(lengths[0]) if len(lengths) > 0 else 0
+        if inputs is None:
+            inputs = np.empty(
+                (rows, 1, len(columns) // 2, 2 * residues), dtype=np.float32
+            )
+
+        # Column 2 * c is channel c of protein A and 2 * c + 1 of protein B.
+        channel, side = divmod(i, 2)
+        inputs[:, 0, channel, side * residues : (side + 1) * residues] = (
+            values.flatten().to_numpy(zero_copy_only=False).reshape(-1, residues)
+        )
+
+    labels = table.column("interaction").combine_chunks()
+    labels = labels.flatten().to_numpy(zero_copy_only=False).reshape(rows, -1)
+
+    return torch.from_numpy(labels.astype(np.int64)), torch.from_numpy(inputs)
+
+
+def read_input_batch(
+    df: vaex.dataframe.DataFrame,
+    indices: Sequence[int],
+    channels: Optional[Sequence[str]] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Read labels and model inputs of several rows of an input dataframe.
+
+    Columns are selected by name and read once for the whole batch, see
+    decode_input_table.
+
+    Args:
+        df: input dataframe with the columns of input_col_name.
+        indices: rows to read.
+        channels: see check_channels.
+
+    Returns:
+        Return labels of shape (rows, 2) and inputs of shape
+        (rows, 1, channels, 2 * residues).
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    return decode_input_table(
+        df.take(indices).to_arrow_table(column_names=input_columns(channels)),
+        channels,
+    )
+
+
+class InteractionClassificationDataset(DataFrameDataset):
+    """Interaction classification dataset.
+
+    A data loader with automatic batching calls __getitems__, which reads
+    the whole batch at once with read_input_batch. Use collate_samples (or
+    a collate_fn built on it) as collate_fn.
+    """
+
+    def __init__(
+        self: "InteractionClassificationDataset",
+        df: Union[vaex.dataframe.DataFrame, DataFrameSource],
+        channels: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize dataset.
+
+        Args:
+            df: input dataframe or its source.
+            channels: see check_channels.
+        """
+        super().__init__(df)
+        self.channels = check_channels(channels)
 
     def __len__(self: "InteractionClassificationDataset") -> int:
         """Return len of dataframe."""
-        return len(self.df)
+        return len(self.source)
 
     def __getitem__(
         self: "InteractionClassificationDataset", idx: int
     ) -> (torch.Tensor, torch.Tensor):
         """Return interaction_input and interaction_labels."""
-        # Extract seq from df and concatenate
-        sequence = np.hstack([self.df[idx][0], self.df[idx][1]])
-
-        # Extract x pos from df and concatenate
-        pos_x = np.hstack([self.df[idx][2], self.df[idx][3]])
-
-        # Extract y pos from df and concatenate
-        pos_y = np.hstack([self.df[idx][4], self.df[idx][5]])
-
-        # Extract z pos from df and concatenate
-        pos_z = np.hstack([self.df[idx][6], self.df[idx][7]])
-
-        # Extract hydropathy from df and concatenate
-        hydropathy = np.hstack([self.df[idx][8], self.df[idx][9]])
-
-        # Extract hydropathy_index from df and concatenate
-        hydropathy_index = np.hstack([self.df[idx][10], self.df[idx][11]])
-
-        # Extract ph from df and concatenate
-        ph = np.hstack([self.df[idx][12], self.df[idx][13]])
-
-        # Extract mass from df and concatenate
-        mass = np.hstack([self.df[idx][14], self.df[idx][15]])
-
-        # Extract hydropathy from df and concatenate
-        isoelectric_point = np.hstack([self.df[idx][16], self.df[idx][17]])
-
-        # Extract hydropathy from df and concatenate
-        charge = np.hstack([self.df[idx][18], self.df[idx][19]])
-
-        # Build final matrix with vertical stacking all features
-        features_matrix = np.vstack(
-            [
-                sequence,
-                pos_x,
-                pos_y,
-                pos_z,
-                hydropathy,
-                hydropathy_index,
-                ph,
-                mass,
-                isoelectric_point,
-                charge,
-            ]
+        labels, inputs = read_input_batch(self.df, [idx], self.channels)
+        return labels[0], inputs[0]
+
+    def __getitems__(
+        self: "InteractionClassificationDataset", indices: List[int]
+    ) -> CollatedBatch:
+        """Return labels and inputs of a batch of rows read at once."""
+        return CollatedBatch(read_input_batch(self.df, indices, self.channels))
+
+
+class ContactMapDataset(Dataset):
+    """Samples of an interaction dataset with the contact maps of their pair.
+
+    Opt in, maps are densified for every sample from the sparse contacts of
+    a ContactMaps, so a sample grows by 2 * size * size bytes. Samples are
+    labels, inputs and uint8 maps of shape (2, size, size).
+    """
+
+    def __init__(
+        self: "ContactMapDataset",
+        dataset: InteractionClassificationDataset,
+        contacts: ContactMaps,
+        size: int,
+        id_columns: Optional[List[str]] = None,
+    ) -> None:
+        """Initialize dataset.
+
+        Args:
+            dataset: dataset whose input dataframe has protein ids.
+            contacts: contact maps of the pairs of the dataframe.
+            size: side of every contact map.
+            id_columns: columns holding ids of protein A and protein B.
+        """
+        self.dataset = dataset
+        self.contacts = contacts
+        self.size = size
+        self.id_columns = id_columns or ["proteinA_id", "proteinB_id"]
+
+    def __len__(self: "ContactMapDataset") -> int:
+        """Return number of samples of the dataset."""
+        return len(self.dataset)
+
+    def read_maps(self: "ContactMapDataset", indices: List[int]) -> torch.Tensor:
+        """Densify contact maps of the pairs of some rows."""
+        ids = self.dataset.df.take(np.asarray(indices)).to_arrow_table(
+            column_names=self.id_columns
+        )
+        return torch.from_numpy(
+            np.stack(
+                [
+                    self.contacts(protein_a, protein_b, self.size)
+                    for protein_a, protein_b in zip(
+                        ids.column(0).to_pylist(), ids.column(1).to_pylist()
+                    )
+                ]
+            )
         )
-        interaction_type = np.array(self.df[idx][20])
 
-        features_matrix.setflags(write=True)
-        interaction_type.setflags(write=True)
+    def __getitem__(
+        self: "ContactMapDataset", idx: int
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Return labels, inputs and contact maps of a row."""
+        labels, inputs = self.dataset[idx]
+        return labels, inputs, self.read_maps([idx])[0]
+
+    def __getitems__(self: "ContactMapDataset", indices: List[int]) -> CollatedBatch:
+        """Return labels, inputs and contact maps of a batch of rows."""
+        labels, inputs = self.dataset.__getitems__(indices)
+        return CollatedBatch((labels, inputs, self.read_maps(indices)))
+
+
+class NegativePairDataset(DataFrameDataset):
+    """Non-interacting pairs drawn at random from the proteins of a dataframe.
+
+    Only slots of the drawn pairs are kept in memory. Features are read from
+    the dataframe when a sample is requested.
+    """
+
+    def __init__(
+        self: "NegativePairDataset",
+        df: Union[vaex.dataframe.DataFrame, DataFrameSource],
+        sampler: NegativePairSampler,
+        length: int,
+        window: Optional[int] = None,
+        channels: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize dataset.
+
+        Args:
+            df: input dataframe or its source, with the columns of
+                input_col_name.
+            sampler: sampler built over the proteins of df.
+            length: number of pairs in one epoch.
+            window: if given, a random window of this many residues is
+                cropped from every protein.
+            channels: see check_channels.
+        """
+        super().__init__(df)
+        self.sampler = sampler
+        self.length = length
+        self.window = window
+        self.channels = check_channels(channels)
+        self.rng = np.random.default_rng()
+        self.resample()
+
+    def resample(self: "NegativePairDataset") -> None:
+        """Draw a new set of pairs, usually once per epoch."""
+        self.first_slots, self.second_slots = self.sampler.sample(self.length)
+
+    def __len__(self: "NegativePairDataset") -> int:
+        """Return number of pairs."""
+        return self.length
+
+    def __getitem__(
+        self: "NegativePairDataset", idx: int
+    ) -> (torch.Tensor, torch.Tensor):
+        """Return interaction_input and interaction_labels."""
+        first_row, first_side = divmod(int(self.first_slots[idx]), 2)
+        second_row, second_side = divmod(int(self.second_slots[idx]), 2)
 
-        interaction_input = torch.from_numpy(features_matrix).view((1, 10, 8000))
+        first = self.read_protein(first_row, first_side)
+        second = self.read_protein(second_row, second_side)
+
+        if self.window is not None:
+            first = crop_matrix(
+                first, random_crop_start(first, self.window, self.rng), self.window
+            )
+            second = crop_matrix(
+                second, random_crop_start(second, self.window, self.rng), self.window
+            )
+
+        features_matrix = np.hstack([first, second])
+        interaction_type = np.array([0, 1])
+
+        interaction_input = torch.from_numpy(features_matrix).unsqueeze(0)
+        interaction_label = torch.from_numpy(interaction_type)
+
+        return interaction_label, interaction_input
+
+    def read_protein(self: "NegativePairDataset", row: int, side: int) -> np.ndarray:
+        """Read channels of protein A (side 0) or protein B (side 1) of a row."""
+        columns = protein_columns(side, self.channels)
+        return protein_matrix(read_row(self.df, row, columns), side, self.channels)
+
+
+def protein_columns(side: int, channels: Optional[Sequence[str]] = None) -> List[str]:
+    """Return channel columns of protein A (side 0) or protein B (side 1)."""
+    return [f"protein{'AB'[side]}_{name}" for name in check_channels(channels)]
+
+
+def read_row(
+    df: vaex.dataframe.DataFrame, idx: int, columns: Optional[List[str]] = None
+) -> Dict[str, np.ndarray]:
+    """Read list columns of one row of an input dataframe by name.
+
+    Args:
+        df: input dataframe.
+        idx: row to read.
+        columns: columns to read, batch_columns if None.
+
+    Returns:
+        Return values of every column.
+    """
+    columns = batch_columns if columns is None else columns
+    table = df[idx : idx + 1].to_arrow_table(column_names=columns)
+    return {
+        name: table.column(name)
+        .combine_chunks()
+        .flatten()
+        .to_numpy(zero_copy_only=False)
+        for name in columns
+    }
+
+
+def protein_matrix(
+    row: Dict[str, np.ndarray], side: int, channels: Optional[Sequence[str]] = None
+) -> np.ndarray:
+    """Stack the channels of one protein of an input dataframe row.
+
+    Args:
+        row: columns of the row, see read_row.
+        side: 0 for protein A and 1 for protein B.
+        channels: see check_channels.
+
+    Returns:
+        Return float32 array of shape (channels, residues).
+    """
+    return np.vstack(
+        [
+            np.asarray(row[name], dtype=np.float32)
+            for name in protein_columns(side, channels)
+        ]
+    )
+
+
+def protein_length(matrix: np.ndarray) -> int:
+    """Return number of residues of a protein without the trailing padding."""
+    residues = np.flatnonzero(matrix[0] > 0)
+    return int(residues[-1]) + 1 if len(residues) > 0 else 0
+
+
+def sequence_lengths(
+    df: vaex.dataframe.DataFrame, batch_rows: int = 1024
+) -> np.ndarray:
+    """Compute protein lengths of every row of an input dataframe.
+
+    Args:
+        df: input dataframe with the columns of input_col_name.
+        batch_rows: rows read at once.
+
+    Returns:
+        Return lengths of protein A and protein B, shape (rows, 2).
+    """
+    lengths = np.zeros((len(df), 2), dtype=np.int64)
+    columns = ["proteinA_seq", "proteinB_seq"]
+
+    for start in range(0, len(df), batch_rows):
+        table = df[start : start + batch_rows].to_arrow_table(column_names=columns)
+        for side, column in enumerate(table):
+            seq = column.combine_chunks()
+            offsets = seq.offsets.to_numpy()
+            values = seq.flatten().to_numpy()
+
+            # Position after every residue, 0 for padding.
+            ends = np.where(values > 0, np.arange(len(values)) + 1, 0)
+            ends = np.maximum(ends - np.repeat(offsets[:-1], np.diff(offsets)), 0)
+            row_ends = np.zeros(len(seq), dtype=np.int64)
+            np.maximum.at(
+                row_ends, np.repeat(np.arange(len(seq)), np.diff(offsets)), ends
+            )
+            lengths[start : start + len(seq), side] = row_ends
+
+    return lengths
+
+
+def crop_starts(length: int, window: int, stride: int) -> np.ndarray:
+    """Return starts of overlapping windows covering a protein.
+
+    Args:
+        length: number of residues.
+        window: residues in one window.
+        stride: residues between the starts of two windows.
+
+    Returns:
+        Return window starts, the last window ends at the last residue.
+    """
+    last = max(length - window, 0)
+    starts = np.arange(0, last + 1, stride)
+    if starts[-1] != last:
+        starts = np.append(starts, last)
+    return starts
+
+
+def random_crop_start(matrix: np.ndarray, window: int, rng: np.random.Generator) -> int:
+    """Draw start of a window uniformly over the residues of a protein."""
+    return int(rng.integers(0, max(protein_length(matrix) - window, 0) + 1))
+
+
+def crop_matrix(matrix: np.ndarray, start: int, window: int) -> np.ndarray:
+    """Crop a window of a protein, padded with 0 if the protein is shorter.
+
+    Args:
+        matrix: array of shape (channels, residues).
+        start: first residue of the window.
+        window: residues in the window.
+
+    Returns:
+        Return array of shape (channels, window).
+    """
+    crop = np.zeros((matrix.shape[0], window), dtype=matrix.dtype)
+    part = matrix[:, start : start + window]
+    crop[:, : part.shape[1]] = part
+    return crop
+
+
+def crop_pair_inputs(
+    row: Dict[str, np.ndarray],
+    window: int,
+    stride: int,
+    channels: Optional[Sequence[str]] = None,
+) -> Tuple[torch.Tensor, np.ndarray]:
+    """Build model inputs of every pair of windows of a row.
+
+    Used at inference, scores of the windows are then aggregated.
+
+    Args:
+        row: columns of a row of the input dataframe, see read_row.
+        window: residues in one window.
+        stride: residues between the starts of two windows.
+        channels: see check_channels.
+
+    Returns:
+        Return inputs of shape (windows, 1, channels, 2 * window) and starts
+        of the windows of protein A and protein B of shape (windows, 2).
+    """
+    first = protein_matrix(row, 0, channels)
+    second = protein_matrix(row, 1, channels)
+    starts = np.array(
+        [
+            [a, b]
+            for a in crop_starts(protein_length(first), window, stride)
+            for b in crop_starts(protein_length(second), window, stride)
+        ]
+    )
+    inputs = np.stack(
+        [
+            np.hstack([crop_matrix(first, a, window), crop_matrix(second, b, window)])
+            for a, b in starts
+        ]
+    )
+
+    return torch.from_numpy(inputs).unsqueeze(1), starts
+
+
+class WindowedInteractionDataset(DataFrameDataset):
+    """Interaction classification dataset over windows of the proteins.
+
+    Proteins longer than the window are not truncated. While training a
+    random window of every protein is drawn each time a row is read, so
+    over epochs every part of long proteins is seen. Otherwise every pair of
+    overlapping windows is a sample.
+    """
+
+    def __init__(
+        self: "WindowedInteractionDataset",
+        df: Union[vaex.dataframe.DataFrame, DataFrameSource],
+        window: int = 1000,
+        stride: Optional[int] = None,
+        random_crops: bool = True,
+        random_state: Optional[int] = None,
+        channels: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize dataset.
+
+        Args:
+            df: input dataframe or its source, with the columns of
+                input_col_name.
+            window: residues in one window.
+            stride: residues between window starts, window // 2 if None.
+            random_crops: draw one random window per protein and row instead
+                of listing every pair of windows.
+            random_state: seed of the random windows.
+            channels: see check_channels.
+        """
+        super().__init__(df)
+        self.channels = check_channels(channels)
+        self.window = window
+        self.stride = stride or max(window // 2, 1)
+        self.random_crops = random_crops
+        self.rng = np.random.default_rng(random_state)
+
+        if not random_crops:
+            self.samples = self.list_windows()
+
+    def list_windows(self: "WindowedInteractionDataset") -> np.ndarray:
+        """List row and window starts of every sample, shape (samples, 3)."""
+        samples = []
+        for row_id, (a, b) in enumerate(sequence_lengths(self.df)):
+            samples.extend(
+                [row_id, i, j]
+                for i in crop_starts(a, self.window, self.stride)
+                for j in crop_starts(b, self.window, self.stride)
+            )
+
+        return np.asarray(samples, dtype=np.int64).reshape(-1, 3)
+
+    def __len__(self: "WindowedInteractionDataset") -> int:
+        """Return number of samples."""
+        return len(self.source) if self.random_crops else len(self.samples)
+
+    def sample_rows(self: "WindowedInteractionDataset") -> np.ndarray:
+        """Return the dataframe row of every sample, used to score rows."""
+        if self.random_crops:
+            return np.arange(len(self.source))
+        return self.samples[:, 0]
+
+    def __getitem__(
+        self: "WindowedInteractionDataset", idx: int
+    ) -> (torch.Tensor, torch.Tensor):
+        """Return interaction_input and interaction_labels."""
+        row_id, a, b = (idx, 0, 0) if self.random_crops else self.samples[idx]
+        row = read_row(self.df, int(row_id), input_columns(self.channels))
+        first = protein_matrix(row, 0, self.channels)
+        second = protein_matrix(row, 1, self.channels)
+        if self.random_crops:
+            a = random_crop_start(first, self.window, self.rng)
+            b = random_crop_start(second, self.window, self.rng)
+
+        features_matrix = np.hstack(
+            [crop_matrix(first, a, self.window), crop_matrix(second, b, self.window)]
+        )
+        interaction_type = row["interaction"].astype(np.int64)
+
+        interaction_input = torch.from_numpy(features_matrix).unsqueeze(0)
         interaction_label = torch.from_numpy(interaction_type)
 
         return interaction_label, interaction_input
+
+
+def shuffle_buffer(
+    samples: Iterable[Any], size: int, rng: np.random.Generator
+) -> Iterator[Any]:
+    """Shuffle a stream keeping at most size samples in memory.
+
+    Args:
+        samples: stream of samples.
+        size: samples in the buffer, 0 keeps the order of the stream.
+        rng: random generator.
+
+    Returns:
+        Return the samples in random order.
+    """
+    buffer: List[Any] = []
+    for sample in samples:
+        if len(buffer) < size:
+            buffer.append(sample)
+            continue
+
+        i = int(rng.integers(size + 1))
+        if i == size:
+            yield sample
+        else:
+            yield buffer[i]
+            buffer[i] = sample
+
+    for i in rng.permutation(len(buffer)):
+        yield buffer[i]
+
+
+class StreamingInteractionDataset(IterableDataset):
+    """Interaction classification dataset streamed from the input files.
+
+    Record batches of the files (partitions of a dataset, or row groups)
+    are read in sequence, so reading is never random access. Every epoch
+    the record batches are put in a new random order and dealt out to the
+    data loader workers of every distributed rank, and samples are shuffled
+    with a bounded buffer. Rows marked as deleted in a manifest are skipped.
+    """
+
+    def __init__(
+        self: "StreamingInteractionDataset",
+        paths: List[str],
+        row_filter: Optional[Callable[[pa.Table], np.ndarray]] = None,
+        columns: Optional[List[str]] = None,
+        batch_rows: int = 64,
+        buffer_size: int = 1024,
+        random_state: Optional[int] = None,
+        rank: Optional[int] = None,
+        world_size: Optional[int] = None,
+        channels: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize dataset.
+
+        Args:
+            paths: dataframes path with respect to /data/processed.
+            row_filter: return True for the rows of the dataset, e.g. a
+                HashSplitFilter. Every row is used if None.
+            columns: extra columns read for row_filter.
+            batch_rows: rows decoded at once.
+            buffer_size: samples in the shuffle buffer, 0 streams the rows in
+                file order.
+            random_state: seed of the order of record batches and samples.
+            rank: distributed rank, from torch.distributed if None.
+            world_size: distributed ranks, from torch.distributed if None.
+            channels: see check_channels.
+        """
+        self.row_filter = row_filter
+        self.channels = check_channels(channels)
+        self.columns = input_columns(channels) + (columns or [])
+        self.batch_rows = batch_rows
+        self.buffer_size = buffer_size
+        self.random_state = random_state
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        self.iterations = 0
+
+        self.units = [
+            (file_path, index, offset, np.asarray(deleted, dtype=np.int64))
+            for path in paths
+            for file_path, deleted in list_dataset_files(path)
+            for index, offset in enumerate(
+                np.cumsum([0, *count_record_batches(file_path)])[:-1]
+            )
+        ]
+
+    def resample(self: "StreamingInteractionDataset") -> None:
+        """Move to the next epoch, record batches are dealt out again."""
+        self.epoch = self.epoch + 1
+
+    def consumer(self: "StreamingInteractionDataset") -> Tuple[int, int]:
+        """Return index of this worker over every rank and number of workers."""
+        rank, world_size = self.rank, self.world_size
+        if rank is None or world_size is None:
+            distributed = dist.is_available() and dist.is_initialized()
+            rank = dist.get_rank() if distributed else 0
+            world_size = dist.get_world_size() if distributed else 1
+
+        info = get_worker_info()
+        worker_id, workers = (0, 1) if info is None else (info.id, info.num_workers)
+
+        return rank * workers + worker_id, world_size * workers
+
+    def read_unit(
+        self: "StreamingInteractionDataset", unit: Tuple[str, int, int, np.ndarray]
+    ) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        """Yield samples of one record batch, batch_rows rows at a time."""
+        file_path, index, offset, deleted = unit
+        table = read_record_batch(file_path, index, self.columns)
+
+        keep = np.ones(len(table), dtype=bool)
+        deleted = deleted[(deleted >= offset) & (deleted < offset + len(table))]
+        keep[deleted - offset] = False
+
+        for start in range(0, len(table), self.batch_rows):
+            rows = table.slice(start, self.batch_rows)
+            selection = keep[start : start + len(rows)]
+            if self.row_filter is not None:
+                selection = selection & self.row_filter(rows)
+            if not selection.any():
+                continue
+
+            labels, inputs = decode_input_table(
+                rows.filter(pa.array(selection)), self.channels
+            )
+            if self.buffer_size == 0:
+                yield from zip(labels, inputs)
+            else:
+                # Copies, so buffered samples don't hold whole batches.
+                yield from zip(labels.clone(), (x.clone() for x in inputs))
+
+    def __iter__(
+        self: "StreamingInteractionDataset",
+    ) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        """Yield interaction_labels and interaction_input of every sample."""
+        # Persistent workers keep their copy of the dataset, so they count
+        # epochs themselves. Other workers get a new copy every epoch.
+        epoch = self.epoch + self.iterations
+        if get_worker_info() is not None:
+            self.iterations = self.iterations + 1
+
+        consumer, consumers = self.consumer()
+        seed = [self.random_state or 0, epoch]
+        order = np.random.default_rng(seed).permutation(len(self.units))
+        rng = np.random.default_rng([*seed, consumer])
+
+        samples = (
+            sample
+            for i in order[consumer::consumers]
+            for sample in self.read_unit(self.units[i])
+        )
+        yield from shuffle_buffer(samples, self.buffer_size, rng)
+
+
+class ChannelNormalizer:
+    """Collate samples and normalize every channel of the batch at once.
+
+    Used as collate_fn of the data loader, so normalization is one
+    vectorized operation per batch instead of one per sample. Padded
+    positions (sequence code 0) stay 0.
+    """
+
+    def __init__(self: "ChannelNormalizer", parameters: np.ndarray) -> None:
+        """Initialize normalizer.
+
+        Args:
+            parameters: array of shape (2, channels) with the shift and the
+                scale of every channel, see normalization_parameters.
+        """
+        self.shift = torch.from_numpy(parameters[0]).view(1, 1, -1, 1)
+        self.scale = torch.from_numpy(parameters[1]).view(1, 1, -1, 1)
+
+    def __call__(
+        self: "ChannelNormalizer",
+        samples: Union[CollatedBatch, List[Tuple[torch.Tensor, torch.Tensor]]],
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Return labels and normalized inputs of a batch."""
+        labels, inputs = collate_samples(samples)
+        inputs = inputs.float()
+        mask = inputs[:, :, :1] > 0
+
+        return labels, (inputs - self.shift).mul_(self.scale).mul_(mask)
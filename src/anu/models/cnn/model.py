@@ -1,36 +1,121 @@
 """CNN model."""
 
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from typing import ContextManager, Iterator, List, Optional, Sequence, Tuple
+
+import torch
 from torch import nn
 from torch import Tensor
+from torch.utils.checkpoint import checkpoint
+
+from anu.data.features.normalization import channel_names
+
+# Modules in every convolution block of ConvNet.conv.
+BLOCK_SIZE = 4
+
+
+@contextmanager
+def frozen_batch_norm_stats(module: nn.Module) -> Iterator[None]:
+    """Keep running statistics of the batch norms of module unchanged.
+
+    Args:
+        module: module holding batch norms.
+
+    Yields:
+        Nothing, statistics are restored on exit.
+    """
+    norms = [m for m in module.modules() if isinstance(m, nn.BatchNorm2d)]
+    saved = [(norm.momentum, norm.num_batches_tracked.clone()) for norm in norms]
+    for norm in norms:
+        norm.momentum = 0.0
+    try:
+        yield
+    finally:
+        for norm, (momentum, tracked) in zip(norms, saved):
+            norm.momentum = momentum
+            norm.num_batches_tracked.copy_(tracked)
+
+
+def recompute_contexts(module: nn.Module) -> Tuple[ContextManager, ContextManager]:
+    """Return contexts of the forward pass and of the recomputation.
+
+    Batch norms update their running statistics in the forward pass only,
+    recomputing a block in the backward pass must not update them twice.
+    """
+    return nullcontext(), frozen_batch_norm_stats(module)
+
+
+def checkpoint_blocks(conv: nn.Sequential, x: Tensor) -> Tensor:
+    """Run convolution blocks keeping only the input of every block.
+
+    Args:
+        conv: convolution blocks of BLOCK_SIZE modules.
+        x: input of the first block.
+
+    Returns:
+        Return output of the last block, activations inside the blocks are
+        recomputed in the backward pass.
+    """
+    for start in range(0, len(conv), BLOCK_SIZE):
+        block = conv[start : start + BLOCK_SIZE]
+        x = checkpoint(
+            block, x, use_reentrant=False, context_fn=partial(recompute_contexts, block)
+        )
+    return x
 
 
 class ConvNet(nn.Module):
     """CNN model."""
 
-    def __init__(self: "ConvNet") -> None:
-        """Initialize CNN model."""
+    def __init__(
+        self: "ConvNet",
+        window: int = 4000,
+        checkpoint: bool = False,
+        channels: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize CNN model.
+
+        Args:
+            window: residues of every protein in the input.
+            checkpoint: while training, keep only the input of every
+                convolution block and recompute its activations in the
+                backward pass.
+            channels: names of the input channels, every channel of the input
+                dataframe if None.
+        """
         super(ConvNet, self).__init__()
+        self.window = window
+        self.checkpoint = checkpoint
+        self.channels: List[str] = list(channel_names if channels is None else channels)
+
+        # Poolings halve the channel rows while there are at least two.
+        rows, kernels = len(self.channels), []
+        for _ in range(3):
+            kernels.append(2 if rows >= 2 else 1)
+            rows = rows // kernels[-1]
 
         self.conv = nn.Sequential(
             # 2D convolution layer
             nn.Conv2d(1, 10, kernel_size=3, stride=1, padding=1),
             nn.BatchNorm2d(10),
             nn.ReLU(inplace=True),
-            nn.MaxPool2d(kernel_size=2, stride=2),
+            nn.MaxPool2d(kernel_size=(kernels[0], 2)),
             # 2D convolution layer
             nn.Conv2d(10, 30, kernel_size=3, stride=1, padding=1),
             nn.BatchNorm2d(30),
             nn.ReLU(inplace=True),
-            nn.MaxPool2d(kernel_size=2, stride=2),
+            nn.MaxPool2d(kernel_size=(kernels[1], 2)),
             # 2D convolution layer
             nn.Conv2d(30, 30, kernel_size=3, stride=1, padding=1),
             nn.BatchNorm2d(30),
             nn.ReLU(inplace=True),
-            nn.MaxPool2d(kernel_size=2, stride=2),
+            nn.MaxPool2d(kernel_size=(kernels[2], 2)),
         )
 
         self.fcn = nn.Sequential(
-            nn.Linear(30 * 1 * 500 * 2, 1500),
+            # Three poolings divide the 2 * window input columns by 8.
+            nn.Linear(30 * rows * (2 * window // 8), 1500),
             nn.ReLU(inplace=True),
             nn.Linear(1500, 120),
             nn.ReLU(inplace=True),
@@ -42,7 +127,15 @@ class ConvNet(nn.Module):
     # Defining the forward pass
     def forward(self: "ConvNet", x: Tensor) -> Tensor:
         """Forward pass function."""
-        x = self.conv(x)
-        x = x.view(x.size(0), -1)
+        checkpointed = False
+        # TorchScript skips this branch, checkpoint can't be scripted.
+        if not torch.jit.is_scripting():
+            checkpointed = self.checkpoint and self.training
+            checkpointed = checkpointed and torch.is_grad_enabled()
+            if checkpointed:
+                x = checkpoint_blocks(self.conv, x)
+        if not checkpointed:
+            x = self.conv(x)
+        x = x.reshape(x.size(0), -1)
         x = self.fcn(x)
         return x
@@ -1,84 +1,546 @@
 """pipeline module for cnn model."""
 
+from functools import partial
 import os
-from typing import List
+from typing import Callable, List, Optional, Union
 
 import click
 from logzero import logger
+import numpy as np
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data import ConcatDataset, DataLoader, Dataset
 import vaex
 
-from anu.data.dataframe_operation import read_dataframes_from_file
-from anu.models.cnn.config import get_default_cnn_trainer_config
-from anu.models.cnn.loader import InteractionClassificationDataset
+from anu.data.dataframe_operation import (
+    describe_dataframe_source,
+    read_dataframe_from_file,
+    read_dataframes_from_file,
+    split_dataframe,
+)
+from anu.data.features.normalization import (
+    load_channel_stats,
+    normalization_parameters,
+)
+from anu.data.negative_sampling import NegativePairSampler
+from anu.data.pipelines.prepare_input import id_col_name, PROTEIN_SEQ_MAX_LEN
+from anu.data.splits import (
+    cluster_split_dataframe,
+    downsample_clusters,
+    hash_split_dataframe,
+    HashSplitFilter,
+)
+from anu.models.cnn.config import (
+    get_accelerated_cnn_trainer_config,
+    get_default_cnn_trainer_config,
+)
+from anu.models.cnn.loader import (
+    ChannelNormalizer,
+    collate_samples,
+    crop_pair_inputs,
+    DataFrameSource,
+    draws_every_epoch,
+    input_columns,
+    InteractionClassificationDataset,
+    NegativePairDataset,
+    read_row,
+    StreamingInteractionDataset,
+    WindowedInteractionDataset,
+    WorkerInit,
+)
+from anu.models.cnn.model import ConvNet
+from anu.models.cnn.shards import get_shards_path, TensorShardDataset, TensorShards
 from anu.models.cnn.trainer import CNNTrainer
 
 
-def load_dataset(df: vaex.dataframe.DataFrame) -> InteractionClassificationDataset:
+def load_dataset(
+    df: Union[vaex.dataframe.DataFrame, DataFrameSource],
+    channels: Optional[List[str]] = None,
+) -> InteractionClassificationDataset:
     """Load dataset to InteractionClassificationDataset.
 
     Args:
-        df: vaex dataframe.
+        df: vaex dataframe or source opened lazily by every worker.
+        channels: channels of the model input, every channel if None.
 
     Returns:
         InteractionClassificationDataset class object
     """
-    return InteractionClassificationDataset(df)
+    return InteractionClassificationDataset(df, channels)
 
 
 def data_loader(
-    dataset: InteractionClassificationDataset, batch_size: int, num_workers: int,
+    dataset: Dataset,
+    batch_size: int,
+    num_workers: int,
+    shuffle: bool = False,
+    collate_fn: Optional[Callable] = None,
+    persistent_workers: Optional[bool] = None,
+    prefetch_factor: Optional[int] = 2,
+    pin_memory: Optional[bool] = None,
+    worker_threads: Optional[int] = 1,
 ) -> DataLoader:
     """Data loader.
 
+    Workers are started with spawn, datasets built on DataFrameSource open
+    their files again in every worker.
+
     Args:
         dataset: InteractionClassificationDataset.
         batch_size: size of each batch.
         num_workers: for multiprocessing.
+        shuffle: shuffle samples every epoch.
+        collate_fn: function building a batch from samples, collate_samples
+            if None.
+        persistent_workers: keep workers and their opened files between
+            epochs. If None, workers are kept unless samples are drawn
+            every epoch, see draws_every_epoch.
+        prefetch_factor: batches loaded in advance by every worker.
+        pin_memory: copy batches to page locked memory, True if cuda is
+            available when None.
+        worker_threads: torch threads of every worker, unchanged if None.
 
     Returns:
         Dataloader
     """
-    return DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+    options = {}
+    if num_workers > 0:
+        options = {
+            "multiprocessing_context": "spawn",
+            "worker_init_fn": WorkerInit(worker_threads),
+            "persistent_workers": (
+                not draws_every_epoch(dataset)
+                if persistent_workers is None
+                else persistent_workers
+            ),
+            "prefetch_factor": prefetch_factor,
+        }
 
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        shuffle=shuffle,
+        collate_fn=collate_samples if collate_fn is None else collate_fn,
+        pin_memory=torch.cuda.is_available() if pin_memory is None else pin_memory,
+        **options,
+    )
 
-def train_cnn(paths: List[str], batch_size: int = 2, num_workers: int = 2) -> None:
-    """Train using cnn model.
+
+def load_negative_dataset(
+    df: vaex.dataframe.DataFrame,
+    known_pair_paths: List[str],
+    ratio: float,
+    window: Optional[int] = None,
+    source: Optional[DataFrameSource] = None,
+    channels: Optional[List[str]] = None,
+) -> NegativePairDataset:
+    """Load randomly drawn non-interacting pairs.
 
     Args:
-        paths: list of dataframes path with respect to /data/processed.
-        batch_size: size of each batch.
-        num_workers: for multiprocessing.
+        df: input dataframe with protein id columns.
+        known_pair_paths: dataframes of known interactions with respect to
+            /data/processed.
+        ratio: number of drawn pairs for every row of df.
+        window: if given, crop a random window of this many residues.
+        source: if given, source of the rows of df read by the dataset.
+        channels: channels of the model input, every channel if None.
+
+    Returns:
+        NegativePairDataset class object
+    """
+    known_dataframes = [read_dataframe_from_file(path) for path in known_pair_paths]
+    sampler = NegativePairSampler.from_dataframe(df, id_col_name, known_dataframes)
+
+    return NegativePairDataset(
+        df if source is None else source,
+        sampler,
+        int(ratio * len(df)),
+        window,
+        channels,
+    )
+
+
+def split_input_dataframe(
+    df: vaex.dataframe.DataFrame,
+    shuffle_block_size: Optional[int] = 64,
+    random_state: int = 32,
+    clusters_path: Optional[str] = None,
+    max_per_cluster: Optional[int] = None,
+    strict_clusters: bool = True,
+    hash_split_by: Optional[str] = None,
+) -> List[vaex.dataframe.DataFrame]:
+    """Split input dataframe in train, test and validation dataframes.
+
+    Args:
+        df: input dataframe.
+        shuffle_block_size: see train_cnn.
+        random_state: seed used to split the dataframe.
+        clusters_path: see train_cnn.
+        max_per_cluster: see train_cnn.
+        strict_clusters: see train_cnn.
+        hash_split_by: see train_cnn.
+
+    Returns:
+        Return train, test and validation dataframes.
     """
+    if clusters_path is not None:
+        clusters_df = read_dataframe_from_file(clusters_path)
+        if max_per_cluster is not None:
+            df = downsample_clusters(df, clusters_df, max_per_cluster, random_state)
+        return cluster_split_dataframe(
+            df,
+            clusters_df,
+            frac=[0.7, 0.2, 0.1],
+            random_state=random_state,
+            strict=strict_clusters,
+        )
+
+    if hash_split_by is not None:
+        return hash_split_dataframe(
+            df, frac=[0.7, 0.2, 0.1], by=hash_split_by, salt=random_state
+        )
+
+    if shuffle_block_size is None:
+        return df.split_random(into=[0.7, 0.2, 0.1], random_state=random_state)
+
+    return split_dataframe(
+        df,
+        frac=[0.7, 0.2, 0.1],
+        random_state=random_state,
+        block_size=shuffle_block_size,
+    )
+
+
+def load_split_datasets(
+    paths: List[str],
+    num_workers: int = 2,
+    shuffle_block_size: Optional[int] = 64,
+    random_state: int = 32,
+    negative_ratio: Optional[float] = None,
+    known_pair_paths: Optional[List[str]] = None,
+    clusters_path: Optional[str] = None,
+    max_per_cluster: Optional[int] = None,
+    strict_clusters: bool = True,
+    hash_split_by: Optional[str] = None,
+    window: Optional[int] = None,
+    crop_stride: Optional[int] = None,
+    shards: bool = False,
+    channels: Optional[List[str]] = None,
+) -> List[Dataset]:
+    """Read, split and load the input dataframes, see train_cnn.
+
+    Returns:
+        Return train, test and validation datasets.
+
+    Raises:
+        ValueError: if shards don't have the rows of the dataframes.
+    """
+    with_ids = (
+        negative_ratio is not None
+        or clusters_path is not None
+        or hash_split_by is not None
+    )
+    columns = input_columns(channels) + (id_col_name if with_ids else [])
+
     logger.info("Loading dataframe")
-    df = read_dataframes_from_file(paths)
+    df = read_dataframes_from_file(paths, columns=columns)
+
+    if shards:
+        logger.info("Loading tensor shards")
+        tensor_shards = TensorShards.load(
+            [get_shards_path(path) for path in paths],
+            [describe_dataframe_source(path) for path in paths],
+        )
+        if len(tensor_shards) != len(df):
+            raise ValueError("Tensor shards are stale, export them again")
+
+    # Rows of the splits are looked up in the shards or opened again by
+    # every worker.
+    df["row_id"] = np.arange(len(df))
 
     logger.info("Spliting dataframe")
-    train_df, test_df, validate_df = df.split_random(frac=[0.7, 0.2, 0.1])
+    train_df, test_df, validate_df = split_input_dataframe(
+        df,
+        shuffle_block_size,
+        random_state,
+        clusters_path,
+        max_per_cluster,
+        strict_clusters,
+        hash_split_by,
+    )
+
+    train_data, test_data, validate_data = train_df, test_df, validate_df
+    if num_workers > 0 and not shards:
+        train_data, test_data, validate_data = [
+            DataFrameSource(paths, columns, split_df["row_id"].values)
+            for split_df in [train_df, test_df, validate_df]
+        ]
 
     # Load dataset
     logger.info("Loading dataset")
-    train_dataset = load_dataset(train_df)
-    test_dataset = load_dataset(test_df)
-    validate_dataset = load_dataset(validate_df)
+    if shards:
+        train_dataset, test_dataset, validate_dataset = [
+            TensorShardDataset(tensor_shards, split_df["row_id"].values)
+            for split_df in [train_df, test_df, validate_df]
+        ]
+    elif window is None:
+        train_dataset = load_dataset(train_data, channels)
+        test_dataset = load_dataset(test_data, channels)
+        validate_dataset = load_dataset(validate_data, channels)
+    else:
+        train_dataset = WindowedInteractionDataset(
+            train_data,
+            window,
+            crop_stride,
+            random_state=random_state,
+            channels=channels,
+        )
+        test_dataset = WindowedInteractionDataset(
+            test_data, window, crop_stride, random_crops=False, channels=channels
+        )
+        validate_dataset = WindowedInteractionDataset(
+            validate_data, window, crop_stride, random_crops=False, channels=channels
+        )
+
+    if negative_ratio is not None:
+        logger.info("Drawing non-interacting pairs")
+        train_dataset = ConcatDataset(
+            [
+                train_dataset,
+                load_negative_dataset(
+                    train_df,
+                    known_pair_paths or [],
+                    negative_ratio,
+                    window,
+                    None if train_data is train_df else train_data,
+                    channels,
+                ),
+            ]
+        )
+
+    return [train_dataset, test_dataset, validate_dataset]
+
+
+def load_streaming_datasets(
+    paths: List[str],
+    hash_split_by: str = "pair",
+    random_state: int = 32,
+    channels: Optional[List[str]] = None,
+) -> List[StreamingInteractionDataset]:
+    """Load datasets streaming the rows of every hash split.
+
+    Args:
+        paths: list of dataframes path with respect to /data/processed.
+        hash_split_by: pair or protein, see hash_split_dataframe.
+        random_state: salt of the hash and seed of the shuffle.
+        channels: channels of the model input, every channel if None.
+
+    Returns:
+        Return train, test and validation datasets. Only the train dataset
+        is shuffled.
+    """
+    frac = [0.7, 0.2, 0.1]
+    return [
+        StreamingInteractionDataset(
+            paths,
+            HashSplitFilter(frac, split, hash_split_by, random_state),
+            id_col_name,
+            buffer_size=1024 if split == 0 else 0,
+            random_state=random_state,
+            channels=channels,
+        )
+        for split in range(len(frac))
+    ]
+
+
+def train_cnn(
+    paths: List[str],
+    batch_size: int = 2,
+    num_workers: int = 2,
+    shuffle_block_size: Optional[int] = 64,
+    random_state: int = 32,
+    negative_ratio: Optional[float] = None,
+    known_pair_paths: Optional[List[str]] = None,
+    clusters_path: Optional[str] = None,
+    max_per_cluster: Optional[int] = None,
+    strict_clusters: bool = True,
+    hash_split_by: Optional[str] = None,
+    normalize: bool = False,
+    window: Optional[int] = None,
+    crop_stride: Optional[int] = None,
+    shards: bool = False,
+    channels: Optional[List[str]] = None,
+    streaming: bool = False,
+    accelerate: bool = False,
+    threads: Optional[int] = None,
+    accumulation_steps: int = 1,
+    checkpoint_activations: bool = False,
+    checkpoint_steps: Optional[int] = None,
+    resume: bool = False,
+    overwrite_checkpoints: bool = False,
+    eval_batch_size: Optional[int] = None,
+    patience: Optional[int] = None,
+    eval_process: bool = False,
+) -> None:
+    """Train using cnn model.
+
+    Args:
+        paths: list of dataframes path with respect to /data/processed.
+        batch_size: size of each batch.
+        num_workers: for multiprocessing, every worker opens the dataframes
+            itself.
+        shuffle_block_size: rows moved together while splitting. If None, rows
+            are split with a full random permutation.
+        random_state: seed used to split the dataframe.
+        negative_ratio: if given, draw this many random non-interacting pairs
+            for every training row. Input dataframes must have protein ids.
+        known_pair_paths: dataframes of known interactions which must never
+            be drawn as non-interacting pairs.
+        clusters_path: if given, protein clusters dataframe with respect to
+            /data/processed. Similar proteins are then kept in one split.
+        max_per_cluster: if given with clusters_path, keep at most this many
+            rows for every pair of clusters.
+        strict_clusters: with clusters_path, share no cluster between
+            splits and drop the rows linking two splits, see
+            cluster_split_dataframe. Otherwise only the training split
+            shares no cluster with the others and no row is dropped.
+        hash_split_by: if pair or protein, split rows lazily by a stable hash
+            of the pair or of both proteins. Splits don't change when rows
+            are appended.
+        normalize: normalize every channel with the statistics saved next to
+            the dataframes.
+        window: if given, train on windows of this many residues of every
+            protein instead of whole padded proteins. A random window is
+            drawn for every training row, test and validation rows are
+            split in every pair of overlapping windows.
+        crop_stride: residues between windows, window // 2 if None.
+        shards: read samples from the tensor shards exported next to the
+            dataframes instead of decoding the dataframes.
+        channels: channels of the model input, seq first. Only their columns
+            are read, every channel if None.
+        streaming: stream record batches of the dataframes in sequence
+            instead of reading rows at random. Rows are split with a hash of
+            the pair, or of the proteins if hash_split_by is protein.
+        accelerate: train with autocast, channels last and a compiled model,
+            see get_accelerated_cnn_trainer_config.
+        threads: torch intra-op threads of training, unchanged if None.
+        accumulation_steps: batches whose gradients are summed before every
+            parameter update, the effective batch size is batch_size times
+            accumulation_steps.
+        checkpoint_activations: recompute activations of the convolution
+            blocks in the backward pass, to lower peak memory.
+        checkpoint_steps: if given, also save a training checkpoint every
+            this many batches, not only after every epoch.
+        resume: resume training from the latest checkpoint.
+        overwrite_checkpoints: remove checkpoints of a previous run, which
+            otherwise stop training from starting over, see CNNTrainer.train.
+        eval_batch_size: size of each evaluation batch, 4 * batch_size if
+            None. Evaluation keeps no activations, so it fits larger batches.
+        patience: if given, stop once the validation loss hasn't improved
+            for this many epochs.
+        eval_process: evaluate checkpoints in a separate process instead of
+            pausing training.
+
+    Raises:
+        ValueError: if shards are used with windows, negative sampling or a
+            subset of the channels, if shards don't have the rows of the
+            dataframes, if streaming is used with shards, windows, negatives
+            or cluster splits, or if a channel is unknown.
+    """
+    if shards and (window is not None or negative_ratio is not None):
+        raise ValueError("Tensor shards can't be used with windows or negatives")
+    if shards and channels is not None:
+        raise ValueError("Tensor shards hold every channel")
+    if streaming and (shards or window is not None or negative_ratio is not None):
+        raise ValueError("Streaming can't be used with shards, windows or negatives")
+    if streaming and clusters_path is not None:
+        raise ValueError("Streaming needs a hash split")
+
+    if threads is not None:
+        torch.set_num_threads(threads)
+
+    if streaming:
+        logger.info("Streaming dataset")
+        train_dataset, test_dataset, validate_dataset = load_streaming_datasets(
+            paths, hash_split_by or "pair", random_state, channels
+        )
+    else:
+        train_dataset, test_dataset, validate_dataset = load_split_datasets(
+            paths,
+            num_workers,
+            shuffle_block_size,
+            random_state,
+            negative_ratio,
+            known_pair_paths,
+            clusters_path,
+            max_per_cluster,
+            strict_clusters,
+            hash_split_by,
+            window,
+            crop_stride,
+            shards,
+            channels,
+        )
+
+    collate_fn = None
+    if normalize:
+        logger.info("Loading channel statistics")
+        collate_fn = ChannelNormalizer(
+            normalization_parameters(load_channel_stats(paths), channels=channels)
+        )
 
     # Dataloader
     logger.info("Preparing dataloader")
-    train_dataloader = data_loader(train_dataset, batch_size, num_workers)
-    test_dataloader = data_loader(test_dataset, batch_size, num_workers)
-    validate_dataloader = data_loader(validate_dataset, batch_size, num_workers)
+    train_dataloader = data_loader(
+        train_dataset,
+        batch_size,
+        num_workers,
+        shuffle=negative_ratio is not None,
+        collate_fn=collate_fn,
+    )
+    eval_batch_size = eval_batch_size or 4 * batch_size
+    test_dataloader = data_loader(
+        test_dataset, eval_batch_size, num_workers, collate_fn=collate_fn
+    )
+    validate_dataloader = data_loader(
+        validate_dataset, eval_batch_size, num_workers, collate_fn=collate_fn
+    )
+
+    config = (
+        get_accelerated_cnn_trainer_config()
+        if accelerate
+        else get_default_cnn_trainer_config()
+    )
+    config["accumulation_steps"] = accumulation_steps
+    config["checkpoint_activations"] = checkpoint_activations
+    config["checkpoint_steps"] = checkpoint_steps
+    config["early_stopping_patience"] = patience
+    config["eval_process"] = eval_process
+
+    model = partial(ConvNet, channels=channels)
+    if window is not None:
+        model = partial(model, window=window)
 
     logger.info("Initiating cnn trainer")
-    cnn_trainer = CNNTrainer(train_dataloader, test_dataloader, validate_dataloader)
-    cnn_trainer.train("protein_cnn_model.pt")
+    cnn_trainer = CNNTrainer(
+        train_dataloader,
+        test_dataloader,
+        validate_dataloader,
+        config=config,
+        model=model,
+    )
+    cnn_trainer.train(
+        "protein_cnn_model.pt",
+        resume=resume,
+        overwrite_checkpoints=overwrite_checkpoints,
+    )
 
 
-def predict_cnn(df: vaex.dataframe.DataFrame) -> None:
-    """Predict using cnn model.
+def load_pretrained_model() -> torch.nn.Module:
+    """Load the pretrained cnn model, exits if it is not available.
 
-    Args:
-        df: vaex dataframe.
+    Returns:
+        Return the model in evaluation mode.
     """
     MODEL_PATH = os.path.realpath(
         os.path.abspath(
@@ -102,17 +564,52 @@ def predict_cnn(df: vaex.dataframe.DataFrame) -> None:
     click.secho("Loading model...", fg="blue")
     model = torch.load(MODEL_PATH)
     model.eval()
+    return model
 
-    click.secho("Preparing data for model...", fg="blue")
-    dataset = load_dataset(df)
 
-    _, model_input = dataset.__getitem__(0)
+def get_model_window(model: torch.nn.Module) -> int:
+    """Return residues of every protein in one sample of a model.
+
+    Models saved before windows were added take whole padded proteins.
+    """
+    return getattr(model, "window", PROTEIN_SEQ_MAX_LEN)
+
+
+def predict_cnn(
+    df: vaex.dataframe.DataFrame, model: Optional[torch.nn.Module] = None
+) -> None:
+    """Predict using cnn model.
+
+    Args:
+        df: vaex dataframe. Proteins must be padded to PROTEIN_SEQ_MAX_LEN
+            residues, or whole if the model takes shorter windows, see
+            get_model_window.
+        model: cnn model, the pretrained model if None.
+    """
+    model = load_pretrained_model() if model is None else model
+
+    click.secho("Preparing data for model...", fg="blue")
     config = get_default_cnn_trainer_config()
+    window = get_model_window(model)
+    # Models saved before channel subsets read every channel.
+    channels = getattr(model, "channels", None)
+
+    if window >= PROTEIN_SEQ_MAX_LEN:
+        dataset = load_dataset(df, channels)
+        _, model_input = dataset.__getitem__(0)
+        model_input_unsqueeze = model_input.unsqueeze_(0)
+    else:
+        # Every pair of windows is scored and the scores are averaged.
+        model_input_unsqueeze, _ = crop_pair_inputs(
+            read_row(df, 0, input_columns(channels)),
+            window,
+            window // 2,
+            channels,
+        )
 
-    model_input_unsqueeze = model_input.unsqueeze_(0)
     click.secho("Calculating interaction statistics", fg="cyan")
     output = model(model_input_unsqueeze.float().to(config["device"]))
-    softmax = torch.nn.Softmax(dim=-1)(output)
+    softmax = torch.nn.Softmax(dim=-1)(output).mean(dim=0)
     argmax = torch.argmax(softmax)
     # print(output)
     # print(softmax)
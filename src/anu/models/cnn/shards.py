@@ -0,0 +1,278 @@
+"""Memory mapped tensor shards of the input dataframes."""
+
+import json
+import os
+import pathlib
+import shutil
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from tqdm import tqdm
+import vaex
+
+from anu.data.dataframe_operation import get_dataset_path, write_file_atomically
+from anu.models.cnn.loader import CollatedBatch, read_input_batch
+
+
+def get_shards_path(path: str) -> str:
+    """Return absolute path of the tensor shards of a dataframe.
+
+    Args:
+        path: path of the dataframe relative to data/processed.
+
+    Returns:
+        Return the shards directory, next to the dataframe.
+    """
+    return f"{get_dataset_path(path)}_shards"
+
+
+def export_tensor_shards(
+    df: vaex.dataframe.DataFrame,
+    path: str,
+    shard_rows: int = 512,
+    batch_rows: int = 64,
+    dtype: str = "float32",
+    source: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """Decode an input dataframe once into fixed shape npy shards.
+
+    Every shard holds inputs of shape (rows, 1, channels, 2 * residues) and
+    labels of shape (rows, 2). Shards are written to a new version directory
+    and meta.json is switched to it atomically, like StructureIndex.save.
+
+    Args:
+        df: input dataframe with the columns of input_col_name, proteins
+            padded to one length.
+        path: absolute path of the shards directory.
+        shard_rows: rows in one shard.
+        batch_rows: rows decoded at once.
+        dtype: dtype of the saved inputs, float32 halves the size and the
+            model casts inputs to float32 anyway.
+        source: files of the dataframe, see describe_dataframe_source,
+            compared by TensorShards.load.
+
+    Returns:
+        Return number of exported rows.
+    """
+    meta_path = os.path.join(path, "meta.json")
+    previous = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as fp:
+            previous = json.load(fp)["version"]
+
+    version = 0 if previous is None else previous + 1
+    version_path = os.path.join(path, str(version))
+    pathlib.Path(version_path).mkdir(parents=True, exist_ok=True)
+
+    shards = []
+    input_shape: List[int] = []
+    if len(df) > 0:
+        input_shape = list(read_input_batch(df, [0])[1].shape[1:])
+
+    # The version directory is not read before meta.json points to it, so
+    # shards are filled in place.
+    progress = tqdm(total=len(df), desc="Exporting", unit="rows", leave=False)
+    for start in range(0, len(df), shard_rows):
+        rows = min(shard_rows, len(df) - start)
+        name = f"{len(shards):05d}"
+        inputs = np.lib.format.open_memmap(
+            os.path.join(version_path, f"inputs-{name}.npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=(rows, *input_shape),
+        )
+        labels = np.lib.format.open_memmap(
+            os.path.join(version_path, f"labels-{name}.npy"),
+            mode="w+",
+            dtype=np.int64,
+            shape=(rows, 2),
+        )
+
+        for offset in range(0, rows, batch_rows):
+            end = min(offset + batch_rows, rows)
+            batch_labels, batch_inputs = read_input_batch(
+                df, range(start + offset, start + end)
+            )
+            inputs[offset:end] = batch_inputs.numpy()
+            labels[offset:end] = batch_labels.numpy()
+            progress.update(end - offset)
+
+        inputs.flush()
+        labels.flush()
+        shards.append({"name": name, "rows": rows})
+
+    progress.close()
+
+    def write_meta(tmp_path: str) -> None:
+        with open(tmp_path, "w") as fp:
+            json.dump(
+                {
+                    "version": version,
+                    "rows": len(df),
+                    "input_shape": input_shape,
+                    "dtype": dtype,
+                    "shards": shards,
+                    "source": source,
+                },
+                fp,
+            )
+
+    write_file_atomically(meta_path, write_meta)
+
+    if previous is not None:
+        shutil.rmtree(os.path.join(path, str(previous)), ignore_errors=True)
+
+    return len(df)
+
+
+class TensorShards:
+    """Inputs and labels of exported shards, memory mapped."""
+
+    def __init__(
+        self: "TensorShards",
+        inputs: List[np.ndarray],
+        labels: List[np.ndarray],
+        paths: Optional[List[str]] = None,
+    ) -> None:
+        """Initialize shards.
+
+        Args:
+            inputs: memory mapped inputs of every shard.
+            labels: memory mapped labels of every shard.
+            paths: shards directories the arrays were loaded from.
+        """
+        self.inputs = inputs
+        self.labels = labels
+        self.paths = paths
+        self.offsets = np.concatenate(
+            [[0], np.cumsum([len(shard) for shard in labels])]
+        ).astype(np.int64)
+
+    def __len__(self: "TensorShards") -> int:
+        """Return number of rows."""
+        return int(self.offsets[-1])
+
+    def __getstate__(self: "TensorShards") -> Dict[str, Any]:
+        """Pickle only the paths, so workers map the shards themselves."""
+        if self.paths is None:
+            return dict(self.__dict__)
+        return {"paths": self.paths}
+
+    def __setstate__(self: "TensorShards", state: Dict[str, Any]) -> None:
+        """Memory map the shards again after unpickling."""
+        if "inputs" not in state:
+            state = TensorShards.load(state["paths"]).__dict__
+        self.__dict__.update(state)
+
+    @classmethod
+    def load(
+        cls: "Type[TensorShards]",
+        paths: List[str],
+        sources: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> "TensorShards":
+        """Memory map shards of one or more dataframes, rows back to back.
+
+        Args:
+            paths: absolute paths of shards directories.
+            sources: current files of every dataframe, see
+                describe_dataframe_source, None to not compare them.
+
+        Returns:
+            Return the shards.
+
+        Raises:
+            OSError: if a directory holds no shards.
+            ValueError: if the files of a dataframe changed since its shards
+                were exported.
+        """
+        inputs, labels = [], []
+        for i, path in enumerate(paths):
+            meta_path = os.path.join(path, "meta.json")
+            if not os.path.exists(meta_path):
+                raise OSError(f"No tensor shards at {path}")
+
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+
+            if sources is not None and meta.get("source") != sources[i]:
+                raise ValueError(
+                    f"Tensor shards at {path} are stale, export them again"
+                )
+
+            version_path = os.path.join(path, str(meta["version"]))
+            for shard in meta["shards"]:
+                for kind, arrays in [("inputs", inputs), ("labels", labels)]:
+                    arrays.append(
+                        np.load(
+                            os.path.join(version_path, f"{kind}-{shard['name']}.npy"),
+                            mmap_mode="r",
+                        )
+                    )
+
+        return cls(inputs, labels, paths)
+
+    def take(
+        self: "TensorShards", rows: Sequence[int]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Read labels and inputs of rows.
+
+        Args:
+            rows: rows over all shards.
+
+        Returns:
+            Return labels of shape (rows, 2) and inputs of shape
+            (rows, 1, channels, 2 * residues).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        shard_ids = np.searchsorted(self.offsets, rows, side="right") - 1
+
+        first = self.inputs[0]
+        inputs = np.empty((len(rows), *first.shape[1:]), dtype=first.dtype)
+        labels = np.empty((len(rows), *self.labels[0].shape[1:]), dtype=np.int64)
+
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            local = rows[mask] - self.offsets[shard_id]
+            inputs[mask] = self.inputs[shard_id][local]
+            labels[mask] = self.labels[shard_id][local]
+
+        return torch.from_numpy(labels), torch.from_numpy(inputs)
+
+
+class TensorShardDataset(Dataset):
+    """Interaction classification dataset over memory mapped tensor shards.
+
+    Samples are slices of the shards, so after the first epoch loading is
+    bounded by the page cache instead of decoding arrow list columns.
+    """
+
+    def __init__(
+        self: "TensorShardDataset",
+        shards: TensorShards,
+        rows: Optional[np.ndarray] = None,
+    ) -> None:
+        """Initialize dataset.
+
+        Args:
+            shards: shards of the input dataframes.
+            rows: rows of the shards in the dataset, every row if None.
+        """
+        self.shards = shards
+        self.rows = np.arange(len(shards)) if rows is None else np.asarray(rows)
+
+    def __len__(self: "TensorShardDataset") -> int:
+        """Return number of rows."""
+        return len(self.rows)
+
+    def __getitem__(
+        self: "TensorShardDataset", idx: int
+    ) -> (torch.Tensor, torch.Tensor):
+        """Return interaction_input and interaction_labels."""
+        labels, inputs = self.shards.take(self.rows[[idx]])
+        return labels[0], inputs[0]
+
+    def __getitems__(self: "TensorShardDataset", indices: List[int]) -> CollatedBatch:
+        """Return labels and inputs of a batch of rows read at once."""
+        return CollatedBatch(self.shards.take(self.rows[indices]))
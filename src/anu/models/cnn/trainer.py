@@ -1,23 +1,370 @@
 """CNN model trainer."""
 
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+import multiprocessing
 import os
 import pathlib
-from time import asctime, time
-from typing import Optional
+from time import asctime
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
 
 from logzero import logger
+import numpy as np
 import torch
-from torch.autograd import Variable
+from torch import nn
 from torch.nn import CrossEntropyLoss
-from torch.optim import Adam
-from torch.utils.data import DataLoader
+from torch.optim import Adam, Optimizer
+from torch.utils.data import DataLoader, Dataset
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
 
+from anu.data.dataframe_operation import write_file_atomically
+from anu.metrics.classification import classification_metrics
+from anu.models.cnn.checkpoints import (
+    CheckpointWriter,
+    get_checkpoint_name,
+    get_rng_state,
+    list_checkpoints,
+    load_latest_checkpoint,
+    set_rng_state,
+)
 from anu.models.cnn.config import CNNTrainerConfig, get_default_cnn_trainer_config
 from anu.models.cnn.model import ConvNet
 
 
+def prepare_model(
+    model: nn.Module, config: CNNTrainerConfig
+) -> Tuple[nn.Module, nn.Module]:
+    """Move model to the device and apply the acceleration options of config.
+
+    Args:
+        model: model to train.
+        config: trainer config.
+
+    Returns:
+        Return the model and the module to call, compiled if enabled. Both
+        share their parameters, the model is the one to save.
+
+    Raises:
+        ValueError: if activation checkpointing is used with TorchScript.
+    """
+    if config["checkpoint_activations"] and config["compile"] == "script":
+        raise ValueError("Activation checkpointing can't be used with TorchScript")
+
+    model = model.to(config["device"])
+    if config["channels_last"]:
+        model = model.to(memory_format=torch.channels_last)
+
+    if config["compile"] == "compile":
+        return model, torch.compile(model)
+    if config["compile"] == "script":
+        return model, torch.jit.script(model)
+    return model, model
+
+
+def autocast_context(config: CNNTrainerConfig) -> ContextManager:
+    """Return bfloat16 autocast on cpu (float16 on cuda) if enabled."""
+    if not config["autocast"]:
+        return nullcontext()
+
+    device_type = torch.device(config["device"]).type
+    dtype = torch.bfloat16 if device_type == "cpu" else torch.float16
+    return torch.autocast(device_type=device_type, dtype=dtype)
+
+
+def to_model_input(inputs: torch.Tensor, config: CNNTrainerConfig) -> torch.Tensor:
+    """Cast a batch to float32 on the device, in one copy."""
+    memory_format = (
+        torch.channels_last if config["channels_last"] else torch.contiguous_format
+    )
+    return inputs.to(config["device"], dtype=torch.float32, memory_format=memory_format)
+
+
+def backward_step(
+    model: nn.Module,
+    criterion: nn.Module,
+    labels: torch.Tensor,
+    inputs: torch.Tensor,
+    config: CNNTrainerConfig,
+    weight: float = 1.0,
+) -> float:
+    """Run forward and backward pass of one batch, adding to the gradients.
+
+    Args:
+        model: module to call, see prepare_model.
+        criterion: loss.
+        labels: one hot labels of shape (batch, 2).
+        inputs: inputs of shape (batch, 1, channels, residues).
+        config: trainer config.
+        weight: factor of the loss in the gradients.
+
+    Returns:
+        Return the loss of the batch.
+    """
+    with autocast_context(config):
+        output = model(to_model_input(inputs, config))
+        loss = criterion(output, labels.argmax(dim=1).to(config["device"]))
+
+    (loss if weight == 1.0 else loss * weight).backward()
+
+    return loss.item()
+
+
+def train_step(
+    model: nn.Module,
+    optimizer: Optimizer,
+    criterion: nn.Module,
+    labels: torch.Tensor,
+    inputs: torch.Tensor,
+    config: CNNTrainerConfig,
+) -> float:
+    """Run forward and backward pass of one batch and update parameters.
+
+    Args:
+        model: module to call, see prepare_model.
+        optimizer: optimizer of the parameters.
+        criterion: loss.
+        labels: one hot labels of shape (batch, 2).
+        inputs: inputs of shape (batch, 1, channels, residues).
+        config: trainer config.
+
+    Returns:
+        Return the loss of the batch.
+    """
+    optimizer.zero_grad(set_to_none=True)
+    loss = backward_step(model, criterion, labels, inputs, config)
+    optimizer.step()
+
+    return loss
+
+
+class GradientAccumulator:
+    """Update parameters once every accumulation_steps batches.
+
+    Gradients of every batch are weighted with its samples and divided by
+    the samples of all accumulated batches before the update, so the update
+    is the one of the whole effective batch, even for a last, smaller one.
+    """
+
+    def __init__(
+        self: "GradientAccumulator",
+        model: nn.Module,
+        optimizer: Optimizer,
+        criterion: nn.Module,
+        config: CNNTrainerConfig,
+    ) -> None:
+        """Initialize accumulator.
+
+        Args:
+            model: module to call, see prepare_model.
+            optimizer: optimizer of the parameters.
+            criterion: loss, averaged over the samples of a batch.
+            config: trainer config.
+        """
+        self.model = model
+        self.optimizer = optimizer
+        self.criterion = criterion
+        self.config = config
+        self.batches = 0
+        self.samples = 0
+
+    def step(
+        self: "GradientAccumulator", labels: torch.Tensor, inputs: torch.Tensor
+    ) -> float:
+        """Add gradients of a batch and update parameters if enough are added.
+
+        Args:
+            labels: one hot labels of shape (batch, 2).
+            inputs: inputs of shape (batch, 1, channels, residues).
+
+        Returns:
+            Return the loss of the batch.
+        """
+        if self.config["accumulation_steps"] == 1:
+            return train_step(
+                self.model,
+                self.optimizer,
+                self.criterion,
+                labels,
+                inputs,
+                self.config,
+            )
+
+        loss = backward_step(
+            self.model, self.criterion, labels, inputs, self.config, len(labels)
+        )
+        self.batches = self.batches + 1
+        self.samples = self.samples + len(labels)
+        if self.batches == self.config["accumulation_steps"]:
+            self.update()
+
+        return loss
+
+    def update(self: "GradientAccumulator") -> None:
+        """Update parameters with the accumulated gradients, if any."""
+        if self.samples == 0:
+            return
+
+        for group in self.optimizer.param_groups:
+            for parameter in group["params"]:
+                if parameter.grad is not None:
+                    parameter.grad.div_(self.samples)
+
+        self.optimizer.step()
+        self.optimizer.zero_grad(set_to_none=True)
+        self.batches = 0
+        self.samples = 0
+
+
+def average_row_scores(
+    labels: np.ndarray, scores: np.ndarray, rows: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Average scores of the samples of every row, e.g. windows of a pair.
+
+    Args:
+        labels: label of every sample, the same for samples of a row.
+        scores: score of every sample.
+        rows: row of every sample.
+
+    Returns:
+        Return label and mean score of every row, in the order of rows.
+    """
+    unique, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = np.bincount(inverse, weights=scores, minlength=len(unique))
+    counts = np.bincount(inverse, minlength=len(unique))
+
+    return labels[first], sums / counts
+
+
+def evaluate(
+    model: nn.Module,
+    dataloader: DataLoader,
+    criterion: nn.Module,
+    config: CNNTrainerConfig,
+) -> Dict[str, float]:
+    """Compute loss and metrics of a model over a data loader.
+
+    Batches run under torch.inference_mode, so no activations are kept for
+    a backward pass and larger batches than for training fit in memory.
+    Interacting pairs, the first class, are the positive class. Datasets
+    with several samples per row, like the windows of a pair, define
+    sample_rows: metrics are then computed on the mean score of every row,
+    the loss is still averaged over the samples.
+
+    Args:
+        model: module to call, see prepare_model.
+        dataloader: batches of one hot labels and inputs.
+        criterion: loss, averaged over the samples of a batch.
+        config: trainer config.
+
+    Returns:
+        Return loss averaged over the samples and every classification
+        metric, see classification_metrics.
+    """
+    model.eval()
+
+    total_loss = 0.0
+    labels, scores = [], []
+    with torch.inference_mode(), autocast_context(config):
+        for input_labels, input_batch in dataloader:
+            targets = input_labels.argmax(dim=1).to(config["device"])
+            output = model(to_model_input(input_batch, config))
+            loss = criterion(output.float(), targets)
+
+            total_loss = total_loss + loss.item() * len(targets)
+            labels.append((targets == 0).cpu().numpy())
+            scores.append(torch.softmax(output.float(), dim=1)[:, 0].cpu().numpy())
+
+    samples = sum(len(batch) for batch in labels)
+    if samples == 0:
+        return {"loss": float("nan")}
+
+    all_labels, all_scores = np.concatenate(labels), np.concatenate(scores)
+    # Evaluation data loaders don't shuffle, samples come in dataset order.
+    if hasattr(dataloader.dataset, "sample_rows"):
+        all_labels, all_scores = average_row_scores(
+            all_labels, all_scores, dataloader.dataset.sample_rows()
+        )
+
+    return {
+        "loss": total_loss / samples,
+        **classification_metrics(all_labels, all_scores),
+    }
+
+
+def evaluate_checkpoint(
+    path: str,
+    model: Callable[..., nn.Module],
+    dataloader: DataLoader,
+    config: CNNTrainerConfig,
+) -> Dict[str, float]:
+    """Evaluate the model saved in a training checkpoint.
+
+    Used in a separate process, so evaluation never stalls training.
+
+    Args:
+        path: absolute path of the checkpoint.
+        model: model class, or function building the model.
+        dataloader: batches of one hot labels and inputs.
+        config: trainer config.
+
+    Returns:
+        Return loss and metrics, see evaluate.
+    """
+    state = torch.load(path, map_location="cpu", weights_only=True)
+    net = model()
+    net.load_state_dict(state["model"])
+    _, forward_net = prepare_model(net, config)
+
+    return evaluate(forward_net, dataloader, CrossEntropyLoss(), config)
+
+
+class EarlyStopping:
+    """Stop training once the validation loss stops improving."""
+
+    def __init__(
+        self: "EarlyStopping", patience: Optional[int], min_delta: float = 0.0
+    ) -> None:
+        """Initialize early stopping.
+
+        Args:
+            patience: evaluations without improvement before stopping, never
+                stop if None.
+            min_delta: decrease of the loss counted as an improvement.
+        """
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = float("inf")
+        self.bad_evaluations = 0
+
+    def step(self: "EarlyStopping", loss: float) -> bool:
+        """Record a validation loss.
+
+        Args:
+            loss: validation loss.
+
+        Returns:
+            Return True if training should stop.
+        """
+        if loss < self.best - self.min_delta:
+            self.best = loss
+            self.bad_evaluations = 0
+        else:
+            self.bad_evaluations = self.bad_evaluations + 1
+
+        return self.patience is not None and self.bad_evaluations >= self.patience
+
+    def state_dict(self: "EarlyStopping") -> Dict[str, Any]:
+        """Return best loss and evaluations without improvement."""
+        return {"best": self.best, "bad_evaluations": self.bad_evaluations}
+
+    def load_state_dict(self: "EarlyStopping", state: Dict[str, Any]) -> None:
+        """Restore state saved by state_dict."""
+        self.best = state["best"]
+        self.bad_evaluations = state["bad_evaluations"]
+
+
 class CNNTrainer:
     """CNN model trainer."""
 
@@ -41,12 +388,290 @@ class CNNTrainer:
         self.valid_dataloader = valid_dataloader
         self.model = model
 
-    def train(self: "CNNTrainer", filename: str) -> None:
-        """Trains the model."""
+    def train_datasets(self: "CNNTrainer") -> List[Dataset]:
+        """Return datasets of the training data loader."""
+        dataset = self.train_dataloader.dataset
+        return getattr(dataset, "datasets", [dataset])
+
+    def resample_train_dataset(self: "CNNTrainer") -> None:
+        """Draw new random pairs for datasets supporting it."""
+        for item in self.train_datasets():
+            if hasattr(item, "resample"):
+                item.resample()
+
+    def random_state(self: "CNNTrainer") -> Dict[str, Any]:
+        """Return state of the random generators and of the train datasets.
+
+        Datasets keep their own random generator (rng), the generator of
+        their negative pair sampler or an epoch counter. Data loader workers
+        are seeded from the torch generator when an epoch starts, and are
+        started again every epoch when they draw samples at random, see
+        draws_every_epoch, so restoring this state reproduces them too.
+        """
+        datasets = []
+        for item in self.train_datasets():
+            state = {}
+            if hasattr(item, "rng"):
+                state["rng"] = item.rng.bit_generator.state
+            if hasattr(item, "sampler"):
+                state["sampler_rng"] = item.sampler.rng.bit_generator.state
+            if hasattr(item, "epoch"):
+                state["epoch"] = item.epoch
+            datasets.append(state)
+
+        return {"rng": get_rng_state(), "datasets": datasets}
+
+    def set_random_state(self: "CNNTrainer", state: Dict[str, Any]) -> None:
+        """Restore state saved by random_state."""
+        set_rng_state(state["rng"])
+        for item, dataset_state in zip(self.train_datasets(), state["datasets"]):
+            if "rng" in dataset_state:
+                item.rng.bit_generator.state = dataset_state["rng"]
+            if "sampler_rng" in dataset_state:
+                item.sampler.rng.bit_generator.state = dataset_state["sampler_rng"]
+            if "epoch" in dataset_state:
+                item.epoch = dataset_state["epoch"]
+
+    def training_state(
+        self: "CNNTrainer", epoch: int, batch: int, random_state: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Return everything needed to resume training.
+
+        Args:
+            epoch: current epoch.
+            batch: batches of the epoch already trained.
+            random_state: random_state at the start of the epoch.
+
+        Returns:
+            Return the training state.
+        """
+        return {
+            "model": self.net.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "epoch": epoch,
+            "batch": batch,
+            "step": self.step,
+            "random": random_state,
+            "early_stopping": self.early_stopping.state_dict(),
+        }
+
+    def restore(self: "CNNTrainer") -> Tuple[int, int]:
+        """Restore the latest checkpoint, if any.
+
+        Returns:
+            Return epoch to start with and its batches already trained.
+        """
+        # Random states must stay on cpu, load_state_dict moves the rest.
+        state = load_latest_checkpoint(self.checkpoints.path)
+        if state is None:
+            logger.warning("No checkpoint to resume from, starting over")
+            return 0, 0
+
+        self.net.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.step = state["step"]
+        self.early_stopping.load_state_dict(state["early_stopping"])
+        self.set_random_state(state["random"])
+        logger.info(f"Resuming epoch {state['epoch']} after {state['batch']} batches")
+
+        return state["epoch"], state["batch"]
+
+    def train_epoch(self: "CNNTrainer", epoch: int, skip: int = 0) -> float:
+        """Train one epoch.
+
+        Batches are drawn in the same order as before a resume, so the
+        batches already trained are read again and skipped.
+
+        Args:
+            epoch: current epoch.
+            skip: batches of the epoch already trained.
+
+        Returns:
+            Return the training loss averaged over the trained batches.
+        """
+        # Pairs of the first epoch are drawn again too, so they come from
+        # the saved random state when the first epoch is resumed.
+        random_state = self.random_state()
+        self.resample_train_dataset()
+
+        every = self.config["checkpoint_steps"]
+        saved = self.step
+        losses = []
+        # Evaluation sets the module called, compiled or not, to eval mode.
+        self.forward_net.train()
+        for batch, (input_labels, input_batch) in enumerate(
+            tqdm(self.train_dataloader, position=2, unit=" row", leave=False)
+        ):
+            if batch < skip:
+                continue
+
+            losses.append(self.accumulator.step(input_labels, input_batch))
+            self.step = self.step + 1
+
+            # Accumulated gradients are not saved, checkpoints wait for an
+            # update.
+            if every is not None and self.step - saved >= every:
+                if self.accumulator.batches == 0:
+                    state = self.training_state(epoch, batch + 1, random_state)
+                    self.checkpoints.save(state, self.step)
+                    saved = self.step
+
+        # Update with the batches left at the end of the epoch.
+        self.accumulator.update()
+
+        return float(np.mean(losses)) if len(losses) > 0 else float("nan")
+
+    def log_metrics(
+        self: "CNNTrainer", split: str, metrics: Dict[str, float], epoch: int
+    ) -> None:
+        """Write metrics of a split to tensorboard."""
+        for name, value in metrics.items():
+            self.writer.add_scalar(f"{split}/{name}", value, epoch)
+        logger.info(f"Epoch {epoch} {split}: loss {metrics['loss']:.4f}")
+
+    def validate(self: "CNNTrainer", epoch: int) -> bool:
+        """Evaluate the model on the validation data loader.
+
+        Args:
+            epoch: epoch just trained.
+
+        Returns:
+            Return True if training should stop early.
+        """
+        metrics = evaluate(
+            self.forward_net, self.eval_dataloader, self.criterion, self.config
+        )
+        self.log_metrics("validation", metrics, epoch)
+        return self.early_stopping.step(metrics["loss"])
+
+    def submit_validation(self: "CNNTrainer", epoch: int) -> None:
+        """Evaluate the checkpoint of the current step in the evaluation process.
+
+        Evaluation is skipped if the previous one is still running, so
+        evaluations never pile up behind training.
+
+        Args:
+            epoch: epoch of the latest checkpoint.
+        """
+        if any(not future.done() for _, _, future in self.evaluations):
+            logger.info(f"Previous evaluation still running, skipping epoch {epoch}")
+            return
+
+        self.checkpoints.wait()
+        path = os.path.join(self.checkpoints.path, get_checkpoint_name(self.step))
+        self.checkpoints.retained.add(path)
+        future = self.evaluator.submit(
+            evaluate_checkpoint, path, self.model, self.eval_dataloader, self.config
+        )
+        self.evaluations.append((epoch, path, future))
+
+    def collect_validations(self: "CNNTrainer", wait: bool = False) -> bool:
+        """Log evaluations done in the evaluation process.
+
+        Args:
+            wait: wait for running evaluations.
+
+        Returns:
+            Return True if training should stop early.
+        """
+        stop = False
+        while len(self.evaluations) > 0:
+            epoch, path, future = self.evaluations[0]
+            if not (wait or future.done()):
+                break
+            self.evaluations.pop(0)
+            try:
+                metrics = future.result()
+            except Exception as err:
+                logger.error(f"Evaluation of epoch {epoch} failed: {err}")
+                continue
+            finally:
+                self.checkpoints.retained.discard(path)
+            self.log_metrics("validation", metrics, epoch)
+            stop = self.early_stopping.step(metrics["loss"]) or stop
+
+        return stop
+
+    def end_epoch(self: "CNNTrainer", epoch: int, loss: float) -> bool:
+        """Log, evaluate and save a checkpoint after an epoch.
+
+        Evaluation runs every eval_epochs epochs, before the checkpoint so
+        it holds the early stopping state, or in the evaluation process on
+        the checkpoint.
+
+        Args:
+            epoch: epoch just trained.
+            loss: training loss of the epoch.
+
+        Returns:
+            Return True if training should stop early.
+        """
+        self.writer.add_scalar("train/loss", loss, epoch)
+
+        every = self.config["eval_epochs"]
+        due = every is not None and (epoch + 1) % every == 0
+        due = due and self.eval_dataloader is not None
+        stop = self.collect_validations()
+        if due and self.evaluator is None:
+            stop = self.validate(epoch) or stop
+
+        self.checkpoints.save(
+            self.training_state(epoch + 1, 0, self.random_state()), self.step
+        )
+        if due and self.evaluator is not None:
+            self.submit_validation(epoch)
+
+        return stop
+
+    def train(
+        self: "CNNTrainer",
+        filename: str,
+        resume: bool = False,
+        overwrite_checkpoints: bool = False,
+    ) -> None:
+        """Trains the model.
+
+        A checkpoint is saved in the background after every epoch, and every
+        checkpoint_steps batches if set. The validation data loader (the
+        test one if None) is evaluated every eval_epochs epochs, and the
+        test data loader once after training. Losses and metrics are written
+        to tensorboard. The trained model is saved to
+        model_savedir/cnn/filename.
+
+        Args:
+            filename: file name of the trained model.
+            resume: restore model, optimizer, progress and random state from
+                the latest checkpoint.
+            overwrite_checkpoints: when not resuming, remove checkpoints of
+                a previous run. They would be resumed instead of the new ones
+                and their later steps would make retention remove the new
+                ones.
+
+        Raises:
+            ValueError: if checkpoints of a previous run exist and training
+                neither resumes nor overwrites them.
+        """
+        save_dir = os.path.join(self.config["model_savedir"], "cnn")
+        self.checkpoints = CheckpointWriter(
+            os.path.join(save_dir, "checkpoints"), self.config["keep_checkpoints"]
+        )
+        if not resume and len(list_checkpoints(self.checkpoints.path)) > 0:
+            if not overwrite_checkpoints:
+                raise ValueError(
+                    f"Checkpoints of a previous run are in {self.checkpoints.path}, "
+                    "resume them with --resume or remove them with "
+                    "--overwrite-checkpoints"
+                )
+            removed = self.checkpoints.clear()
+            logger.warning(f"Removed {removed} checkpoints of a previous run")
+
         logger.info("Starting ConvNet Training.")
 
         # spawn the model on selected device
-        cnn_net = self.model().to(self.config["device"])
+        self.net, forward_net = prepare_model(
+            self.model(checkpoint=self.config["checkpoint_activations"]),
+            self.config,
+        )
         logger.info("Initialized model.")
 
         # write model to tensorboard
@@ -54,46 +679,70 @@ class CNNTrainer:
         # logger.info("Graph added to tensor board")
 
         # spawn an optimizer
-        optimizer = Adam(cnn_net.parameters(), lr=0.0001)  # .to(self.config["device"])
+        self.optimizer = Adam(self.net.parameters(), lr=0.0001)
         logger.info("Initialized optimizer [ADAM]")
 
         # loss criterion
         criterion_loss = CrossEntropyLoss()
         logger.info("Initialized loss criterion")
 
-        current_status = tqdm(total=0, position=3, bar_format="{desc}")
-        save_status = tqdm(total=0, position=4, bar_format="{desc}")
-        for _epoch in tqdm(range(self.config["epochs"]), unit=" epoch", position=1):
-            for _, (input_labels, input_batch) in enumerate(
-                tqdm(self.train_dataloader, position=2, unit=" row", leave=False)
-            ):
-                # forward pass
-                current_status.set_description_str("Forward pass.")
-                output = cnn_net(input_batch.float().to(self.config["device"]))
-
-                # calculate loss
-                current_status.set_description_str("Calculate loss.")
-                loss = criterion_loss(
-                    output,
-                    Variable((input_labels.max(dim=0)[1]).to(self.config["device"])),
-                )
+        self.forward_net = forward_net
+        self.criterion = criterion_loss
+        self.accumulator = GradientAccumulator(
+            forward_net, self.optimizer, criterion_loss, self.config
+        )
+        self.early_stopping = EarlyStopping(
+            self.config["early_stopping_patience"],
+            self.config["early_stopping_delta"],
+        )
+        # Data loaders of iterable datasets have no length, so no truth value.
+        self.eval_dataloader = (
+            self.valid_dataloader
+            if self.valid_dataloader is not None
+            else self.test_dataloader
+        )
+        self.evaluations: List[Tuple[int, str, Future]] = []
+        self.evaluator = None
+        if self.config["eval_process"] and self.eval_dataloader is not None:
+            self.evaluator = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
 
-                # backward pass
-                current_status.set_description_str("Loss backward.")
-                loss.backward()
+        self.step = 0
+        start, skip = self.restore() if resume else (0, 0)
 
-                # update parameters
-                optimizer.step()
+        save_status = tqdm(total=0, position=4, bar_format="{desc}")
+        try:
+            for _epoch in tqdm(
+                range(start, self.config["epochs"]),
+                initial=start,
+                total=self.config["epochs"],
+                unit=" epoch",
+                position=1,
+            ):
+                loss = self.train_epoch(_epoch, skip if _epoch == start else 0)
+                stop = self.end_epoch(_epoch, loss)
+                save_status.set_description_str(f"Last checkpoint at: {asctime()}")
+                if stop:
+                    logger.info(f"Validation loss stopped improving, epoch {_epoch}")
+                    break
 
-                # TODO: Add callbacks for writing metrics and visualizations
+            self.collect_validations(wait=True)
+        finally:
+            self.checkpoints.close()
+            if self.evaluator is not None:
+                self.evaluator.shutdown()
 
-            save_status.set_description_str("Saving model")
-            path = os.path.join(self.config["model_savedir"], "cnn", str(int(time())))
-            pathlib.Path(path).mkdir(exist_ok=True, parents=True)
-            torch.save(
-                cnn_net,
-                os.path.join(
-                    self.config["model_savedir"], "cnn", f"{_epoch}_{filename}"
-                ),
+        if self.test_dataloader is not None:
+            metrics = evaluate(
+                forward_net, self.test_dataloader, criterion_loss, self.config
             )
-            save_status.set_description_str(f"Last model saved at: {asctime()}")
+            self.log_metrics("test", metrics, self.config["epochs"])
+        self.writer.flush()
+
+        pathlib.Path(save_dir).mkdir(exist_ok=True, parents=True)
+        write_file_atomically(
+            os.path.join(save_dir, filename),
+            lambda tmp_path: torch.save(self.net, tmp_path),
+        )
+        save_status.set_description_str(f"Model saved at: {asctime()}")
@@ -0,0 +1,396 @@
+"""Tune batch size, threads and loader workers of cnn training."""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import platform
+import resource
+from time import perf_counter
+from typing import List, Optional, Tuple, TypedDict
+
+from logzero import logger
+import torch
+
+from anu.data.dataframe_operation import write_file_atomically
+from anu.data.pipelines.prepare_input import input_col_name
+from anu.models.cnn.benchmark import benchmark_training, synthetic_batches
+from anu.models.cnn.config import (
+    CNNTrainerConfig,
+    get_accelerated_cnn_trainer_config,
+    get_default_cnn_trainer_config,
+)
+from anu.models.cnn.loader import DataFrameSource, InteractionClassificationDataset
+from anu.models.cnn.pipeline import data_loader
+
+PROFILE_FILENAME = "tuning_profile.json"
+
+
+class TrialResult(TypedDict):
+    """Throughput and memory of one trial."""
+
+    batch_size: int
+    threads: int
+    workers: int
+    samples_per_second: float
+    peak_rss: int
+
+
+class TrialSettings(TypedDict):
+    """Training options of the trials, a profile only fits these options."""
+
+    window: int
+    accelerate: bool
+    checkpoint_activations: bool
+    accumulation_steps: int
+
+
+class TuningProfile(TypedDict):
+    """Best training configuration of a machine."""
+
+    host: str
+    cpus: int
+    settings: TrialSettings
+    batch_size: int
+    threads: int
+    workers: int
+    samples_per_second: float
+    trials: List[TrialResult]
+
+
+def get_profile_path() -> str:
+    """Return absolute path of the tuning profile, in the log directory."""
+    return os.path.join(get_default_cnn_trainer_config()["logdir"], PROFILE_FILENAME)
+
+
+def default_memory_budget() -> int:
+    """Return half of the physical memory in bytes."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+
+
+def default_thread_counts() -> List[int]:
+    """Return powers of two up to the cpu count, and the cpu count."""
+    cpus = os.cpu_count() or 1
+    counts = [2**power for power in range(cpus.bit_length()) if 2**power < cpus]
+    return counts + [cpus]
+
+
+def peak_rss() -> int:
+    """Return peak resident memory of this process in bytes."""
+    # ru_maxrss is in kilobytes on linux and in bytes on macos.
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def trial_settings(
+    window: int = 4000,
+    accelerate: bool = False,
+    checkpoint_activations: bool = False,
+    accumulation_steps: int = 1,
+) -> TrialSettings:
+    """Return training options of the trials.
+
+    Args:
+        window: residues of every protein.
+        accelerate: train with the accelerated trainer config.
+        checkpoint_activations: checkpoint activations of the convolutions.
+        accumulation_steps: batches whose gradients are summed in one update.
+
+    Returns:
+        Return the settings.
+    """
+    return {
+        "window": window,
+        "accelerate": accelerate,
+        "checkpoint_activations": checkpoint_activations,
+        "accumulation_steps": accumulation_steps,
+    }
+
+
+def trial_config(settings: TrialSettings) -> CNNTrainerConfig:
+    """Return the trainer config of trials run with settings."""
+    config = (
+        get_accelerated_cnn_trainer_config()
+        if settings["accelerate"]
+        else get_default_cnn_trainer_config()
+    )
+    config["checkpoint_activations"] = settings["checkpoint_activations"]
+    config["accumulation_steps"] = settings["accumulation_steps"]
+    return config
+
+
+def run_compute_trial(
+    batch_size: int, threads: int, settings: TrialSettings, steps: int
+) -> Tuple[float, int]:
+    """Time forward and backward passes of ConvNet, in a fresh process.
+
+    Args:
+        batch_size: samples in one batch.
+        threads: torch intra-op threads.
+        settings: training options, see trial_settings.
+        steps: timed training steps, after one warmup step.
+
+    Returns:
+        Return samples per second and peak resident memory in bytes.
+    """
+    torch.set_num_threads(threads)
+    window = settings["window"]
+    batches = synthetic_batches(steps + 1, batch_size, window)
+    result = benchmark_training(trial_config(settings), batches, window, warmup=1)
+
+    return result["samples_per_second"], peak_rss()
+
+
+def run_loader_trial(
+    paths: List[str], batch_size: int, workers: int, batches: int
+) -> Tuple[float, int]:
+    """Time reading batches of the input dataframes, in a fresh process.
+
+    Args:
+        paths: dataframes path with respect to /data/processed.
+        batch_size: samples in one batch.
+        workers: data loader workers.
+        batches: timed batches, after the first one.
+
+    Returns:
+        Return samples per second and peak resident memory in bytes of the
+        trial process.
+    """
+    source = DataFrameSource(paths, input_col_name)
+    loader = iter(
+        data_loader(InteractionClassificationDataset(source), batch_size, workers)
+    )
+
+    next(loader)
+    samples = 0
+    start = perf_counter()
+    for _ in range(batches):
+        labels, _ = next(loader, (None, None))
+        if labels is None:
+            break
+        samples = samples + len(labels)
+
+    return samples / max(perf_counter() - start, 1e-9), peak_rss()
+
+
+def run_trial(*args: object, loader: bool = False) -> Tuple[float, int]:
+    """Run a compute or loader trial in a fresh spawned process.
+
+    Args:
+        args: arguments of run_compute_trial, or of run_loader_trial.
+        loader: run run_loader_trial instead of run_compute_trial.
+
+    Returns:
+        Return samples per second and peak resident memory of the trial.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        function = run_loader_trial if loader else run_compute_trial
+        return executor.submit(function, *args).result()
+
+
+def tune_compute(
+    batch_sizes: List[int],
+    threads: List[int],
+    memory_budget: int,
+    settings: Optional[TrialSettings] = None,
+    steps: int = 5,
+) -> List[TrialResult]:
+    """Time ConvNet training for every thread count and batch size.
+
+    Batch sizes of a thread count stop growing once a trial exceeds the
+    memory budget, larger ones would only use more memory.
+
+    Args:
+        batch_sizes: batch sizes to try.
+        threads: torch intra-op thread counts to try.
+        memory_budget: peak resident memory allowed for a trial, in bytes.
+        settings: training options, trial_settings() if None.
+        steps: timed training steps of every trial.
+
+    Returns:
+        Return every trial, including the first one over the budget.
+    """
+    settings = settings or trial_settings()
+    trials: List[TrialResult] = []
+    for thread_count in threads:
+        for batch_size in sorted(batch_sizes):
+            speed, rss = run_trial(batch_size, thread_count, settings, steps)
+            trials.append(
+                {
+                    "batch_size": batch_size,
+                    "threads": thread_count,
+                    "workers": 0,
+                    "samples_per_second": speed,
+                    "peak_rss": rss,
+                }
+            )
+            if rss > memory_budget:
+                break
+
+    return trials
+
+
+def tune_workers(
+    paths: List[str],
+    best: TrialResult,
+    workers: List[int],
+    memory_budget: int,
+    batches: int = 20,
+) -> List[TrialResult]:
+    """Time reading the input dataframes with more and more loader workers.
+
+    Workers and training threads together never use more than the available
+    cores. Trials stop at the first worker count which keeps up with
+    training.
+
+    Args:
+        paths: dataframes path with respect to /data/processed.
+        best: fastest compute trial, its batch size and threads are used.
+        workers: data loader workers to try.
+        memory_budget: peak resident memory allowed for a trial, in bytes.
+        batches: timed batches of every trial.
+
+    Returns:
+        Return every trial.
+    """
+    cpus = os.cpu_count() or 1
+    trials: List[TrialResult] = []
+    for worker_count in sorted(workers):
+        if worker_count > 0 and worker_count + best["threads"] > cpus:
+            continue
+        speed, rss = run_trial(
+            paths, best["batch_size"], worker_count, batches, loader=True
+        )
+        trials.append(
+            {
+                "batch_size": best["batch_size"],
+                "threads": best["threads"],
+                "workers": worker_count,
+                "samples_per_second": speed,
+                "peak_rss": rss,
+            }
+        )
+        if speed >= best["samples_per_second"] or rss > memory_budget:
+            break
+
+    return trials
+
+
+def choose_workers(best: TrialResult, trials: List[TrialResult]) -> int:
+    """Return the fewest workers keeping up with training, else the fastest."""
+    fast = [
+        trial
+        for trial in trials
+        if trial["samples_per_second"] >= best["samples_per_second"]
+    ]
+    if len(fast) > 0:
+        return fast[0]["workers"]
+    if len(trials) > 0:
+        return max(trials, key=lambda trial: trial["samples_per_second"])["workers"]
+    return 0
+
+
+def tune_training(
+    batch_sizes: List[int],
+    threads: List[int],
+    workers: List[int],
+    memory_budget: int,
+    settings: Optional[TrialSettings] = None,
+    steps: int = 5,
+    paths: Optional[List[str]] = None,
+) -> TuningProfile:
+    """Find the fastest batch size, thread count and loader workers.
+
+    Every trial runs in a fresh process, so its peak memory and threads are
+    its own. The fastest compute trial within the memory budget gives the
+    batch size and threads, loader trials then give the workers.
+
+    Args:
+        batch_sizes: batch sizes to try.
+        threads: torch intra-op thread counts to try.
+        workers: data loader workers to try.
+        memory_budget: peak resident memory allowed for a trial, in bytes.
+        settings: training options, trial_settings() if None. The profile
+            is only used to train with the same options.
+        steps: timed training steps of every compute trial.
+        paths: input dataframes for loader trials, workers are not tuned if
+            None.
+
+    Returns:
+        Return the best configuration and every trial.
+
+    Raises:
+        ValueError: if no compute trial fits in the memory budget.
+    """
+    settings = settings or trial_settings()
+    trials = tune_compute(batch_sizes, threads, memory_budget, settings, steps)
+    fitting = [trial for trial in trials if trial["peak_rss"] <= memory_budget]
+    if len(fitting) == 0:
+        raise ValueError("No trial fits in the memory budget")
+    best = max(fitting, key=lambda trial: trial["samples_per_second"])
+
+    loader_trials: List[TrialResult] = []
+    if paths is not None:
+        try:
+            loader_trials = tune_workers(paths, best, workers, memory_budget, steps * 4)
+        except OSError:
+            logger.warning("Unable to load input, loader workers are not tuned")
+    fitting = [t for t in loader_trials if t["peak_rss"] <= memory_budget]
+
+    return {
+        "host": platform.node(),
+        "cpus": os.cpu_count() or 1,
+        "settings": settings,
+        "batch_size": best["batch_size"],
+        "threads": best["threads"],
+        "workers": choose_workers(best, fitting),
+        "samples_per_second": best["samples_per_second"],
+        "trials": trials + loader_trials,
+    }
+
+
+def save_tuning_profile(profile: TuningProfile, path: Optional[str] = None) -> None:
+    """Save profile using write_file_atomically.
+
+    Args:
+        profile: tuning profile.
+        path: profile file, get_profile_path if None.
+    """
+
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "w") as fp:
+            json.dump(profile, fp, indent=2)
+
+    path = path or get_profile_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_file_atomically(path, write)
+
+
+def load_tuning_profile(
+    path: Optional[str] = None, settings: Optional[TrialSettings] = None
+) -> Optional[TuningProfile]:
+    """Load the profile tuned on this machine.
+
+    Args:
+        path: profile file, get_profile_path if None.
+        settings: training options the profile must have been tuned with,
+            see trial_settings, any if None.
+
+    Returns:
+        Return the profile, None if there is none, if it was tuned on
+        another machine or with other training options.
+    """
+    path = path or get_profile_path()
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as fp:
+        profile: TuningProfile = json.load(fp)
+
+    if profile["host"] != platform.node() or profile["cpus"] != os.cpu_count():
+        return None
+    # Profiles saved before settings were recorded match no settings.
+    if settings is not None and profile.get("settings") != settings:
+        return None
+    return profile
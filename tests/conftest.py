@@ -1,11 +1,100 @@
 """Package-wide test fixtures."""
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple
 from unittest.mock import Mock
 
 from _pytest.config import Config
+import numpy as np
+import pyarrow as pa
 import pytest
 from pytest_mock import MockFixture
 
+from anu.data.pipelines.prepare_input import input_col_name
+
 
 def pytest_configure(config: Config) -> None:
     """Pytest configuration hook."""
     config.addinivalue_line("markers", "e2e: mark as end-to-end test.")
+
+
+@pytest.fixture
+def data_path(tmp_path: Path, mocker: MockFixture) -> Path:
+    """Fixture for a temporary data directory."""
+    mocker.patch(
+        "anu.data.dataframe_operation.get_base_data_path", return_value=str(tmp_path)
+    )
+    return tmp_path
+
+
+@pytest.fixture
+def input_table() -> Callable[..., pa.Table]:
+    """Fixture for building rows of an input dataframe with protein ids."""
+
+    def make(
+        rows: int, lengths: Sequence[int] = (6,), seed: int = 0, start: int = 0
+    ) -> pa.Table:
+        rng = np.random.default_rng(seed)
+        columns = {}
+        for name in input_col_name[:-1]:
+            values = []
+            for i in range(rows):
+                length = lengths[i % len(lengths)]
+                if name.endswith("_seq"):
+                    values.append(rng.integers(1, 21, length).astype(float))
+                else:
+                    values.append(rng.normal(0, 1, length).round(2))
+            columns[name] = pa.array(
+                [row.tolist() for row in values], type=pa.list_(pa.float64())
+            )
+
+        columns["interaction"] = pa.array(
+            [[1, 0] if (start + i) % 2 else [0, 1] for i in range(rows)]
+        )
+        columns["proteinA_id"] = pa.array([f"A{start + i}" for i in range(rows)])
+        columns["proteinB_id"] = pa.array([f"B{start + i}" for i in range(rows)])
+        return pa.table(columns)
+
+    return make
+
+
+def pdb_record(
+    record: str,
+    name: str,
+    residue: str,
+    chain: str,
+    number: int,
+    coords: Tuple[float, float, float],
+) -> str:
+    """Format an atom record of a pdb file."""
+    x, y, z = coords
+    return (
+        f"{record:<6}{1:>5} {name:<4} {residue:>3} {chain}{number:>4}    "
+        f"{x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{0.0:6.2f}          {name[0]:>2}\n"
+    )
+
+
+@pytest.fixture
+def pdb_files(tmp_path: Path) -> List[Path]:
+    """Fixture for pdb files of two proteins in data/raw/pdb.
+
+    P1 has residues ALA and GLY in chain A, SER in chain B and a water of
+    chain A listed last, then a second model. P2 has one MET residue.
+    """
+    pdb_path = tmp_path / "raw" / "pdb"
+    pdb_path.mkdir(parents=True)
+
+    first = pdb_path / "P1.pdb"
+    first.write_text(
+        "HEADER    TEST\n"
+        + pdb_record("ATOM", "N", "ALA", "A", 1, (0, 0, 0))
+        + pdb_record("ATOM", "CA", "ALA", "A", 1, (2, 0, 0))
+        + pdb_record("ATOM", "CA", "GLY", "A", 2, (3, 3, 3))
+        + pdb_record("ATOM", "CA", "SER", "B", 1, (1, 1, 1))
+        + pdb_record("HETATM", "O", "HOH", "A", 101, (5, 5, 5))
+        + "ENDMDL\n"
+        + pdb_record("ATOM", "CA", "ALA", "A", 1, (9, 9, 9))
+    )
+    second = pdb_path / "P2.pdb"
+    second.write_text(pdb_record("ATOM", "CA", "MET", "A", 1, (1, 2, 3)))
+
+    return [second, first]
@@ -0,0 +1,56 @@
+"""Test cases for the atom_table module."""
+
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from pytest_mock import MockFixture
+
+from anu.constants.atom import atom_name_to_code
+from anu.data.index import atom_table
+from anu.data.index.atom_table import AtomTable
+
+
+def test_encode_atom_names() -> None:
+    """It encodes heavy atoms of amino acids and other atoms as 0."""
+    codes = atom_table.encode_atom_names(np.array(["N", "CA", "H", "OXT"]))
+
+    assert codes.tolist() == [1, 2, 0, len(atom_name_to_code)]
+
+
+def test_write_atom_table(tmp_path: Path, pdb_files: List[Path]) -> None:
+    """It stores atoms of every residue, typed for amino acids only."""
+    path = tmp_path / "atoms.arrow"
+    atom_table.write_atom_table(str(path), [str(item) for item in pdb_files], 1)
+
+    table = AtomTable.open(str(path))
+    atoms = table.get("P1")
+
+    assert table.ids.tolist() == ["P1", "P2"]
+    assert len(table) == 2
+    assert "P2" in table and "P3" not in table
+    assert len(list(table.iter_batches())) == 2
+    assert atoms["residue_offsets"].tolist() == [0, 2, 3, 4, 5]
+    assert atoms["atom_type"].tolist() == [1, 2, 2, 0, 2]
+    np.testing.assert_allclose(atoms["coords"][:2], [[0, 0, 0], [2, 0, 0]])
+    np.testing.assert_allclose(table.get(" P2")["coords"], [[1, 2, 3]])
+    with pytest.raises(KeyError):
+        table.get("P3")
+
+
+def test_build_atom_table(
+    tmp_path: Path, pdb_files: List[Path], mocker: MockFixture
+) -> None:
+    """It writes the atom table of every cached pdb file."""
+    mocker.patch.object(atom_table, "get_base_data_path", return_value=str(tmp_path))
+    mocker.patch.object(
+        atom_table, "get_pdb_path", return_value=str(pdb_files[0].parent)
+    )
+
+    table = atom_table.build_atom_table()
+
+    assert table.ids.tolist() == ["P1", "P2"]
+    assert Path(atom_table.get_atom_table_path()).exists()
+    with pytest.raises(OSError):
+        AtomTable.open(str(tmp_path / "missing.arrow"))
@@ -0,0 +1,66 @@
+"""Test cases for the checkpoints module."""
+
+import os
+from pathlib import Path
+import random
+
+import numpy as np
+import torch
+
+from anu.models.cnn import checkpoints
+from anu.models.cnn.checkpoints import CheckpointWriter
+
+
+def draw() -> list:
+    """Draw a number from every random generator."""
+    return [random.random(), np.random.rand(), torch.rand(1).item()]
+
+
+def test_rng_state(tmp_path: Path) -> None:
+    """It restores every generator from a state loaded with weights only."""
+    torch.save(checkpoints.get_rng_state(), tmp_path / "rng.pt")
+    expected = draw()
+
+    checkpoints.set_rng_state(torch.load(tmp_path / "rng.pt", weights_only=True))
+
+    assert draw() == expected
+
+
+def test_snapshot() -> None:
+    """It copies tensors, so training can update them in place."""
+    state = {"model": {"weight": torch.zeros(2)}, "steps": [1, (2, 3)]}
+
+    copy = checkpoints.snapshot(state)
+    state["model"]["weight"].add_(1)
+    state["steps"][1] = 0
+
+    assert copy["model"]["weight"].tolist() == [0, 0]
+    assert copy["steps"] == [1, (2, 3)]
+
+
+def test_checkpoint_writer(tmp_path: Path) -> None:
+    """It keeps the latest checkpoints and the retained ones."""
+    writer = CheckpointWriter(str(tmp_path / "checkpoints"), keep=2)
+    path = os.path.join(writer.path, checkpoints.get_checkpoint_name(1))
+    writer.retained.add(path)
+
+    for step in range(1, 5):
+        writer.save({"step": torch.tensor(step)}, step)
+    writer.close()
+
+    assert [
+        os.path.basename(item) for item in checkpoints.list_checkpoints(writer.path)
+    ] == [checkpoints.get_checkpoint_name(step) for step in [1, 3, 4]]
+    assert checkpoints.load_latest_checkpoint(writer.path)["step"].item() == 4
+    assert checkpoints.load_latest_checkpoint(str(tmp_path)) is None
+
+
+def test_checkpoint_writer_clear(tmp_path: Path) -> None:
+    """It removes every checkpoint."""
+    writer = CheckpointWriter(str(tmp_path))
+    writer.save({"step": 1}, 1)
+    writer.save({"step": 2}, 2)
+
+    assert writer.clear() == 2
+    assert checkpoints.list_checkpoints(str(tmp_path)) == []
+    writer.close()
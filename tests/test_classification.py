@@ -0,0 +1,36 @@
+"""Test cases for the classification module."""
+
+import math
+
+import numpy as np
+import pytest
+
+from anu.metrics.classification import classification_metrics, roc_auc
+
+
+def test_roc_auc() -> None:
+    """It counts pairs ranked right, ties count half."""
+    assert roc_auc(np.array([0, 0, 1, 1]), np.array([0.1, 0.4, 0.35, 0.8])) == 0.75
+    assert roc_auc(np.array([0, 1]), np.array([0.5, 0.5])) == 0.5
+    assert math.isnan(roc_auc(np.array([1, 1]), np.array([0.1, 0.2])))
+
+
+def test_classification_metrics() -> None:
+    """It computes metrics of scores above the threshold."""
+    metrics = classification_metrics(
+        np.array([1, 1, 0, 0, 1]), np.array([0.9, 0.2, 0.7, 0.1, 0.6])
+    )
+
+    assert metrics["accuracy"] == pytest.approx(0.6)
+    assert metrics["precision"] == pytest.approx(2 / 3)
+    assert metrics["recall"] == pytest.approx(2 / 3)
+    assert metrics["f1"] == pytest.approx(2 / 3)
+    assert metrics["roc_auc"] == pytest.approx(4 / 6)
+
+
+def test_classification_metrics_without_positives() -> None:
+    """It sets undefined precision and recall to 0."""
+    metrics = classification_metrics(np.array([0, 0]), np.array([0.1, 0.2]))
+
+    assert metrics["accuracy"] == 1.0
+    assert metrics["precision"] == metrics["recall"] == metrics["f1"] == 0.0
@@ -0,0 +1,56 @@
+"""Test cases for the compact_chunks module."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+import vaex
+
+from anu.data.dataframe_operation import (
+    read_dataframes_from_file,
+    read_dataset_manifest,
+    save_dataframe_to_file,
+)
+from anu.data.pipelines.compact_chunks import compact_chunks
+
+
+@pytest.fixture
+def chunk_size(data_path: Path) -> int:
+    """Fixture saving five chunks and returning the size of a chunk."""
+    for i in range(5):
+        save_dataframe_to_file(
+            vaex.from_arrays(x=np.arange(i * 3, (i + 1) * 3)), f"chunks/{i}"
+        )
+    return (data_path / "processed" / "chunks" / "0.arrow").stat().st_size
+
+
+def test_compact_chunks(chunk_size: int) -> None:
+    """It merges chunks in row groups sized from the memory budget."""
+    rows = compact_chunks("chunks", "inputs", 5, memory_budget=2 * chunk_size)
+
+    manifest = read_dataset_manifest("inputs")
+    df = read_dataframes_from_file(["inputs"])
+    assert rows == 15
+    assert manifest is not None
+    assert [entry["rows"] for entry in manifest["partitions"]] == [6, 6, 3]
+    assert df.x.tolist() == list(range(15))
+
+
+def test_compact_chunks_resumes(chunk_size: int) -> None:
+    """It rebuilds only the last group when chunks are appended."""
+    compact_chunks("chunks", "inputs", 5, memory_budget=2 * chunk_size)
+    save_dataframe_to_file(vaex.from_arrays(x=np.arange(15, 18)), "chunks/5")
+
+    rows = compact_chunks("chunks", "inputs", 6, memory_budget=chunk_size)
+
+    df = read_dataframes_from_file(["inputs"])
+    assert rows == 6
+    assert df.x.tolist() == list(range(18))
+
+
+def test_compact_chunks_rejects_other_columns(chunk_size: int) -> None:
+    """It raises ValueError when chunks have different columns."""
+    save_dataframe_to_file(vaex.from_arrays(y=np.arange(3)), "chunks/5")
+
+    with pytest.raises(ValueError):
+        compact_chunks("chunks", "inputs", 6, memory_budget=chunk_size)
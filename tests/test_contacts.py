@@ -0,0 +1,111 @@
+"""Test cases for the contacts module."""
+
+from pathlib import Path
+import pickle
+from typing import Callable
+
+import numpy as np
+import pyarrow as pa
+import pytest
+import vaex
+
+from anu.data import dataframe_operation as do
+from anu.data.features import contacts
+
+
+def brute_force_pairs(coords: np.ndarray, radius: float) -> set:
+    """Find every pair closer than radius comparing all pairs."""
+    distances = np.linalg.norm(coords[:, None] - coords[None], axis=-1)
+    first, second = np.nonzero(np.triu(distances <= radius, k=1))
+    return set(zip(first.tolist(), second.tolist()))
+
+
+def test_cell_list_pairs() -> None:
+    """It finds the same pairs as comparing every pair."""
+    coords = np.random.default_rng(0).uniform(-20, 20, (300, 3))
+
+    first, second = contacts.cell_list_pairs(coords, 6.0)
+
+    assert (first < second).all()
+    assert set(zip(first.tolist(), second.tolist())) == brute_force_pairs(coords, 6.0)
+
+
+def test_cell_list_pairs_groups() -> None:
+    """It never pairs points of different groups."""
+    coords = np.zeros((4, 3))
+
+    first, second = contacts.cell_list_pairs(coords, 1.0, np.array([0, 0, 1, 1]))
+
+    assert sorted(zip(first.tolist(), second.tolist())) == [(0, 1), (2, 3)]
+    assert len(contacts.cell_list_pairs(np.empty((0, 3)), 1.0)[0]) == 0
+
+
+def test_pairs_to_csr() -> None:
+    """It lists sorted neighbours of every point."""
+    offsets, indices = contacts.pairs_to_csr(np.array([0, 0]), np.array([2, 1]), 4)
+
+    assert offsets.tolist() == [0, 2, 3, 4, 4]
+    assert indices.tolist() == [1, 2, 0, 0]
+    assert contacts.neighbour_counts(offsets).tolist() == [2, 1, 1, 0]
+
+
+def test_residue_contacts_skips_padding() -> None:
+    """It never puts padded positions in contact."""
+    x = np.array([0.0, 1.0, 0.0, 50.0])
+    seq = np.array([1, 2, 0, 3])
+
+    offsets, indices = contacts.residue_contacts(x, np.zeros(4), np.zeros(4), seq)
+
+    assert contacts.densify_contacts(offsets, indices).tolist() == [
+        [0, 1, 0, 0],
+        [1, 0, 0, 0],
+        [0, 0, 0, 0],
+        [0, 0, 0, 0],
+    ]
+    assert contacts.densify_contacts(offsets, indices, 1).tolist() == [[0]]
+
+
+def test_contact_features(input_table: Callable[..., pa.Table]) -> None:
+    """It computes contacts of both proteins of every row."""
+    table = input_table(5, lengths=[4, 7])
+    df = vaex.from_arrow_table(table)
+
+    features = contacts.contact_features(df, radius=1.5, batch_rows=2)
+
+    assert len(features) == 5
+    offsets, indices = contacts.residue_contacts(
+        *[np.asarray(table[f"proteinB_{name}"][3].as_py()) for name in "xyz"],
+        np.asarray(table["proteinB_seq"][3].as_py()),
+        1.5,
+    )
+    np.testing.assert_array_equal(
+        contacts.row_contact_map(features, 3, "B"),
+        contacts.densify_contacts(offsets, indices),
+    )
+    empty = vaex.from_arrow_table(table.slice(0, 0))
+    assert len(contacts.contact_features(empty)) == 0
+
+
+def test_save_contact_features(
+    data_path: Path, input_table: Callable[..., pa.Table]
+) -> None:
+    """It saves partitions of contacts found by their pair."""
+    df = vaex.from_arrow_table(input_table(5, lengths=[4, 7]))
+    features = contacts.contact_features(df, radius=1.5)
+
+    assert contacts.save_contact_features(df, "contacts", 1.5, batch_rows=2)
+    assert contacts.save_contact_features(df[:2], "contacts", 1.5, batch_rows=2)
+    assert len(do.read_dataset("contacts")) == 2
+    assert contacts.save_contact_features(df, "contacts", 1.5, batch_rows=2)
+
+    manifest = do.read_dataset_manifest("contacts")
+    assert manifest is not None
+    assert len(manifest["partitions"]) == 3
+    maps = pickle.loads(pickle.dumps(contacts.ContactMaps("contacts")))
+    assert maps.find("A3", "B3") == 3
+    assert maps.find("B3", "A3") is None
+    np.testing.assert_array_equal(
+        maps("A3", "B3", 5)[1], contacts.row_contact_map(features, 3, "B", 5)
+    )
+    with pytest.raises(KeyError):
+        maps("A9", "B9", 5)
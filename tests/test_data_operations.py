@@ -0,0 +1,33 @@
+"""Test cases for the data_operations module."""
+
+import vaex
+
+from anu.data import data_operations
+
+
+def test_canonicalize_protein_pairs() -> None:
+    """It strips ids, orders every pair and drops duplicates and empty ids."""
+    df = vaex.from_arrays(
+        a=["P2", " P1", "P1", "P3", None, ""],
+        b=["P1", "P2 ", "P2", "P3", "P4", "P5"],
+    )
+
+    pairs = data_operations.canonicalize_protein_pairs(df, "a", "b")
+
+    assert sorted(zip(pairs["a"].tolist(), pairs["b"].tolist())) == [
+        ("P1", "P2"),
+        ("P3", "P3"),
+    ]
+
+
+def test_find_conflicting_pairs() -> None:
+    """It finds pairs listed as interacting and non-interacting."""
+    positive = vaex.from_arrays(a=["P1", "P1"], b=["P2", "P3"])
+    negative = vaex.from_arrays(x=["P1", "P2"], y=["P3", "P4"])
+
+    conflicts = data_operations.find_conflicting_pairs(
+        positive, ("a", "b"), negative, ("x", "y")
+    )
+
+    assert conflicts["protein_a"].tolist() == ["P1"]
+    assert conflicts["protein_b"].tolist() == ["P3"]
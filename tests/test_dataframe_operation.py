@@ -0,0 +1,366 @@
+"""Test cases for the dataframe_operation module."""
+
+from pathlib import Path
+import threading
+from typing import List
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from pytest_mock import MockFixture
+import vaex
+
+from anu.data import dataframe_operation as do
+
+
+def make_dataframe(start: int, rows: int = 10) -> vaex.dataframe.DataFrame:
+    """Create a dataframe with consecutive values starting at start."""
+    return vaex.from_arrays(
+        x=np.arange(start, start + rows),
+        name=np.array([f"row{i}" for i in range(start, start + rows)]),
+    )
+
+
+def save_partitions(path: str, count: int, rows: int = 10) -> None:
+    """Save count partitions of consecutive values to a dataset."""
+    for i in range(count):
+        assert do.save_dataframe_partition(
+            make_dataframe(i * rows, rows), path, f"part-{i:05d}", {"index": i}
+        )
+
+
+def test_save_dataframe_to_file(data_path: Path) -> None:
+    """It replaces the saved dataframe."""
+    assert do.save_dataframe_to_file(make_dataframe(0), "df")
+    assert do.save_dataframe_to_file(make_dataframe(10, 2), "df")
+
+    df = do.read_dataframe_from_file("df")
+    assert df is not None
+    assert df.x.tolist() == [10, 11]
+
+
+def test_save_dataframe_to_file_interrupted(
+    data_path: Path, mocker: MockFixture
+) -> None:
+    """It keeps the previous file and removes the partial one."""
+    df = make_dataframe(0, 2)
+    do.save_dataframe_to_file(df, "df")
+
+    def interrupt(path: str) -> None:
+        Path(path).write_bytes(b"partial")
+        raise KeyboardInterrupt
+
+    mocker.patch.object(type(df), "export_arrow", side_effect=interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        do.save_dataframe_to_file(make_dataframe(10), "df")
+
+    assert [path.name for path in (data_path / "processed").iterdir()] == ["df.arrow"]
+    df = do.read_dataframe_from_file("df")
+    assert df is not None
+    assert df.x.tolist() == [0, 1]
+
+
+def test_save_dataframes_to_file(data_path: Path) -> None:
+    """It saves every dataframe."""
+    assert do.save_dataframes_to_file(
+        {"first": make_dataframe(0, 2), "second": make_dataframe(2, 2)}
+    )
+
+    df = do.read_dataframe_from_file("second")
+    assert df is not None
+    assert df.x.tolist() == [2, 3]
+
+
+def test_add_partitions_to_manifest(data_path: Path) -> None:
+    """It records rows, size, checksum and schema of every partition."""
+    save_partitions("dataset", 2)
+
+    manifest = do.read_dataset_manifest("dataset")
+    assert manifest is not None
+    assert manifest["rows"] == 20
+    assert manifest["schema"] == {"x": "int64", "name": "string"}
+    assert [entry["name"] for entry in manifest["partitions"]] == [
+        "part-00000.arrow",
+        "part-00001.arrow",
+    ]
+    entry = manifest["partitions"][0]
+    file_path = data_path / "processed" / "dataset" / "part-00000.arrow"
+    assert entry["bytes"] == file_path.stat().st_size
+    assert entry["checksum"] == do.compute_file_checksum(str(file_path))
+    assert entry["meta"] == {"index": 0}
+
+
+def test_add_partitions_to_manifest_rejects_other_schema(data_path: Path) -> None:
+    """It raises ValueError when a partition has another schema."""
+    save_partitions("dataset", 1)
+    do.save_dataframe_to_file(vaex.from_arrays(y=np.arange(3)), "dataset/other")
+
+    with pytest.raises(ValueError):
+        do.add_partitions_to_manifest("dataset", ["other.arrow"])
+
+
+def test_add_partitions_to_manifest_serializes_writers(data_path: Path) -> None:
+    """It keeps the partitions added by concurrent writers."""
+    names = [f"part-{i:05d}" for i in range(8)]
+    for i, name in enumerate(names):
+        do.save_dataframe_to_file(make_dataframe(i), f"dataset/{name}")
+
+    threads = [
+        threading.Thread(
+            target=do.add_partitions_to_manifest, args=("dataset", [f"{name}.arrow"])
+        )
+        for name in names
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    manifest = do.read_dataset_manifest("dataset")
+    assert manifest is not None
+    assert manifest["rows"] == 80
+    assert len(manifest["partitions"]) == 8
+
+
+def test_remove_partitions_from_manifest(data_path: Path) -> None:
+    """It removes partitions from the manifest only."""
+    save_partitions("dataset", 2)
+
+    manifest = do.remove_partitions_from_manifest("dataset", ["part-00000.arrow"])
+
+    assert manifest["rows"] == 10
+    assert (data_path / "processed" / "dataset" / "part-00000.arrow").exists()
+
+
+def test_build_dataset_manifest(data_path: Path) -> None:
+    """It orders numeric partition names numerically."""
+    for i in [10, 2, 1]:
+        do.save_dataframe_to_file(make_dataframe(i, 1), f"dataset/{i}")
+
+    manifest = do.build_dataset_manifest("dataset")
+
+    assert [entry["name"] for entry in manifest["partitions"]] == [
+        "1.arrow",
+        "2.arrow",
+        "10.arrow",
+    ]
+
+
+def test_read_dataset(data_path: Path) -> None:
+    """It reads the rows of every partition in order."""
+    save_partitions("dataset", 3)
+
+    df = do.read_dataset("dataset")
+
+    assert df.x.tolist() == list(range(30))
+    assert df["name"].tolist()[12] == "row12"
+
+
+def test_read_dataset_opens_partitions_lazily(
+    data_path: Path, mocker: MockFixture
+) -> None:
+    """It opens one partition until rows are accessed."""
+    save_partitions("dataset", 4)
+    spy = mocker.spy(do, "open_dataframe_file")
+
+    df = do.read_dataset("dataset", columns=["x"])
+
+    assert spy.call_count == 1
+    assert len(df) == 40
+    assert df.get_column_names() == ["x"]
+    assert df[25:27].x.tolist() == [25, 26]
+    assert spy.call_count == 2
+    assert df.x.sum() == sum(range(40))
+
+
+def test_read_dataset_skips_deleted_rows(data_path: Path) -> None:
+    """It skips rows marked as deleted."""
+    save_partitions("dataset", 3)
+    do.add_tombstones_to_manifest(
+        "dataset", {"part-00001.arrow": [0, 5], "part-00002.arrow": list(range(10))}
+    )
+
+    df = do.read_dataset("dataset")
+
+    expected = [i for i in range(20) if i not in [10, 15]]
+    assert df.x.tolist() == expected
+    assert do.read_dataframes_from_file(["dataset"]).x.tolist() == expected
+
+
+def test_read_dataset_prunes_partitions(data_path: Path) -> None:
+    """It skips partitions rejected by the filter."""
+    save_partitions("dataset", 3)
+
+    df = do.read_dataset("dataset", lambda entry: entry["meta"]["index"] != 1)
+
+    assert df.x.tolist() == list(range(10)) + list(range(20, 30))
+
+
+def test_read_dataset_fails_without_partitions(data_path: Path) -> None:
+    """It raises OSError when the dataset has no manifest or partition."""
+    with pytest.raises(OSError):
+        do.read_dataset("dataset")
+
+    save_partitions("dataset", 1)
+    with pytest.raises(OSError):
+        do.read_dataset("dataset", lambda entry: False)
+
+
+def test_read_dataset_detects_replaced_partition(data_path: Path) -> None:
+    """It raises ValueError when a partition has fewer rows than listed."""
+    save_partitions("dataset", 2)
+    do.save_dataframe_to_file(make_dataframe(10, 5), "dataset/part-00001")
+
+    df = do.read_dataset("dataset")
+
+    with pytest.raises(ValueError):
+        df.x.tolist()
+
+
+def test_verify_dataset(data_path: Path) -> None:
+    """It lists missing and corrupted partitions."""
+    save_partitions("dataset", 3)
+    dataset_path = data_path / "processed" / "dataset"
+    (dataset_path / "part-00000.arrow").unlink()
+    content = bytearray((dataset_path / "part-00001.arrow").read_bytes())
+    content[-100] ^= 0xFF
+    (dataset_path / "part-00001.arrow").write_bytes(bytes(content))
+
+    assert do.verify_dataset("dataset") == ["part-00000.arrow", "part-00001.arrow"]
+
+
+def test_verify_dataset_without_checksum(data_path: Path) -> None:
+    """It verifies partitions added without checksum by size."""
+    assert do.save_dataframe_partition(
+        make_dataframe(0), "dataset", "part-00000", checksum=False
+    )
+    manifest = do.read_dataset_manifest("dataset")
+    assert manifest is not None
+    assert manifest["partitions"][0]["checksum"] is None
+
+    assert do.verify_dataset("dataset") == []
+
+
+def test_read_dataframes_from_file(data_path: Path) -> None:
+    """It keeps the order of files and datasets."""
+    save_partitions("dataset", 2)
+    do.add_tombstones_to_manifest("dataset", {"part-00000.arrow": [0]})
+    do.save_dataframe_to_file(make_dataframe(100, 2), "first")
+    do.save_dataframe_to_file(make_dataframe(200, 2), "last")
+
+    df = do.read_dataframes_from_file(["first", "dataset", "last"], ["x"])
+
+    expected: List[int] = [100, 101, *range(1, 20), 200, 201]
+    assert df.x.tolist() == expected
+
+
+def test_describe_dataframe_source(data_path: Path) -> None:
+    """It changes when rows of a dataset are deleted or a file is written."""
+    save_partitions("dataset", 2)
+    do.save_dataframe_to_file(make_dataframe(0, 2), "file")
+    dataset = do.describe_dataframe_source("dataset")
+    file = do.describe_dataframe_source("file")
+
+    do.add_tombstones_to_manifest("dataset", {"part-00001.arrow": [3]})
+    do.save_dataframe_to_file(make_dataframe(0, 3), "file")
+
+    assert [entry["name"] for entry in dataset] == [
+        "part-00000.arrow",
+        "part-00001.arrow",
+    ]
+    assert do.describe_dataframe_source("dataset")[1]["deleted"] == [3]
+    assert do.describe_dataframe_source("dataset")[0] == dataset[0]
+    assert do.describe_dataframe_source("file") != file
+
+
+def write_record_batches(path: Path, batches: int, rows: int = 10) -> str:
+    """Write a zstd compressed arrow file of batches record batches."""
+    table = pa.Table.from_batches(
+        [
+            pa.record_batch({"x": np.arange(i, i + rows), "y": -np.arange(i, i + rows)})
+            for i in range(0, batches * rows, rows)
+        ]
+    )
+    do.write_arrow_table_atomically(table, str(path), compression="zstd")
+    return str(path)
+
+
+def test_count_record_batches(tmp_path: Path) -> None:
+    """It counts rows of every record batch."""
+    file_path = write_record_batches(tmp_path / "table.arrow", 3)
+
+    assert do.count_record_batches(file_path) == [10, 10, 10]
+
+
+def test_read_record_batch(tmp_path: Path) -> None:
+    """It reads the columns of one record batch in the requested order."""
+    file_path = write_record_batches(tmp_path / "table.arrow", 3)
+
+    table = do.read_record_batch(file_path, 1, ["y", "x"])
+
+    assert table.column_names == ["y", "x"]
+    assert table["x"].to_pylist() == list(range(10, 20))
+
+
+def test_open_dataframe_file_decodes_record_batches_lazily(
+    tmp_path: Path, mocker: MockFixture
+) -> None:
+    """It decodes only the record batches holding the rows read."""
+    file_path = write_record_batches(tmp_path / "table.arrow", 4)
+    df = do.open_dataframe_file(file_path, ["x"])
+    spy = mocker.spy(do.RecordBatchFileDataset, "read_batch")
+
+    assert df.get_column_names() == ["x"]
+    assert df[21:24].x.tolist() == [21, 22, 23]
+    assert {call.args[1] for call in spy.call_args_list} == {2}
+    assert df.x.sum() == sum(range(40))
+
+
+def test_block_shuffle_indices() -> None:
+    """It moves contiguous blocks of rows and is reproducible."""
+    indices = do.block_shuffle_indices(10, block_size=4, window_size=1)
+
+    starts = [index for index in indices.tolist() if index % 4 == 0]
+    assert sorted(starts) == [0, 4, 8]
+    assert indices.tolist() == [
+        index for start in starts for index in range(start, min(start + 4, 10))
+    ]
+    np.testing.assert_array_equal(
+        do.block_shuffle_indices(100, 4, 16), do.block_shuffle_indices(100, 4, 16)
+    )
+
+
+def test_block_shuffle_indices_shuffles_windows() -> None:
+    """It shuffles rows only inside windows."""
+    indices = do.block_shuffle_indices(100, block_size=5, window_size=20)
+
+    assert sorted(indices.tolist()) == list(range(100))
+    windows = indices.reshape(5, 20) // 5
+    assert all(len(set(window.tolist())) == 4 for window in windows)
+
+
+@pytest.mark.parametrize("sizes", [(0, 4), (4, 0)])
+def test_block_shuffle_indices_rejects_sizes(sizes: tuple) -> None:
+    """It raises ValueError when a size is not positive."""
+    with pytest.raises(ValueError):
+        do.block_shuffle_indices(10, *sizes)
+
+
+def test_shuffle_dataframe_in_blocks() -> None:
+    """It takes a fraction of the rows in block shuffle order."""
+    df = make_dataframe(0, 20)
+
+    shuffled = do.shuffle_dataframe(df, frac=0.5, block_size=5, window_size=5)
+
+    assert len(shuffled) == 10
+    assert len(set(shuffled.x.tolist())) == 10
+    with pytest.raises(ValueError):
+        do.shuffle_dataframe(df, replace=True, block_size=5)
+
+
+def test_split_dataframe() -> None:
+    """It splits every row into exactly one part."""
+    parts = do.split_dataframe(make_dataframe(0, 20), [0.7, 0.2, 0.1], block_size=2)
+
+    assert [len(part) for part in parts] == [14, 4, 2]
+    assert sorted(x for part in parts for x in part.x.tolist()) == list(range(20))
@@ -0,0 +1,303 @@
+"""Test cases for the loader module."""
+
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from pytest_mock import MockFixture
+import torch
+from torch.utils.data import ConcatDataset
+import vaex
+
+from anu.data.dataframe_operation import (
+    add_tombstones_to_manifest,
+    save_dataframe_partition,
+)
+from anu.data.features.contacts import ContactMaps, save_contact_features
+from anu.data.negative_sampling import NegativePairSampler
+from anu.data.splits import hash_split_dataframe, HashSplitFilter
+from anu.models.cnn import loader
+
+
+def test_check_channels() -> None:
+    """It keeps the order of the channels and defaults to every channel."""
+    assert loader.check_channels(["seq", "z", "x"]) == ["seq", "z", "x"]
+    assert len(loader.check_channels()) == 10
+
+
+@pytest.mark.parametrize("channels", [[], ["x", "seq"], ["seq", "color"]])
+def test_check_channels_rejects_channels(channels: list) -> None:
+    """It raises ValueError for unknown channels or seq not first."""
+    with pytest.raises(ValueError):
+        loader.check_channels(channels)
+
+
+def test_input_columns() -> None:
+    """It lists columns of protein A and B channel by channel."""
+    assert loader.input_columns(["seq", "x"]) == [
+        "proteinA_seq",
+        "proteinB_seq",
+        "proteinA_x",
+        "proteinB_x",
+        "interaction",
+    ]
+
+
+def test_read_input_batch(input_table: Callable[..., pa.Table]) -> None:
+    """It reads labels and the channels of both proteins of every row."""
+    table = input_table(3)
+    df = vaex.from_arrow_table(table)
+
+    labels, inputs = loader.read_input_batch(df, [2, 0])
+
+    assert labels.tolist() == [[0, 1], [0, 1]]
+    assert inputs.shape == (2, 1, 10, 12)
+    assert inputs.dtype == torch.float32
+    np.testing.assert_allclose(
+        inputs[0, 0, 4, 6:].numpy(), table["proteinB_hydropathy"][2].as_py()
+    )
+
+
+def test_read_input_batch_with_channels(input_table: Callable[..., pa.Table]) -> None:
+    """It reads only the given channels."""
+    table = input_table(2)
+    df = vaex.from_arrow_table(table.select(loader.input_columns(["seq", "mass"])))
+
+    _, inputs = loader.read_input_batch(df, [1], ["seq", "mass"])
+
+    assert inputs.shape == (1, 1, 2, 12)
+    np.testing.assert_allclose(inputs[0, 0, 1, :6], table["proteinA_mass"][1].as_py())
+
+
+def test_read_input_batch_rejects_unpadded_rows(
+    input_table: Callable[..., pa.Table],
+) -> None:
+    """It raises ValueError when proteins have different lengths."""
+    df = vaex.from_arrow_table(input_table(2, lengths=[4, 6]))
+
+    with pytest.raises(ValueError):
+        loader.read_input_batch(df, [0, 1])
+
+
+def test_interaction_classification_dataset(
+    input_table: Callable[..., pa.Table],
+) -> None:
+    """It reads a batch at once, like the samples read one by one."""
+    dataset = loader.InteractionClassificationDataset(
+        vaex.from_arrow_table(input_table(3))
+    )
+
+    labels, inputs = loader.collate_samples(dataset.__getitems__([2, 0]))
+    samples = loader.collate_samples([dataset[2], dataset[0]])
+
+    assert len(dataset) == 3
+    assert torch.equal(labels, samples[0])
+    assert torch.equal(inputs, samples[1])
+    assert inputs.shape == (2, 1, 10, 12)
+
+
+def test_negative_pair_dataset(input_table: Callable[..., pa.Table]) -> None:
+    """It reads proteins of two rows of new pairs, labelled non-interacting."""
+    table = input_table(3)
+    df = vaex.from_arrow_table(table)
+    sampler = NegativePairSampler.from_dataframe(
+        df, ["proteinA_id", "proteinB_id"], [], random_state=0
+    )
+    dataset = loader.NegativePairDataset(df, sampler, 4, window=4)
+    first = dataset.first_slots.copy()
+
+    labels, inputs = dataset[0]
+    dataset.resample()
+
+    row, side = divmod(int(first[0]), 2)
+    assert len(dataset) == 4
+    assert labels.tolist() == [0, 1]
+    assert inputs.shape == (1, 10, 8)
+    assert set(inputs[0, 0, :4].tolist()) <= set(
+        table[f"protein{'AB'[side]}_seq"][row].as_py()
+    )
+    assert not np.array_equal(dataset.first_slots, first)
+
+
+def test_windowed_dataset_with_channels(input_table: Callable[..., pa.Table]) -> None:
+    """It crops windows of the given channels."""
+    df = vaex.from_arrow_table(input_table(2, lengths=[5, 9]))
+
+    dataset = loader.WindowedInteractionDataset(
+        df, window=4, random_crops=False, channels=["seq", "x", "y"]
+    )
+    labels, inputs = dataset[0]
+
+    assert len(dataset) == 2 * 2 + 4 * 4
+    assert labels.tolist() == [0, 1]
+    assert inputs.shape == (1, 3, 8)
+
+
+def test_crop_pair_inputs(input_table: Callable[..., pa.Table]) -> None:
+    """It builds inputs of every pair of windows."""
+    df = vaex.from_arrow_table(input_table(1, lengths=[6]))
+    row = loader.read_row(df, 0, loader.input_columns(["seq"]))
+
+    inputs, starts = loader.crop_pair_inputs(row, 4, 2, ["seq"])
+
+    assert inputs.shape == (4, 1, 1, 8)
+    assert starts.tolist() == [[0, 0], [0, 2], [2, 0], [2, 2]]
+
+
+def test_contact_map_dataset(
+    data_path: Path, input_table: Callable[..., pa.Table]
+) -> None:
+    """It adds contact maps of the pair to every sample."""
+    df = vaex.from_arrow_table(input_table(3))
+    save_contact_features(df, "contacts", 1.5)
+    dataset = loader.ContactMapDataset(
+        loader.InteractionClassificationDataset(df),
+        ContactMaps("contacts"),
+        size=6,
+    )
+
+    labels, inputs, maps = dataset[1]
+    batch = dataset.__getitems__([2, 0])
+
+    assert len(dataset) == 3
+    assert maps.shape == (2, 6, 6)
+    assert maps.dtype == torch.uint8
+    assert batch[2].shape == (2, 2, 6, 6)
+    assert torch.equal(batch[2][1], dataset[0][2])
+    assert torch.equal(batch[0][1], dataset[0][0])
+    assert inputs.shape == (1, 10, 12)
+
+
+def test_channel_normalizer() -> None:
+    """It normalizes every channel of a batch and keeps padding at 0."""
+    normalizer = loader.ChannelNormalizer(
+        np.array([[0, 2], [1, 0.5]], dtype=np.float32)
+    )
+    inputs = torch.tensor([[[[1.0, 0.0], [4.0, 9.0]]]])
+
+    labels, outputs = normalizer([(torch.tensor([0, 1]), inputs[0])])
+
+    assert labels.tolist() == [[0, 1]]
+    assert outputs.tolist() == [[[[1.0, 0.0], [1.0, 0.0]]]]
+
+
+def test_draws_every_epoch(input_table: Callable[..., pa.Table]) -> None:
+    """It finds random crops and resampled datasets inside other datasets."""
+    df = vaex.from_arrow_table(input_table(2))
+    fixed = loader.InteractionClassificationDataset(df)
+    crops = loader.WindowedInteractionDataset(df, window=4)
+    windows = loader.WindowedInteractionDataset(df, window=4, random_crops=False)
+
+    assert not loader.draws_every_epoch(ConcatDataset([fixed, windows]))
+    assert loader.draws_every_epoch(ConcatDataset([fixed, crops]))
+    assert loader.draws_every_epoch(
+        loader.ContactMapDataset(crops, ContactMaps("contacts"), 6)
+    )
+
+
+def test_shuffle_buffer() -> None:
+    """It yields every sample once, in stream order without a buffer."""
+    rng = np.random.default_rng(0)
+
+    shuffled = list(loader.shuffle_buffer(range(100), 10, rng))
+
+    assert sorted(shuffled) == list(range(100))
+    assert shuffled != list(range(100))
+    assert list(loader.shuffle_buffer(range(5), 0, rng)) == list(range(5))
+    assert sorted(loader.shuffle_buffer(range(5), 10, rng)) == list(range(5))
+
+
+def test_streaming_dataset_consumer(mocker: MockFixture) -> None:
+    """It numbers data loader workers over every distributed rank."""
+    dataset = loader.StreamingInteractionDataset([], rank=1, world_size=2)
+
+    assert dataset.consumer() == (1, 2)
+
+    info = mocker.Mock(id=1, num_workers=3)
+    mocker.patch.object(loader, "get_worker_info", return_value=info)
+    assert dataset.consumer() == (4, 6)
+
+
+def streamed_table(input_table: Callable[..., pa.Table]) -> pa.Table:
+    """Return rows of three partitions of two rows, without the deleted one."""
+    table = pa.concat_tables([input_table(2, seed=i, start=2 * i) for i in range(3)])
+    return table.take([0, 1, 3, 4, 5])
+
+
+@pytest.fixture
+def streamed_dataset(data_path: Path, input_table: Callable[..., pa.Table]) -> str:
+    """Fixture for a dataset of three partitions of two rows, one deleted."""
+    for i in range(3):
+        save_dataframe_partition(
+            vaex.from_arrow_table(input_table(2, seed=i, start=2 * i)),
+            "inputs",
+            f"part-{i:05d}",
+        )
+    add_tombstones_to_manifest("inputs", {"part-00001.arrow": [0]})
+    return "inputs"
+
+
+def streamed_rows(dataset: loader.StreamingInteractionDataset) -> list:
+    """Return the first residue of protein A of every streamed sample."""
+    return [float(inputs[0, 0, 0]) for _, inputs in dataset]
+
+
+def test_streaming_dataset(
+    streamed_dataset: str, input_table: Callable[..., pa.Table]
+) -> None:
+    """It streams rows which are not deleted, in a new order every epoch."""
+    table = streamed_table(input_table)
+    first = [row[0] for row in table["proteinA_seq"].to_pylist()]
+    dataset = loader.StreamingInteractionDataset(
+        [streamed_dataset], batch_rows=1, buffer_size=2, random_state=0
+    )
+
+    epochs = []
+    for _ in range(4):
+        epochs.append(streamed_rows(dataset))
+        dataset.resample()
+
+    labels, inputs = next(iter(dataset))
+    assert sorted(epochs[0]) == sorted(first)
+    assert any(epoch != epochs[0] for epoch in epochs[1:])
+    assert inputs.shape == (1, 10, 12)
+    assert labels.shape == (2,)
+
+
+def test_streaming_dataset_deals_out_record_batches(streamed_dataset: str) -> None:
+    """It gives every record batch to one worker of one rank."""
+    consumers = [
+        loader.StreamingInteractionDataset(
+            [streamed_dataset], buffer_size=0, rank=rank, world_size=2
+        )
+        for rank in range(2)
+    ]
+    everything = loader.StreamingInteractionDataset([streamed_dataset], buffer_size=0)
+
+    rows = [streamed_rows(dataset) for dataset in consumers]
+
+    assert all(len(part) > 0 for part in rows)
+    assert sorted(rows[0] + rows[1]) == sorted(streamed_rows(everything))
+
+
+def test_streaming_dataset_row_filter(
+    streamed_dataset: str, input_table: Callable[..., pa.Table]
+) -> None:
+    """It keeps rows of the hash split, like hash_split_dataframe."""
+    df = vaex.from_arrow_table(streamed_table(input_table))
+    expected = [
+        sorted(part.proteinA_seq.tolist(), key=lambda row: row[0])
+        for part in hash_split_dataframe(df, [0.5, 0.5], salt=1)
+    ]
+    assert all(len(rows) > 0 for rows in expected)
+
+    for split in range(2):
+        dataset = loader.StreamingInteractionDataset(
+            [streamed_dataset],
+            HashSplitFilter([0.5, 0.5], split, salt=1),
+            ["proteinA_id", "proteinB_id"],
+            buffer_size=0,
+        )
+        assert sorted(streamed_rows(dataset)) == [row[0] for row in expected[split]]
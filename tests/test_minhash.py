@@ -0,0 +1,86 @@
+"""Test cases for the minhash module."""
+
+import numpy as np
+import pyarrow as pa
+import pytest
+import vaex
+
+from anu.data.features import minhash
+
+
+def random_sequences(count: int, length: int, seed: int = 0) -> np.ndarray:
+    """Return random integer coded sequences without padding."""
+    return np.random.default_rng(seed).integers(1, 21, (count, length))
+
+
+def test_encode_kmers() -> None:
+    """It encodes k-mers in base of the amino acid codes and masks padding."""
+    base = len(minhash.AminoAcidToInt) + 1
+
+    kmers, valid = minhash.encode_kmers(np.array([[1, 2, 3, 0]]), k=2)
+
+    assert kmers.tolist() == [[base + 2, 2 * base + 3, 3 * base]]
+    assert valid.tolist() == [[True, True, False]]
+
+
+def test_minhash_signatures() -> None:
+    """It gives the same signature to the same k-mers, whatever the padding."""
+    seqs = random_sequences(2, 30)
+    padded = np.zeros((4, 40), dtype=np.int64)
+    padded[:2, :30] = seqs
+    padded[2, :30] = seqs[0]
+
+    signatures = minhash.minhash_signatures(padded, num_perm=8, batch_size=3)
+
+    assert signatures.shape == (4, 8)
+    np.testing.assert_array_equal(signatures[0], signatures[2])
+    assert (signatures[0] != signatures[1]).any()
+    assert (signatures[3] == minhash.MAX_HASH).all()
+
+
+def test_connected_components() -> None:
+    """It labels nodes with the smallest node of their component."""
+    edges = np.array([[3, 2], [0, 1], [1, 3], [5, 6]])
+
+    labels = minhash.connected_components(7, edges)
+
+    assert labels.tolist() == [0, 0, 0, 0, 4, 5, 5]
+
+
+def test_lsh_clusters() -> None:
+    """It links similar sequences and keeps sequences without k-mers alone."""
+    seqs = np.zeros((5, 60), dtype=np.int64)
+    seqs[:3, :50] = random_sequences(3, 50)
+    seqs[3, :50] = seqs[0, :50]
+    seqs[3, 48:50] = [1, 1]
+    signatures = minhash.minhash_signatures(seqs)
+
+    labels = minhash.lsh_clusters(signatures)
+
+    assert labels.tolist() == [0, 1, 2, 0, 4]
+
+
+def test_lsh_clusters_rejects_bands() -> None:
+    """It raises ValueError when bands don't divide the hash functions."""
+    with pytest.raises(ValueError):
+        minhash.lsh_clusters(np.zeros((2, 10), dtype=np.uint64), bands=3)
+
+
+def test_cluster_proteins() -> None:
+    """It clusters every distinct protein of both columns."""
+    seqs = random_sequences(2, 40).tolist()
+    df = vaex.from_arrow_table(
+        pa.table(
+            {
+                "a": ["P2", "P1", "P2"],
+                "b": ["P3", "P4", "P1"],
+                "a_seq": [seqs[0], seqs[1], seqs[0]],
+                "b_seq": [seqs[0][:39], seqs[1][1:], seqs[1]],
+            }
+        )
+    )
+
+    clusters = minhash.cluster_proteins(df, ["a", "b"], ["a_seq", "b_seq"])
+
+    assert clusters.protein_id.tolist() == ["P1", "P2", "P3", "P4"]
+    assert clusters.cluster.tolist() == [0, 1, 1, 0]
@@ -0,0 +1,38 @@
+"""Test cases for the model module."""
+
+import pytest
+import torch
+
+from anu.models.cnn.model import ConvNet
+
+
+@pytest.mark.parametrize("channels", [None, ["seq"], ["seq", "x", "y", "z"]])
+def test_conv_net(channels: list) -> None:
+    """It predicts two class scores from inputs of the given channels."""
+    model = ConvNet(window=16, channels=channels).eval()
+    rows = 10 if channels is None else len(channels)
+
+    with torch.no_grad():
+        outputs = model(torch.rand(3, 1, rows, 32))
+
+    assert outputs.shape == (3, 2)
+    assert torch.isfinite(outputs).all()
+
+
+def test_conv_net_checkpoint() -> None:
+    """It computes the gradients and batch statistics of the plain model."""
+    torch.manual_seed(0)
+    model = ConvNet(window=16)
+    checkpointed = ConvNet(window=16, checkpoint=True)
+    checkpointed.load_state_dict(model.state_dict())
+    inputs = torch.rand(3, 1, 10, 32)
+
+    for item in [model, checkpointed]:
+        item(inputs).sum().backward()
+
+    for (name, parameter), other in zip(
+        model.named_parameters(), checkpointed.parameters()
+    ):
+        torch.testing.assert_close(parameter.grad, other.grad, msg=name)
+    for name, buffer in checkpointed.state_dict().items():
+        torch.testing.assert_close(buffer, model.state_dict()[name], msg=name)
@@ -0,0 +1,67 @@
+"""Test cases for the negative_sampling module."""
+
+import numpy as np
+import pyarrow as pa
+import pytest
+import vaex
+
+from anu.data import negative_sampling
+
+
+def test_encode_protein_ids() -> None:
+    """It maps stripped ids to their position and unknown ids to -1."""
+    ids = np.array(["P1", "P2", "P4"])
+
+    codes = negative_sampling.encode_protein_ids(ids, pa.array([" P4", "P3", "P1"]))
+
+    assert codes.tolist() == [2, -1, 0]
+
+
+def test_known_pairs() -> None:
+    """It finds pairs in both orders and leaves out unknown proteins."""
+    ids = np.array(["P1", "P2", "P3"])
+    known = negative_sampling.KnownPairs.build(
+        ids,
+        [
+            vaex.from_arrays(a=["P1", "P2"], b=["P2", "P1"]),
+            vaex.from_arrays(a=["P3", "P9"], b=["P3", "P1"]),
+        ],
+    )
+
+    contains = known.contains(np.array([1, 0, 2, 0]), np.array([0, 2, 2, 1]))
+
+    assert len(known) == 2
+    assert contains.tolist() == [True, False, True, True]
+
+
+def test_negative_pair_sampler() -> None:
+    """It draws pairs of distinct proteins which are not known pairs."""
+    df = vaex.from_arrays(a=["P1", "P3"], b=["P2", "P4"])
+    known = vaex.from_arrays(a=["P3", "P9"], b=["P1", "P2"])
+    sampler = negative_sampling.NegativePairSampler.from_dataframe(
+        df, ["a", "b"], [known], random_state=0
+    )
+
+    first, second = sampler.sample(50)
+
+    ids = sampler.known_pairs.ids[sampler.slot_codes]
+    pairs = {tuple(sorted(pair)) for pair in zip(ids[first], ids[second])}
+    assert len(first) == len(second) == 50
+    assert pairs == {("P1", "P4"), ("P2", "P3"), ("P2", "P4")}
+
+
+@pytest.mark.parametrize(
+    "df",
+    [
+        vaex.from_arrays(a=["P1", "P1"], b=["P1", "P1"]),
+        vaex.from_arrays(a=["P1", "P2"], b=["P2", "P1"]),
+    ],
+)
+def test_negative_pair_sampler_without_pairs(df: vaex.dataframe.DataFrame) -> None:
+    """It raises ValueError when every pair is known or the same protein."""
+    sampler = negative_sampling.NegativePairSampler.from_dataframe(
+        df, ["a", "b"], [], random_state=0
+    )
+
+    with pytest.raises(ValueError):
+        sampler.sample(1)
@@ -0,0 +1,120 @@
+"""Test cases for the normalization module."""
+
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pyarrow as pa
+import pytest
+import vaex
+
+from anu.data.features import normalization as nz
+
+
+def test_log_bin_edges() -> None:
+    """It maps values to fixed log spaced bins keeping their sign."""
+    edges = nz.log_bin_edges(np.array([0.0, 0.5, 1.0, 1.05, -3.0, 1000.0]), 8)
+
+    assert edges[0] == 0
+    assert edges[2] == pytest.approx(1.0)
+    assert edges[3] == edges[2]
+    assert edges[4] == pytest.approx(-(2 ** (16 / 8)) + 1)
+    assert 900 < edges[5] <= 1000
+    assert (np.abs(edges) <= [0, 0.5, 1, 1.05, 3, 1000]).all()
+
+
+def test_channel_stats_merge() -> None:
+    """It gives the statistics of all the values after merging parts."""
+    values = np.random.default_rng(0).normal(5, 2, 1000)
+
+    parts = [nz.ChannelStats.from_values(part, 8) for part in np.split(values, 4)]
+    merged = nz.ChannelStats(bins_per_octave=8)
+    for part in parts:
+        merged = merged.merge(part)
+    whole = nz.ChannelStats.from_values(values, 8)
+
+    assert merged.count == 1000
+    assert merged.mean == pytest.approx(values.mean())
+    assert merged.std == pytest.approx(values.std())
+    assert merged.minimum == values.min() and merged.maximum == values.max()
+    assert merged.values.tolist() == whole.values.tolist()
+    assert merged.counts.tolist() == whole.counts.tolist()
+    assert len(merged.values) < 40
+
+
+def test_channel_stats_counts_categories() -> None:
+    """It counts every distinct value without bins."""
+    stats = nz.ChannelStats.from_values(np.array([3, 1, 3, 2]))
+
+    assert stats.values.tolist() == [1, 2, 3]
+    assert stats.counts.tolist() == [1, 1, 2]
+    assert nz.ChannelStats().merge(nz.ChannelStats()).count == 0
+    assert nz.ChannelStats().std == 0
+
+
+def test_channel_stats_rebins_distinct_values() -> None:
+    """It bins distinct values of statistics saved without bins."""
+    exact = nz.ChannelStats.from_values(np.array([1.0, 1.01, 7.0]))
+    binned = nz.ChannelStats.from_values(np.array([7.02]), 8)
+
+    merged = exact.merge(binned)
+
+    assert merged.bins_per_octave == 8
+    assert merged.counts.tolist() == [2, 2]
+    with pytest.raises(ValueError):
+        binned.merge(nz.ChannelStats.from_values(np.array([1.0]), 4))
+
+
+def test_compute_channel_stats(input_table: Callable[..., pa.Table]) -> None:
+    """It pools both proteins and leaves padded positions out."""
+    table = input_table(3)
+    padded = table.set_column(
+        0, "proteinA_seq", pa.array([[0.0] * 6] * 3, type=pa.list_(pa.float64()))
+    )
+
+    stats = nz.compute_channel_stats(vaex.from_arrow_table(padded), batch_rows=2)
+
+    mass = np.concatenate(table["proteinB_mass"].to_pylist())
+    assert stats["mass"].count == 18
+    assert stats["mass"].mean == pytest.approx(mass.mean())
+    assert stats["mass"].bins_per_octave == nz.BINS_PER_OCTAVE
+    assert stats["seq"].bins_per_octave is None
+    assert stats["seq"].counts.sum() == 18
+
+
+def test_save_load_channel_stats(data_path: Path) -> None:
+    """It merges the statistics saved next to every dataframe."""
+    first = {
+        name: nz.ChannelStats.from_values(np.arange(4.0), 8)
+        for name in nz.channel_names
+    }
+    second = {
+        name: nz.ChannelStats.from_values(np.arange(4.0, 8.0), 8)
+        for name in nz.channel_names
+    }
+    (data_path / "processed" / "second").mkdir(parents=True)
+    nz.save_channel_stats(first, "first")
+    nz.save_channel_stats(second, "second")
+
+    stats = nz.load_channel_stats(["first", "second"])
+
+    assert (data_path / "processed" / "first.stats.json").exists()
+    assert (data_path / "processed" / "second" / "stats.json").exists()
+    assert stats["x"].count == 8
+    assert stats["x"].mean == pytest.approx(3.5)
+    assert stats["x"].bins_per_octave == 8
+    with pytest.raises(OSError):
+        nz.load_channel_stats(["third"])
+
+
+def test_normalization_parameters() -> None:
+    """It shifts and scales every channel but seq and constant channels."""
+    stats = {
+        "seq": nz.ChannelStats.from_values(np.array([1.0, 5.0])),
+        "x": nz.ChannelStats.from_values(np.array([1.0, 5.0])),
+        "y": nz.ChannelStats.from_values(np.array([2.0, 2.0])),
+    }
+
+    parameters = nz.normalization_parameters(stats, channels=["seq", "x", "y"])
+
+    assert parameters.tolist() == [[0, 3, 0], [1, 0.5, 1]]
@@ -0,0 +1,53 @@
+"""Test cases for the pipeline module."""
+
+from typing import Callable
+
+import pyarrow as pa
+import pytest
+import torch
+import vaex
+
+from anu.data.pipelines.prepare_input import PROTEIN_SEQ_MAX_LEN
+from anu.models.cnn import pipeline
+from anu.models.cnn.loader import WindowedInteractionDataset
+from anu.models.cnn.model import ConvNet
+
+
+def test_get_model_window() -> None:
+    """It defaults to padded proteins for models without a window."""
+    assert pipeline.get_model_window(ConvNet(window=16)) == 16
+    assert pipeline.get_model_window(torch.nn.Linear(1, 1)) == PROTEIN_SEQ_MAX_LEN
+
+
+def test_predict_cnn_with_windowed_model(
+    input_table: Callable[..., pa.Table], capsys: pytest.CaptureFixture
+) -> None:
+    """It scores windows of unpadded proteins of a windowed model."""
+    df = vaex.from_arrow_table(input_table(1, lengths=(10,)))
+    model = ConvNet(window=4, channels=["seq"]).eval()
+
+    with torch.no_grad():
+        pipeline.predict_cnn(df, model)
+
+    assert "Result" in capsys.readouterr().out
+
+
+def test_data_loader_persistent_workers(input_table: Callable[..., pa.Table]) -> None:
+    """It starts workers again every epoch when samples are drawn at random."""
+    df = vaex.from_arrow_table(input_table(2))
+
+    fixed = pipeline.data_loader(pipeline.load_dataset(df), 1, 1)
+    crops = pipeline.data_loader(WindowedInteractionDataset(df, window=4), 1, 1)
+
+    assert fixed.persistent_workers
+    assert not crops.persistent_workers
+
+
+def test_data_loader_reads_batches(input_table: Callable[..., pa.Table]) -> None:
+    """It reads every batch of the dataset at once."""
+    dataset = pipeline.load_dataset(vaex.from_arrow_table(input_table(5)))
+
+    batches = list(pipeline.data_loader(dataset, 2, 0))
+
+    assert [len(labels) for labels, _ in batches] == [2, 2, 1]
+    assert batches[0][1].shape == (2, 1, 10, 12)
@@ -0,0 +1,109 @@
+"""Test cases for the protein_index module."""
+
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+from pytest_mock import MockFixture
+import vaex
+
+from anu.data import dataframe_operation as do
+from anu.data.index import protein_index as pi
+from anu.data.index.protein_index import (
+    find_protein_rows,
+    ProteinIndex,
+    update_index,
+    update_protein_index,
+)
+
+
+def pair_table(first: list, second: list) -> pa.Table:
+    """Create a table of protein id pairs."""
+    return pa.table({"first": first, "second": second})
+
+
+def test_build_lookup() -> None:
+    """It finds the rows of every protein, a self pair once."""
+    index = ProteinIndex.build(
+        pa.array(["P2", "P1", "P3", "P1"]), pa.array(["P1", "P3", "P3", "P2"]), 10
+    )
+
+    assert index.ids.tolist() == ["P1", "P2", "P3"]
+    assert index.lookup("P1").tolist() == [10, 11, 13]
+    assert index.lookup(" P3 ").tolist() == [11, 12]
+    assert index.lookup("P4").tolist() == []
+    assert "P2" in index and "P4" not in index
+    assert len(index) == 3
+    assert index.num_rows == 14
+
+
+def test_merge() -> None:
+    """It merges rows of appended proteins."""
+    index = ProteinIndex.build(pa.array(["P1"]), pa.array(["P2"]))
+    delta = ProteinIndex.build(pa.array(["P3", "P2"]), pa.array(["P1", "P4"]), 1)
+
+    merged = index.merge(delta)
+
+    assert merged.ids.tolist() == ["P1", "P2", "P3", "P4"]
+    assert merged.lookup("P1").tolist() == [0, 1]
+    assert merged.lookup("P2").tolist() == [0, 2]
+    assert merged.num_rows == 3
+
+
+def test_save_load(tmp_path: Path) -> None:
+    """It keeps one version of the saved arrays."""
+    index = ProteinIndex.build(pa.array(["P1"]), pa.array(["P2"]))
+    index.save(str(tmp_path))
+    index.merge(ProteinIndex.build(pa.array(["P3"]), pa.array(["P1"]), 1)).save(
+        str(tmp_path)
+    )
+
+    loaded = ProteinIndex.load(str(tmp_path))
+
+    assert loaded.lookup("P1").tolist() == [0, 1]
+    assert loaded.num_rows == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["1", "meta.json"]
+
+
+def test_update_index_appends_rows(tmp_path: Path, mocker: MockFixture) -> None:
+    """It indexes only the appended rows."""
+    update_index(str(tmp_path), pair_table(["P1"], ["P2"]))
+    spy = mocker.spy(ProteinIndex, "build")
+
+    index = update_index(str(tmp_path), pair_table(["P1", "P3"], ["P2", "P2"]))
+    update_index(str(tmp_path), pair_table(["P1", "P3"], ["P2", "P2"]))
+
+    assert index.lookup("P2").tolist() == [0, 1]
+    assert spy.call_count == 1
+    assert spy.call_args.args[0].to_pylist() == ["P3"]
+    assert ProteinIndex.load(str(tmp_path)).num_rows == 2
+
+
+def test_update_index_rebuilds_rewritten_table(tmp_path: Path) -> None:
+    """It rebuilds the index when indexed rows changed."""
+    update_index(str(tmp_path), pair_table(["P1", "P2"], ["P2", "P3"]))
+
+    index = update_index(str(tmp_path), pair_table(["P4", "P2"], ["P2", "P3"]))
+
+    assert index.lookup("P1").tolist() == []
+    assert index.lookup("P4").tolist() == [0]
+
+    index = update_index(str(tmp_path), pair_table(["P4"], ["P2"]))
+    assert index.num_rows == 1
+
+
+def test_find_protein_rows(data_path: Path, mocker: MockFixture) -> None:
+    """It returns the rows of the pair dataframe containing the protein."""
+    mocker.patch.object(pi, "get_base_data_path", return_value=str(data_path))
+    df = vaex.from_arrays(
+        protein_a=np.array(["P1", "P2", "P3"]), protein_b=np.array(["P2", "P3", "P1"])
+    )
+    do.save_dataframe_to_file(df, "pairs")
+    update_protein_index("pairs")
+
+    rows = find_protein_rows("pairs", "P3")
+
+    assert rows["protein_a"].tolist() == ["P2", "P3"]
+    assert (
+        data_path / "processed" / "index" / "protein" / "pairs" / "meta.json"
+    ).exists()
@@ -0,0 +1,68 @@
+"""Test cases for the shards module."""
+
+from pathlib import Path
+from typing import Callable
+
+import pyarrow as pa
+import pytest
+import torch
+import vaex
+
+from anu.data import dataframe_operation as do
+from anu.models.cnn import shards
+from anu.models.cnn.loader import read_input_batch
+
+
+@pytest.fixture
+def dataset(data_path: Path, input_table: Callable[..., pa.Table]) -> str:
+    """Fixture for an input dataset of two partitions."""
+    for i in range(2):
+        do.save_dataframe_partition(
+            vaex.from_arrow_table(input_table(3, start=3 * i)), "input", f"part-{i}"
+        )
+    return "input"
+
+
+def test_export_tensor_shards(dataset: str) -> None:
+    """It exports the decoded inputs and labels of every row."""
+    df = do.read_dataframes_from_file([dataset])
+    path = shards.get_shards_path(dataset)
+
+    assert shards.export_tensor_shards(df, path, shard_rows=4, batch_rows=3) == 6
+
+    tensor_shards = shards.TensorShards.load([path])
+    labels, inputs = tensor_shards.take([5, 0, 4])
+    expected_labels, expected_inputs = read_input_batch(df, [5, 0, 4])
+    assert len(tensor_shards) == 6
+    assert torch.equal(labels, expected_labels)
+    assert torch.allclose(inputs, expected_inputs)
+
+
+def test_tensor_shards_detect_stale_source(dataset: str) -> None:
+    """It raises ValueError when rows were deleted since the export."""
+    path = shards.get_shards_path(dataset)
+    shards.export_tensor_shards(
+        do.read_dataframes_from_file([dataset]),
+        path,
+        source=do.describe_dataframe_source(dataset),
+    )
+    shards.TensorShards.load([path], [do.describe_dataframe_source(dataset)])
+
+    do.add_tombstones_to_manifest(dataset, {"part-1.arrow": [0]})
+
+    with pytest.raises(ValueError, match="stale"):
+        shards.TensorShards.load([path], [do.describe_dataframe_source(dataset)])
+
+
+def test_tensor_shard_dataset(dataset: str) -> None:
+    """It reads rows of the shards in the order of the dataset."""
+    df = do.read_dataframes_from_file([dataset])
+    path = shards.get_shards_path(dataset)
+    shards.export_tensor_shards(df, path, shard_rows=4)
+
+    data = shards.TensorShardDataset(shards.TensorShards.load([path]), [4, 1])
+    labels, inputs = data.__getitems__([1, 0])
+
+    assert len(data) == 2
+    assert torch.equal(labels, read_input_batch(df, [1, 4])[0])
+    assert torch.equal(data[1][1], inputs[0])
@@ -0,0 +1,185 @@
+"""Test cases for the splits module."""
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from pytest_mock import MockFixture
+import vaex
+
+from anu.data import splits
+
+
+def make_clusters(count: int, size: int = 1) -> vaex.dataframe.DataFrame:
+    """Create clusters of size proteins labeled by their first protein."""
+    ids = np.array([f"P{i:04d}" for i in range(count)])
+    return vaex.from_arrays(protein_id=ids, cluster=np.arange(count) // size * size)
+
+
+def make_pairs(first: np.ndarray, second: np.ndarray) -> vaex.dataframe.DataFrame:
+    """Create a pair dataframe from protein numbers."""
+    return vaex.from_arrays(
+        proteinA_id=np.array([f"P{i:04d}" for i in first]),
+        proteinB_id=np.array([f"P{i:04d}" for i in second]),
+        row=np.arange(len(first)),
+    )
+
+
+def split_clusters(
+    df: vaex.dataframe.DataFrame, clusters_df: vaex.dataframe.DataFrame
+) -> set:
+    """Return clusters of the proteins of a split."""
+    labels = dict(zip(clusters_df["protein_id"].tolist(), clusters_df.cluster.tolist()))
+    return {
+        labels[protein_id]
+        for column in ["proteinA_id", "proteinB_id"]
+        for protein_id in df[column].tolist()
+    }
+
+
+def test_traverse_graph() -> None:
+    """It visits every component from one node before the next one."""
+    first, second = np.array([0, 1, 3]), np.array([1, 2, 4])
+
+    position = splits.traverse_graph(first, second, 5, np.random.default_rng(0))
+
+    assert sorted(position.tolist()) == [0, 1, 2, 3, 4]
+    assert abs(position[3] - position[4]) == 1
+    assert max(position[:3]) - min(position[:3]) == 2
+
+
+def test_cluster_split_dataframe_keeps_linked_clusters(mocker: MockFixture) -> None:
+    """It drops no row when linked clusters fit in their split."""
+    rng = np.random.default_rng(0)
+    clusters_df = make_clusters(400, 2)
+    # Chains of 4 proteins, so 2 clusters, without links between chains.
+    first = rng.integers(0, 100, 1000) * 4
+    df = make_pairs(first, first + rng.integers(0, 4, 1000))
+    warning = mocker.patch.object(splits.logger, "warning")
+
+    parts = splits.cluster_split_dataframe(df, clusters_df, [0.7, 0.2, 0.1], 1)
+
+    assert sum(len(part) for part in parts) == 1000
+    assert [len(part) / 1000 for part in parts] == pytest.approx(
+        [0.7, 0.2, 0.1], abs=0.03
+    )
+    assert not warning.called
+    for i, part in enumerate(parts):
+        for other in parts[i + 1 :]:
+            assert split_clusters(part, clusters_df).isdisjoint(
+                split_clusters(other, clusters_df)
+            )
+
+
+def test_cluster_split_dataframe_cuts_large_components(mocker: MockFixture) -> None:
+    """It drops only rows linking two splits of a large component."""
+    clusters_df = make_clusters(1000)
+    # One chain of every protein.
+    df = make_pairs(np.arange(999), np.arange(1, 1000))
+    warning = mocker.patch.object(splits.logger, "warning")
+
+    parts = splits.cluster_split_dataframe(df, clusters_df, [0.7, 0.2, 0.1], 1)
+
+    kept = sum(len(part) for part in parts)
+    assert kept >= 995
+    assert [len(part) / kept for part in parts] == pytest.approx(
+        [0.7, 0.2, 0.1], abs=0.01
+    )
+    warning.assert_called_once()
+    for i, part in enumerate(parts):
+        for other in parts[i + 1 :]:
+            assert split_clusters(part, clusters_df).isdisjoint(
+                split_clusters(other, clusters_df)
+            )
+
+
+def test_cluster_split_dataframe_loose() -> None:
+    """It keeps every row, rows of later splits have a held out cluster."""
+    rng = np.random.default_rng(0)
+    clusters_df = make_clusters(200, 4)
+    df = make_pairs(rng.integers(0, 200, 500), rng.integers(0, 200, 500))
+
+    parts = splits.cluster_split_dataframe(
+        df, clusters_df, [0.7, 0.2, 0.1], 1, strict=False
+    )
+
+    assert sorted(row for part in parts for row in part.row.tolist()) == list(
+        range(500)
+    )
+    train = split_clusters(parts[0], clusters_df)
+    for part in parts[1:]:
+        for first, second in zip(
+            part["proteinA_id"].tolist(), part["proteinB_id"].tolist()
+        ):
+            rows = make_pairs(np.array([int(first[1:])]), np.array([int(second[1:])]))
+            assert not split_clusters(rows, clusters_df) <= train
+
+
+def test_cluster_split_dataframe_fails_without_cluster() -> None:
+    """It raises ValueError when a protein has no cluster."""
+    df = make_pairs(np.array([0]), np.array([5]))
+
+    with pytest.raises(ValueError):
+        splits.cluster_split_dataframe(df, make_clusters(3), [0.5, 0.5])
+
+
+def test_stable_hash() -> None:
+    """It computes FNV-1a hashes of stripped strings."""
+    hashes = splits.stable_hash(np.array(["", "a", " a "]))
+
+    assert hashes.tolist() == [
+        0xCBF29CE484222325,
+        0xAF63DC4C8601EC8C,
+        0xAF63DC4C8601EC8C,
+    ]
+    np.testing.assert_array_equal(
+        splits.stable_hash(pa.chunked_array([["b"], ["a"]])),
+        splits.stable_hash(np.array(["b", "a"])),
+    )
+
+
+def test_hash_to_fraction() -> None:
+    """It spreads hashes uniformly over [0, 1), differently for every salt."""
+    hashes = np.arange(10000, dtype=np.uint64)
+
+    fractions = splits.hash_to_fraction(hashes)
+
+    assert fractions.min() >= 0 and fractions.max() < 1
+    assert np.histogram(fractions, bins=4, range=(0, 1))[0].min() > 2300
+    assert not np.array_equal(fractions, splits.hash_to_fraction(hashes, salt=1))
+
+
+def test_hash_split_dataframe() -> None:
+    """It puts every pair in one split, whatever the order of the pair."""
+    first = np.arange(1000)
+    df = make_pairs(
+        np.concatenate([first, first + 1]), np.concatenate([first + 1, first])
+    )
+
+    parts = splits.hash_split_dataframe(df, [0.7, 0.2, 0.1], salt=3)
+
+    rows = [part.row.tolist() for part in parts]
+    assert sorted(row for part in rows for row in part) == list(range(2000))
+    np.testing.assert_allclose(
+        [len(part) / 2000 for part in rows], [0.7, 0.2, 0.1], atol=0.05
+    )
+    for part in rows:
+        assert {row % 1000 for row in part if row < 1000} == {
+            row % 1000 for row in part if row >= 1000
+        }
+
+
+def test_hash_split_dataframe_by_protein() -> None:
+    """It shares no protein between splits."""
+    rng = np.random.default_rng(0)
+    df = make_pairs(rng.integers(0, 100, 1000), rng.integers(0, 100, 1000))
+
+    parts = splits.hash_split_dataframe(df, [0.5, 0.5], by="protein")
+
+    proteins = [
+        set(part.proteinA_id.tolist()) | set(part.proteinB_id.tolist())
+        for part in parts
+    ]
+    assert all(len(part) > 0 for part in parts)
+    assert not proteins[0] & proteins[1]
+    with pytest.raises(ValueError):
+        splits.hash_split_dataframe(df, [0.5, 0.5], by="cluster")
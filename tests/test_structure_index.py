@@ -0,0 +1,86 @@
+"""Test cases for the structure_index module."""
+
+import io
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from pytest_mock import MockFixture
+
+from anu.data.index import structure_index
+from anu.data.index.structure_index import StructureIndex
+from anu.data.parser.pdb_parser import parse_pdb_atoms
+
+
+def test_parse_pdb_atoms(pdb_files: List[Path]) -> None:
+    """It reads the first model with residues grouped by chain."""
+    atoms = parse_pdb_atoms(str(pdb_files[1]), amino_acids_only=False)
+    amino_acids = parse_pdb_atoms(str(pdb_files[1]))
+
+    assert atoms["residue_names"].tolist() == ["ALA", "GLY", "HOH", "SER"]
+    assert atoms["chain_ids"].tolist() == ["A", "A", "A", "B"]
+    assert atoms["residue_offsets"].tolist() == [0, 2, 3, 4, 5]
+    assert atoms["atom_names"].tolist() == ["N", "CA", "CA", "O", "CA"]
+    np.testing.assert_allclose(atoms["coords"][3], [5, 5, 5])
+    assert amino_acids["residue_names"].tolist() == ["ALA", "GLY", "SER"]
+
+
+def test_structure_index(pdb_files: List[Path]) -> None:
+    """It finds sequence, centroids and chains of every protein."""
+    index = StructureIndex.build([str(path) for path in pdb_files])
+
+    assert index.ids.tolist() == ["P1", "P2"]
+    assert "P2" in index and "P3" not in index
+    assert index.lengths().tolist() == [4, 1]
+    assert index.get_sequence(" P1") == "AGXS"
+    assert index.get_sequence("P2") == "M"
+    np.testing.assert_allclose(index.get_centroids("P1")[:2], [[1, 0, 0], [3, 3, 3]])
+    assert index.get_chains("P1") == [("A", 0, 3), ("B", 3, 4)]
+    assert index.get_chains("P2") == [("A", 0, 1)]
+    with pytest.raises(KeyError):
+        index.get_sequence("P3")
+
+
+def test_structure_index_file_offsets(pdb_files: List[Path]) -> None:
+    """It points to the first record of every residue."""
+    index = StructureIndex.build([str(path) for path in pdb_files])
+
+    with open(pdb_files[1], "rb") as fp:
+        data = fp.read()
+
+    assert [
+        data[offset : offset + 26][17:26].decode()
+        for offset in index.get_file_offsets("P1")
+    ] == ["ALA A   1", "GLY A   2", "HOH A 101", "SER B   1"]
+
+
+def test_write_fasta(pdb_files: List[Path]) -> None:
+    """It writes sequences in lines of line_width residues."""
+    index = StructureIndex.build([str(path) for path in pdb_files])
+    fp = io.StringIO()
+
+    written = index.write_fasta(fp, line_width=3)
+
+    assert written == 2
+    assert fp.getvalue() == ">P1\nAGX\nS\n>P2\nM\n"
+
+
+def test_build_structure_index(
+    tmp_path: Path, pdb_files: List[Path], mocker: MockFixture
+) -> None:
+    """It saves a new version of the index and removes the previous one."""
+    mocker.patch.object(
+        structure_index, "get_base_data_path", return_value=str(tmp_path)
+    )
+    path = Path(structure_index.get_structure_index_path())
+
+    structure_index.build_structure_index()
+    structure_index.build_structure_index()
+    index = StructureIndex.load(str(path))
+
+    assert sorted(item.name for item in path.iterdir()) == ["1", "meta.json"]
+    assert index.get_sequence("P1") == "AGXS"
+    assert isinstance(index.centroids, np.memmap)
+    with pytest.raises(OSError):
+        StructureIndex.load(str(tmp_path))
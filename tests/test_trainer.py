@@ -0,0 +1,252 @@
+"""Test cases for the trainer module."""
+
+from functools import partial
+import os
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from pytest_mock import MockFixture
+import torch
+from torch.nn import CrossEntropyLoss
+import vaex
+
+from anu.data.dataframe_operation import save_dataframe_to_file
+from anu.models.cnn import trainer
+from anu.models.cnn.checkpoints import list_checkpoints
+from anu.models.cnn.config import get_default_cnn_trainer_config
+from anu.models.cnn.loader import (
+    InteractionClassificationDataset,
+    StreamingInteractionDataset,
+    WindowedInteractionDataset,
+)
+from anu.models.cnn.model import ConvNet
+from anu.models.cnn.pipeline import data_loader
+
+
+@pytest.fixture
+def cnn_trainer(
+    tmp_path: Path, input_table: Callable[..., pa.Table]
+) -> trainer.CNNTrainer:
+    """Fixture for a trainer of a small ConvNet over a few rows."""
+    dataset = InteractionClassificationDataset(
+        vaex.from_arrow_table(input_table(4, lengths=(8,)))
+    )
+    config = get_default_cnn_trainer_config()
+    config["logdir"] = str(tmp_path / "logs")
+    config["model_savedir"] = str(tmp_path / "models")
+    config["epochs"] = 2
+
+    return trainer.CNNTrainer(
+        data_loader(dataset, 2, 0),
+        data_loader(dataset, 4, 0),
+        config=config,
+        model=partial(ConvNet, window=8),
+    )
+
+
+def test_prepare_model() -> None:
+    """It applies channels last and bfloat16 autocast on cpu."""
+    config = get_default_cnn_trainer_config()
+    config["device"] = "cpu"
+    config["channels_last"] = True
+    config["autocast"] = True
+
+    model, forward_net = trainer.prepare_model(ConvNet(window=8), config)
+    inputs = trainer.to_model_input(
+        torch.rand(2, 1, 10, 16, dtype=torch.float64), config
+    )
+    with trainer.autocast_context(config):
+        outputs = forward_net(inputs)
+
+    assert model is forward_net
+    assert inputs.dtype == torch.float32
+    assert inputs.is_contiguous(memory_format=torch.channels_last)
+    assert outputs.dtype == torch.bfloat16
+
+
+def test_train_refuses_checkpoints_of_previous_run(
+    cnn_trainer: trainer.CNNTrainer,
+) -> None:
+    """It keeps checkpoints of a previous run unless asked to remove them."""
+    cnn_trainer.train("model.pt")
+    path = cnn_trainer.checkpoints.path
+    checkpoints = list_checkpoints(path)
+
+    with pytest.raises(ValueError, match="--overwrite-checkpoints"):
+        cnn_trainer.train("model.pt")
+    assert list_checkpoints(path) == checkpoints
+
+    cnn_trainer.train("model.pt", overwrite_checkpoints=True)
+    assert len(list_checkpoints(path)) == 2
+    assert (Path(cnn_trainer.config["model_savedir"]) / "cnn" / "model.pt").exists()
+
+
+def test_train_resume(cnn_trainer: trainer.CNNTrainer) -> None:
+    """It trains the same model when resuming from the checkpoint of an epoch."""
+    cnn_trainer.train("model.pt")
+    expected = cnn_trainer.net.state_dict()
+    path = cnn_trainer.checkpoints.path
+    os.remove(list_checkpoints(path)[-1])
+
+    cnn_trainer.train("model.pt", resume=True)
+
+    assert len(list_checkpoints(path)) == 2
+    for name, value in cnn_trainer.net.state_dict().items():
+        torch.testing.assert_close(value, expected[name], msg=name)
+
+
+def test_average_row_scores() -> None:
+    """It averages scores of the samples of every row."""
+    labels, scores = trainer.average_row_scores(
+        np.array([1, 1, 0, 1]), np.array([0.2, 0.4, 0.9, 0.6]), np.array([0, 0, 1, 0])
+    )
+
+    assert labels.tolist() == [1, 0]
+    np.testing.assert_allclose(scores, [0.4, 0.9])
+
+
+def test_evaluate_windowed_dataset(
+    input_table: Callable[..., pa.Table], mocker: MockFixture
+) -> None:
+    """It computes metrics on rows, not on windows of rows."""
+    metrics = mocker.spy(trainer, "classification_metrics")
+    df = vaex.from_arrow_table(input_table(2, lengths=[5, 9]))
+    dataset = WindowedInteractionDataset(df, window=4, random_crops=False)
+    config = get_default_cnn_trainer_config()
+    config["device"] = "cpu"
+
+    trainer.evaluate(
+        ConvNet(window=4).eval(),
+        data_loader(dataset, 3, 0),
+        CrossEntropyLoss(),
+        config,
+    )
+
+    labels, scores = metrics.call_args.args
+    assert len(dataset) == 20
+    assert labels.tolist() == [0, 1]
+    assert len(scores) == 2
+
+
+def test_train_streaming_datasets(
+    data_path: Path, tmp_path: Path, input_table: Callable[..., pa.Table]
+) -> None:
+    """It evaluates on data loaders of iterable datasets, which have no length."""
+    save_dataframe_to_file(
+        vaex.from_arrow_table(input_table(4, lengths=(8,))), "inputs"
+    )
+    dataset = StreamingInteractionDataset(["inputs"], buffer_size=0)
+    config = get_default_cnn_trainer_config()
+    config["logdir"] = str(tmp_path / "logs")
+    config["model_savedir"] = str(tmp_path / "models")
+    config["epochs"] = 1
+    cnn_trainer = trainer.CNNTrainer(
+        data_loader(dataset, 2, 0),
+        data_loader(dataset, 4, 0),
+        valid_dataloader=data_loader(dataset, 4, 0),
+        config=config,
+        model=partial(ConvNet, window=8),
+    )
+
+    cnn_trainer.train("model.pt")
+
+    assert (tmp_path / "models" / "cnn" / "model.pt").exists()
+
+
+@pytest.mark.parametrize("sizes", [[2, 2], [3, 1], [3]])
+def test_gradient_accumulator(sizes: list) -> None:
+    """It updates parameters like one step over the whole batch."""
+    torch.manual_seed(0)
+    labels = torch.tensor([[1, 0], [0, 1], [0, 1], [1, 0]])[: sum(sizes)]
+    inputs = torch.rand(sum(sizes), 3)
+    config = get_default_cnn_trainer_config()
+    config["device"] = "cpu"
+    model = torch.nn.Linear(3, 2)
+    accumulated = torch.nn.Linear(3, 2)
+    accumulated.load_state_dict(model.state_dict())
+
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    trainer.train_step(model, optimizer, CrossEntropyLoss(), labels, inputs, config)
+
+    config["accumulation_steps"] = 2
+    accumulator = trainer.GradientAccumulator(
+        accumulated,
+        torch.optim.SGD(accumulated.parameters(), lr=0.1),
+        CrossEntropyLoss(),
+        config,
+    )
+    for batch_labels, batch_inputs in zip(labels.split(sizes), inputs.split(sizes)):
+        accumulator.step(batch_labels, batch_inputs)
+    accumulator.update()
+
+    assert accumulator.samples == 0
+    for parameter, other in zip(model.parameters(), accumulated.parameters()):
+        torch.testing.assert_close(parameter, other)
+
+
+def test_early_stopping() -> None:
+    """It stops after patience evaluations without improvement."""
+    early_stopping = trainer.EarlyStopping(2, min_delta=0.1)
+
+    stops = [early_stopping.step(loss) for loss in [1.0, 0.8, 0.75, 0.9, 0.5]]
+    restored = trainer.EarlyStopping(2, min_delta=0.1)
+    restored.load_state_dict(early_stopping.state_dict())
+
+    assert stops == [False, False, False, True, False]
+    assert restored.state_dict() == {"best": 0.5, "bad_evaluations": 0}
+    assert not any(trainer.EarlyStopping(None).step(1.0) for _ in range(5))
+
+
+def test_evaluate(input_table: Callable[..., pa.Table]) -> None:
+    """It computes loss and metrics without gradients and in eval mode."""
+    dataset = InteractionClassificationDataset(
+        vaex.from_arrow_table(input_table(4, lengths=(8,)))
+    )
+    config = get_default_cnn_trainer_config()
+    config["device"] = "cpu"
+    model = ConvNet(window=8)
+
+    metrics = trainer.evaluate(
+        model, data_loader(dataset, 3, 0), CrossEntropyLoss(), config
+    )
+
+    assert not model.training
+    assert all(parameter.grad is None for parameter in model.parameters())
+    assert set(metrics) == {"loss", "accuracy", "precision", "recall", "f1", "roc_auc"}
+    assert metrics["loss"] > 0
+
+
+def test_evaluate_checkpoint(
+    tmp_path: Path, input_table: Callable[..., pa.Table]
+) -> None:
+    """It evaluates the model of a training checkpoint."""
+    dataset = InteractionClassificationDataset(
+        vaex.from_arrow_table(input_table(4, lengths=(8,)))
+    )
+    config = get_default_cnn_trainer_config()
+    config["device"] = "cpu"
+    model = ConvNet(window=8)
+    torch.save({"model": model.state_dict()}, tmp_path / "checkpoint.pt")
+    loader = data_loader(dataset, 4, 0)
+
+    metrics = trainer.evaluate_checkpoint(
+        str(tmp_path / "checkpoint.pt"), partial(ConvNet, window=8), loader, config
+    )
+
+    expected = trainer.evaluate(model, loader, CrossEntropyLoss(), config)
+    assert metrics["loss"] == pytest.approx(expected["loss"])
+
+
+def test_train_stops_early(cnn_trainer: trainer.CNNTrainer) -> None:
+    """It stops once the validation loss stops improving."""
+    cnn_trainer.config["epochs"] = 5
+    cnn_trainer.config["early_stopping_patience"] = 1
+    cnn_trainer.config["early_stopping_delta"] = 100.0
+
+    cnn_trainer.train("model.pt")
+
+    assert cnn_trainer.step == 4
+    assert cnn_trainer.early_stopping.bad_evaluations == 1
@@ -0,0 +1,72 @@
+"""Test cases for the tuning module."""
+
+from pathlib import Path
+from typing import Tuple
+
+import pytest
+from pytest_mock import MockFixture
+
+from anu.models.cnn import tuning
+
+
+def fake_trial(batch_size: int, threads: int, *args: object) -> Tuple[float, int]:
+    """Return a speed growing with batch size and threads, and memory."""
+    return float(batch_size * threads), batch_size * 100
+
+
+def test_tune_training(mocker: MockFixture) -> None:
+    """It picks the fastest trial within the budget and records settings."""
+    mocker.patch.object(tuning, "run_trial", side_effect=fake_trial)
+    settings = tuning.trial_settings(window=16, checkpoint_activations=True)
+
+    profile = tuning.tune_training([1, 2, 4], [1, 2], [0], 250, settings)
+
+    assert (profile["batch_size"], profile["threads"]) == (2, 2)
+    assert profile["settings"] == settings
+    assert len(profile["trials"]) == 6
+    tuning.run_trial.assert_any_call(1, 1, settings, 5)
+
+
+def test_tune_training_over_budget(mocker: MockFixture) -> None:
+    """It raises ValueError when no trial fits in the memory budget."""
+    mocker.patch.object(tuning, "run_trial", side_effect=fake_trial)
+
+    with pytest.raises(ValueError):
+        tuning.tune_training([1], [1], [0], 50)
+
+
+def test_load_tuning_profile(tmp_path: Path, mocker: MockFixture) -> None:
+    """It loads a profile only for the settings it was tuned with."""
+    mocker.patch.object(tuning, "run_trial", side_effect=fake_trial)
+    path = str(tmp_path / "profile.json")
+    tuning.save_tuning_profile(tuning.tune_training([1], [1], [0], 1000), path)
+
+    assert tuning.load_tuning_profile(path) is not None
+    assert tuning.load_tuning_profile(path, tuning.trial_settings()) is not None
+    assert tuning.load_tuning_profile(path, tuning.trial_settings(window=16)) is None
+    assert tuning.load_tuning_profile(str(tmp_path / "missing.json")) is None
+
+
+def test_trial_config() -> None:
+    """It applies the settings to the trainer config."""
+    config = tuning.trial_config(
+        tuning.trial_settings(accelerate=True, accumulation_steps=4)
+    )
+
+    assert config["compile"] == "compile"
+    assert config["accumulation_steps"] == 4
+    assert not config["checkpoint_activations"]
+
+
+def test_choose_workers() -> None:
+    """It picks the fewest workers keeping up with training."""
+    best = {"samples_per_second": 10.0}
+    trials = [
+        {"workers": 0, "samples_per_second": 4.0},
+        {"workers": 2, "samples_per_second": 12.0},
+        {"workers": 4, "samples_per_second": 20.0},
+    ]
+
+    assert tuning.choose_workers(best, trials) == 2
+    assert tuning.choose_workers(best, trials[:1]) == 0
+    assert tuning.choose_workers(best, []) == 0
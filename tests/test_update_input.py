@@ -0,0 +1,197 @@
+"""Test cases for the update_input module."""
+
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from pytest_mock import MockFixture
+import vaex
+
+from anu.data import dataframe_operation as do
+from anu.data.index import protein_index as pi
+from anu.data.pipelines import update_input as ui
+
+
+def make_ledger(rows: List[Tuple[str, str, str, str, str, int, bool]]) -> pa.Table:
+    """Create a ledger from protein a, protein b, hashes, partition, row, live."""
+    return pa.table(
+        {
+            "key": [ui.canonical_pair_key(row[0], row[1]) for row in rows],
+            "hash_a": [row[2] for row in rows],
+            "hash_b": [row[3] for row in rows],
+            "partition": [row[4] for row in rows],
+            "row": [row[5] for row in rows],
+            "live": [row[6] for row in rows],
+        },
+        schema=ui.LEDGER_SCHEMA,
+    )
+
+
+@pytest.fixture
+def input_path(data_path: Path, mocker: MockFixture) -> Path:
+    """Fixture for a temporary data directory of input datasets and indexes."""
+    mocker.patch.object(ui, "get_base_data_path", return_value=str(data_path))
+    mocker.patch.object(pi, "get_base_data_path", return_value=str(data_path))
+    return data_path
+
+
+LEDGER = [
+    ("P1", "P2", "h1", "h2", "part.arrow", 0, True),
+    ("P2", "P3", "h2", "h3", "part.arrow", 1, True),
+    ("P3", "P4", "h3", "h4", "part.arrow", 2, True),
+    ("P4", "P5", "h4", "h5", "part.arrow", 3, False),
+]
+
+
+def test_canonical_pair_key() -> None:
+    """It doesn't depend on the order of proteins."""
+    assert ui.canonical_pair_key("P2 ", "P1") == ui.canonical_pair_key("P1", "P2")
+
+
+def test_plan_update() -> None:
+    """It featurizes new and changed pairs and tombstones stale rows."""
+    ledger = make_ledger(LEDGER)
+    hashes = {"P1": "h1", "P2": "h2", "P3": "h3-new", "P4": "h4", "P5": None}
+    pairs = [("P2", "P1"), ("P3", "P2"), ("P4", "P5"), ("P1", "P4"), ("P1", "P2")]
+
+    featurize, deleted = ui.plan_update(ledger, pairs, hashes)
+
+    assert featurize == [("P3", "P2"), ("P1", "P4")]
+    assert deleted == {"part.arrow": [1, 2]}
+
+
+def test_plan_update_with_index(tmp_path: Path) -> None:
+    """It compares only rows of the changed proteins."""
+    ledger = make_ledger(LEDGER)
+    index = ui.update_index(str(tmp_path), ui.get_ledger_pairs(ledger))
+    hashes = {"P1": "h1-new", "P2": "h2", "P3": "h3-new", "P4": "h4"}
+    pairs = [("P1", "P2"), ("P2", "P3"), ("P3", "P4")]
+
+    featurize, deleted = ui.plan_update(ledger, pairs, hashes, index, ["P1"])
+
+    assert featurize == [("P1", "P2")]
+    assert deleted == {"part.arrow": [0]}
+
+
+def test_find_input_rows(input_path: Path) -> None:
+    """It returns the live dataset rows containing the protein."""
+    save_path = "input/db/dataset"
+    for name, first, second in [
+        ("part", ["P1", "P2", "P1"], ["P2", "P3", "P3"]),
+        ("delta-00000", ["P3", "P1"], ["P4", "P4"]),
+    ]:
+        df = vaex.from_arrays(proteinA_id=np.array(first), proteinB_id=np.array(second))
+        do.save_dataframe_partition(df, save_path, name)
+    do.add_tombstones_to_manifest(save_path, {"part.arrow": [0]})
+    ledger = make_ledger(
+        [
+            ("P1", "P2", "h", "h", "part.arrow", 0, False),
+            ("P2", "P3", "h", "h", "part.arrow", 1, True),
+            ("P1", "P3", "h", "h", "part.arrow", 2, True),
+            ("P3", "P4", "h", "h", "delta-00000.arrow", 0, True),
+            ("P1", "P4", "h", "h", "delta-00000.arrow", 1, True),
+        ]
+    )
+    do.write_arrow_table_atomically(
+        ledger, str(Path(do.get_dataset_path(save_path)) / ui.LEDGER_FILENAME)
+    )
+
+    rows = ui.find_input_rows(save_path, "P1")
+
+    assert rows["proteinA_id"].tolist() == ["P1", "P1"]
+    assert rows["proteinB_id"].tolist() == ["P3", "P4"]
+
+
+def test_find_input_rows_without_ledger(input_path: Path) -> None:
+    """It raises OSError when the dataset has no ledger."""
+    with pytest.raises(OSError):
+        ui.find_input_rows("input/db/dataset", "P1")
+
+
+def fake_pair_input(protein_a: str, protein_b: str, *args: object) -> vaex.DataFrame:
+    """Featurize a pair as its protein ids."""
+    return vaex.from_arrays(
+        proteinA_id=np.array([protein_a]), proteinB_id=np.array([protein_b])
+    )
+
+
+def write_source(data_path: Path, pairs: List[Tuple[str, str]]) -> None:
+    """Write the json source of pairs and a pdb file of every protein."""
+    import json
+
+    source = data_path / "processed" / "protein_id" / "pairs.json"
+    source.parent.mkdir(parents=True, exist_ok=True)
+    source.write_text(
+        json.dumps({"a": [pair[0] for pair in pairs], "b": [pair[1] for pair in pairs]})
+    )
+    pdb_path = data_path / "raw" / "pdb"
+    pdb_path.mkdir(parents=True, exist_ok=True)
+    for protein_id in {protein_id for pair in pairs for protein_id in pair}:
+        if not (pdb_path / f"{protein_id}.pdb").exists():
+            (pdb_path / f"{protein_id}.pdb").write_text(protein_id)
+
+
+def test_update_input_from_json(input_path: Path, mocker: MockFixture) -> None:
+    """It featurizes only new pairs and pairs whose structure changed."""
+    mocker.patch.object(ui, "build_input_from_json_intermediate_step", fake_pair_input)
+    write_source(input_path, [("P1", "P2"), ("P2", "P3"), ("P3", "P4")])
+
+    assert ui.update_input_from_json("pairs.json", "db", "df", True) == (3, 0)
+    assert ui.update_input_from_json("pairs.json", "db", "df", True) == (0, 0)
+
+    (input_path / "raw" / "pdb" / "P4.pdb").write_text("P4 refetched")
+    write_source(input_path, [("P1", "P2"), ("P3", "P4"), ("P4", "P5")])
+
+    assert ui.update_input_from_json("pairs.json", "db", "df", True) == (2, 2)
+    df = do.read_dataset("input/db/df")
+    assert list(zip(df["proteinA_id"].tolist(), df["proteinB_id"].tolist())) == [
+        ("P1", "P2"),
+        ("P3", "P4"),
+        ("P4", "P5"),
+    ]
+    assert ui.find_input_rows("input/db/df", "P4")["proteinB_id"].tolist() == [
+        "P4",
+        "P5",
+    ]
+
+
+def test_tombstone_mask() -> None:
+    """It marks the deleted rows of every partition."""
+    ledger = make_ledger(LEDGER + [("P1", "P5", "h1", "h5", "delta.arrow", 1, True)])
+
+    mask = ui.tombstone_mask(ledger, {"part.arrow": [1, 3], "delta.arrow": [0, 1]})
+
+    assert mask.tolist() == [False, True, False, True, True]
+    assert ui.tombstone_mask(ledger.slice(0, 0), {"part.arrow": [0]}).tolist() == []
+
+
+def test_update_input_from_json_resumes(input_path: Path, mocker: MockFixture) -> None:
+    """It keeps ledger rows of the partitions saved before an interruption."""
+    write_source(input_path, [("P1", "P2"), ("P2", "P3"), ("P3", "P4")])
+    mocker.patch.object(
+        ui,
+        "build_input_from_json_intermediate_step",
+        side_effect=[fake_pair_input("P1", "P2"), KeyboardInterrupt],
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        ui.update_input_from_json("pairs.json", "db", "df", True, partition_rows=1)
+
+    assert len(ui.read_ledger("input/db/df")) == 1
+    assert len(pa.ipc.open_file(ui.get_ledger_path("input/db/df")).read_all()) == 0
+
+    mocker.patch.object(ui, "build_input_from_json_intermediate_step", fake_pair_input)
+    assert ui.update_input_from_json("pairs.json", "db", "df", True) == (2, 0)
+    assert not Path(ui.get_ledger_delta_path("input/db/df", "")).exists()
+    assert len(pa.ipc.open_file(ui.get_ledger_path("input/db/df")).read_all()) == 3
+
+
+def test_bootstrap_ledger_without_ids(input_path: Path) -> None:
+    """It raises ValueError for datasets saved without protein ids."""
+    df = vaex.from_arrays(proteinA_seq=np.array([1, 2]))
+    do.save_dataframe_partition(df, "input/db/df", "part")
+
+    with pytest.raises(ValueError, match="rebuild"):
+        ui.bootstrap_ledger("input/db/df", str(input_path), {})